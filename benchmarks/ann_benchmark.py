@@ -0,0 +1,64 @@
+import time
+import argparse
+import tempfile
+import numpy as np
+from typing import *
+
+from benchmarks.benchmark_utils import generate_questions, build_search_engine, recall_at_k
+from search_engine.question_search_engine import QuestionSearchEngine
+
+
+def measure(search_engine: QuestionSearchEngine, queries: Sequence[str],
+            top_n: int) -> Tuple[List[List[Tuple[float, str]]], np.ndarray]:
+    """Find similar questions for each query, measuring latency of each query in milliseconds."""
+    results, latencies = [], []
+    for query in queries:
+        start_time = time.perf_counter()
+        results.append(search_engine.most_similar(query, n=top_n))
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    return results, np.asarray(latencies)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recall@k and latency of approximate search against exact search')
+    parser.add_argument('--num-questions', type=int, default=200000, help='number of questions in corpus')
+    parser.add_argument('--num-queries', type=int, default=500, help='number of queries')
+    parser.add_argument('--top-n', type=int, default=10, help='number of similar questions per query (k)')
+    parser.add_argument('--num-clusters', type=int, default=None, help='number of clusters (default: sqrt(N))')
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64],
+                        help='numbers of probed clusters')
+    args = parser.parse_args()
+
+    corpus = generate_questions(args.num_questions)
+    # queries are corpus questions without their first word, like slightly rephrased existing questions
+    random_generator = np.random.RandomState(1)
+    queries = [' '.join(corpus[idx].split()[1:]) or corpus[idx]
+               for idx in random_generator.choice(args.num_questions, args.num_queries, replace=False)]
+
+    with tempfile.TemporaryDirectory() as work_dir_path:
+        start_time = time.perf_counter()
+        search_engine = build_search_engine(corpus, work_dir_path, approximate=True)
+        build_time = time.perf_counter() - start_time
+        if args.num_clusters is not None:
+            search_engine._ivf_index = search_engine._ivf_index.build(search_engine._tf_idf_vectorizer.questions,
+                                                                      num_of_clusters=args.num_clusters)
+        # exact search engine shares fitted vectorizer
+        exact_search_engine = QuestionSearchEngine(corpus, fit_vectorizer=False,
+                                                   tf_idf_vectorizer=search_engine._tf_idf_vectorizer,
+                                                   result_cache_size=0)
+
+        exact_results, exact_latencies = measure(exact_search_engine, queries, args.top_n)
+
+        print(f'Corpus: {args.num_questions} questions, {search_engine._ivf_index.num_of_clusters} clusters, '
+              f'queries: {args.num_queries}, k: {args.top_n}, fit with clustering: {build_time:.1f} s\n')
+        print(f'{"mode":>12} {"recall@k":>10} {"mean (ms)":>10} {"p50 (ms)":>10} {"p99 (ms)":>10} {"speedup":>8}')
+        print(f'{"exact":>12} {1.:>10.3f} {exact_latencies.mean():>10.3f} {np.percentile(exact_latencies, 50):>10.3f} '
+              f'{np.percentile(exact_latencies, 99):>10.3f} {1.:>7.1f}x')
+
+        for num_of_probes in args.probes:
+            search_engine.num_of_probes = num_of_probes
+            results, latencies = measure(search_engine, queries, args.top_n)
+            mode = f'probes={num_of_probes}'
+            print(f'{mode:>12} {recall_at_k(results, exact_results):>10.3f} {latencies.mean():>10.3f} '
+                  f'{np.percentile(latencies, 50):>10.3f} {np.percentile(latencies, 99):>10.3f} '
+                  f'{exact_latencies.mean() / latencies.mean():>7.1f}x')
@@ -0,0 +1,35 @@
+import time
+import argparse
+import tempfile
+
+from benchmarks.benchmark_utils import generate_questions, build_search_engine
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Throughput of most_similar against most_similar_batch')
+    parser.add_argument('--num-questions', type=int, default=100000, help='number of questions in corpus')
+    parser.add_argument('--num-queries', type=int, default=2000, help='number of queries')
+    parser.add_argument('--top-n', type=int, default=5, help='number of similar questions per query')
+    args = parser.parse_args()
+
+    corpus = generate_questions(args.num_questions)
+    queries = generate_questions(args.num_queries, seed=1)
+
+    with tempfile.TemporaryDirectory() as work_dir_path:
+        search_engine = build_search_engine(corpus, work_dir_path)
+
+        start_time = time.perf_counter()
+        single_results = [search_engine.most_similar(query, n=args.top_n) for query in queries]
+        single_time = time.perf_counter() - start_time
+
+        print(f'Corpus: {args.num_questions} questions, queries: {args.num_queries}, top n: {args.top_n}\n')
+        print(f'{"mode":>24} {"queries/sec":>12}')
+        print(f'{"most_similar":>24} {args.num_queries / single_time:>12.1f}')
+
+        for batch_size in [None, 16, 64, 256]:
+            start_time = time.perf_counter()
+            batch_results = search_engine.most_similar_batch(queries, n=args.top_n, batch_size=batch_size)
+            batch_time = time.perf_counter() - start_time
+
+            mode = f'most_similar_batch ({batch_size or "auto"})'
+            print(f'{mode:>24} {args.num_queries / batch_time:>12.1f}')
@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import numpy as np
+from typing import *
+
+from benchmarks.benchmark_utils import generate_questions, build_vectorizer
+from search_engine.question_search_engine import QuestionSearchEngine
+
+# file that peak resident set size (VmHWM) of the process is reset through, on Linux
+CLEAR_REFS_PATH = '/proc/self/clear_refs'
+STATUS_PATH = '/proc/self/status'
+# relative change of a metric against baseline that is reported as regression by default
+REGRESSION_TOLERANCE = 0.1
+# metrics compared against baseline - larger value of each of them is worse, and smaller absolute increase of it
+# is considered noise (e.g. for stages that take a few milliseconds)
+COMPARED_METRICS = {'wall_time': 0.01, 'peak_rss_mb': 1.}
+
+
+def reset_peak_rss() -> bool:
+    """Reset peak resident set size of the process, so that peak of the next stage can be measured.
+
+    Returns:
+        True if peak is reset. False if it is not supported, in which case peak of the whole process is measured.
+    """
+    try:
+        with open(CLEAR_REFS_PATH, 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of the process since the last reset, in megabytes.
+
+    Returns:
+        Peak resident set size
+    """
+    try:
+        with open(STATUS_PATH, 'r') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / 1024 ** 2 if sys.platform == 'darwin' else max_rss / 1024
+
+
+def measure(stage: Callable[[], Any], num_of_items: int, repeats: int = 1) -> Tuple[Dict[str, float], Any]:
+    """Measure wall time, peak resident set size and throughput of stage.
+
+    Args:
+        stage: function that runs the stage
+        num_of_items: number of items (questions or queries) processed by the stage
+        repeats: number of runs, the fastest one is reported
+
+    Returns:
+        Pair of measured metrics and result of the last run
+    """
+    wall_times = []
+    reset_peak_rss()
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        result = stage()
+        wall_times.append(time.perf_counter() - start_time)
+
+    wall_time = min(wall_times)
+    return {'wall_time': wall_time, 'peak_rss_mb': peak_rss_mb(),
+            'items_per_second': num_of_items / max(wall_time, 1e-9)}, result
+
+
+def run_suite(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run all stages on synthetic corpus.
+
+    Args:
+        args: configuration of the suite
+
+    Returns:
+        Configuration, environment and metrics of each stage
+    """
+    corpus = generate_questions(args.num_questions, num_of_words=args.num_words, question_length=args.question_length,
+                                zipf_skew=args.zipf_skew, stack_overflow_like=True)
+    queries = generate_questions(args.num_queries, num_of_words=args.num_words,
+                                 question_length=args.question_length, zipf_skew=args.zipf_skew, seed=1,
+                                 stack_overflow_like=True)
+    stages = {}
+
+    with tempfile.TemporaryDirectory() as work_dir_path:
+        def create_vectorizer():
+            return build_vectorizer(work_dir_path, use_cache=True)
+
+        stages['fit'], _ = measure(lambda: create_vectorizer().fit(corpus, n_jobs=args.n_jobs), len(corpus),
+                                   args.repeats)
+
+        def load():
+            tf_idf_vectorizer = create_vectorizer()
+            tf_idf_vectorizer.load()
+            return tf_idf_vectorizer
+
+        stages['load'], tf_idf_vectorizer = measure(load, len(corpus), args.repeats)
+        stages['transform'], _ = measure(lambda: tf_idf_vectorizer.transform(queries, sparse=True), len(queries),
+                                         args.repeats)
+
+        search_engine = QuestionSearchEngine(corpus, fit_vectorizer=False, tf_idf_vectorizer=tf_idf_vectorizer,
+                                             result_cache_size=0)
+        search_engine.load()
+
+        def most_similar():
+            latencies = []
+            for query in queries:
+                start_time = time.perf_counter()
+                search_engine.most_similar(query, n=args.top_n)
+                latencies.append(time.perf_counter() - start_time)
+            return latencies
+
+        stages['most_similar'], latencies = measure(most_similar, len(queries), args.repeats)
+        stages['most_similar']['p50_ms'], stages['most_similar']['p99_ms'] = \
+            (np.percentile(latencies, [50, 99]) * 1000).tolist()
+        stages['most_similar_batch'], _ = measure(lambda: search_engine.most_similar_batch(queries, n=args.top_n),
+                                                  len(queries), args.repeats)
+
+    return {
+        'config': {'num_questions': args.num_questions, 'num_queries': args.num_queries, 'num_words': args.num_words,
+                   'question_length': args.question_length, 'zipf_skew': args.zipf_skew, 'top_n': args.top_n,
+                   'n_jobs': args.n_jobs, 'repeats': args.repeats},
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                        'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+        'stages': stages
+    }
+
+
+def compare_with_baseline(results: Dict[str, Any], baseline: Dict[str, Any],
+                          tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    """Compare metrics of each stage with baseline.
+
+    Args:
+        results: results of the suite
+        baseline: results of the suite stored as baseline
+        tolerance: relative increase of metric that is reported as regression, if it is also larger than noise
+
+    Returns:
+        The list of descriptions of regressions
+    """
+    if results['config'] != baseline['config']:
+        print('Warning: configuration differs from baseline, comparison is not reliable')
+
+    regressions = []
+    print(f'\n{"stage":>20} {"metric":>12} {"baseline":>12} {"current":>12} {"change":>8}')
+    for stage, metrics in results['stages'].items():
+        for metric, noise in COMPARED_METRICS.items():
+            baseline_value = baseline['stages'].get(stage, {}).get(metric)
+            if not baseline_value:
+                continue
+            change = metrics[metric] / baseline_value - 1
+            is_regression = change > tolerance and metrics[metric] - baseline_value > noise
+            print(f'{stage:>20} {metric:>12} {baseline_value:>12.3f} {metrics[metric]:>12.3f} {change:>+8.1%}'
+                  f'{"  REGRESSION" if is_regression else ""}')
+            if is_regression:
+                regressions.append(f'{stage} {metric} increased by {change:.1%}')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Wall time, peak RSS and throughput of fit, load, transform and '
+                                                 'most_similar on synthetic StackOverflow-like corpus')
+    parser.add_argument('--num-questions', type=int, default=200000, help='number of questions in corpus')
+    parser.add_argument('--num-queries', type=int, default=1000, help='number of queries')
+    parser.add_argument('--num-words', type=int, default=20000, help='number of distinct words in corpus')
+    parser.add_argument('--question-length', type=int, default=8, help='average number of words in question')
+    parser.add_argument('--zipf-skew', type=float, default=1.1, help='exponent of Zipf distribution of words')
+    parser.add_argument('--top-n', type=int, default=5, help='number of similar questions per query')
+    parser.add_argument('--n-jobs', type=int, default=1, help='number of processes that fit vectorizer')
+    parser.add_argument('--repeats', type=int, default=1, help='number of runs of each stage (the fastest counts)')
+    parser.add_argument('--output', help='path to JSON file where results are written')
+    parser.add_argument('--baseline', help='path to JSON file with results that are compared against')
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE,
+                        help='relative increase of wall time or peak RSS reported as regression')
+    args = parser.parse_args()
+
+    results = run_suite(args)
+
+    print(f'\nCorpus: {args.num_questions} questions, queries: {args.num_queries}, words: {args.num_words}, '
+          f'Zipf skew: {args.zipf_skew}\n')
+    print(f'{"stage":>20} {"wall time s":>12} {"peak RSS MB":>12} {"items/sec":>12}')
+    for stage, metrics in results['stages'].items():
+        print(f'{stage:>20} {metrics["wall_time"]:>12.3f} {metrics["peak_rss_mb"]:>12.1f} '
+              f'{metrics["items_per_second"]:>12.1f}')
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            regressions = compare_with_baseline(results, json.load(file), args.tolerance)
+        if regressions:
+            print(f'\n{len(regressions)} regressions: {"; ".join(regressions)}')
+            sys.exit(1)
@@ -0,0 +1,90 @@
+import os
+import numpy as np
+from typing import *
+from collections import Counter
+
+from search_engine.question_search_engine import QuestionSearchEngine
+from search_engine.vectorizer.tf_idf_vectorizer import TfIdfVectorizer
+
+
+# openings and endings of StackOverflow question titles
+QUESTION_OPENINGS = ['How do I', 'How to', 'Why does', 'What is the difference between', 'Error when using',
+                     'Is it possible to', 'Best way to', 'Cannot']
+QUESTION_ENDINGS = ['?', '?', ' not working', ' in Python?', ' in Java?', ' with JavaScript', ' - exception']
+
+
+def generate_questions(num_of_questions: int, num_of_words: int = 20000, question_length: int = 8,
+                       zipf_skew: float = 1.1, seed: int = 0, stack_overflow_like: bool = False) -> List[str]:
+    """Generate synthetic question corpus with Zipf distributed word frequencies.
+
+    Args:
+        num_of_questions: number of questions in corpus
+        num_of_words: number of distinct words that questions are made of
+        question_length: average number of words in question
+        zipf_skew: exponent of Zipf distribution of word frequencies
+        seed: seed of random generator
+        stack_overflow_like: flag that indicates should generated words be wrapped into common openings and
+                             endings of StackOverflow question titles (e.g. "How do I ... in Python?")
+
+    Returns:
+        List of synthetic questions
+    """
+    random_generator = np.random.RandomState(seed)
+    words = np.asarray([f'w{chr(97 + idx % 26)}{idx}'.translate(str.maketrans('0123456789', 'abcdefghij'))
+                        for idx in range(num_of_words)])
+
+    ranks = np.arange(1, num_of_words + 1, dtype=np.float64)
+    probabilities = ranks ** -zipf_skew
+    probabilities /= probabilities.sum()
+
+    lengths = np.maximum(1, random_generator.poisson(question_length, num_of_questions))
+    question_words = words[random_generator.choice(num_of_words, lengths.sum(), p=probabilities)]
+    bounds = np.concatenate(([0], np.cumsum(lengths)))
+    questions = [' '.join(question_words[start:end]) for start, end in zip(bounds[:-1], bounds[1:])]
+    if not stack_overflow_like:
+        return questions
+
+    openings = random_generator.choice(QUESTION_OPENINGS, num_of_questions)
+    endings = random_generator.choice(QUESTION_ENDINGS, num_of_questions)
+    return [f'{opening} {question}{ending}' for opening, question, ending in zip(openings, questions, endings)]
+
+
+def build_vectorizer(work_dir_path: str, use_cache: bool = False, **kwargs: Any) -> TfIdfVectorizer:
+    """Create vectorizer whose model files are stored inside given working directory.
+
+    Args:
+        work_dir_path: path to the directory for model files
+        use_cache: flag that indicates should vectorized question corpus be stored inside the working directory
+        kwargs: additional arguments of vectorizer
+
+    Returns:
+        Vectorizer that is not fitted yet
+    """
+    return TfIdfVectorizer(use_cache=use_cache, cache_path=os.path.join(work_dir_path, 'index'),
+                           query_encoder_path=os.path.join(work_dir_path, 'query_encoder'), **kwargs)
+
+
+def build_search_engine(questions: Sequence[str], work_dir_path: str, **kwargs: Any) -> QuestionSearchEngine:
+    """Build search engine whose model files are stored inside given working directory. Result cache is disabled,
+    so that repeated queries are measured as well.
+
+    Args:
+        questions: sequence of raw question corpus
+        work_dir_path: path to the directory for model files
+        kwargs: additional arguments of search engine
+
+    Returns:
+        Search engine fitted on given questions
+    """
+    kwargs.setdefault('result_cache_size', 0)
+    return QuestionSearchEngine(questions, fit_vectorizer=True, tf_idf_vectorizer=build_vectorizer(work_dir_path),
+                                **kwargs)
+
+
+def recall_at_k(results: List[List[Tuple[float, str]]], exact_results: List[List[Tuple[float, str]]]) -> float:
+    """Average ratio of exact top k questions that are found by approximate search. Corpus can contain equal
+    questions, so questions are compared as multisets."""
+    recalls = [sum((Counter(question for _, question in result) &
+                    Counter(question for _, question in exact_result)).values()) / len(exact_result)
+               for result, exact_result in zip(results, exact_results) if exact_result]
+    return float(np.mean(recalls)) if recalls else 1.
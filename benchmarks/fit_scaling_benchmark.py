@@ -0,0 +1,28 @@
+import os
+import time
+import argparse
+import tempfile
+
+from benchmarks.benchmark_utils import generate_questions, build_vectorizer
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scaling of TfIdfVectorizer.fit with number of processes')
+    parser.add_argument('--num-questions', type=int, default=1000000, help='number of questions in corpus')
+    parser.add_argument('--n-jobs', type=int, nargs='+', default=[1, 2, 4, 8, 16], help='numbers of processes')
+    args = parser.parse_args()
+
+    corpus = generate_questions(args.num_questions)
+
+    print(f'Corpus: {args.num_questions} questions, CPU cores: {os.cpu_count()}\n')
+    print(f'{"n_jobs":>8} {"fit time (s)":>14} {"speedup":>10}')
+    single_process_time = None
+    with tempfile.TemporaryDirectory() as work_dir_path:
+        for n_jobs in args.n_jobs:
+            vectorizer = build_vectorizer(work_dir_path)
+            start_time = time.perf_counter()
+            vectorizer.fit(corpus, n_jobs=n_jobs)
+            fit_time = time.perf_counter() - start_time
+
+            single_process_time = single_process_time or fit_time
+            print(f'{n_jobs:>8} {fit_time:>14.2f} {single_process_time / fit_time:>9.2f}x')
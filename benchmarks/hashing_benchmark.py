@@ -0,0 +1,97 @@
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from typing import *
+
+from constants import VOCABULARY_SIZE
+from benchmarks.benchmark_utils import generate_questions, build_vectorizer, recall_at_k
+from search_engine.question_search_engine import QuestionSearchEngine
+from search_engine.vectorizer.query_encoder import hash_tokens
+
+
+def directory_size(path: str) -> int:
+    """Calculate size of all files in directory in bytes."""
+    return sum(os.path.getsize(os.path.join(path, file_name)) for file_name in os.listdir(path))
+
+
+def fit_search_engine(corpus: Sequence[str], work_dir_path: str, vocabulary_size: Optional[int] = None,
+                      num_of_hashed_features: Optional[int] = None) -> Tuple[QuestionSearchEngine, float, int]:
+    """Fit search engine in vocabulary or hashing mode.
+
+    Args:
+        corpus: sequence of raw question corpus
+        work_dir_path: path to the directory for query encoder
+        vocabulary_size: size of vocabulary in vocabulary mode
+        num_of_hashed_features: number of features in hashing mode
+
+    Returns:
+        Triple of search engine, fit time in seconds and size of query encoder in bytes
+    """
+    os.makedirs(work_dir_path)
+    tf_idf_vectorizer = build_vectorizer(work_dir_path, num_of_hashed_features=num_of_hashed_features)
+    if vocabulary_size is not None:
+        tf_idf_vectorizer._vocabulary_size = vocabulary_size
+    start_time = time.perf_counter()
+    search_engine = QuestionSearchEngine(corpus, fit_vectorizer=True, tf_idf_vectorizer=tf_idf_vectorizer,
+                                         result_cache_size=0)
+    fit_time = time.perf_counter() - start_time
+    return search_engine, fit_time, directory_size(tf_idf_vectorizer._query_encoder_path)
+
+
+def measure(search_engine: QuestionSearchEngine, queries: Sequence[str],
+            top_n: int) -> Tuple[List[List[Tuple[float, str]]], float]:
+    """Find similar questions for each query, measuring mean latency in milliseconds."""
+    start_time = time.perf_counter()
+    results = [search_engine.most_similar(query, n=top_n) for query in queries]
+    return results, (time.perf_counter() - start_time) / len(queries) * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Collision rate and ranking quality of hashing mode against '
+                                                 'vocabulary mode of Tf-Idf vectorizer')
+    parser.add_argument('--num-questions', type=int, default=200000, help='number of questions in corpus')
+    parser.add_argument('--num-words', type=int, default=50000, help='number of distinct words in corpus')
+    parser.add_argument('--num-queries', type=int, default=500, help='number of queries')
+    parser.add_argument('--top-n', type=int, default=10, help='number of similar questions per query (k)')
+    parser.add_argument('--num-features', type=int, nargs='+', default=[2 ** 12, 2 ** 14, 2 ** 16, 2 ** 18, 2 ** 20],
+                        help='numbers of hashed features')
+    args = parser.parse_args()
+
+    corpus = generate_questions(args.num_questions, num_of_words=args.num_words, stack_overflow_like=True)
+    # queries are corpus questions without their first word, like slightly rephrased existing questions
+    random_generator = np.random.RandomState(1)
+    queries = [' '.join(corpus[idx].split()[1:]) or corpus[idx]
+               for idx in random_generator.choice(args.num_questions, args.num_queries, replace=False)]
+
+    with tempfile.TemporaryDirectory() as work_dir_path:
+        # reference ranking uses vocabulary with all words from corpus, so no word is dropped or collides
+        reference_search_engine, _, _ = fit_search_engine(corpus, os.path.join(work_dir_path, 'reference'),
+                                                          vocabulary_size=args.num_words * 10)
+        tokens = list(reference_search_engine._tf_idf_vectorizer._vocabulary)
+        reference_results, _ = measure(reference_search_engine, queries, args.top_n)
+        del reference_search_engine
+
+        print(f'\nCorpus: {args.num_questions} questions, {len(tokens)} distinct tokens, '
+              f'queries: {args.num_queries}, k: {args.top_n}\n')
+        print(f'{"mode":>18} {"dropped":>8} {"collided":>9} {"recall@k":>9} {"fit s":>7} {"model KB":>9} '
+              f'{"query ms":>9}')
+
+        modes = [('vocabulary', VOCABULARY_SIZE, None)] + \
+            [(f'hashing {num_of_features}', None, num_of_features) for num_of_features in args.num_features]
+        for mode, vocabulary_size, num_of_features in modes:
+            search_engine, fit_time, model_size = fit_search_engine(
+                corpus, os.path.join(work_dir_path, mode.replace(' ', '_')), vocabulary_size, num_of_features)
+            results, latency = measure(search_engine, queries, args.top_n)
+
+            # share of distinct tokens that are not in vocabulary, and share of those that share feature with others
+            if num_of_features is None:
+                dropped, collided = 1 - len(search_engine._tf_idf_vectorizer._vocabulary) / len(tokens), 0.
+            else:
+                feature_indices, _ = hash_tokens([tokens], num_of_features)
+                feature_counts = np.bincount(feature_indices, minlength=num_of_features)
+                dropped, collided = 0., float(np.mean(feature_counts[feature_indices] > 1))
+            print(f'{mode:>18} {dropped:>8.1%} {collided:>9.1%} {recall_at_k(results, reference_results):>9.3f} '
+                  f'{fit_time:>7.2f} {model_size / 1024:>9.1f} {latency:>9.3f}')
+            del search_engine
@@ -0,0 +1,84 @@
+import time
+import timeit
+import argparse
+import tempfile
+import numpy as np
+
+from benchmarks.benchmark_utils import generate_questions, build_search_engine
+from search_engine.instrumentation.metrics import CProfileSampler, metrics
+
+TIMER_CALLS = 1000000
+STAGES = ['preprocess', 'transform', 'score', 'select', 'corpus_lookup']
+
+
+def timer_overhead_ns() -> float:
+    """Measure cost of one timed empty stage in nanoseconds.
+
+    Returns:
+        Cost of entering and exiting timer
+    """
+    def timed_stage():
+        with metrics.timer('empty'):
+            pass
+
+    return min(timeit.repeat(timed_stage, number=TIMER_CALLS, repeat=3)) / TIMER_CALLS * 1e9
+
+
+def query_latency_ms(search_engine, queries, n: int) -> float:
+    """Measure median latency of most_similar in milliseconds.
+
+    Args:
+        search_engine: search engine that is queried
+        queries: raw queries
+        n: number of similar questions per query
+
+    Returns:
+        Median latency
+    """
+    latencies = []
+    for query in queries:
+        start_time = time.perf_counter()
+        search_engine.most_similar(query, n=n)
+        latencies.append(time.perf_counter() - start_time)
+    return float(np.median(latencies)) * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Overhead of instrumentation and time spent in each search stage')
+    parser.add_argument('--num-questions', type=int, default=100000, help='number of questions in corpus')
+    parser.add_argument('--num-queries', type=int, default=1000, help='number of queries')
+    parser.add_argument('--top-n', type=int, default=5, help='number of similar questions per query')
+    parser.add_argument('--profile', action='store_true', help='profile every 100th run of each stage with cProfile')
+    args = parser.parse_args()
+
+    corpus = generate_questions(args.num_questions)
+    queries = generate_questions(args.num_queries, seed=1)
+
+    with tempfile.TemporaryDirectory() as work_dir_path:
+        search_engine = build_search_engine(corpus, work_dir_path)
+        search_engine.most_similar(queries[0], n=args.top_n)
+
+        print(f'Corpus: {args.num_questions} questions, queries: {args.num_queries}, top n: {args.top_n}\n')
+        print(f'{"instrumentation":>16} {"timer ns":>10} {"p50 query ms":>14}')
+        for enabled in [False, True]:
+            metrics.enabled = enabled
+            metrics.reset()
+            overhead = timer_overhead_ns()
+            metrics.reset()
+            if enabled and args.profile:
+                sampler = CProfileSampler()
+                metrics.set_profiler(sampler)
+            latency = query_latency_ms(search_engine, queries, args.top_n)
+            print(f'{"enabled" if enabled else "disabled":>16} {overhead:>10.1f} {latency:>14.3f}')
+
+        print(f'\n{"stage":>14} {"mean ms":>10} {"p99 ms <=":>10} {"share":>8}')
+        total_time = sum(metrics.histogram(stage).sum for stage in STAGES)
+        for stage in STAGES:
+            histogram = metrics.histogram(stage)
+            print(f'{stage:>14} {histogram.sum / histogram.count * 1000:>10.3f} '
+                  f'{histogram.quantile(0.99) * 1000:>10.3f} {histogram.sum / total_time:>8.1%}')
+
+        if args.profile:
+            for stage in sampler.stages:
+                print(f'\nProfile of stage {stage}:')
+                sampler.stats(stage).sort_stats('cumulative').print_stats(5)
@@ -0,0 +1,111 @@
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from typing import *
+
+from benchmarks.benchmark_utils import generate_questions, build_vectorizer
+from search_engine.index.csr_matrix import CsrMatrix
+from search_engine.index.inverted_index import InvertedIndex
+from search_engine.similarity_scorer.near_duplicates import find_near_duplicates, load_near_duplicates
+from search_engine.similarity_scorer.similarity_metrics import sparse_cosine_similarity
+
+# number of sampled questions scored against whole corpus at once
+BRUTE_FORCE_CHUNK_SIZE = 16
+
+
+def plant_near_duplicates(questions: List[str], ratio: float, seed: int = 1) -> List[str]:
+    """Append copies of randomly chosen questions with one of their words replaced by a word of another question.
+
+    Args:
+        questions: list of questions
+        ratio: number of copies relative to number of questions
+        seed: seed of random generator
+
+    Returns:
+        List of questions followed by their near-duplicates
+    """
+    random_generator = np.random.RandomState(seed)
+    copies = []
+    for idx in random_generator.choice(len(questions), int(len(questions) * ratio)).tolist():
+        words = questions[idx].split()
+        other_words = questions[random_generator.randint(len(questions))].split()
+        words[random_generator.randint(len(words))] = other_words[random_generator.randint(len(other_words))]
+        copies.append(' '.join(words))
+    return questions + copies
+
+
+def brute_force_pairs(questions: CsrMatrix, inverted_index: InvertedIndex, sample: np.ndarray,
+                      threshold: float) -> Tuple[Set[Tuple[int, int]], float]:
+    """Find near-duplicates of sampled questions by scoring each of them against all questions, the way it is done
+    with most_similar.
+
+    Args:
+        questions: vectorized question corpus
+        inverted_index: inverted index over vectorized question corpus
+        sample: indices of sampled questions
+        threshold: minimal cosine similarity of near-duplicate questions
+
+    Returns:
+        Pair of set of found pairs (the lower question index first) and time in seconds
+    """
+    pairs, elapsed_time = set(), 0.
+    # questions are scored in small chunks, since each of them has nonzero score with a large part of corpus
+    for chunk in np.array_split(sample, max(1, sample.shape[0] // BRUTE_FORCE_CHUNK_SIZE)):
+        start_time = time.perf_counter()
+        query_indices, question_indices, scores = sparse_cosine_similarity(questions.take_rows(chunk), inverted_index)
+        elapsed_time += time.perf_counter() - start_time
+        sampled_indices = chunk[query_indices]
+        is_pair = (scores >= threshold) & (question_indices != sampled_indices)
+        pairs.update(zip(np.minimum(sampled_indices, question_indices)[is_pair].tolist(),
+                         np.maximum(sampled_indices, question_indices)[is_pair].tolist()))
+    return pairs, elapsed_time
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runtime of near-duplicate self-join against scoring each question '
+                                                 'against whole corpus')
+    parser.add_argument('--num-questions', type=int, nargs='+', default=[100000, 1000000],
+                        help='numbers of questions in corpus')
+    parser.add_argument('--threshold', type=float, default=0.8, help='minimal cosine similarity of near-duplicates')
+    parser.add_argument('--duplicate-ratio', type=float, default=0.05,
+                        help='number of planted near-duplicates relative to number of questions')
+    parser.add_argument('--num-features', type=int, default=None,
+                        help='number of hashed features, which are used instead of vocabulary if it is given')
+    parser.add_argument('--num-jobs', type=int, default=os.cpu_count() or 1, help='number of processes')
+    parser.add_argument('--sample-size', type=int, default=1000,
+                        help='number of questions scored against whole corpus for brute force estimate')
+    args = parser.parse_args()
+
+    features = 'vocabulary' if args.num_features is None else f'{args.num_features} hashed features'
+    print(f'\nThreshold: {args.threshold}, processes: {args.num_jobs}, {features}\n')
+    print(f'{"questions":>10} {"join s":>8} {"questions/s":>12} {"candidates/q":>13} {"verified/q":>11} '
+          f'{"pairs":>9} {"brute force s":>14} {"recall":>7}')
+    for num_of_questions in args.num_questions:
+        corpus = plant_near_duplicates(generate_questions(int(num_of_questions / (1 + args.duplicate_ratio)),
+                                                          stack_overflow_like=True), args.duplicate_ratio)
+        with tempfile.TemporaryDirectory() as work_dir_path:
+            tf_idf_vectorizer = build_vectorizer(work_dir_path, num_of_hashed_features=args.num_features)
+            tf_idf_vectorizer.fit(corpus)
+            del corpus
+            questions = tf_idf_vectorizer.questions
+
+            output_path = os.path.join(work_dir_path, 'near_duplicates.bin')
+            stats = find_near_duplicates(questions, args.threshold, output_path, n_jobs=args.num_jobs)
+
+            # brute force time is extrapolated from sampled questions, and their pairs have to be found by join
+            sample = np.sort(np.random.RandomState(2).choice(questions.shape[0], args.sample_size, replace=False))
+            expected_pairs, sample_time = brute_force_pairs(questions, tf_idf_vectorizer.inverted_index, sample,
+                                                            args.threshold)
+            pairs = load_near_duplicates(output_path)
+            is_sampled = np.isin(pairs['first'], sample) | np.isin(pairs['second'], sample)
+            found_pairs = set(zip(pairs['first'][is_sampled].tolist(), pairs['second'][is_sampled].tolist()))
+            recall = len(expected_pairs & found_pairs) / len(expected_pairs) if expected_pairs else 1.
+            del pairs
+
+        brute_force_time = sample_time / args.sample_size * stats.num_of_questions
+        print(f'{stats.num_of_questions:>10} {stats.elapsed_time:>8.1f} {stats.questions_per_second:>12.0f} '
+              f'{stats.num_of_candidates / stats.num_of_questions:>13.1f} '
+              f'{stats.num_of_verified_pairs / stats.num_of_questions:>11.1f} {stats.num_of_pairs:>9} '
+              f'{brute_force_time:>14.1f} {recall:>7.3f}')
@@ -0,0 +1,56 @@
+import re
+import timeit
+from typing import *
+
+from benchmarks.benchmark_utils import generate_questions
+from search_engine.vectorizer.preprocessor import QuestionPreprocessor
+
+
+NUM_OF_QUESTIONS = 200000
+NUM_OF_DISTINCT_QUERIES = 1000
+REPEAT = 3
+
+
+def legacy_preprocess(questions: Sequence[str]) -> List[List[str]]:
+    """Previous QuestionPreprocessor.preprocess: regex compiled for each question and separate passes."""
+    preprocessed_questions = []
+    for question in questions:
+        question = re.compile('[^a-zA-Z ]+').sub('', question)
+        question = question.lower()
+        tokens = question.split()
+        tokens = [token for token in tokens if len(token) > 1 or len(token) == 1 and token == 'c']
+        preprocessed_questions.append(tokens)
+    return preprocessed_questions
+
+
+def count_tokens(questions: Iterable[List[str]]) -> int:
+    """Consume preprocessed questions, counting their tokens."""
+    return sum(map(len, questions))
+
+
+def measure(func: Callable[[], int]) -> Tuple[float, int]:
+    """Measure the best wall time of one call in seconds, together with number of produced tokens."""
+    num_of_tokens = func()
+    return min(timeit.repeat(func, number=1, repeat=REPEAT)), num_of_tokens
+
+
+if __name__ == '__main__':
+    questions = [f'How do I {question}, in C# or C++ (version {idx % 10})?'
+                 for idx, question in enumerate(generate_questions(NUM_OF_QUESTIONS))]
+    queries = questions[:NUM_OF_DISTINCT_QUERIES] * (NUM_OF_QUESTIONS // NUM_OF_DISTINCT_QUERIES)
+    preprocessor = QuestionPreprocessor()
+    assert legacy_preprocess(questions) == preprocessor.preprocess(questions)
+
+    cases = [
+        ('legacy preprocess', lambda: count_tokens(legacy_preprocess(questions))),
+        ('preprocess', lambda: count_tokens(preprocessor.preprocess(questions))),
+        ('preprocess_iter', lambda: count_tokens(preprocessor.preprocess_iter(questions))),
+        ('legacy repeated queries', lambda: count_tokens(legacy_preprocess(queries))),
+        ('preprocess_query', lambda: count_tokens(map(preprocessor.preprocess_query, queries)))
+    ]
+
+    print(f'Preprocessing {NUM_OF_QUESTIONS} questions ({NUM_OF_DISTINCT_QUERIES} distinct ones for queries)\n')
+    print(f'{"implementation":>24} {"time (s)":>10} {"tokens/sec":>14}')
+    for name, func in cases:
+        elapsed_time, num_of_tokens = measure(func)
+        print(f'{name:>24} {elapsed_time:>10.3f} {num_of_tokens / elapsed_time:>14.0f}')
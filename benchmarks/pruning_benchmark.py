@@ -0,0 +1,69 @@
+import time
+import argparse
+import tempfile
+import numpy as np
+from typing import *
+
+from benchmarks.benchmark_utils import generate_questions, build_search_engine
+from search_engine.index.incremental_index import IncrementalIndex
+from search_engine.similarity_scorer.top_k_selection import select_top_k
+
+
+def measure(index: IncrementalIndex, query_vectors: Sequence[np.ndarray], top_n: int,
+            pruning: bool) -> Tuple[List[Tuple[np.ndarray, np.ndarray]], float, float]:
+    """Score questions and select top n for each query, with or without MaxScore pruning.
+
+    Args:
+        index: index over vectorized question corpus
+        query_vectors: Tf-Idf vector representation of each query
+        top_n: number of similar questions per query
+        pruning: flag that indicates should questions that can not be among top n be skipped
+
+    Returns:
+        Triple of top n question indices and scores for each query, mean number of scored questions per query and
+        mean latency in milliseconds
+    """
+    results, num_of_scored = [], 0
+    start_time = time.perf_counter()
+    for query_vector in query_vectors:
+        question_indices, scores = index.score(query_vector, top_n if pruning else None)
+        top_positions = select_top_k(scores, top_n)
+        results.append((question_indices[top_positions], scores[top_positions]))
+        num_of_scored += question_indices.shape[0]
+    latency = (time.perf_counter() - start_time) / len(query_vectors) * 1000
+    return results, num_of_scored / len(query_vectors), latency
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Questions scored per query and latency of exhaustive scoring '
+                                                 'against MaxScore pruning')
+    parser.add_argument('--num-questions', type=int, default=500000, help='number of questions in corpus')
+    parser.add_argument('--num-queries', type=int, default=500, help='number of queries')
+    parser.add_argument('--top-n', type=int, nargs='+', default=[1, 5, 10, 50],
+                        help='numbers of similar questions per query')
+    args = parser.parse_args()
+
+    # questions wrapped into common openings and endings, so that queries contain very common words, and queries are
+    # corpus questions without their first word, like slightly rephrased existing questions
+    corpus = generate_questions(args.num_questions, stack_overflow_like=True)
+    random_generator = np.random.RandomState(1)
+    queries = [' '.join(corpus[idx].split()[1:]) or corpus[idx]
+               for idx in random_generator.choice(args.num_questions, args.num_queries, replace=False)]
+
+    with tempfile.TemporaryDirectory() as work_dir_path:
+        search_engine = build_search_engine(corpus, work_dir_path)
+        index = search_engine._get_index()
+        query_vectors = list(search_engine._tf_idf_vectorizer.transform(queries))
+
+        print(f'\nCorpus: {args.num_questions} questions, queries: {args.num_queries}\n')
+        print(f'{"top n":>6} {"scored (exhaustive)":>20} {"scored (pruned)":>16} {"exhaustive ms":>14} '
+              f'{"pruned ms":>10} {"identical":>10}')
+        for top_n in args.top_n:
+            exhaustive_results, exhaustive_scored, exhaustive_latency = measure(index, query_vectors, top_n, False)
+            pruned_results, pruned_scored, pruned_latency = measure(index, query_vectors, top_n, True)
+            identical = all(np.array_equal(exhaustive_indices, pruned_indices) and
+                            np.array_equal(exhaustive_scores, pruned_scores)
+                            for (exhaustive_indices, exhaustive_scores), (pruned_indices, pruned_scores)
+                            in zip(exhaustive_results, pruned_results))
+            print(f'{top_n:>6} {exhaustive_scored:>20.0f} {pruned_scored:>16.0f} {exhaustive_latency:>14.3f} '
+                  f'{pruned_latency:>10.3f} {str(identical):>10}')
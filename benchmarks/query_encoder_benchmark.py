@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+MODES = ['query encoder', 'vectorizer', 'search engine']
+
+
+def peak_rss_kb() -> int:
+    """Read peak resident set size of the current process. High water mark from /proc is used, since the one from
+    getrusage is inherited from the parent process through exec.
+
+    Returns:
+        Peak resident set size in kilobytes
+    """
+    with open('/proc/self/status', 'r') as file:
+        for line in file:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+    raise OSError('Peak resident set size is not available')
+
+
+def start_process(mode: str, work_dir_path: str) -> None:
+    """Load model in the given mode, encode (or search) one query and print startup time and peak RSS as JSON.
+    Runs in a fresh process, so that imports and memory of other modes are not measured.
+
+    Args:
+        mode: what is loaded - query encoder only, vectorizer with vectorized question corpus, or search engine
+        work_dir_path: path to the directory with model files
+
+    Returns:
+        no value
+    """
+    start_time = time.perf_counter()
+    if mode == 'query encoder':
+        from search_engine.vectorizer.query_encoder import QueryEncoder
+        QueryEncoder.load(os.path.join(work_dir_path, 'query_encoder')).encode(['How do I parse JSON in Python?'])
+    else:
+        from search_engine.question_search_engine import QuestionSearchEngine
+        from search_engine.vectorizer.tf_idf_vectorizer import TfIdfVectorizer
+        tf_idf_vectorizer = TfIdfVectorizer(cache_path=os.path.join(work_dir_path, 'tf-idf_index'),
+                                            query_encoder_path=os.path.join(work_dir_path, 'query_encoder'))
+        if mode == 'vectorizer':
+            tf_idf_vectorizer.load()
+            tf_idf_vectorizer.transform(['How do I parse JSON in Python?'])
+        else:
+            with open(os.path.join(work_dir_path, 'questions.json'), 'r') as file:
+                questions = json.load(file)
+            search_engine = QuestionSearchEngine(questions, fit_vectorizer=False, tf_idf_vectorizer=tf_idf_vectorizer)
+            search_engine.most_similar('How do I parse JSON in Python?')
+    startup_time = time.perf_counter() - start_time
+    print(json.dumps({'startup_time': startup_time, 'rss': peak_rss_kb()}))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Startup time and memory of process that only encodes queries '
+                                                 'against processes that load vectorized question corpus')
+    parser.add_argument('--num-questions', type=int, default=500000, help='number of questions in corpus')
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--work-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode is not None:
+        start_process(args.mode, args.work_dir)
+        sys.exit(0)
+
+    from benchmarks.benchmark_utils import generate_questions
+    from search_engine.vectorizer.tf_idf_vectorizer import TfIdfVectorizer
+
+    with tempfile.TemporaryDirectory() as work_dir_path:
+        corpus = generate_questions(args.num_questions, stack_overflow_like=True)
+        with open(os.path.join(work_dir_path, 'questions.json'), 'w') as file:
+            json.dump(corpus, file)
+        tf_idf_vectorizer = TfIdfVectorizer(cache_path=os.path.join(work_dir_path, 'tf-idf_index'),
+                                            query_encoder_path=os.path.join(work_dir_path, 'query_encoder'))
+        tf_idf_vectorizer.fit(corpus)
+
+        print(f'\nCorpus: {args.num_questions} questions\n')
+        print(f'{"loaded model":>16} {"startup ms":>11} {"peak RSS MB":>12}')
+        for mode in MODES:
+            output = subprocess.run([sys.executable, '-m', 'benchmarks.query_encoder_benchmark', '--mode', mode,
+                                     '--work-dir', work_dir_path], stdout=subprocess.PIPE, check=True,
+                                    universal_newlines=True).stdout
+            result = json.loads(output.splitlines()[-1])
+            print(f'{mode:>16} {result["startup_time"] * 1000:>11.1f} {result["rss"] / 1024:>12.1f}')
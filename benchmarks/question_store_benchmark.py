@@ -0,0 +1,62 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+
+from benchmarks.benchmark_utils import generate_questions
+from search_engine.corpus.corpus_loader import load_corpus
+from search_engine.corpus.question_store import QuestionStore
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Memory and loading time of question store against dictionary and '
+                                                 'list of question strings')
+    parser.add_argument('--num-questions', type=int, default=1000000, help='number of questions in corpus')
+    parser.add_argument('--top-n', type=int, default=5, help='number of questions decoded per query')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir_path:
+        corpus_path = os.path.join(work_dir_path, 'questions.json')
+        with open(corpus_path, 'w', encoding='utf-8') as file:
+            for question_id, question in enumerate(generate_questions(args.num_questions, stack_overflow_like=True)):
+                file.write(json.dumps({'id': question_id, 'question': question}) + '\n')
+
+        tracemalloc.start()
+        start_time = time.perf_counter()
+        data, _ = load_corpus(corpus_path)
+        corpus = list(data.keys())
+        dict_time = time.perf_counter() - start_time
+        dict_memory = tracemalloc.get_traced_memory()[0]
+        del data, corpus
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        start_time = time.perf_counter()
+        question_store, _ = QuestionStore.build(corpus_path)
+        store_time = time.perf_counter() - start_time
+        store_memory, store_peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        store_path = os.path.join(work_dir_path, 'store')
+        question_store.save(store_path)
+        start_time = time.perf_counter()
+        question_store = QuestionStore.load(store_path)
+        open_time = time.perf_counter() - start_time
+
+        random_generator = np.random.RandomState(0)
+        positions = random_generator.randint(len(question_store), size=(1000, args.top_n))
+        start_time = time.perf_counter()
+        for query_positions in positions:
+            results = [question_store[position] for position in query_positions]
+        decode_time = (time.perf_counter() - start_time) / len(positions)
+
+        print(f'\nCorpus: {args.num_questions} questions, distinct: {len(question_store)}\n')
+        print(f'{"corpus form":>24} {"memory MB":>10} {"load s":>8}')
+        print(f'{"dictionary and list":>24} {dict_memory / 1024 ** 2:>10.1f} {dict_time:>8.2f}')
+        print(f'{"question store":>24} {store_memory / 1024 ** 2:>10.1f} {store_time:>8.2f}')
+        print(f'{"memory mapped store":>24} {"-":>10} {open_time:>8.4f}')
+        print(f'\nPeak memory while building store: {store_peak_memory / 1024 ** 2:.1f} MB')
+        print(f'Decoding top {args.top_n} results: {decode_time * 1e6:.1f} us per query')
@@ -0,0 +1,93 @@
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import numpy as np
+from typing import *
+
+from benchmarks.benchmark_utils import generate_questions, build_search_engine
+from search_engine.service.search_service import SearchService
+
+
+async def run_client(host: str, port: int, queries: Sequence[str], n: int, latencies: List[float]) -> None:
+    """Send queries one after another over one kept alive connection, recording latency of each request.
+
+    Args:
+        host: host of the service
+        port: port of the service
+        queries: queries sent by the client
+        n: number of similar questions per query
+        latencies: list where request latencies in seconds are appended
+
+    Returns:
+        no value
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    for query in queries:
+        body = json.dumps({'query': query, 'n': n}).encode('utf-8')
+        start_time = time.perf_counter()
+        writer.write(f'POST /search HTTP/1.1\r\nHost: {host}\r\nContent-Length: {len(body)}\r\n\r\n'
+                     .encode('latin-1') + body)
+        head = await reader.readuntil(b'\r\n\r\n')
+        content_length = int(head.lower().split(b'content-length:')[1].split(b'\r\n')[0])
+        await reader.readexactly(content_length)
+        latencies.append(time.perf_counter() - start_time)
+    writer.close()
+
+
+async def run_load(search_engine: Any, queries: Sequence[str], num_of_clients: int, n: int, max_batch_size: int,
+                   max_wait_time: float) -> Tuple[float, List[float], float]:
+    """Start service and send queries from concurrent clients.
+
+    Args:
+        search_engine: search engine served by the service
+        queries: queries split among clients
+        num_of_clients: number of concurrent clients
+        n: number of similar questions per query
+        max_batch_size: maximal number of queries scored together
+        max_wait_time: maximal time in seconds that the first query of a batch waits for other queries
+
+    Returns:
+        Elapsed time in seconds, request latencies in seconds and average batch size
+    """
+    service = SearchService(search_engine, port=0, max_batch_size=max_batch_size, max_wait_time=max_wait_time)
+    await service.start()
+    latencies = []
+    start_time = time.perf_counter()
+    await asyncio.gather(*[run_client(service.host, service.port, queries[client::num_of_clients], n, latencies)
+                           for client in range(num_of_clients)])
+    elapsed_time = time.perf_counter() - start_time
+    mean_batch_size = service.batching_stats.mean_batch_size
+    await service.close()
+    return elapsed_time, latencies, mean_batch_size
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Throughput and latency of search service with micro-batching')
+    parser.add_argument('--num-questions', type=int, default=100000, help='number of questions in corpus')
+    parser.add_argument('--num-queries', type=int, default=4000, help='number of queries')
+    parser.add_argument('--num-clients', type=int, default=64, help='number of concurrent clients')
+    parser.add_argument('--top-n', type=int, default=5, help='number of similar questions per query')
+    parser.add_argument('--max-wait-time', type=float, default=0.002,
+                        help='maximal time in seconds that the first query of a batch waits for other queries')
+    args = parser.parse_args()
+
+    corpus = generate_questions(args.num_questions)
+    queries = generate_questions(args.num_queries, seed=1)
+
+    with tempfile.TemporaryDirectory() as work_dir_path:
+        search_engine = build_search_engine(corpus, work_dir_path)
+
+        print(f'Corpus: {args.num_questions} questions, queries: {args.num_queries}, '
+              f'clients: {args.num_clients}, top n: {args.top_n}\n')
+        print(f'{"max batch size":>16} {"mean batch":>11} {"queries/sec":>12} {"p50 ms":>8} {"p99 ms":>8}')
+        for max_batch_size in [1, 8, 32, 128]:
+            loop = asyncio.new_event_loop()
+            elapsed_time, latencies, mean_batch_size = loop.run_until_complete(
+                run_load(search_engine, queries, args.num_clients, args.top_n, max_batch_size, args.max_wait_time))
+            loop.close()
+
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+            print(f'{max_batch_size:>16} {mean_batch_size:>11.1f} {args.num_queries / elapsed_time:>12.1f} '
+                  f'{p50:>8.2f} {p99:>8.2f}')
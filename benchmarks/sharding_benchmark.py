@@ -0,0 +1,52 @@
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+
+from benchmarks.benchmark_utils import generate_questions, build_search_engine
+from search_engine.question_search_engine import QuestionSearchEngine
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Query latency of sharded index against number of shards')
+    parser.add_argument('--num-questions', type=int, default=10000000, help='number of questions in corpus')
+    parser.add_argument('--num-queries', type=int, default=500, help='number of queries')
+    parser.add_argument('--top-n', type=int, default=5, help='number of similar questions per query')
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8], help='numbers of shards')
+    args = parser.parse_args()
+
+    corpus = generate_questions(args.num_questions)
+    queries = generate_questions(args.num_queries, seed=1)
+
+    with tempfile.TemporaryDirectory() as work_dir_path:
+        fitted_search_engine = build_search_engine(corpus, work_dir_path)
+        tf_idf_vectorizer = fitted_search_engine._tf_idf_vectorizer
+        expected_results = None
+
+        print(f'Corpus: {args.num_questions} questions, queries: {args.num_queries}, top n: {args.top_n}, '
+              f'CPU cores: {os.cpu_count()}\n')
+        print(f'{"shards":>6} {"p50 ms":>8} {"p99 ms":>8} {"batch queries/sec":>18} {"identical":>10}')
+        for num_of_shards in args.shards:
+            search_engine = QuestionSearchEngine(corpus, fit_vectorizer=False, tf_idf_vectorizer=tf_idf_vectorizer,
+                                                 result_cache_size=0, num_of_shards=num_of_shards)
+            # workers of shards are started by the first query
+            search_engine.most_similar(queries[0], n=args.top_n)
+
+            latencies, results = [], []
+            for query in queries:
+                start_time = time.perf_counter()
+                results.append(search_engine.most_similar(query, n=args.top_n))
+                latencies.append(time.perf_counter() - start_time)
+
+            start_time = time.perf_counter()
+            batch_results = search_engine.most_similar_batch(queries, n=args.top_n)
+            batch_time = time.perf_counter() - start_time
+            search_engine.close()
+
+            if expected_results is None:
+                expected_results = results
+            identical = results == expected_results and batch_results == expected_results
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+            print(f'{num_of_shards:>6} {p50:>8.2f} {p99:>8.2f} {args.num_queries / batch_time:>18.1f} '
+                  f'{str(identical):>10}')
@@ -0,0 +1,105 @@
+import time
+import argparse
+import tempfile
+import numpy as np
+from typing import *
+
+from benchmarks.benchmark_utils import generate_questions, build_search_engine
+from search_engine.corpus.question_store import QuestionStore
+from search_engine.question_search_engine import QuestionSearchEngine
+from search_engine.similarity_scorer.top_k_selection import select_top_k
+
+
+def generate_tags(num_of_questions: int, selectivities: Sequence[float], seed: int = 1) -> List[List[str]]:
+    """Generate tags of questions, where each tag is given to the fraction of questions equal to its selectivity.
+
+    Args:
+        num_of_questions: number of questions
+        selectivities: fraction of questions with each tag
+        seed: seed of random generator
+
+    Returns:
+        Tags of each question
+    """
+    random_generator = np.random.RandomState(seed)
+    has_tags = random_generator.rand(num_of_questions, len(selectivities)) < np.asarray(selectivities)
+    tag_names = [f'tag-{selectivity}' for selectivity in selectivities]
+    return [[tag_names[position] for position in np.flatnonzero(question_tags).tolist()]
+            for question_tags in has_tags]
+
+
+def post_filter(search_engine: QuestionSearchEngine, query: str, tag: str, n: int) -> List[Tuple[float, str]]:
+    """Score all questions and keep top n of those with given tag, the way results were filtered before tags were
+    indexed.
+
+    Args:
+        search_engine: search engine over tagged questions
+        query: raw question
+        tag: tag that similar questions must have
+        n: number of similar questions that should be found
+
+    Returns:
+        The list of top n most similar questions with given tag and their similarity scores
+    """
+    index = search_engine._get_index()
+    vectorized_query = search_engine._tf_idf_vectorizer.transform([query])[0]
+    question_indices, scores = index.score(vectorized_query)
+    is_tagged = np.isin(question_indices, search_engine._corpus.tag_index.questions(tag))
+    question_indices, scores = question_indices[is_tagged], scores[is_tagged]
+    top_positions = select_top_k(scores, n)
+    return search_engine._build_result(question_indices[top_positions], scores[top_positions])
+
+
+def measure(search: Callable[[str], List[Tuple[float, str]]],
+            queries: Sequence[str]) -> Tuple[List[List[Tuple[float, str]]], float]:
+    """Search for similar questions of each query.
+
+    Args:
+        search: function that finds similar questions of a query
+        queries: raw questions
+
+    Returns:
+        Pair of results of each query and mean latency in milliseconds
+    """
+    start_time = time.perf_counter()
+    results = [search(query) for query in queries]
+    return results, (time.perf_counter() - start_time) / len(queries) * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Latency of tag-filtered search against scoring all questions and '
+                                                 'filtering their scores')
+    parser.add_argument('--num-questions', type=int, default=500000, help='number of questions in corpus')
+    parser.add_argument('--num-queries', type=int, default=200, help='number of queries')
+    parser.add_argument('--top-n', type=int, default=10, help='number of similar questions per query')
+    parser.add_argument('--selectivities', type=float, nargs='+', default=[0.0001, 0.001, 0.01, 0.1, 0.5],
+                        help='fractions of questions with filtered tag')
+    args = parser.parse_args()
+
+    corpus = generate_questions(args.num_questions, stack_overflow_like=True)
+    question_store = QuestionStore.from_questions(corpus, question_tags=generate_tags(args.num_questions,
+                                                                                      args.selectivities))
+    random_generator = np.random.RandomState(2)
+    queries = [' '.join(corpus[idx].split()[1:]) or corpus[idx]
+               for idx in random_generator.choice(args.num_questions, args.num_queries, replace=False)]
+    del corpus
+
+    with tempfile.TemporaryDirectory() as work_dir_path:
+        search_engine = build_search_engine(question_store, work_dir_path)
+        _, unfiltered_latency = measure(lambda query: search_engine.most_similar(query, n=args.top_n), queries)
+
+        print(f'\nCorpus: {args.num_questions} questions, queries: {args.num_queries}, top n: {args.top_n}, '
+              f'unfiltered search: {unfiltered_latency:.3f} ms\n')
+        print(f'{"selectivity":>12} {"tagged":>9} {"post-filter ms":>15} {"filtered ms":>12} {"speedup":>8} '
+              f'{"identical":>10}')
+        for selectivity in args.selectivities:
+            tag = f'tag-{selectivity}'
+            expected_results, post_filter_latency = measure(
+                lambda query: post_filter(search_engine, query, tag, args.top_n), queries)
+            results, filtered_latency = measure(
+                lambda query: search_engine.most_similar(query, n=args.top_n, all_tags=[tag]), queries)
+            identical = all([question for _, question in result] == [question for _, question in expected_result]
+                            for result, expected_result in zip(results, expected_results))
+            print(f'{selectivity:>12} {search_engine._corpus.tag_index.questions(tag).shape[0]:>9} '
+                  f'{post_filter_latency:>15.3f} {filtered_latency:>12.3f} '
+                  f'{post_filter_latency / filtered_latency:>8.1f} {str(identical):>10}')
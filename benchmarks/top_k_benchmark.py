@@ -0,0 +1,45 @@
+import timeit
+import numpy as np
+
+from search_engine.similarity_scorer.top_k_selection import select_top_k
+
+
+MATCH_COUNTS = [100, 1000, 10000, 100000, 1000000]
+TOP_N = 5
+REPEAT = 5
+
+
+def argsort_top_k(scores: np.ndarray, question_indices: np.ndarray, n: int) -> list:
+    """Previous selection from QuestionSearchEngine.most_similar: full argsort, rounding and Python sort."""
+    high_scores_indices = np.argsort(scores)[-n:]
+    top_scores = [np.round(score, 4) for score in np.take(scores, high_scores_indices)]
+    top_indices = np.take(question_indices, high_scores_indices)
+    return sorted(zip(top_scores, top_indices), key=lambda pair: pair[0], reverse=True)
+
+
+def partition_top_k(scores: np.ndarray, question_indices: np.ndarray, n: int) -> list:
+    """Selection with select_top_k, as used by QuestionSearchEngine.most_similar."""
+    top_positions = select_top_k(scores, n)
+    return list(zip(np.round(scores[top_positions], 4).tolist(), question_indices[top_positions]))
+
+
+def measure(func, scores: np.ndarray, question_indices: np.ndarray) -> float:
+    """Measure the best latency of one selection call in milliseconds."""
+    number = max(1, 100000 // scores.shape[0])
+    timings = timeit.repeat(lambda: func(scores, question_indices, TOP_N), number=number, repeat=REPEAT)
+    return min(timings) / number * 1000
+
+
+if __name__ == '__main__':
+    random_generator = np.random.RandomState(0)
+
+    print(f'Top {TOP_N} selection latency (ms) against number of matched questions\n')
+    print(f'{"matches":>10} {"argsort":>12} {"partition":>12} {"speedup":>10}')
+    for match_count in MATCH_COUNTS:
+        scores = random_generator.random_sample(match_count)
+        question_indices = np.sort(random_generator.choice(10 * match_count, match_count, replace=False))
+
+        argsort_latency = measure(argsort_top_k, scores, question_indices)
+        partition_latency = measure(partition_top_k, scores, question_indices)
+        print(f'{match_count:>10} {argsort_latency:>12.4f} {partition_latency:>12.4f} '
+              f'{argsort_latency / partition_latency:>9.1f}x')
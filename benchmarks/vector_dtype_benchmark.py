@@ -0,0 +1,62 @@
+import time
+import argparse
+import tempfile
+import numpy as np
+from typing import *
+from collections import Counter
+
+from benchmarks.benchmark_utils import generate_questions, build_vectorizer
+from search_engine.index.quantization import VECTOR_DTYPES
+from search_engine.question_search_engine import QuestionSearchEngine
+
+
+def index_size(search_engine: QuestionSearchEngine) -> int:
+    """Number of bytes occupied by vectorized corpus, inverted index and IDF vector."""
+    vectorizer = search_engine._tf_idf_vectorizer
+    question_scales = vectorizer.inverted_index.question_scales
+    return vectorizer.questions.nbytes + vectorizer.inverted_index.postings_matrix.nbytes + \
+        vectorizer.idf_vector.nbytes + (question_scales.nbytes if question_scales is not None else 0)
+
+
+def top_n_overlap(results: List[List[Tuple[float, str]]], expected_results: List[List[Tuple[float, str]]]) -> float:
+    """Average ratio of expected top n questions that are found in results. Corpus can contain equal questions,
+    so questions are compared as multisets."""
+    overlaps = [sum((Counter(question for _, question in result) &
+                     Counter(question for _, question in expected_result)).values()) / len(expected_result)
+                for result, expected_result in zip(results, expected_results) if expected_result]
+    return float(np.mean(overlaps)) if overlaps else 1.
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Memory, throughput and ranking agreement of stored vector types')
+    parser.add_argument('--num-questions', type=int, default=200000, help='number of questions in corpus')
+    parser.add_argument('--num-queries', type=int, default=2000, help='number of queries')
+    parser.add_argument('--top-n', type=int, default=5, help='number of similar questions per query')
+    args = parser.parse_args()
+
+    corpus = generate_questions(args.num_questions)
+    queries = generate_questions(args.num_queries, seed=1)
+
+    rows, expected_results = [], None
+    for dtype in VECTOR_DTYPES:
+        with tempfile.TemporaryDirectory() as work_dir_path:
+            tf_idf_vectorizer = build_vectorizer(work_dir_path, dtype=dtype)
+            search_engine = QuestionSearchEngine(corpus, fit_vectorizer=True, tf_idf_vectorizer=tf_idf_vectorizer,
+                                                 result_cache_size=0)
+
+            start_time = time.perf_counter()
+            results = [search_engine.most_similar(query, n=args.top_n) for query in queries]
+            single_time = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            search_engine.most_similar_batch(queries, n=args.top_n)
+            batch_time = time.perf_counter() - start_time
+
+            if expected_results is None:
+                expected_results = results
+            rows.append(f'{dtype:>8} {index_size(search_engine) / 1024 ** 2:>11.1f} {args.num_queries / single_time:>11.1f} '
+                  f'{args.num_queries / batch_time:>10.1f} {top_n_overlap(results, expected_results):>14.4f}')
+
+    print(f'Corpus: {args.num_questions} questions, queries: {args.num_queries}, top n: {args.top_n}\n')
+    print(f'{"dtype":>8} {"index (MB)":>11} {"single q/s":>11} {"batch q/s":>10} {"top-n overlap":>14}')
+    print('\n'.join(rows))
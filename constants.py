@@ -13,11 +13,79 @@ RAW_DATA_EXTENSION = 'json'
 RAW_DATA_FILE_PATH = os.path.join(RAW_DATA_DIR_PATH, f'questions.{RAW_DATA_EXTENSION}')
 QUESTION_ID_KEY = 'id'
 QUESTION_CONTENT_KEY = 'question'
+QUESTION_TAGS_KEY = 'tags'
+# minimal number of bytes of corpus file parsed by one process
+CORPUS_LOADING_MIN_CHUNK_SIZE = 16 * 1024 ** 2
 
 # Data cache
-TF_IDF_CACHE_PATH = os.path.join(CACHE_DIR_PATH, 'tf-idf_cache.pkl')
+TF_IDF_CACHE_PATH = os.path.join(CACHE_DIR_PATH, 'tf-idf_index')
+# content and IDs of distinct questions from raw corpus file, in compact form
+QUESTION_STORE_PATH = os.path.join(CACHE_DIR_PATH, 'question_store')
 
 # Tf-Idf
 VOCABULARY_SIZE = 3000
-VOCABULARY_PATH = os.path.join(MODEL_DIR_PATH, 'vocabulary.pkl')
-IDF_VECTOR_PATH = os.path.join(MODEL_DIR_PATH, 'idf_vector.pkl')
+# vocabulary, IDF vector and preprocessing configuration, which are all that is needed for encoding queries
+QUERY_ENCODER_PATH = os.path.join(MODEL_DIR_PATH, 'query_encoder')
+# number of features that tokens are hashed into instead of building vocabulary (e.g. 2 ** 18), None to use
+# vocabulary of VOCABULARY_SIZE most frequent words
+NUM_OF_HASHED_FEATURES = None
+# type of stored Tf-Idf weights - float64, float32 or int8 (quantized, with scale factor for each question)
+VECTOR_DTYPE = 'float64'
+
+# Search
+# number of recent queries whose tokens are cached by preprocessor (0 disables caching)
+QUERY_TOKENS_CACHE_SIZE = 4096
+# maximal number of cached query results (0 disables caching) and their time to live in seconds
+RESULT_CACHE_SIZE = 10000
+RESULT_CACHE_TTL = 300
+# upper bound of memory (in bytes) used for intermediate scores while matching a batch of queries
+BATCH_SCORING_MEMORY_LIMIT = 256 * 1024 ** 2
+# memory used for each posting of query terms while scoring a batch of queries - question index, term position,
+# query index, pair key and accumulator position (int64) with Tf-Idf weight, contribution and score (float64)
+BYTES_PER_SCORED_POSTING = 64
+
+# Incremental indexing
+# number of index segments (fitted corpus and batches of added questions) after which the index is compacted
+MAX_NUM_OF_SEGMENTS = 8
+# ratio of added and removed questions to all questions after which IDF vector is recalculated
+IDF_REFRESH_RATIO = 0.1
+
+# Approximate search
+# number of clusters probed for each query by default
+NUM_OF_PROBES = 8
+# number of k-means iterations and number of sampled questions per cluster that centroids are trained on
+CLUSTERING_NUM_OF_ITERATIONS = 10
+CLUSTERING_SAMPLES_PER_CLUSTER = 64
+# maximal number of centroid values gathered at once while assigning questions to clusters
+CLUSTERING_CHUNK_SIZE = 8 * 1024 ** 2
+
+# Near-duplicates
+# pairs of questions whose cosine similarity is not lower than threshold, as records of indices and score
+NEAR_DUPLICATES_PATH = os.path.join(CACHE_DIR_PATH, 'near_duplicates.bin')
+NEAR_DUPLICATES_THRESHOLD = 0.9
+# number of consecutive questions joined at once by one process
+NEAR_DUPLICATES_BLOCK_SIZE = 4096
+
+# Search service
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8080
+# maximal number of queries scored together, and maximal time (in seconds) that the first query of a batch
+# waits for other queries
+MAX_BATCH_SIZE = 64
+MAX_BATCH_WAIT_TIME = 0.002
+# number of the most recent requests that latency percentiles are calculated from
+LATENCY_WINDOW_SIZE = 10000
+# number of worker processes forked by prefork server
+NUM_OF_WORKERS = os.cpu_count() or 1
+# maximal time in seconds that stopped service waits for requests that are being handled
+SHUTDOWN_TIMEOUT = 10
+# maximal size of request body in bytes and maximal number of request headers
+MAX_REQUEST_BODY_SIZE = 1024 ** 2
+MAX_NUM_OF_REQUEST_HEADERS = 100
+
+# Instrumentation
+# flag that indicates are durations of search stages and counters recorded by default
+INSTRUMENTATION_ENABLED = False
+# upper bounds (in seconds) of buckets of stage duration histograms
+LATENCY_HISTOGRAM_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                             0.5, 1., 2.5, 5., 10.)
\ No newline at end of file
@@ -1,35 +1,127 @@
-from ast import literal_eval
+import os
+import time
+import argparse
+from typing import *
 
-from utils import *
-from constants import *
-from search_engine.question_search_engine import QuestionSearchEngine
+from constants import NEAR_DUPLICATES_PATH, NEAR_DUPLICATES_THRESHOLD, QUESTION_STORE_PATH, RAW_DATA_FILE_PATH
 
+# modules that import numpy, multiprocessing or the search engine are imported by functions that use them, so that
+# their import time is included in measured time to first query
 
-def load_data(path: str) -> Dict[int, str]:
-    """Load question corpus stored in JSON file. Duplicated questions are ignored.
+
+def load_search_engine(path: str, n_jobs: int = 1, refit: bool = False, tf_idf_vectorizer: Optional[Any] = None,
+                       question_store_path: str = QUESTION_STORE_PATH, fit: bool = True,
+                       verify_checksum: bool = False) -> Tuple[Any, Any, bool]:
+    """Create search engine over question corpus, whose questions are kept in compact question store.
+
+    If persisted model, index and question store are built from corpus with the same hash as the given one, they are
+    opened (memory mapped) without parsing the corpus and refitting the vectorizer. Otherwise, corpus is parsed,
+    vectorizer is fitted and all of them are persisted together with the hash of the corpus - unless fitting is
+    disabled, when IndexFormatError is raised instead (e.g. in a server that only opens the published index).
 
     Args:
         path: path to the corpus
+        n_jobs: number of processes that parse the corpus file and fit the vectorizer
+        refit: flag that indicates should vectorizer be fitted even if persisted index is fresh
+        tf_idf_vectorizer: vectorizer that should be used instead of the default one
+        question_store_path: path to the directory where question store is saved
+        fit: flag that indicates may vectorizer be fitted if persisted index is missing or stale
+        verify_checksum: flag that indicates should checksums of persisted index be verified when it is opened. Index
+                         is then read whole (instead of only being mapped into memory), and a corrupted one is
+                         treated as stale.
 
     Returns:
-         Question corpus in dictionary form, where question content is the key and question ID is the value
+        Triple of search engine, question store and flag that indicates is persisted index used
     """
-    data = {}
-    with open(path, 'r') as file:
-        lines = file.readlines()
-        for line in lines:
-            row_data = literal_eval(line)
-            data[row_data[QUESTION_CONTENT_KEY]] = row_data[QUESTION_ID_KEY]
+    from search_engine.corpus.question_store import QuestionStore, hash_corpus
+    from search_engine.index.index_store import IndexFormatError
+    from search_engine.question_search_engine import QuestionSearchEngine
+    from search_engine.vectorizer.tf_idf_vectorizer import TfIdfVectorizer
+
+    if refit and not fit:
+        raise ValueError('Vectorizer cannot be refitted if fitting is disabled')
+
+    tf_idf_vectorizer = tf_idf_vectorizer if tf_idf_vectorizer is not None else TfIdfVectorizer(use_cache=True)
+    corpus_hash = hash_corpus(path)
+    stored_metadata = tf_idf_vectorizer.stored_metadata()
+    if not refit and stored_metadata is not None and stored_metadata.get('corpus_hash') == corpus_hash:
+        try:
+            question_store = QuestionStore.load(question_store_path, corpus_hash)
+            if verify_checksum:
+                tf_idf_vectorizer.load(verify_checksum=True)
+            print(f'----> Opened persisted index of {len(question_store)} questions\n\n')
+            return QuestionSearchEngine(question_store, fit_vectorizer=False, tf_idf_vectorizer=tf_idf_vectorizer), \
+                question_store, True
+        except (OSError, IndexFormatError):
+            if not fit:
+                raise
 
-    return data
+    if not fit:
+        raise IndexFormatError(f'Persisted index is missing or it is not built from corpus {path}')
+    question_store, stats = QuestionStore.build(path, n_jobs=n_jobs)
+    print(f'----> Loaded {len(question_store)} questions from {stats.num_of_lines} lines '
+          f'({stats.lines_per_second:.1f} lines/sec, {stats.num_of_malformed_lines} malformed lines)\n\n')
+    tf_idf_vectorizer.fit(question_store, n_jobs=n_jobs, metadata={'corpus_hash': corpus_hash})
+    # question store is saved last, so that persisted state is fresh only if all of it is saved
+    question_store.save(question_store_path)
+
+    return QuestionSearchEngine(question_store, fit_vectorizer=False, tf_idf_vectorizer=tf_idf_vectorizer), \
+        question_store, False
+
+
+def write_near_duplicates(tf_idf_vectorizer: Any, threshold: float, n_jobs: int = 1,
+                          output_path: str = NEAR_DUPLICATES_PATH) -> Any:
+    """Find all pairs of near-duplicate questions in vectorized question corpus and write them to file.
+
+    Args:
+        tf_idf_vectorizer: fitted vectorizer whose vectorized corpus is joined
+        threshold: minimal cosine similarity of near-duplicate questions
+        n_jobs: number of processes that join blocks of questions
+        output_path: path to the file that pairs of question indices and their scores are written to
+
+    Returns:
+        Self-join statistics
+    """
+    from search_engine.similarity_scorer.near_duplicates import find_near_duplicates
+
+    tf_idf_vectorizer.load()
+    stats = find_near_duplicates(tf_idf_vectorizer.questions, threshold, output_path,
+                                 tf_idf_vectorizer.inverted_index.question_scales, n_jobs=n_jobs)
+    print(f'----> Found {stats.num_of_pairs} pairs of near-duplicate questions among {stats.num_of_questions} '
+          f'questions in {stats.elapsed_time:.2f} s ({stats.num_of_verified_pairs} of {stats.num_of_candidates} '
+          f'candidate pairs verified), written to {output_path}\n\n')
+    return stats
 
 
 if __name__ == '__main__':
-    data = load_data(RAW_DATA_FILE_PATH)
-    search_engine = QuestionSearchEngine(list(data.keys()), fit_vectorizer=True)
-
-    while True:
-        query = input('>>> ')
-        result = search_engine.most_similar(query)
-        for similarity_score, question in result:
-            print(similarity_score, data[question], question)
+    start_time = time.perf_counter()
+    parser = argparse.ArgumentParser(description='Interactive search of similar questions')
+    parser.add_argument('--refit', action='store_true',
+                        help='fit vectorizer even if persisted index is built from the same corpus')
+    parser.add_argument('--near-duplicates', type=float, nargs='?', const=NEAR_DUPLICATES_THRESHOLD,
+                        metavar='THRESHOLD', help='write all pairs of questions whose cosine similarity is not lower '
+                                                  'than threshold to the file and exit')
+    args = parser.parse_args()
+
+    n_jobs = os.cpu_count() or 1
+    tf_idf_vectorizer = None
+    if args.near_duplicates is not None:
+        from search_engine.vectorizer.tf_idf_vectorizer import TfIdfVectorizer
+        tf_idf_vectorizer = TfIdfVectorizer(use_cache=True)
+    search_engine, question_store, is_persisted = load_search_engine(RAW_DATA_FILE_PATH, n_jobs=n_jobs,
+                                                                     refit=args.refit,
+                                                                     tf_idf_vectorizer=tf_idf_vectorizer)
+    if args.near_duplicates is not None:
+        write_near_duplicates(tf_idf_vectorizer, args.near_duplicates, n_jobs=n_jobs)
+    else:
+        # the first query opens the index and decodes its results from question store
+        if len(question_store):
+            search_engine.most_similar(question_store[0])
+        print(f'----> Time to first query: {time.perf_counter() - start_time:.2f} s '
+              f'({"persisted index" if is_persisted else "fitted vectorizer"})\n\n')
+
+        while True:
+            query = input('>>> ')
+            result = search_engine.most_similar(query)
+            for similarity_score, question in result:
+                print(similarity_score, question_store.question_id(question), question)
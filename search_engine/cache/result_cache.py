@@ -0,0 +1,150 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import *
+
+
+class CacheStats(NamedTuple):
+    """Statistics of result cache.
+
+    Attributes:
+        hits (int): number of lookups that found valid result
+        misses (int): number of lookups that did not find valid result
+        evictions (int): number of results evicted because cache was full
+        expirations (int): number of results dropped because they were older than time to live
+        invalidations (int): number of times whole cache was dropped because index changed
+        size (int): number of currently cached results
+    """
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    invalidations: int
+    size: int
+
+    @property
+    def hit_rate(self) -> float:
+        """Ratio of lookups that found valid result."""
+        return self.hits / max(self.hits + self.misses, 1)
+
+
+class ResultCache:
+    """Bounded cache of search results with LRU and TTL eviction.
+
+    Every lookup and store is made for a version of the index that results are computed from. When the version
+    changes, all cached results are dropped, and results computed from the previous version are not stored.
+
+    Attributes:
+        _max_size (int): maximal number of cached results
+        _ttl (float): time to live of each result in seconds
+        _clock (Callable[[], float]): function that returns current time in seconds
+        _results (OrderedDict): cached results with their expiration times, from least to most recently used
+        _version (Hashable): version of the index that cached results are computed from
+        _lock (threading.Lock): lock for changes of the cache
+        _hits (int): number of lookups that found valid result
+        _misses (int): number of lookups that did not find valid result
+        _evictions (int): number of results evicted because cache was full
+        _expirations (int): number of results dropped because they were older than time to live
+        _invalidations (int): number of times whole cache was dropped because index changed
+    """
+
+    def __init__(self, max_size: int, ttl: float, clock: Callable[[], float] = time.monotonic) -> None:
+        """Initialize empty cache.
+
+        Args:
+            max_size: maximal number of cached results. Nothing is cached if it is 0.
+            ttl: time to live of each result in seconds
+            clock: function that returns current time in seconds
+
+        Returns:
+            no value
+        """
+        self._max_size = max_size
+        self._ttl = ttl
+        self._clock = clock
+        self._results = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self._hits = self._misses = self._evictions = self._expirations = self._invalidations = 0
+
+    @property
+    def stats(self) -> CacheStats:
+        """Statistics of the cache."""
+        with self._lock:
+            return CacheStats(self._hits, self._misses, self._evictions, self._expirations, self._invalidations,
+                              len(self._results))
+
+    def get(self, key: Hashable, version: Hashable) -> Optional[Any]:
+        """Get cached result.
+
+        Args:
+            key: key of the result
+            version: current version of the index
+
+        Returns:
+            Cached result, or None if there is no valid result for given key
+        """
+        with self._lock:
+            self._invalidate_if_changed(version)
+            entry = self._results.get(key)
+            if entry is not None and entry[0] <= self._clock():
+                del self._results[key]
+                self._expirations += 1
+                entry = None
+
+            if entry is None:
+                self._misses += 1
+                return None
+
+            self._results.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, result: Any, version: Hashable) -> None:
+        """Store result, evicting the least recently used one if cache is full.
+
+        Args:
+            key: key of the result
+            result: result that should be cached
+            version: version of the index that result is computed from
+
+        Returns:
+            no value
+        """
+        if self._max_size <= 0:
+            return
+
+        with self._lock:
+            # result computed from outdated index must not be cached
+            if version != self._version:
+                return
+
+            self._results[key] = (self._clock() + self._ttl, result)
+            self._results.move_to_end(key)
+            if len(self._results) > self._max_size:
+                self._results.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self) -> None:
+        """Drop all cached results.
+
+        Returns:
+            no value
+        """
+        with self._lock:
+            self._results.clear()
+
+    def _invalidate_if_changed(self, version: Hashable) -> None:
+        """Drop all cached results if version of the index changed.
+
+        Args:
+            version: current version of the index
+
+        Returns:
+            no value
+        """
+        if version != self._version:
+            if self._results:
+                self._invalidations += 1
+            self._results.clear()
+            self._version = version
@@ -0,0 +1,166 @@
+import os
+import re
+import json
+import time
+from typing import *
+
+from settings import logger
+from constants import QUESTION_ID_KEY, QUESTION_CONTENT_KEY, QUESTION_TAGS_KEY, CORPUS_LOADING_MIN_CHUNK_SIZE
+
+# tags of a question are stored as one string, each of them in angle brackets (e.g. "<python><pytest>")
+TAG_PATTERN = re.compile(r'<([^<>]*)>')
+
+
+class LoadingStats(NamedTuple):
+    """Statistics of corpus loading.
+
+    Attributes:
+        num_of_lines (int): number of non-empty lines read from corpus file
+        num_of_malformed_lines (int): number of lines that could not be parsed into question
+        elapsed_time (float): loading time in seconds
+    """
+    num_of_lines: int
+    num_of_malformed_lines: int
+    elapsed_time: float
+
+    @property
+    def lines_per_second(self) -> float:
+        """Loading throughput."""
+        return self.num_of_lines / max(self.elapsed_time, 1e-9)
+
+
+def parse_tags(tags: Union[str, Sequence[str], None]) -> List[str]:
+    """Parse tags of a question into list of normalized (stripped, lower case) distinct tags, in order of their first
+    occurrence. Empty tags are dropped.
+
+    Args:
+        tags: tags in angle brackets as one string (e.g. "<python><pytest>"), or sequence of tags
+
+    Returns:
+        The list of tags
+    """
+    if tags is None:
+        return []
+    if isinstance(tags, str):
+        tags = TAG_PATTERN.findall(tags)
+    elif not isinstance(tags, (list, tuple)) or not all(isinstance(tag, str) for tag in tags):
+        raise TypeError('Tags have to be a string or a sequence of strings')
+    return [tag for tag in dict.fromkeys(tag.strip().lower() for tag in tags) if tag]
+
+
+def iter_questions(path: str, start: int = 0, end: Optional[int] = None, malformed_lines: Optional[List[int]] = None,
+                   with_tags: bool = False) -> Iterator[Union[Tuple[str, int], Tuple[str, int, List[str]]]]:
+    """Lazily parse questions from JSON Lines corpus file, one line at a time.
+
+    Only lines that start inside the byte range [start, end) are parsed, so the file can be split into
+    byte ranges that are parsed independently, and each line still belongs to exactly one range.
+
+    Args:
+        path: path to the corpus
+        start: offset of the first byte of the range
+        end: offset after the last byte of the range. Range ends at the end of file if not given.
+        malformed_lines: list where offsets of lines that could not be parsed will be appended, including lines
+                         whose question content is not a string or whose question ID is not an integer
+        with_tags: flag that indicates should tags of each question be parsed as well. Questions without tags field
+                   have no tags.
+
+    Returns:
+        Iterator over (question content, question ID) pairs, or (question content, question ID, tags) triples if
+        tags are parsed
+    """
+    with open(path, 'rb') as file:
+        if start > 0:
+            # line that started before the range belongs to the previous range
+            file.seek(start - 1)
+            file.readline()
+        offset = file.tell()
+
+        for line in file:
+            if end is not None and offset >= end:
+                break
+            line_offset, offset = offset, offset + len(line)
+            if not line.strip():
+                continue
+
+            try:
+                row_data = json.loads(line)
+                question, question_id = row_data[QUESTION_CONTENT_KEY], row_data[QUESTION_ID_KEY]
+                # bool is subclass of int, but it is not valid question ID, and IDs are stored as int64
+                if not isinstance(question, str) or not isinstance(question_id, int) or \
+                        isinstance(question_id, bool) or not -2 ** 63 <= question_id < 2 ** 63:
+                    raise TypeError('Question content has to be a string and question ID has to be a 64-bit integer')
+                if with_tags:
+                    yield question, question_id, parse_tags(row_data.get(QUESTION_TAGS_KEY))
+                else:
+                    yield question, question_id
+            except (ValueError, TypeError, KeyError):
+                if malformed_lines is not None:
+                    malformed_lines.append(line_offset)
+
+
+def _load_range(path: str, start: int, end: int) -> Tuple[List[Tuple[str, int]], int, int]:
+    """Parse questions from one byte range of corpus file.
+
+    Args:
+        path: path to the corpus
+        start: offset of the first byte of the range
+        end: offset after the last byte of the range
+
+    Returns:
+        Triple of parsed (question content, question ID) pairs, number of parsed lines and number of
+        malformed lines
+    """
+    malformed_lines = []
+    questions = list(iter_questions(path, start=start, end=end, malformed_lines=malformed_lines))
+    return questions, len(questions) + len(malformed_lines), len(malformed_lines)
+
+
+def load_corpus(path: str, n_jobs: int = 1,
+                min_chunk_size: int = CORPUS_LOADING_MIN_CHUNK_SIZE) -> Tuple[Dict[str, int], LoadingStats]:
+    """Load question corpus stored in JSON Lines file. Duplicated questions are ignored, and the ID of the last
+    occurrence is kept. Malformed lines are counted and skipped.
+
+    Args:
+        path: path to the corpus
+        n_jobs: number of processes that parse the file
+        min_chunk_size: minimal size of byte range parsed by one process
+
+    Returns:
+        Pair of question corpus in dictionary form, where question content is the key and question ID is the
+        value, and loading statistics
+    """
+    print('----> Loading question corpus\n\n')
+    start_time = time.perf_counter()
+
+    file_size = os.path.getsize(path)
+    n_jobs = max(1, min(n_jobs, file_size // max(1, min_chunk_size)))
+
+    data = {}
+    num_of_lines, num_of_malformed_lines = 0, 0
+    if n_jobs == 1:
+        malformed_lines = []
+        for question, question_id in iter_questions(path, malformed_lines=malformed_lines):
+            data[question] = question_id
+            num_of_lines += 1
+        num_of_malformed_lines = len(malformed_lines)
+        num_of_lines += num_of_malformed_lines
+    else:
+        # process pool is imported only when it is used, since multiprocessing is slow to import
+        from concurrent.futures import ProcessPoolExecutor
+
+        bounds = [file_size * job // n_jobs for job in range(n_jobs + 1)]
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            # ranges are merged in file order, so duplicates are resolved the same way as in sequential loading
+            for questions, range_lines, range_malformed_lines in executor.map(
+                    _load_range, [path] * n_jobs, bounds[:-1], bounds[1:]):
+                data.update(questions)
+                num_of_lines += range_lines
+                num_of_malformed_lines += range_malformed_lines
+
+    stats = LoadingStats(num_of_lines, num_of_malformed_lines, time.perf_counter() - start_time)
+    if num_of_malformed_lines:
+        logger.warning(f'Skipped {num_of_malformed_lines} malformed lines while loading question corpus')
+    logger.info(f'Loading question corpus with {len(data)} questions finished - {stats.num_of_lines} lines, '
+                f'{stats.lines_per_second:.1f} lines/sec')
+
+    return data, stats
@@ -0,0 +1,471 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import numpy as np
+from array import array
+from typing import *
+
+from settings import logger
+from utils import check_does_dir_exist, check_does_file_exist
+from constants import CORPUS_LOADING_MIN_CHUNK_SIZE
+from search_engine.corpus.corpus_loader import LoadingStats, iter_questions
+from search_engine.index.index_store import IndexFormatError
+from search_engine.index.tag_index import TagIndex
+
+STORE_FORMAT_NAME = 'question-search-engine-question-store'
+STORE_FORMAT_VERSION = 2
+HEADER_FILE_NAME = 'header.json'
+# name, file name and little-endian type of each array stored in question store
+STORE_ARRAYS = [
+    ('buffer', 'buffer.bin', '|u1'),
+    ('offsets', 'offsets.bin', '<i8'),
+    ('question_ids', 'question_ids.bin', '<i8'),
+    ('hashes', 'hashes.bin', '<u8'),
+    ('hash_order', 'hash_order.bin', '<i8'),
+    ('tag_buffer', 'tag_buffer.bin', '|u1'),
+    ('tag_offsets', 'tag_offsets.bin', '<i8'),
+    ('tag_indptr', 'tag_indptr.bin', '<i8'),
+    ('tag_questions', 'tag_questions.bin', '<i4')
+]
+HASH_BLOCK_SIZE = 16 * 1024 ** 2
+# ID of questions whose ID is not known (e.g. questions added to the search engine)
+UNKNOWN_QUESTION_ID = -1
+
+
+def hash_corpus(path: str) -> str:
+    """Calculate hash of raw corpus file content, used for detecting is persisted index built from it.
+
+    Args:
+        path: path to the corpus
+
+    Returns:
+        Hexadecimal BLAKE2 hash of the file
+    """
+    file_hash = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def hash_question(question: bytes) -> int:
+    """Calculate 64-bit hash of UTF-8 encoded question content.
+
+    Args:
+        question: UTF-8 encoded question
+
+    Returns:
+        Hash of the question
+    """
+    return int.from_bytes(hashlib.blake2b(question, digest_size=8).digest(), 'little')
+
+
+class QuestionStore(Sequence[str]):
+    """Compact columnar store of question corpus - content of all questions is one contiguous UTF-8 buffer with
+    offset of each question, and IDs of questions are an int64 array.
+
+    Store takes about 24 bytes per question besides the content itself, instead of two Python objects per question,
+    and its arrays can be memory mapped from disk. Question content is decoded only when it is accessed. Questions
+    are found by content through sorted 64-bit hashes of their content. Tags of questions are kept in tag index, as
+    sorted indices of questions with each tag. Questions added after the store is built are held in memory and have
+    no tags.
+
+    Attributes:
+        buffer (np.ndarray): UTF-8 encoded content of all questions
+        offsets (np.ndarray): offset of each question in buffer, followed by the size of buffer
+        question_ids (np.ndarray): ID of each question
+        corpus_hash (str): hash of the raw corpus that store is built from, if it is built from corpus file
+        tag_index (TagIndex): index of tags of questions
+        _hashes (np.ndarray): sorted hashes of question contents, calculated on first search if not given
+        _hash_order (np.ndarray): position of question with each of sorted hashes
+        _added_questions (List[str]): questions added after the store is built
+    """
+
+    def __init__(self, buffer: np.ndarray, offsets: np.ndarray, question_ids: np.ndarray,
+                 corpus_hash: Optional[str] = None, hashes: Optional[np.ndarray] = None,
+                 hash_order: Optional[np.ndarray] = None, tag_index: Optional[TagIndex] = None) -> None:
+        """Initialize store from its arrays.
+
+        Args:
+            buffer: UTF-8 encoded content of all questions
+            offsets: offset of each question in buffer, followed by the size of buffer
+            question_ids: ID of each question
+            corpus_hash: hash of the raw corpus that store is built from
+            hashes: sorted hashes of question contents
+            hash_order: position of question with each of sorted hashes
+            tag_index: index of tags of questions. Questions have no tags if it is not given.
+
+        Returns:
+            no value
+        """
+        if len(offsets) != len(question_ids) + 1 or offsets[-1] != len(buffer):
+            raise ValueError('Offsets of questions do not match question IDs and buffer')
+        if tag_index is not None and tag_index.num_of_questions != len(question_ids):
+            raise ValueError('Tag index does not match questions')
+
+        self.buffer = buffer
+        self.offsets = offsets
+        self.question_ids = question_ids
+        self.corpus_hash = corpus_hash
+        self.tag_index = tag_index if tag_index is not None else TagIndex.empty(len(question_ids))
+        self._hashes = hashes
+        self._hash_order = hash_order
+        self._added_questions = []
+
+    @classmethod
+    def from_questions(cls, questions: Iterable[str], question_ids: Optional[Iterable[int]] = None,
+                       question_tags: Optional[Sequence[Sequence[str]]] = None) -> 'QuestionStore':
+        """Create store from questions, keeping their order. Duplicated questions are kept.
+
+        Args:
+            questions: raw questions
+            question_ids: ID of each question. IDs are unknown if they are not given.
+            question_tags: tags of each question (e.g. parsed with parse_tags). Questions have no tags if they are
+                           not given.
+
+        Returns:
+            Store with given questions
+        """
+        buffer, offsets = bytearray(), array('q', [0])
+        for question in questions:
+            buffer += question.encode('utf-8')
+            offsets.append(len(buffer))
+        question_ids = np.fromiter(question_ids, dtype=np.int64) if question_ids is not None else \
+            np.full(len(offsets) - 1, UNKNOWN_QUESTION_ID, dtype=np.int64)
+        tag_index = TagIndex.from_question_tags(question_tags) if question_tags is not None else None
+        return cls(np.frombuffer(buffer, dtype=np.uint8), np.frombuffer(offsets, dtype=np.int64), question_ids,
+                   tag_index=tag_index)
+
+    @classmethod
+    def build(cls, corpus_path: str, n_jobs: int = 1,
+              min_chunk_size: int = CORPUS_LOADING_MIN_CHUNK_SIZE) -> Tuple['QuestionStore', LoadingStats]:
+        """Build store from question corpus stored in JSON Lines file. Duplicated questions are ignored, and the ID of
+        the last occurrence is kept (the same way as in load_corpus), together with its tags. Duplicates are found
+        through hashes of question contents, so content of questions is never held as Python strings.
+
+        Args:
+            corpus_path: path to the corpus
+            n_jobs: number of processes that parse the file
+            min_chunk_size: minimal size of byte range parsed by one process
+
+        Returns:
+            Pair of the store and loading statistics
+        """
+        print('----> Loading question corpus\n\n')
+        start_time = time.perf_counter()
+        corpus_hash = hash_corpus(corpus_path)
+
+        file_size = os.path.getsize(corpus_path)
+        n_jobs = max(1, min(n_jobs, file_size // max(1, min_chunk_size)))
+        bounds = [file_size * job // n_jobs for job in range(n_jobs + 1)]
+        if n_jobs == 1:
+            ranges = [_encode_range(corpus_path, 0, file_size)]
+        else:
+            # process pool is imported only when it is used, since multiprocessing is slow to import
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                ranges = list(executor.map(_encode_range, [corpus_path] * n_jobs, bounds[:-1], bounds[1:]))
+
+        # ranges are concatenated in file order, so duplicates are resolved the same way as in sequential loading
+        buffers, range_lengths, range_question_ids, range_hashes, range_tags, range_lines, range_malformed_lines = \
+            zip(*ranges)
+        buffer, lengths = _concatenate(buffers), _concatenate(range_lengths)
+        question_ids, hashes = _concatenate(range_question_ids), _concatenate(range_hashes)
+        tag_names, tag_lengths, tag_ids = _merge_tags(range_tags)
+        num_of_lines, num_of_malformed_lines = sum(range_lines), sum(range_malformed_lines)
+        del ranges, buffers
+
+        offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        keep, sources = _deduplicate(buffer, offsets, hashes)
+        if not keep.all():
+            buffer = buffer[np.repeat(keep, lengths)]
+            offsets = np.concatenate(([0], np.cumsum(lengths[keep]))).astype(np.int64)
+            hashes = hashes[keep]
+        hash_order = np.argsort(hashes, kind='stable')
+        tag_index = TagIndex.from_tag_ids(tag_names, tag_lengths, tag_ids, sources[keep])
+        store = cls(buffer, offsets, question_ids[sources[keep]], corpus_hash, hashes[hash_order], hash_order,
+                    tag_index)
+
+        stats = LoadingStats(num_of_lines, num_of_malformed_lines, time.perf_counter() - start_time)
+        if num_of_malformed_lines:
+            logger.warning(f'Skipped {num_of_malformed_lines} malformed lines while loading question corpus')
+        logger.info(f'Loading question corpus with {len(store)} questions finished - {stats.num_of_lines} lines, '
+                    f'{stats.lines_per_second:.1f} lines/sec')
+
+        return store, stats
+
+    @classmethod
+    def load(cls, path: str, corpus_hash: Optional[str] = None, mmap: bool = True) -> 'QuestionStore':
+        """Open store saved in directory.
+
+        Args:
+            path: path to the store directory
+            corpus_hash: hash of the raw corpus. Store built from another corpus is rejected if it is given.
+            mmap: flag that indicates should arrays be memory mapped instead of read into memory, so that processes
+                  that open the same store share its pages through the OS page cache
+
+        Returns:
+            Question store
+        """
+        header_path = os.path.join(path, HEADER_FILE_NAME)
+        if not check_does_file_exist(header_path):
+            raise FileNotFoundError(header_path)
+        try:
+            with open(header_path, 'r') as file:
+                header = json.load(file)
+        except ValueError:
+            raise IndexFormatError('Question store header is not valid JSON')
+        if not isinstance(header, dict) or header.get('format') != STORE_FORMAT_NAME or \
+                header.get('version') != STORE_FORMAT_VERSION:
+            raise IndexFormatError('Unknown question store format or version')
+        if corpus_hash is not None and header['corpus_hash'] != corpus_hash:
+            raise IndexFormatError(f'Question store {path} is stale - it is built from another corpus')
+
+        arrays = {}
+        num_of_questions = header['num_of_questions']
+        lengths = {'buffer': header['buffer_size'], 'offsets': num_of_questions + 1,
+                   'tag_buffer': header['tag_buffer_size'], 'tag_offsets': header['num_of_tags'] + 1,
+                   'tag_indptr': header['num_of_tags'] + 1, 'tag_questions': header['num_of_tag_postings']}
+        for name, file_name, dtype in STORE_ARRAYS:
+            file_path, length = os.path.join(path, file_name), lengths.get(name, num_of_questions)
+            if not check_does_file_exist(file_path) or os.path.getsize(file_path) != length * np.dtype(dtype).itemsize:
+                raise IndexFormatError(f'Question store file {file_path} is missing or does not match store header')
+            # empty files can not be memory mapped. Memory mapped arrays are viewed as plain arrays, which are
+            # cheaper to index.
+            if mmap and length:
+                arrays[name] = np.memmap(file_path, dtype=dtype, mode='r', shape=(length,)).view(np.ndarray)
+            else:
+                arrays[name] = np.fromfile(file_path, dtype=dtype, count=length)
+
+        tag_buffer, tag_offsets = arrays.pop('tag_buffer'), arrays.pop('tag_offsets')
+        tag_names = [str(memoryview(tag_buffer)[start:end], 'utf-8')
+                     for start, end in zip(tag_offsets[:-1].tolist(), tag_offsets[1:].tolist())]
+        tag_index = TagIndex(tag_names, arrays.pop('tag_indptr'), arrays.pop('tag_questions'), num_of_questions)
+        return cls(corpus_hash=header['corpus_hash'], tag_index=tag_index, **arrays)
+
+    def save(self, path: str) -> None:
+        """Save store into directory with header and raw little-endian arrays. Store is written into temporary
+        directory first and then moved to given path, so readers never see partially written store.
+
+        Args:
+            path: path to the store directory
+
+        Returns:
+            no value
+        """
+        temporary_path = f'{path}.tmp'
+        if os.path.exists(temporary_path):
+            shutil.rmtree(temporary_path)
+        check_does_dir_exist(path=temporary_path, create_dir=True)
+
+        self._build_hash_index()
+        encoded_tags = [tag.encode('utf-8') for tag in self.tag_index.tag_names]
+        tag_offsets = np.zeros(len(encoded_tags) + 1, dtype=np.int64)
+        np.cumsum([len(tag) for tag in encoded_tags], out=tag_offsets[1:])
+        arrays = {'buffer': self.buffer, 'offsets': self.offsets, 'question_ids': self.question_ids,
+                  'hashes': self._hashes, 'hash_order': self._hash_order,
+                  'tag_buffer': np.frombuffer(b''.join(encoded_tags), dtype=np.uint8), 'tag_offsets': tag_offsets,
+                  'tag_indptr': self.tag_index.indptr, 'tag_questions': self.tag_index.question_indices}
+        for name, file_name, dtype in STORE_ARRAYS:
+            np.ascontiguousarray(arrays[name], dtype=dtype).tofile(os.path.join(temporary_path, file_name))
+        header = {
+            'format': STORE_FORMAT_NAME,
+            'version': STORE_FORMAT_VERSION,
+            'corpus_hash': self.corpus_hash,
+            'num_of_questions': len(self.question_ids),
+            'buffer_size': len(self.buffer),
+            'num_of_tags': self.tag_index.num_of_tags,
+            'tag_buffer_size': int(tag_offsets[-1]),
+            'num_of_tag_postings': len(self.tag_index.question_indices)
+        }
+        with open(os.path.join(temporary_path, HEADER_FILE_NAME), 'w') as file:
+            json.dump(header, file, indent=2)
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(temporary_path, path)
+
+    @property
+    def nbytes(self) -> int:
+        """Size of arrays of the store in bytes."""
+        return sum(array.nbytes for array in [self.buffer, self.offsets, self.question_ids, self._hashes,
+                                              self._hash_order] if array is not None) + self.tag_index.nbytes
+
+    def __len__(self) -> int:
+        return len(self.question_ids) + len(self._added_questions)
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('Question index out of range')
+        if i >= len(self.question_ids):
+            return self._added_questions[i - len(self.question_ids)]
+        # slices of memory view are cheaper than slices of (memory mapped) numpy array
+        start, end = self.offsets.item(i), self.offsets.item(i + 1)
+        return str(memoryview(self.buffer)[start:end], 'utf-8')
+
+    def __iter__(self) -> Iterator[str]:
+        buffer = memoryview(self.buffer)
+        for start, end in zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist()):
+            yield str(buffer[start:end], 'utf-8')
+        yield from self._added_questions
+
+    def extend(self, questions: Iterable[str]) -> None:
+        """Add questions to the store. They are held in memory and have no IDs.
+
+        Args:
+            questions: raw questions
+
+        Returns:
+            no value
+        """
+        self._added_questions.extend(questions)
+
+    def find(self, question: str) -> int:
+        """Find position of question with given content, through hashes of question contents.
+
+        Args:
+            question: raw question
+
+        Returns:
+            Position of the first question with given content, or -1 if there is no such question
+        """
+        self._build_hash_index()
+        encoded_question = question.encode('utf-8')
+        question_hash = np.uint64(hash_question(encoded_question))
+        start = int(np.searchsorted(self._hashes, question_hash, side='left'))
+        end = int(np.searchsorted(self._hashes, question_hash, side='right'))
+        # questions with colliding hashes are compared by content
+        for position in self._hash_order[start:end].tolist():
+            question_start, question_end = self.offsets.item(position), self.offsets.item(position + 1)
+            if memoryview(self.buffer)[question_start:question_end] == encoded_question:
+                return position
+        return self._added_questions.index(question) + len(self.question_ids) \
+            if question in self._added_questions else -1
+
+    def question_id(self, question: str) -> Optional[int]:
+        """Find ID of question with given content.
+
+        Args:
+            question: raw question
+
+        Returns:
+            ID of the question, or None if question is not in the store or its ID is not known
+        """
+        position = self.find(question)
+        if not 0 <= position < len(self.question_ids) or self.question_ids[position] == UNKNOWN_QUESTION_ID:
+            return None
+        return int(self.question_ids[position])
+
+    def _build_hash_index(self) -> None:
+        """Calculate sorted hashes of question contents, if they are not calculated or loaded already.
+
+        Returns:
+            no value
+        """
+        if self._hashes is not None and self._hash_order is not None:
+            return
+        buffer = memoryview(self.buffer)
+        hashes = np.fromiter((hash_question(buffer[start:end]) for start, end in
+                              zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist())),
+                             dtype=np.uint64, count=len(self.question_ids))
+        self._hash_order = np.argsort(hashes, kind='stable')
+        self._hashes = hashes[self._hash_order]
+
+
+def _encode_range(path: str, start: int, end: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray,
+                                                              Tuple[List[str], np.ndarray, np.ndarray], int, int]:
+    """Parse questions from one byte range of corpus file into arrays.
+
+    Args:
+        path: path to the corpus
+        start: offset of the first byte of the range
+        end: offset after the last byte of the range
+
+    Returns:
+        UTF-8 encoded content of questions, their lengths in bytes, IDs and hashes, tags of questions (as triple of
+        tag names of the range, number of tags of each question and positions of its tags in those names), number of
+        parsed lines and number of malformed lines
+    """
+    buffer, lengths, question_ids, hashes = bytearray(), array('q'), array('q'), array('Q')
+    tag_positions, tag_lengths, tag_ids = {}, array('q'), array('i')
+    malformed_lines = []
+    for question, question_id, tags in iter_questions(path, start=start, end=end, malformed_lines=malformed_lines,
+                                                      with_tags=True):
+        encoded_question = question.encode('utf-8')
+        buffer += encoded_question
+        lengths.append(len(encoded_question))
+        question_ids.append(question_id)
+        hashes.append(hash_question(encoded_question))
+        tag_lengths.append(len(tags))
+        tag_ids.extend(tag_positions.setdefault(tag, len(tag_positions)) for tag in tags)
+    range_tags = list(tag_positions), np.frombuffer(tag_lengths, dtype=np.int64), np.frombuffer(tag_ids, dtype=np.int32)
+    return np.frombuffer(buffer, dtype=np.uint8), np.frombuffer(lengths, dtype=np.int64), \
+        np.frombuffer(question_ids, dtype=np.int64), np.frombuffer(hashes, dtype=np.uint64), range_tags, \
+        len(lengths) + len(malformed_lines), len(malformed_lines)
+
+
+def _merge_tags(range_tags: Sequence[Tuple[List[str], np.ndarray, np.ndarray]]) -> Tuple[List[str], np.ndarray,
+                                                                                           np.ndarray]:
+    """Merge tags of questions parsed from byte ranges, so that tags of all questions refer to the same tag names.
+
+    Args:
+        range_tags: tag names of each range, number of tags of each question and positions of its tags in those names
+
+    Returns:
+        Triple of sorted tag names, number of tags of each question and positions of its tags in sorted tag names
+    """
+    tag_names = sorted(set(tag for names, _, _ in range_tags for tag in names))
+    tag_positions = {tag: position for position, tag in enumerate(tag_names)}
+    tag_ids = [np.array([tag_positions[tag] for tag in names], dtype=np.int32)[ids] for names, _, ids in range_tags]
+    return tag_names, _concatenate([lengths for _, lengths, _ in range_tags]), _concatenate(tag_ids)
+
+
+def _concatenate(arrays: Sequence[np.ndarray]) -> np.ndarray:
+    """Concatenate arrays, without copying a single array.
+
+    Args:
+        arrays: arrays of the same type
+
+    Returns:
+        Concatenated array
+    """
+    return arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+
+
+def _deduplicate(buffer: np.ndarray, offsets: np.ndarray, hashes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Find duplicated questions through hashes of their contents. Only questions with equal hashes are compared.
+
+    Args:
+        buffer: UTF-8 encoded content of all questions
+        offsets: offset of each question in buffer, followed by the size of buffer
+        hashes: hash of each question content
+
+    Returns:
+        Pair of mask of the first occurrences of questions and position of the question whose ID and tags each
+        question gets, which is the last occurrence for the first occurrence of each question
+    """
+    keep = np.ones(len(hashes), dtype=bool)
+    sources = np.arange(len(hashes))
+    order = np.argsort(hashes, kind='stable')
+    sorted_hashes = hashes[order]
+    is_repeated = sorted_hashes[1:] == sorted_hashes[:-1]
+    # starts of runs of equal hashes with more than one question
+    run_starts = np.flatnonzero(is_repeated & np.concatenate(([True], ~is_repeated[:-1])))
+    run_ends = np.searchsorted(sorted_hashes, sorted_hashes[run_starts], side='right')
+
+    for run_start, run_end in zip(run_starts.tolist(), run_ends.tolist()):
+        first_positions = {}
+        # questions of a run are in corpus order, since sort is stable
+        for position in order[run_start:run_end].tolist():
+            question = buffer[offsets[position]:offsets[position + 1]].tobytes()
+            first_position = first_positions.setdefault(question, position)
+            if first_position != position:
+                keep[position] = False
+                sources[first_position] = position
+    return keep, sources
@@ -0,0 +1,202 @@
+import numpy as np
+from typing import *
+
+
+class CsrMatrix:
+    """Compressed sparse row (CSR) matrix used for storing vectorized question corpus.
+
+    Nonzero values of row i are stored in data[indptr[i]:indptr[i + 1]], and their column indices
+    are stored in indices[indptr[i]:indptr[i + 1]]. Column indices inside each row are sorted.
+
+    Attributes:
+        indptr (np.ndarray): row pointers of (M + 1,) shape
+        indices (np.ndarray): column index of each nonzero value, of (nnz,) shape
+        data (np.ndarray): nonzero values, of (nnz,) shape
+        shape (Tuple[int, int]): matrix dimensions (M, D)
+    """
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, shape: Tuple[int, int]) -> None:
+        """Initialize CSR matrix from its component arrays.
+
+        Args:
+            indptr: row pointers of (M + 1,) shape
+            indices: column index of each nonzero value
+            data: nonzero values
+            shape: matrix dimensions (M, D)
+
+        Returns:
+            no value
+        """
+        if len(indptr) != shape[0] + 1:
+            raise ValueError(f'indptr length {len(indptr)} does not match number of rows {shape[0]}')
+        if len(indices) != len(data) or indptr[-1] != len(data):
+            raise ValueError('indices and data lengths do not match indptr')
+
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = (int(shape[0]), int(shape[1]))
+
+    @classmethod
+    def empty(cls, num_of_columns: int, dtype: Any = np.float64) -> 'CsrMatrix':
+        """Create CSR matrix without rows.
+
+        Args:
+            num_of_columns: number of columns (D)
+            dtype: type of nonzero values
+
+        Returns:
+            Empty CSR matrix of (0, D) shape
+        """
+        return cls(np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=dtype),
+                   (0, num_of_columns))
+
+    @classmethod
+    def vstack(cls, matrices: Sequence['CsrMatrix']) -> 'CsrMatrix':
+        """Stack CSR matrices with the same number of columns vertically.
+
+        Args:
+            matrices: non-empty sequence of CSR matrices
+
+        Returns:
+            CSR matrix with rows of all given matrices, in given order
+        """
+        nnz_offsets = np.cumsum([0] + [matrix.nnz for matrix in matrices[:-1]])
+        indptr = np.concatenate([np.zeros(1, dtype=np.int64)] +
+                                [matrix.indptr[1:] + offset for matrix, offset in zip(matrices, nnz_offsets)])
+        return cls(indptr, np.concatenate([matrix.indices for matrix in matrices]),
+                   np.concatenate([matrix.data for matrix in matrices]),
+                   (sum(matrix.shape[0] for matrix in matrices), matrices[0].shape[1]))
+
+    @property
+    def nnz(self) -> int:
+        """Number of stored nonzero values."""
+        return len(self.data)
+
+    @property
+    def nbytes(self) -> int:
+        """Number of bytes occupied by component arrays."""
+        return self.indptr.nbytes + self.indices.nbytes + self.data.nbytes
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def row_lengths(self) -> np.ndarray:
+        """Number of nonzero values in each row.
+
+        Returns:
+            numpy array of (M,) shape
+        """
+        return np.diff(self.indptr)
+
+    def row_indices(self) -> np.ndarray:
+        """Row index of each nonzero value.
+
+        Returns:
+            numpy array of (nnz,) shape
+        """
+        return np.repeat(np.arange(self.shape[0], dtype=np.int64), self.row_lengths())
+
+    def getrow(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Get column indices and nonzero values of one row.
+
+        Args:
+            i: row index
+
+        Returns:
+            Pair of column indices and values for given row
+        """
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def row_slice(self, start: int, end: int) -> 'CsrMatrix':
+        """Get matrix with consecutive rows from start (inclusive) to end (exclusive).
+
+        Args:
+            start: index of the first row
+            end: index after the last row
+
+        Returns:
+            CSR matrix of (end - start, D) shape, sharing nonzero values with this matrix
+        """
+        start, end, _ = slice(start, end).indices(self.shape[0])
+        end = max(start, end)
+        first, last = self.indptr[start], self.indptr[end]
+        return CsrMatrix(self.indptr[start:end + 1] - first, self.indices[first:last], self.data[first:last],
+                         (end - start, self.shape[1]))
+
+    def take_rows(self, rows: np.ndarray) -> 'CsrMatrix':
+        """Get matrix with given rows, in given order.
+
+        Args:
+            rows: numpy array with indices of rows
+
+        Returns:
+            CSR matrix of (len(rows), D) shape
+        """
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        indptr = np.zeros(rows.shape[0] + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+
+        # offset of each nonzero value of given rows, without looping over rows
+        offsets = np.arange(indptr[-1]) + np.repeat(starts - indptr[:-1], lengths)
+        return CsrMatrix(indptr, self.indices[offsets], self.data[offsets], (rows.shape[0], self.shape[1]))
+
+    def transpose(self) -> 'CsrMatrix':
+        """Transpose matrix, keeping it in CSR form (i.e. build CSC form of the original matrix).
+
+        Row indices of the original matrix stay sorted inside each row of the transposed matrix.
+
+        Returns:
+            CSR matrix of (D, M) shape
+        """
+        # stable sort keeps original row order for equal column indices
+        order = np.argsort(self.indices, kind='stable')
+        indptr = np.zeros(self.shape[1] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.indices, minlength=self.shape[1]), out=indptr[1:])
+        indices = self.row_indices()[order].astype(np.int32)
+        return CsrMatrix(indptr, indices, self.data[order], (self.shape[1], self.shape[0]))
+
+    def toarray(self) -> np.ndarray:
+        """Materialize matrix as dense numpy array. Intended for small matrices (e.g. queries) only.
+
+        Returns:
+            Dense numpy array of (M, D) shape
+        """
+        dense = np.zeros(self.shape, dtype=self.data.dtype)
+        dense[self.row_indices(), self.indices] = self.data
+        return dense
+
+    def dot(self, vectors: np.ndarray) -> np.ndarray:
+        """Multiply CSR matrix with dense vectors, computing the products only over nonzero values.
+
+        Args:
+            vectors: numpy array of (D,) or (D, K) shape
+
+        Returns:
+            numpy array of (M,) or (M, K) shape
+        """
+        if vectors.ndim == 2:
+            products = self.data[:, None] * vectors[self.indices]
+        else:
+            products = self.data * vectors[self.indices]
+        return self.sum_rows(products)
+
+    def sum_rows(self, values: np.ndarray) -> np.ndarray:
+        """Sum values aligned with nonzero elements for each row.
+
+        Args:
+            values: numpy array of (nnz,) or (nnz, K) shape
+
+        Returns:
+            numpy array of (M,) or (M, K) shape
+        """
+        result = np.zeros((self.shape[0],) + values.shape[1:], dtype=values.dtype)
+        if self.nnz == 0:
+            return result
+
+        # empty rows have to be skipped, since reduceat does not return zero for empty segments
+        nonempty_rows = np.flatnonzero(self.row_lengths())
+        result[nonempty_rows] = np.add.reduceat(values, self.indptr[nonempty_rows], axis=0)
+        return result
@@ -0,0 +1,415 @@
+import threading
+import numpy as np
+from typing import *
+
+from search_engine.index.csr_matrix import CsrMatrix
+from search_engine.index.inverted_index import InvertedIndex
+from search_engine.index.quantization import dequantize, quantize
+from search_engine.similarity_scorer.similarity_metrics import max_score_cosine_similarity, \
+    sparse_cosine_similarity, term_at_a_time_cosine_similarity
+
+
+class Segment(NamedTuple):
+    """Part of the index with consecutive questions.
+
+    Attributes:
+        offset (int): index of the first question of the segment in whole corpus
+        questions (CsrMatrix): vectorized questions of the segment
+        inverted_index (InvertedIndex): inverted index over questions of the segment
+    """
+    offset: int
+    questions: CsrMatrix
+    inverted_index: InvertedIndex
+
+
+class IncrementalIndex:
+    """Index over vectorized question corpus that supports adding and removing questions without refit.
+
+    Added questions are appended as new segments, and removed questions are marked with tombstones and skipped
+    while scoring. Document frequencies are kept up to date with every change, while IDF vector (and Tf-Idf
+    weights of indexed questions) is refreshed lazily during compaction, which also merges segments into one.
+
+    Indices of questions never change - questions added later get indices after all existing ones, and
+    compaction only drops Tf-Idf scores of removed questions, keeping their (empty) rows.
+
+    After compaction with IDF refresh, scores match a full refit on the remaining questions within 1e-9, as long
+    as vocabulary of the full refit is the same. Vocabulary is never changed incrementally - words that are not
+    in vocabulary are ignored in added questions, and words whose questions were all removed stay in vocabulary.
+
+    Tf-Idf weights of added questions are stored with the same type as the ones of the fitted corpus, and
+    compaction reweights dequantized weights.
+
+    Attributes:
+        _segments (List[Segment]): segments of the index, the first one holds the fitted corpus
+        _dtype (str): type of Tf-Idf weights of indexed questions
+        _idf_vector (np.ndarray): IDF vector used for Tf-Idf weights of indexed questions
+        _document_frequencies (np.ndarray): number of indexed questions (without removed ones) that contain each
+                                            word from vocabulary
+        _deleted (np.ndarray): tombstone flag for each question
+        _num_of_questions (int): number of indexed questions, including removed ones
+        _num_of_removed (int): number of removed questions
+        _num_of_changes (int): number of added and removed questions since the last IDF refresh
+        _lock (threading.RLock): lock for changes of the index
+        _compaction_lock (threading.Lock): lock that allows only one compaction at the time
+        version (int): number that is incremented on every change of the index
+    """
+
+    def __init__(self, questions: CsrMatrix, inverted_index: InvertedIndex, idf_vector: np.ndarray) -> None:
+        """Initialize index with fitted question corpus.
+
+        Args:
+            questions: vectorized question corpus
+            inverted_index: inverted index over vectorized question corpus
+            idf_vector: IDF vector used for vectorizing question corpus
+
+        Returns:
+            no value
+        """
+        self._segments = [Segment(0, questions, inverted_index)]
+        self._dtype = 'int8' if inverted_index.question_scales is not None else questions.data.dtype.name
+        self._idf_vector = idf_vector
+        self._document_frequencies = inverted_index.postings_lengths(np.arange(inverted_index.num_of_terms))
+        self._deleted = np.zeros(questions.shape[0], dtype=bool)
+        self._num_of_questions = questions.shape[0]
+        self._num_of_removed = 0
+        self._num_of_changes = 0
+
+        self._lock = threading.RLock()
+        self._compaction_lock = threading.Lock()
+        self.version = 0
+
+    @property
+    def num_of_questions(self) -> int:
+        """Number of indexed questions, including removed ones."""
+        return self._num_of_questions
+
+    @property
+    def num_of_segments(self) -> int:
+        """Number of segments of the index."""
+        return len(self._segments)
+
+    @property
+    def idf_vector(self) -> np.ndarray:
+        """IDF vector used for Tf-Idf weights of indexed questions."""
+        return self._idf_vector
+
+    def is_deleted(self, question_indices: np.ndarray) -> np.ndarray:
+        """Check which of given questions are removed.
+
+        Args:
+            question_indices: indices of questions
+
+        Returns:
+            numpy array of boolean flags
+        """
+        return self._deleted[question_indices]
+
+    def add(self, vectorized_questions: CsrMatrix, idf_vector: np.ndarray) -> np.ndarray:
+        """Add vectorized questions to the index as a new segment.
+
+        Args:
+            vectorized_questions: vectorized questions with float weights
+            idf_vector: IDF vector used for vectorizing questions. If IDF vector of the index was refreshed
+                        in the meantime, questions are reweighted.
+
+        Returns:
+            numpy array with indices assigned to added questions
+        """
+        with self._lock:
+            if not np.array_equal(idf_vector, self._idf_vector):
+                vectorized_questions = _reweight(vectorized_questions, self._idf_vector / idf_vector)
+
+            offset = self._num_of_questions
+            segment = _build_segment(offset, vectorized_questions, self._dtype)
+            self._document_frequencies = self._document_frequencies + \
+                np.bincount(vectorized_questions.indices, minlength=self._document_frequencies.shape[0])
+            self._deleted = np.concatenate((self._deleted, np.zeros(vectorized_questions.shape[0], dtype=bool)))
+            self._num_of_questions += vectorized_questions.shape[0]
+            self._num_of_changes += vectorized_questions.shape[0]
+            self._segments = self._segments + [segment]
+            self.version += 1
+
+        return np.arange(offset, offset + vectorized_questions.shape[0])
+
+    def remove(self, question_indices: Sequence[int]) -> int:
+        """Remove questions from the index by marking them with tombstones.
+
+        Args:
+            question_indices: indices of questions that should be removed
+
+        Returns:
+            Number of removed questions, without the ones that were already removed
+        """
+        with self._lock:
+            question_indices = np.unique(np.asarray(question_indices, dtype=np.int64))
+            if question_indices.shape[0] and (question_indices[0] < 0 or
+                                              question_indices[-1] >= self._num_of_questions):
+                raise IndexError('Question index out of range')
+            question_indices = question_indices[~self._deleted[question_indices]]
+
+            # words of removed questions are no longer counted in document frequencies
+            document_frequencies = self._document_frequencies.copy()
+            for segment in self._segments:
+                rows = question_indices[(question_indices >= segment.offset) &
+                                        (question_indices < segment.offset + segment.questions.shape[0])]
+                document_frequencies -= np.bincount(segment.questions.take_rows(rows - segment.offset).indices,
+                                                    minlength=document_frequencies.shape[0])
+
+            deleted = self._deleted.copy()
+            deleted[question_indices] = True
+            self._deleted = deleted
+            self._document_frequencies = document_frequencies
+            self._num_of_removed += question_indices.shape[0]
+            self._num_of_changes += question_indices.shape[0]
+            self.version += 1
+
+        return question_indices.shape[0]
+
+    def needs_compaction(self, max_num_of_segments: int, idf_refresh_ratio: float) -> bool:
+        """Check should the index be compacted, because there are too many segments or IDF vector is stale.
+
+        Args:
+            max_num_of_segments: maximal number of segments before compaction
+            idf_refresh_ratio: ratio of changed (added and removed) questions to all remaining questions after
+                               which IDF vector is considered stale
+
+        Returns:
+            True if index should be compacted. False otherwise.
+        """
+        num_of_remaining = self._num_of_questions - self._num_of_removed
+        return len(self._segments) > max_num_of_segments or \
+            self._num_of_changes > idf_refresh_ratio * max(num_of_remaining, 1)
+
+    def compact(self, refresh_idf: bool = True) -> Segment:
+        """Merge all segments into one, dropping Tf-Idf scores of removed questions, and optionally refresh
+        IDF vector from the current document frequencies, reweighting all questions.
+
+        Merged segment is built without blocking queries or changes of the index. Questions added while
+        compaction is running stay in their own segments.
+
+        Args:
+            refresh_idf: flag that indicates should IDF vector be recalculated
+
+        Returns:
+            Merged segment
+        """
+        with self._compaction_lock:
+            with self._lock:
+                segments, deleted, old_idf_vector = self._segments, self._deleted, self._idf_vector
+                num_of_remaining = self._num_of_questions - self._num_of_removed
+                num_of_removed, num_of_changes = self._num_of_removed, self._num_of_changes
+                idf_vector = np.round(np.log((num_of_remaining + 1) / (self._document_frequencies + 1)) + 1,
+                                      decimals=8).astype(old_idf_vector.dtype) if refresh_idf else old_idf_vector
+
+            questions = CsrMatrix.vstack([_dequantize_segment(segment) for segment in segments])
+            questions = _drop_rows(questions, deleted[:questions.shape[0]])
+            if refresh_idf:
+                questions = _reweight(questions, idf_vector / old_idf_vector)
+            merged_segment = _build_segment(0, questions, self._dtype)
+
+            with self._lock:
+                # questions removed while compaction was running must stay removed
+                if self._num_of_removed != num_of_removed:
+                    merged_segment = _build_segment(0, _drop_rows(questions, self._deleted[:questions.shape[0]]),
+                                                    self._dtype)
+
+                # questions added while compaction was running have to be reweighted with refreshed IDF vector
+                added_segments = self._segments[len(segments):]
+                if refresh_idf:
+                    added_segments = [_build_segment(segment.offset, _reweight(_dequantize_segment(segment),
+                                                                               idf_vector / old_idf_vector),
+                                                     self._dtype)
+                                      for segment in added_segments]
+                    self._num_of_changes -= num_of_changes
+
+                self._segments = [merged_segment] + added_segments
+                self._idf_vector = idf_vector
+                self.version += 1
+
+        return merged_segment
+
+    def postings_lengths(self, term_indices: np.ndarray) -> np.ndarray:
+        """Get total lengths of postings lists of given terms over all segments.
+
+        Args:
+            term_indices: indices of terms in vocabulary
+
+        Returns:
+            numpy array with number of postings for each term
+        """
+        return sum(segment.inverted_index.postings_lengths(term_indices) for segment in self._segments)
+
+    def score(self, query_vector: np.ndarray, k: Optional[int] = None,
+              question_indices: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Calculate cosine similarity scores between query vector and indexed questions, term at a time.
+
+        If only some questions may be scored (e.g. the ones with filtered tags), and there are few of them compared to
+        postings of query terms, only their vectors are scored (with score_candidates). Otherwise, postings are scored
+        while the other questions are ignored, the same way as removed questions.
+
+        Args:
+            query_vector: numpy array of (D,) shape with Tf-Idf vector representation of the query
+            k: number of top questions that are needed. If it is given, questions of each segment that can not be
+               among its top k are skipped (MaxScore pruning), which does not change top k questions and their scores.
+            question_indices: sorted indices of questions that may be scored. All questions may be scored if they are
+                              not given.
+
+        Returns:
+            Pair of numpy arrays - sorted indices of questions (without removed ones) that share at least one
+            term with the query (or only those that can be among top k) and cosine similarity scores for them
+        """
+        segments, deleted = self._segments, self._deleted
+        excluded = deleted if self._num_of_removed else None
+        if question_indices is not None:
+            num_of_postings = self.postings_lengths(np.flatnonzero(query_vector)).sum()
+            num_of_nonzeros = sum(segment.questions.nnz for segment in segments)
+            # scoring vectors of given questions reads their average number of nonzero values for each of them
+            if question_indices.shape[0] * num_of_nonzeros <= num_of_postings * deleted.shape[0]:
+                return self.score_candidates(query_vector, question_indices)
+            excluded = np.ones(deleted.shape[0], dtype=bool)
+            excluded[question_indices[question_indices < deleted.shape[0]]] = False
+            excluded |= deleted
+
+        if k is None:
+            segment_scores = [term_at_a_time_cosine_similarity(query_vector, segment.inverted_index)
+                              for segment in segments]
+        else:
+            segment_scores = [max_score_cosine_similarity(
+                query_vector, segment.inverted_index, k,
+                excluded[segment.offset:segment.offset + segment.questions.shape[0]] if excluded is not None else None)
+                for segment in segments]
+        if len(segments) == 1:
+            question_indices, scores = segment_scores[0]
+        else:
+            question_indices = np.concatenate([segment.offset + indices
+                                               for segment, (indices, _) in zip(segments, segment_scores)])
+            scores = np.concatenate([scores for _, scores in segment_scores])
+
+        if excluded is not None:
+            # taking positions is much cheaper than boolean indexing when about half of questions are excluded
+            not_excluded = np.flatnonzero(~excluded[question_indices])
+            question_indices, scores = question_indices[not_excluded], scores[not_excluded]
+        return question_indices, scores
+
+    def score_candidates(self, query_vector: np.ndarray,
+                         question_indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Calculate cosine similarity scores between query vector and given candidate questions only.
+
+        Args:
+            query_vector: numpy array of (D,) shape with Tf-Idf vector representation of the query
+            question_indices: sorted indices of candidate questions
+
+        Returns:
+            Pair of numpy arrays - sorted indices of candidate questions (without removed ones) that share at least
+            one term with the query and cosine similarity scores for those questions
+        """
+        segments, deleted = self._segments, self._deleted
+        question_indices = question_indices[question_indices < deleted.shape[0]]
+        question_indices = question_indices[~deleted[question_indices]]
+
+        scores = np.zeros(question_indices.shape[0])
+        for segment in segments:
+            start, end = np.searchsorted(question_indices, [segment.offset,
+                                                            segment.offset + segment.questions.shape[0]])
+            rows = question_indices[start:end] - segment.offset
+            scores[start:end] = segment.questions.take_rows(rows).dot(query_vector)
+            if segment.inverted_index.question_scales is not None:
+                scores[start:end] *= segment.inverted_index.question_scales[rows]
+
+        nonzeros = np.flatnonzero(scores)
+        return question_indices[nonzeros], scores[nonzeros]
+
+    def score_batch(self, query_vectors: CsrMatrix) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Calculate cosine similarity scores between multiple query vectors and indexed questions.
+
+        Args:
+            query_vectors: CSR matrix of (N, D) shape with Tf-Idf vector representation of the queries
+
+        Returns:
+            Triple of numpy arrays - query indices, question indices (without removed ones) and nonzero cosine
+            similarity scores, sorted by query index and then by question index
+        """
+        segments, deleted = self._segments, self._deleted
+        segment_scores = [sparse_cosine_similarity(query_vectors, segment.inverted_index) for segment in segments]
+        if len(segments) == 1:
+            query_indices, question_indices, scores = segment_scores[0]
+        else:
+            query_indices = np.concatenate([indices for indices, _, _ in segment_scores])
+            question_indices = np.concatenate([segment.offset + indices
+                                               for segment, (_, indices, _) in zip(segments, segment_scores)])
+            scores = np.concatenate([scores for _, _, scores in segment_scores])
+            # segments are ordered by question indices, so stable sort by query keeps order of questions
+            order = np.argsort(query_indices, kind='stable')
+            query_indices, question_indices, scores = query_indices[order], question_indices[order], scores[order]
+
+        if self._num_of_removed:
+            not_deleted = ~deleted[question_indices]
+            query_indices, question_indices, scores = \
+                query_indices[not_deleted], question_indices[not_deleted], scores[not_deleted]
+        return query_indices, question_indices, scores
+
+
+def _build_segment(offset: int, questions: CsrMatrix, dtype: str) -> Segment:
+    """Build segment from vectorized questions, converting their weights into given type.
+
+    Args:
+        offset: index of the first question of the segment in whole corpus
+        questions: vectorized questions with float weights
+        dtype: type of Tf-Idf weights of the segment
+
+    Returns:
+        Segment with inverted index over its questions
+    """
+    questions, question_scales = quantize(questions, dtype)
+    return Segment(offset, questions, InvertedIndex(questions, question_scales))
+
+
+def _dequantize_segment(segment: Segment) -> CsrMatrix:
+    """Get vectorized questions of segment with float64 weights.
+
+    Args:
+        segment: segment of the index
+
+    Returns:
+        Vectorized questions with float64 weights
+    """
+    return dequantize(segment.questions, segment.inverted_index.question_scales)
+
+
+def _drop_rows(questions: CsrMatrix, deleted: np.ndarray) -> CsrMatrix:
+    """Drop nonzero values of deleted rows, keeping them as empty rows.
+
+    Args:
+        questions: vectorized questions
+        deleted: deletion flag for each row
+
+    Returns:
+        CSR matrix with the same shape
+    """
+    if not np.any(deleted):
+        return questions
+
+    row_lengths = np.where(deleted, 0, questions.row_lengths())
+    kept = np.repeat(~deleted, questions.row_lengths())
+    indptr = np.zeros(questions.shape[0] + 1, dtype=np.int64)
+    np.cumsum(row_lengths, out=indptr[1:])
+    return CsrMatrix(indptr, np.asarray(questions.indices[kept]), np.asarray(questions.data[kept]), questions.shape)
+
+
+def _reweight(questions: CsrMatrix, idf_ratio: np.ndarray) -> CsrMatrix:
+    """Reweight Tf-Idf vectors for new IDF vector and normalize them again.
+
+    Since Tf-Idf vectors are normalized, Tf values are known only up to the scale of each vector, which is
+    enough for cosine similarity.
+
+    Args:
+        questions: vectorized questions
+        idf_ratio: ratio of new and old IDF value for each word from vocabulary
+
+    Returns:
+        CSR matrix with reweighted vectors
+    """
+    data = questions.data * idf_ratio[questions.indices]
+    norms = np.sqrt(questions.sum_rows(data ** 2))
+    data /= np.repeat(norms, questions.row_lengths())
+    return CsrMatrix(np.asarray(questions.indptr), np.asarray(questions.indices), data, questions.shape)
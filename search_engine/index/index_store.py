@@ -0,0 +1,233 @@
+import os
+import json
+import zlib
+import shutil
+import numpy as np
+from typing import *
+
+from utils import check_does_dir_exist, check_does_file_exist
+from search_engine.index.csr_matrix import CsrMatrix
+from search_engine.index.inverted_index import InvertedIndex
+
+INDEX_FORMAT_NAME = 'question-search-engine-index'
+INDEX_FORMAT_VERSION = 1
+HEADER_FILE_NAME = 'header.json'
+VOCABULARY_FILE_NAME = 'vocabulary.txt'
+
+# name, file name and little-endian type of each array stored in index. Arrays without type (Tf-Idf weights)
+# are stored with their own type, and type of each array is recorded in index header.
+INDEX_ARRAYS = [
+    ('idf_vector', 'idf_vector.bin', None),
+    ('indptr', 'indptr.bin', '<i8'),
+    ('indices', 'indices.bin', '<i4'),
+    ('data', 'data.bin', None),
+    ('postings_indptr', 'postings_indptr.bin', '<i8'),
+    ('postings_indices', 'postings_indices.bin', '<i4'),
+    ('postings_data', 'postings_data.bin', None)
+]
+# array that is stored only for quantized Tf-Idf weights
+QUESTION_SCALES_ARRAY = ('question_scales', 'question_scales.bin', '<f8')
+# maximal weight of each term, which is calculated when index is opened if it is not stored (in older indexes)
+MAX_WEIGHTS_ARRAY = ('max_weights', 'max_weights.bin', '<f8')
+CHECKSUM_BLOCK_SIZE = 16 * 1024 ** 2
+
+
+class IndexFormatError(ValueError):
+    """Raised when on-disk index is corrupted, has unsupported version or does not match the model."""
+
+
+class StoredIndex(NamedTuple):
+    """Content of on-disk index.
+
+    Attributes:
+        vocabulary (Dict[str, int]): vocabulary for Bag-Of-Words model, None if tokens are hashed into features
+        idf_vector (np.ndarray): vector with IDF scores for all words from vocabulary
+        questions (CsrMatrix): vectorized question corpus
+        inverted_index (InvertedIndex): inverted index over vectorized question corpus
+        metadata (Dict[str, Any]): additional metadata stored in index header
+    """
+    vocabulary: Optional[Dict[str, int]]
+    idf_vector: np.ndarray
+    questions: CsrMatrix
+    inverted_index: InvertedIndex
+    metadata: Dict[str, Any]
+
+
+def save_index(path: str, vocabulary: Optional[Dict[str, int]], idf_vector: np.ndarray, questions: CsrMatrix,
+               inverted_index: InvertedIndex, metadata: Optional[Dict[str, Any]] = None) -> None:
+    """Save index into directory with header, vocabulary table and raw little-endian arrays.
+
+    Index is written into temporary directory first and then moved to given path, so readers never see
+    partially written index.
+
+    Args:
+        path: path to the index directory
+        vocabulary: vocabulary for Bag-Of-Words model. It is not stored if tokens are hashed into features.
+        idf_vector: vector with IDF scores for all words from vocabulary
+        questions: vectorized question corpus
+        inverted_index: inverted index over vectorized question corpus
+        metadata: additional JSON serializable metadata stored in index header
+
+    Returns:
+        no value
+    """
+    temporary_path = f'{path}.tmp'
+    if os.path.exists(temporary_path):
+        shutil.rmtree(temporary_path)
+    check_does_dir_exist(path=temporary_path, create_dir=True)
+
+    postings = inverted_index.postings_matrix
+    arrays = {
+        'idf_vector': idf_vector,
+        'indptr': questions.indptr,
+        'indices': questions.indices,
+        'data': questions.data,
+        'postings_indptr': postings.indptr,
+        'postings_indices': postings.indices,
+        'postings_data': postings.data,
+        'max_weights': inverted_index.max_weights
+    }
+    index_arrays = INDEX_ARRAYS + [MAX_WEIGHTS_ARRAY]
+    if inverted_index.question_scales is not None:
+        arrays['question_scales'] = inverted_index.question_scales
+        index_arrays = index_arrays + [QUESTION_SCALES_ARRAY]
+
+    header = {
+        'format': INDEX_FORMAT_NAME,
+        'version': INDEX_FORMAT_VERSION,
+        'num_of_questions': questions.shape[0],
+        'vocabulary_size': questions.shape[1],
+        'nnz': questions.nnz,
+        'metadata': metadata or {},
+        'files': {}
+    }
+
+    if vocabulary is not None:
+        vocabulary_path = os.path.join(temporary_path, VOCABULARY_FILE_NAME)
+        with open(vocabulary_path, 'w', encoding='utf-8') as file:
+            for word in sorted(vocabulary, key=vocabulary.get):
+                file.write(f'{word}\n')
+        header['files'][VOCABULARY_FILE_NAME] = {'checksum': _file_checksum(vocabulary_path)}
+
+    for name, file_name, dtype in index_arrays:
+        array_path = os.path.join(temporary_path, file_name)
+        dtype = dtype or np.dtype(arrays[name].dtype).newbyteorder('<').str
+        np.ascontiguousarray(arrays[name], dtype=dtype).tofile(array_path)
+        header['files'][file_name] = {'dtype': dtype, 'length': int(len(arrays[name])),
+                                      'checksum': _file_checksum(array_path)}
+
+    with open(os.path.join(temporary_path, HEADER_FILE_NAME), 'w') as file:
+        json.dump(header, file, indent=2)
+
+    # replace previous index
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(temporary_path, path)
+
+
+def load_index(path: str, verify_checksum: bool = False) -> StoredIndex:
+    """Open index stored in directory, mapping its arrays into memory.
+
+    Arrays are opened with np.memmap in read-only mode, so opening is independent of index size and
+    processes that open the same index share its pages through the OS page cache.
+
+    Args:
+        path: path to the index directory
+        verify_checksum: flag that indicates should checksum of each file be verified. It requires reading
+                         the whole index.
+
+    Returns:
+        Content of the index
+    """
+    header_path = os.path.join(path, HEADER_FILE_NAME)
+    if not check_does_file_exist(header_path):
+        raise FileNotFoundError(header_path)
+
+    header = read_index_header(path)
+    for file_name, file_info in header['files'].items():
+        file_path = os.path.join(path, file_name)
+        if not check_does_file_exist(file_path):
+            raise IndexFormatError(f'Index file {file_path} is missing')
+        try:
+            expected_size = file_info['length'] * np.dtype(file_info['dtype']).itemsize \
+                if 'dtype' in file_info else None
+        except TypeError:
+            raise IndexFormatError(f'Unknown type of index file {file_path}')
+        if expected_size is not None and os.path.getsize(file_path) != expected_size:
+            raise IndexFormatError(f'Size of index file {file_path} does not match index header')
+        if verify_checksum and _file_checksum(file_path) != file_info['checksum']:
+            raise IndexFormatError(f'Checksum of index file {file_path} does not match index header')
+
+    arrays = {}
+    index_arrays = INDEX_ARRAYS + [optional_array for optional_array in [QUESTION_SCALES_ARRAY, MAX_WEIGHTS_ARRAY]
+                                   if optional_array[1] in header['files']]
+    for name, file_name, _ in index_arrays:
+        length, dtype = header['files'][file_name]['length'], header['files'][file_name]['dtype']
+        # empty files can not be memory mapped
+        arrays[name] = np.memmap(os.path.join(path, file_name), dtype=dtype, mode='r', shape=(length,)) \
+            if length else np.zeros(0, dtype=dtype)
+
+    # index of questions whose tokens are hashed into features has no vocabulary
+    vocabulary = None
+    if VOCABULARY_FILE_NAME in header['files']:
+        with open(os.path.join(path, VOCABULARY_FILE_NAME), 'r', encoding='utf-8') as file:
+            vocabulary = {word: i for i, word in enumerate(file.read().splitlines())}
+
+    num_of_questions, vocabulary_size = header['num_of_questions'], header['vocabulary_size']
+    if vocabulary is not None and len(vocabulary) != vocabulary_size or len(arrays['idf_vector']) != vocabulary_size:
+        raise IndexFormatError('Vocabulary size does not match index header')
+
+    if 'question_scales' in arrays and len(arrays['question_scales']) != num_of_questions:
+        raise IndexFormatError('Number of question scale factors does not match index header')
+    if 'max_weights' in arrays and len(arrays['max_weights']) != vocabulary_size:
+        raise IndexFormatError('Number of maximal term weights does not match index header')
+
+    try:
+        questions = CsrMatrix(arrays['indptr'], arrays['indices'], arrays['data'], (num_of_questions, vocabulary_size))
+        postings = CsrMatrix(arrays['postings_indptr'], arrays['postings_indices'], arrays['postings_data'],
+                             (vocabulary_size, num_of_questions))
+    except ValueError as error:
+        raise IndexFormatError(f'Index arrays are inconsistent: {error}')
+
+    return StoredIndex(vocabulary, arrays['idf_vector'], questions,
+                       InvertedIndex.from_postings(postings, arrays.get('question_scales'), arrays.get('max_weights')),
+                       header['metadata'])
+
+
+def read_index_header(path: str) -> Dict[str, Any]:
+    """Read and validate header of index stored in directory.
+
+    Args:
+        path: path to the index directory
+
+    Returns:
+        Index header
+    """
+    try:
+        with open(os.path.join(path, HEADER_FILE_NAME), 'r') as file:
+            header = json.load(file)
+    except ValueError:
+        raise IndexFormatError('Index header is not valid JSON')
+
+    if not isinstance(header, dict) or header.get('format') != INDEX_FORMAT_NAME:
+        raise IndexFormatError('Unknown index format')
+    if header.get('version') != INDEX_FORMAT_VERSION:
+        raise IndexFormatError(f'Unsupported index version {header.get("version")}, '
+                               f'expected version {INDEX_FORMAT_VERSION}')
+    return header
+
+
+def _file_checksum(path: str) -> int:
+    """Calculate CRC32 checksum of file content.
+
+    Args:
+        path: path to the file
+
+    Returns:
+        Checksum of the file
+    """
+    checksum = 0
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(CHECKSUM_BLOCK_SIZE), b''):
+            checksum = zlib.crc32(block, checksum)
+    return checksum
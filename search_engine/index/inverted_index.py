@@ -0,0 +1,160 @@
+import numpy as np
+from typing import *
+
+from search_engine.index.csr_matrix import CsrMatrix
+
+
+class InvertedIndex:
+    """Inverted index over vectorized question corpus.
+
+    For each term from vocabulary it keeps postings list, i.e. indices of questions that contain the term
+    (sorted in ascending order) together with Tf-Idf weight of the term in those questions.
+
+    Weights can be stored as float64, float32 or int8 values. Quantized (int8) weight of the term in a question has
+    to be multiplied by scale factor of the question.
+
+    Maximal weight of each term over all questions is kept as well, so that score contribution of each query term
+    is bounded without reading its postings (used for pruning questions that can not be among top results).
+
+    Attributes:
+        _postings (CsrMatrix): postings lists in form of (D, M) CSR matrix, where row t holds postings for term t
+        _question_scales (np.ndarray): scale factor of each question for quantized weights, None otherwise
+        _max_weights (np.ndarray): maximal (dequantized) weight of each term, calculated on first use if not given
+    """
+
+    def __init__(self, questions: CsrMatrix, question_scales: Optional[np.ndarray] = None) -> None:
+        """Build inverted index from vectorized question corpus.
+
+        Args:
+            questions: vectorized question corpus as CSR matrix of (M, D) shape
+            question_scales: scale factor of each question, if weights are quantized
+
+        Returns:
+            no value
+        """
+        self._postings = questions.transpose()
+        self._question_scales = question_scales
+        self._max_weights = _max_row_weights(self._postings, question_scales)
+
+    @classmethod
+    def from_postings(cls, postings: CsrMatrix, question_scales: Optional[np.ndarray] = None,
+                      max_weights: Optional[np.ndarray] = None) -> 'InvertedIndex':
+        """Create inverted index from already built postings lists.
+
+        Args:
+            postings: postings lists in form of (D, M) CSR matrix
+            question_scales: scale factor of each question, if weights are quantized
+            max_weights: maximal (dequantized) weight of each term. It is calculated on first use if not given.
+
+        Returns:
+            Inverted index
+        """
+        inverted_index = cls.__new__(cls)
+        inverted_index._postings = postings
+        inverted_index._question_scales = question_scales
+        inverted_index._max_weights = max_weights
+        return inverted_index
+
+    @property
+    def postings_matrix(self) -> CsrMatrix:
+        """Postings lists in form of (D, M) CSR matrix."""
+        return self._postings
+
+    @property
+    def question_scales(self) -> Optional[np.ndarray]:
+        """Scale factor of each question for quantized weights, None if weights are not quantized."""
+        return self._question_scales
+
+    @property
+    def max_weights(self) -> np.ndarray:
+        """Maximal (dequantized) Tf-Idf weight of each term over all questions, 0 for terms without postings."""
+        if self._max_weights is None:
+            self._max_weights = _max_row_weights(self._postings, self._question_scales)
+        return self._max_weights
+
+    @property
+    def num_of_terms(self) -> int:
+        """Number of terms (vocabulary size)."""
+        return self._postings.shape[0]
+
+    @property
+    def num_of_questions(self) -> int:
+        """Number of indexed questions."""
+        return self._postings.shape[1]
+
+    def postings(self, term_index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Get postings list for one term.
+
+        Args:
+            term_index: index of the term in vocabulary
+
+        Returns:
+            Pair of sorted question indices and Tf-Idf weights of the term in those questions
+        """
+        return self._postings.getrow(term_index)
+
+    def postings_lengths(self, term_indices: np.ndarray) -> np.ndarray:
+        """Get lengths of postings lists (document frequencies inside index) for given terms.
+
+        Args:
+            term_indices: indices of terms in vocabulary
+
+        Returns:
+            numpy array with number of postings for each term
+        """
+        return self._postings.indptr[term_indices + 1] - self._postings.indptr[term_indices]
+
+    def gather_postings(self, term_indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Gather postings lists of given terms into flat arrays, keeping order of given terms.
+
+        Args:
+            term_indices: indices of terms in vocabulary
+
+        Returns:
+            Triple of numpy arrays - position of the term (in given term_indices) that each posting belongs to,
+            question indices and Tf-Idf weights of postings
+        """
+        postings = self._postings.take_rows(term_indices)
+        return postings.row_indices(), postings.indices, postings.data
+
+    def lookup_weights(self, term_index: int, question_indices: np.ndarray) -> np.ndarray:
+        """Find weights of one term in given questions, searching its sorted postings list instead of reading it whole.
+
+        Args:
+            term_index: index of the term in vocabulary
+            question_indices: sorted indices of questions
+
+        Returns:
+            numpy array with weight of the term in each question (as it is stored), 0 for questions without the term
+        """
+        start, end = self._postings.indptr[term_index], self._postings.indptr[term_index + 1]
+        term_questions = self._postings.indices[start:end]
+        positions = np.searchsorted(term_questions, question_indices)
+        found = positions < term_questions.shape[0]
+        found[found] = term_questions[positions[found]] == question_indices[found]
+
+        weights = np.zeros(question_indices.shape[0], dtype=self._postings.data.dtype)
+        weights[found] = self._postings.data[start + positions[found]]
+        return weights
+
+
+def _max_row_weights(postings: CsrMatrix, question_scales: Optional[np.ndarray]) -> np.ndarray:
+    """Find maximal (dequantized) weight in each row of postings lists.
+
+    Args:
+        postings: postings lists in form of (D, M) CSR matrix
+        question_scales: scale factor of each question, if weights are quantized
+
+    Returns:
+        numpy array with maximal weight of each term, 0 for terms without postings
+    """
+    weights = postings.data.astype(np.float64)
+    if question_scales is not None:
+        weights *= question_scales[postings.indices]
+
+    max_weights = np.zeros(postings.shape[0])
+    # rows are reduced from their start to the start of the next nonempty row, so empty rows are skipped
+    nonempty_rows = np.flatnonzero(postings.indptr[1:] > postings.indptr[:-1])
+    if nonempty_rows.shape[0]:
+        max_weights[nonempty_rows] = np.maximum.reduceat(weights, postings.indptr[nonempty_rows])
+    return max_weights
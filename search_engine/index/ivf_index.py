@@ -0,0 +1,212 @@
+import threading
+import numpy as np
+from typing import *
+
+from constants import CLUSTERING_CHUNK_SIZE, CLUSTERING_NUM_OF_ITERATIONS, CLUSTERING_SAMPLES_PER_CLUSTER
+from search_engine.index.csr_matrix import CsrMatrix
+from search_engine.similarity_scorer.top_k_selection import select_top_k
+
+
+class IvfIndex:
+    """Inverted file (IVF) index that partitions vectorized questions into clusters with spherical k-means.
+
+    Each question belongs to the cluster with the most similar centroid. Query is compared with centroids only,
+    and questions from a few clusters with the most similar centroids are the candidates for exact scoring,
+    so scoring cost depends on the size of probed clusters instead of the corpus size.
+
+    Attributes:
+        centroids (np.ndarray): normalized cluster centroids of (K, D) shape
+        _assignments (np.ndarray): cluster of each question
+        _lists_indptr (np.ndarray): pointers to sorted question indices of each cluster in _lists, of (K + 1,) shape
+        _lists (np.ndarray): question indices grouped by cluster, built lazily after questions are added
+        _lock (threading.Lock): lock for adding questions
+    """
+
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray) -> None:
+        """Initialize index from cluster centroids and cluster of each question.
+
+        Args:
+            centroids: normalized cluster centroids of (K, D) shape
+            assignments: cluster of each question
+
+        Returns:
+            no value
+        """
+        self.centroids = centroids
+        self._assignments = assignments
+        self._lists_indptr = None
+        self._lists = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, questions: CsrMatrix, num_of_clusters: Optional[int] = None,
+              num_of_iterations: int = CLUSTERING_NUM_OF_ITERATIONS,
+              samples_per_cluster: int = CLUSTERING_SAMPLES_PER_CLUSTER, seed: int = 0) -> 'IvfIndex':
+        """Cluster vectorized questions with spherical k-means and build index over clusters.
+
+        Args:
+            questions: vectorized question corpus
+            num_of_clusters: number of clusters (K). Square root of number of questions is used if it is None.
+            num_of_iterations: number of k-means iterations
+            samples_per_cluster: number of sampled questions per cluster that centroids are trained on
+            seed: seed of random generator used for sampling questions
+
+        Returns:
+            Index over clusters of given questions
+        """
+        random_generator = np.random.RandomState(seed)
+        num_of_questions = questions.shape[0]
+        if num_of_questions == 0:
+            return cls(np.zeros((1, questions.shape[1])), np.zeros(0, dtype=np.int64))
+        if num_of_clusters is None:
+            num_of_clusters = int(np.sqrt(num_of_questions))
+        num_of_clusters = max(1, min(num_of_clusters, num_of_questions))
+
+        # centroids are trained on a sample, while all questions are assigned to trained centroids
+        sample, sample_size = questions, samples_per_cluster * num_of_clusters
+        if num_of_questions > sample_size:
+            sample = questions.take_rows(np.sort(random_generator.choice(num_of_questions, sample_size,
+                                                                         replace=False)))
+        centroids = _spherical_k_means(sample, num_of_clusters, num_of_iterations, random_generator)
+        return cls(centroids, _assign(questions, centroids))
+
+    @property
+    def num_of_clusters(self) -> int:
+        """Number of clusters."""
+        return self.centroids.shape[0]
+
+    @property
+    def num_of_questions(self) -> int:
+        """Number of indexed questions."""
+        return self._assignments.shape[0]
+
+    def add(self, questions: CsrMatrix) -> None:
+        """Assign new questions to clusters with the most similar centroids. Centroids are not changed.
+
+        Args:
+            questions: vectorized questions, indexed after already indexed ones
+
+        Returns:
+            no value
+        """
+        assignments = _assign(questions, self.centroids)
+        with self._lock:
+            self._assignments = np.concatenate((self._assignments, assignments))
+            self._lists = None
+
+    def candidates(self, query_vector: np.ndarray, num_of_probes: int) -> np.ndarray:
+        """Find candidate questions for query, from clusters whose centroids are the most similar to the query.
+
+        Args:
+            query_vector: numpy array of (D,) shape with Tf-Idf vector representation of the query
+            num_of_probes: number of probed clusters
+
+        Returns:
+            Sorted numpy array with indices of candidate questions
+        """
+        lists_indptr, lists = self._get_lists()
+        query_terms = np.flatnonzero(query_vector)
+        if query_terms.shape[0] == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        # only centroid values of query terms take part in similarity
+        centroid_scores = self.centroids[:, query_terms].dot(query_vector[query_terms])
+        probed_clusters = select_top_k(centroid_scores, num_of_probes)
+        candidates = np.concatenate([np.zeros(0, dtype=np.int64)] +
+                                    [lists[lists_indptr[cluster]:lists_indptr[cluster + 1]]
+                                     for cluster in probed_clusters.tolist()])
+        return np.sort(candidates)
+
+    def _get_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Get question indices grouped by cluster, grouping them again if questions were added.
+
+        Returns:
+            Pair of numpy arrays - pointers to questions of each cluster and question indices
+        """
+        with self._lock:
+            if self._lists is None:
+                # stable sort keeps question indices sorted inside each cluster
+                self._lists = np.argsort(self._assignments, kind='stable')
+                self._lists_indptr = np.zeros(self.num_of_clusters + 1, dtype=np.int64)
+                np.cumsum(np.bincount(self._assignments, minlength=self.num_of_clusters), out=self._lists_indptr[1:])
+            return self._lists_indptr, self._lists
+
+
+def _spherical_k_means(questions: CsrMatrix, num_of_clusters: int, num_of_iterations: int,
+                       random_generator: np.random.RandomState) -> np.ndarray:
+    """Cluster normalized vectors with k-means that uses cosine similarity, keeping centroids normalized.
+
+    Args:
+        questions: vectorized questions
+        num_of_clusters: number of clusters
+        num_of_iterations: number of iterations
+        random_generator: random generator used for initialization of centroids
+
+    Returns:
+        Normalized centroids of (K, D) shape
+    """
+    # centroids are initialized with random questions
+    centroids = questions.take_rows(random_generator.choice(questions.shape[0], num_of_clusters,
+                                                            replace=False)).toarray()
+    for _ in range(num_of_iterations):
+        assignments = _assign(questions, centroids)
+        # sum of vectors of each cluster
+        sums = np.bincount(assignments[questions.row_indices()] * questions.shape[1] + questions.indices,
+                           weights=questions.data, minlength=num_of_clusters * questions.shape[1])
+        sums = sums.reshape(num_of_clusters, questions.shape[1])
+        norms = np.linalg.norm(sums, axis=1)
+
+        # empty clusters get random questions as new centroids
+        empty_clusters = np.flatnonzero(norms == 0)
+        if empty_clusters.shape[0]:
+            sums[empty_clusters] = questions.take_rows(random_generator.choice(questions.shape[0],
+                                                                               empty_clusters.shape[0])).toarray()
+            norms[empty_clusters] = np.maximum(np.linalg.norm(sums[empty_clusters], axis=1), 1e-12)
+        centroids = sums / norms[:, None]
+
+    return centroids
+
+
+def _assign(questions: CsrMatrix, centroids: np.ndarray) -> np.ndarray:
+    """Assign each question to the cluster with the most similar centroid.
+
+    Questions are processed in chunks of questions with similar number of nonzero values, which are padded to
+    the same length, so that similarities with all centroids are computed with one batched matrix multiplication.
+    Chunks are limited so that gathered centroid values have at most CLUSTERING_CHUNK_SIZE elements.
+
+    Args:
+        questions: vectorized questions
+        centroids: normalized centroids of (K, D) shape
+
+    Returns:
+        numpy array with cluster of each question
+    """
+    num_of_questions = questions.shape[0]
+    assignments = np.zeros(num_of_questions, dtype=np.int64)
+    transposed_centroids = np.ascontiguousarray(centroids.transpose())
+    max_chunk_size = max(1, CLUSTERING_CHUNK_SIZE // centroids.shape[0])
+
+    row_lengths = questions.row_lengths()
+    order = np.argsort(row_lengths, kind='stable')
+    sorted_lengths = np.maximum(row_lengths[order], 1)
+
+    start = 0
+    while start < num_of_questions:
+        # rows are sorted by length, so padded size of chunk is its number of rows times length of its last row
+        padded_sizes = np.arange(1, num_of_questions - start + 1) * sorted_lengths[start:]
+        end = start + max(1, int(np.searchsorted(padded_sizes, max_chunk_size, side='right')))
+        rows = order[start:end]
+
+        chunk = questions.take_rows(rows)
+        chunk_lengths = chunk.row_lengths()
+        positions = np.arange(chunk.nnz) - np.repeat(chunk.indptr[:-1], chunk_lengths)
+        padded_indices = np.zeros((rows.shape[0], sorted_lengths[end - 1]), dtype=np.int64)
+        padded_data = np.zeros((rows.shape[0], sorted_lengths[end - 1]))
+        padded_indices[chunk.row_indices(), positions] = chunk.indices
+        padded_data[chunk.row_indices(), positions] = chunk.data
+
+        similarities = np.matmul(padded_data[:, None, :], transposed_centroids[padded_indices])[:, 0, :]
+        assignments[rows] = np.argmax(similarities, axis=1)
+        start = end
+
+    return assignments
@@ -0,0 +1,68 @@
+import numpy as np
+from typing import *
+
+from search_engine.index.csr_matrix import CsrMatrix
+
+# supported types of stored Tf-Idf weights
+VECTOR_DTYPES = ('float64', 'float32', 'int8')
+# largest absolute value of quantized weight
+INT8_MAX_VALUE = 127
+
+
+def quantize(questions: CsrMatrix, dtype: str) -> Tuple[CsrMatrix, Optional[np.ndarray]]:
+    """Convert Tf-Idf weights of vectorized questions into given type.
+
+    Weights are converted directly into float types. For int8 type, weights of each question are divided by its
+    scale factor (the largest absolute weight of the question divided by 127) and rounded, so that weight is
+    approximately equal to quantized weight times scale factor of the question.
+
+    Args:
+        questions: vectorized questions with float weights
+        dtype: type of weights, one of VECTOR_DTYPES
+
+    Returns:
+        Pair of vectorized questions with converted weights and scale factor of each question
+        (None for float types)
+    """
+    if dtype not in VECTOR_DTYPES:
+        raise ValueError(f'Unsupported vector type {dtype}, expected one of {", ".join(VECTOR_DTYPES)}')
+    if dtype != 'int8':
+        return CsrMatrix(questions.indptr, questions.indices, questions.data.astype(dtype, copy=False),
+                         questions.shape), None
+
+    max_weights = np.zeros(questions.shape[0])
+    nonempty_rows = np.flatnonzero(questions.row_lengths())
+    if nonempty_rows.shape[0]:
+        max_weights[nonempty_rows] = np.maximum.reduceat(np.abs(questions.data), questions.indptr[nonempty_rows])
+    # empty questions get unit scale, so that scale factors can always be divided by
+    scales = np.where(max_weights > 0, max_weights / INT8_MAX_VALUE, 1.)
+    data = np.rint(questions.data / np.repeat(scales, questions.row_lengths())).astype(np.int8)
+    return CsrMatrix(questions.indptr, questions.indices, data, questions.shape), scales
+
+
+def dequantize(questions: CsrMatrix, scales: Optional[np.ndarray]) -> CsrMatrix:
+    """Convert Tf-Idf weights of vectorized questions back into float64 type.
+
+    Args:
+        questions: vectorized questions with converted weights
+        scales: scale factor of each question (None for float types)
+
+    Returns:
+        Vectorized questions with float64 weights
+    """
+    data = questions.data.astype(np.float64, copy=False)
+    if scales is not None:
+        data *= np.repeat(scales, questions.row_lengths())
+    return CsrMatrix(questions.indptr, questions.indices, data, questions.shape)
+
+
+def idf_dtype(dtype: str) -> np.dtype:
+    """Type of IDF vector for given type of Tf-Idf weights. Quantized weights use float32 IDF vector.
+
+    Args:
+        dtype: type of weights, one of VECTOR_DTYPES
+
+    Returns:
+        Type of IDF vector
+    """
+    return np.dtype('float32' if dtype == 'int8' else dtype)
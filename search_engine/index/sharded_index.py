@@ -0,0 +1,270 @@
+import os
+import threading
+import numpy as np
+from typing import *
+
+from search_engine.index.csr_matrix import CsrMatrix
+from search_engine.index.incremental_index import IncrementalIndex
+from search_engine.index.inverted_index import InvertedIndex
+from search_engine.similarity_scorer.top_k_selection import select_top_k, select_top_k_rows
+
+
+class ShardError(RuntimeError):
+    """Raised when worker process of a shard stops unexpectedly. Workers are started again on next use."""
+
+
+class ShardedIndex:
+    """Index whose questions are partitioned into shards of consecutive questions, each scored by its own worker
+    process.
+
+    All shards share vocabulary and IDF vector, since they hold rows of the same vectorized corpus. Queries are
+    scattered to all shards, each shard selects its own top k questions, and those are merged into global top k.
+    Score of each question is accumulated in the same order as in the unsharded index, and shards are merged in
+    order of their questions, so results (including ties) are identical to the unsharded ones.
+
+    Shards are balanced by number of nonzero values (i.e. postings). Workers are started on first use in each
+    process, so that index created before fork (e.g. in prefork server) gets its own workers in each forked process.
+    Workers are forked where it is possible, so they share questions of their shards copy-on-write. Inverted index
+    of each shard is built only by its worker, so there is no inverted index over all questions.
+
+    Attributes:
+        _questions (CsrMatrix): vectorized question corpus
+        _question_scales (np.ndarray): scale factor of each question for quantized weights, None otherwise
+        _document_frequencies (np.ndarray): number of questions that contain each term
+        shard_bounds (np.ndarray): index of the first question of each shard and number of questions at the end
+        version (int): version of the index, which never changes since sharded index can not be changed
+        _workers (List[multiprocessing.Process]): worker process of each shard
+        _connections (List[multiprocessing.connection.Connection]): connection with worker of each shard
+        _pid (int): ID of the process that started workers
+        _lock (threading.Lock): lock that allows only one scatter-gather at the time
+    """
+
+    def __init__(self, questions: CsrMatrix, num_of_shards: int,
+                 question_scales: Optional[np.ndarray] = None) -> None:
+        """Partition vectorized questions into shards. Workers are started on first use.
+
+        Args:
+            questions: vectorized question corpus
+            num_of_shards: number of shards (K). Shards without questions are not created.
+            question_scales: scale factor of each question, if weights are quantized
+
+        Returns:
+            no value
+        """
+        if num_of_shards < 1:
+            raise ValueError(f'Number of shards has to be positive, but it is {num_of_shards}')
+
+        self._questions = questions
+        self._question_scales = question_scales
+        self._document_frequencies = np.bincount(questions.indices, minlength=questions.shape[1])
+        # shards end at rows where cumulative number of nonzero values reaches equal parts of all nonzero values
+        bounds = np.searchsorted(questions.indptr, np.linspace(0, questions.nnz, num_of_shards + 1)[1:-1])
+        self.shard_bounds = np.unique(np.concatenate(([0], np.minimum(bounds, questions.shape[0]),
+                                                      [questions.shape[0]])))
+        self._workers = []
+        self._connections = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self.version = 0
+
+    @property
+    def num_of_shards(self) -> int:
+        """Number of shards."""
+        return max(1, self.shard_bounds.shape[0] - 1)
+
+    def postings_lengths(self, term_indices: np.ndarray) -> np.ndarray:
+        """Get total lengths of postings lists of given terms over all shards.
+
+        Args:
+            term_indices: indices of terms in vocabulary
+
+        Returns:
+            numpy array with number of postings for each term
+        """
+        return self._document_frequencies[term_indices]
+
+    def top_k_batch(self, query_vectors: CsrMatrix, k: int,
+                    question_indices: Optional[np.ndarray] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Find top k most similar questions for each query, scoring shards in parallel.
+
+        Args:
+            query_vectors: CSR matrix of (N, D) shape with Tf-Idf vector representation of the queries
+            k: number of questions that should be found for each query
+            question_indices: sorted indices of questions that may be found (e.g. questions with filtered tags).
+                              All questions may be found if they are not given.
+
+        Returns:
+            List with pair of numpy arrays for each query - at most k question indices with the highest cosine
+            similarity scores and those scores, ordered by score in descending order
+        """
+        num_of_queries = query_vectors.shape[0]
+        if self._questions.shape[0] == 0:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0))] * num_of_queries
+
+        offsets = self.shard_bounds[:-1].tolist()
+        if question_indices is None:
+            messages = [(query_vectors, k, None)] * len(offsets)
+        else:
+            # each shard gets given questions within its bounds, as indices of its own questions
+            positions = np.searchsorted(question_indices, self.shard_bounds).tolist()
+            messages = [(query_vectors, k, question_indices[start:end] - offset)
+                        for offset, start, end in zip(offsets, positions[:-1], positions[1:])]
+
+        with self._lock:
+            self._start_workers()
+            shard_results = self._scatter_gather(messages)
+        for shard_result in shard_results:
+            if isinstance(shard_result, Exception):
+                raise shard_result
+
+        top_k_rows = []
+        for query in range(num_of_queries):
+            # shards are concatenated in order of their questions, so ties are broken as in the unsharded index
+            question_indices = np.concatenate([offset + shard_result[query][0]
+                                               for offset, shard_result in zip(offsets, shard_results)])
+            scores = np.concatenate([shard_result[query][1] for shard_result in shard_results])
+            top_positions = select_top_k(scores, k)
+            top_k_rows.append((question_indices[top_positions], scores[top_positions]))
+        return top_k_rows
+
+    def close(self) -> None:
+        """Stop worker processes started by this process.
+
+        Returns:
+            no value
+        """
+        with self._lock:
+            self._stop_workers()
+
+    def _scatter_gather(self, messages: Sequence[Any]) -> List[Any]:
+        """Send message to worker of each shard and receive their results. Workers of all shards are stopped if
+        worker of any shard stops unexpectedly, since results of the other shards can not be matched with messages
+        anymore.
+
+        Args:
+            messages: message for worker of each shard
+
+        Returns:
+            The list with result of each shard
+        """
+        shard = 0
+        try:
+            # scatter queries to all shards before gathering results, so that shards are scored in parallel
+            for shard, (connection, message) in enumerate(zip(self._connections, messages)):
+                connection.send(message)
+            shard_results = []
+            for shard, connection in enumerate(self._connections):
+                shard_results.append(connection.recv())
+            return shard_results
+        except (EOFError, OSError) as exception:
+            self._stop_workers(terminate=True)
+            raise ShardError(f'Worker process of shard {shard} stopped unexpectedly, workers of all shards are '
+                             f'started again on next use') from exception
+
+    def _start_workers(self) -> None:
+        """Start worker process of each shard, unless they are already started by this process.
+
+        Returns:
+            no value
+        """
+        if self._pid == os.getpid():
+            return
+
+        # workers inherited from another process (e.g. before fork) can not be used
+        self._workers, self._connections = [], []
+        # multiprocessing is imported only when workers are started, since it is slow to import
+        import multiprocessing
+
+        context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+        for start, end in zip(self.shard_bounds[:-1].tolist(), self.shard_bounds[1:].tolist()):
+            question_scales = self._question_scales[start:end] if self._question_scales is not None else None
+            connection, worker_connection = context.Pipe()
+            worker = context.Process(target=_serve_shard, daemon=True,
+                                     args=(worker_connection, self._questions.row_slice(start, end), question_scales))
+            worker.start()
+            worker_connection.close()
+            self._workers.append(worker)
+            self._connections.append(connection)
+        self._pid = os.getpid()
+
+    def _stop_workers(self, terminate: bool = False) -> None:
+        """Stop worker processes started by this process.
+
+        Args:
+            terminate: flag that indicates should workers be terminated instead of being asked to stop, e.g. when
+                       they may be blocked on sending results that are not received anymore
+
+        Returns:
+            no value
+        """
+        if self._pid == os.getpid():
+            for worker, connection in zip(self._workers, self._connections):
+                if terminate:
+                    worker.terminate()
+                else:
+                    try:
+                        connection.send(None)
+                    except OSError:
+                        # worker has already stopped
+                        pass
+                connection.close()
+            for worker in self._workers:
+                worker.join()
+        self._workers, self._connections, self._pid = [], [], None
+
+
+def _serve_shard(connection: Any, questions: CsrMatrix, question_scales: Optional[np.ndarray]) -> None:
+    """Score queries against questions of one shard, until stop message (None) is received.
+
+    Args:
+        connection: connection with the process that scatters queries
+        questions: vectorized questions of the shard
+        question_scales: scale factor of each question of the shard, if weights are quantized
+
+    Returns:
+        no value
+    """
+    # shard is never changed, so IDF vector of its questions is not needed
+    index = IncrementalIndex(questions, InvertedIndex(questions, question_scales), idf_vector=None)
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        query_vectors, k, question_indices = message
+        try:
+            connection.send(_top_k_batch(index, query_vectors, k, question_indices))
+        except Exception as exception:
+            connection.send(exception)
+
+
+def _top_k_batch(index: IncrementalIndex, query_vectors: CsrMatrix, k: int,
+                 question_indices: Optional[np.ndarray]) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Find top k most similar questions of one shard for each query.
+
+    Args:
+        index: index over questions of the shard
+        query_vectors: CSR matrix of (N, D) shape with Tf-Idf vector representation of the queries
+        k: number of questions that should be found for each query
+        question_indices: sorted indices of questions of the shard that may be found, all of them if not given
+
+    Returns:
+        List with pair of numpy arrays for each query - at most k question indices with the highest cosine
+        similarity scores and those scores, ordered by score in descending order
+    """
+    num_of_queries = query_vectors.shape[0]
+    if question_indices is None:
+        query_indices, question_indices, scores = index.score_batch(query_vectors)
+        return select_top_k_rows(query_indices, question_indices, scores, num_of_queries, k)
+
+    # filtered questions are scored query by query, the same way as in the unsharded index
+    top_k_rows = []
+    for row in range(num_of_queries):
+        query_vector = query_vectors.row_slice(row, row + 1).toarray()[0]
+        filtered_indices, scores = index.score(query_vector, k, question_indices)
+        top_positions = select_top_k(scores, k)
+        top_k_rows.append((filtered_indices[top_positions], scores[top_positions]))
+    return top_k_rows
@@ -0,0 +1,183 @@
+import numpy as np
+from bisect import bisect_left
+from typing import *
+
+from search_engine.index.csr_matrix import CsrMatrix
+from search_engine.similarity_scorer.similarity_metrics import DENSE_ACCUMULATOR_RATIO
+
+
+class TagIndex:
+    """Index of question tags - sorted indices of questions with each tag, stored as one array with offsets of
+    each tag (the same way as postings of inverted index).
+
+    Questions matching a filter are found by intersecting or merging sorted indices of questions with filtered tags,
+    so cost of filtering depends on the number of questions with those tags instead of the corpus size.
+
+    Attributes:
+        tag_names (List[str]): sorted names of all tags
+        indptr (np.ndarray): offset of sorted question indices of each tag, followed by the number of all of them
+        question_indices (np.ndarray): sorted indices of questions with each tag, one tag after another
+        num_of_questions (int): number of questions whose tags are indexed
+    """
+
+    def __init__(self, tag_names: Sequence[str], indptr: np.ndarray, question_indices: np.ndarray,
+                 num_of_questions: int) -> None:
+        """Initialize tag index from its arrays.
+
+        Args:
+            tag_names: sorted names of all tags
+            indptr: offset of sorted question indices of each tag, followed by the number of all of them
+            question_indices: sorted indices of questions with each tag, one tag after another
+            num_of_questions: number of questions whose tags are indexed
+
+        Returns:
+            no value
+        """
+        if len(indptr) != len(tag_names) + 1 or indptr[-1] != len(question_indices):
+            raise ValueError('Offsets of tags do not match tag names and question indices')
+
+        self.tag_names = list(tag_names)
+        self.indptr = indptr
+        self.question_indices = question_indices
+        self.num_of_questions = num_of_questions
+
+    @classmethod
+    def empty(cls, num_of_questions: int = 0) -> 'TagIndex':
+        """Create tag index of questions without tags.
+
+        Args:
+            num_of_questions: number of questions
+
+        Returns:
+            Tag index without tags
+        """
+        return cls([], np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32), num_of_questions)
+
+    @classmethod
+    def from_question_tags(cls, question_tags: Sequence[Sequence[str]]) -> 'TagIndex':
+        """Create tag index from tags of each question.
+
+        Args:
+            question_tags: normalized tags of each question
+
+        Returns:
+            Tag index over given questions
+        """
+        tag_names = sorted(set(tag for tags in question_tags for tag in tags))
+        tag_positions = {tag: position for position, tag in enumerate(tag_names)}
+        lengths = np.fromiter((len(tags) for tags in question_tags), dtype=np.int64, count=len(question_tags))
+        tag_ids = np.fromiter((tag_positions[tag] for tags in question_tags for tag in tags), dtype=np.int32,
+                              count=int(lengths.sum()))
+        return cls.from_tag_ids(tag_names, lengths, tag_ids)
+
+    @classmethod
+    def from_tag_ids(cls, tag_names: Sequence[str], lengths: np.ndarray, tag_ids: np.ndarray,
+                     rows: Optional[np.ndarray] = None) -> 'TagIndex':
+        """Create tag index from positions of tags of each question in sorted tag names.
+
+        Args:
+            tag_names: sorted names of all tags
+            lengths: number of tags of each question
+            tag_ids: positions of tags of each question in tag names, one question after another
+            rows: questions whose tags are indexed, in their order (e.g. without duplicated questions). All questions
+                  are indexed if not given.
+
+        Returns:
+            Tag index over given questions
+        """
+        indptr = np.zeros(lengths.shape[0] + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        question_tags = CsrMatrix(indptr, tag_ids, np.ones(tag_ids.shape[0], dtype=bool),
+                                  (lengths.shape[0], len(tag_names)))
+        if rows is not None:
+            question_tags = question_tags.take_rows(rows)
+        tag_questions = question_tags.transpose()
+        return cls(tag_names, tag_questions.indptr, tag_questions.indices, question_tags.shape[0])
+
+    @property
+    def num_of_tags(self) -> int:
+        """Number of distinct tags."""
+        return len(self.tag_names)
+
+    @property
+    def nbytes(self) -> int:
+        """Size of arrays of the index in bytes, without tag names."""
+        return self.indptr.nbytes + self.question_indices.nbytes
+
+    def questions(self, tag: str) -> np.ndarray:
+        """Get indices of questions with given tag.
+
+        Args:
+            tag: name of the tag, which is normalized the same way as tags of questions
+
+        Returns:
+            numpy array with sorted indices of questions, empty if there is no such tag
+        """
+        tag = tag.strip().lower()
+        position = bisect_left(self.tag_names, tag)
+        if position == len(self.tag_names) or self.tag_names[position] != tag:
+            return self.question_indices[:0]
+        return self.question_indices[self.indptr[position]:self.indptr[position + 1]]
+
+    def filter(self, all_tags: Optional[Sequence[str]] = None,
+               any_tags: Optional[Sequence[str]] = None) -> Optional[np.ndarray]:
+        """Find questions that have all of the tags from one list and at least one of the tags from the other.
+
+        Args:
+            all_tags: tags that questions must all have (AND filter)
+            any_tags: tags that questions must have at least one of (OR filter)
+
+        Returns:
+            numpy array with sorted indices of matching questions, or None if no filter is given
+        """
+        if not all_tags and not any_tags:
+            return None
+
+        question_indices = None
+        if all_tags:
+            # shorter lists are intersected first, so that each intersection looks up fewer questions
+            for tag_questions in sorted((self.questions(tag) for tag in all_tags), key=len):
+                question_indices = tag_questions if question_indices is None else \
+                    _intersect(question_indices, tag_questions)
+        if any_tags:
+            any_questions = _union([self.questions(tag) for tag in any_tags], self.num_of_questions)
+            question_indices = any_questions if question_indices is None else \
+                _intersect(question_indices, any_questions)
+        return question_indices.astype(np.int64)
+
+
+def _intersect(question_indices: np.ndarray, other_question_indices: np.ndarray) -> np.ndarray:
+    """Intersect sorted question indices by looking each of them up in the other (usually longer) sorted indices.
+
+    Args:
+        question_indices: sorted indices of questions
+        other_question_indices: sorted indices of questions
+
+    Returns:
+        numpy array with sorted indices of questions that are in both arrays
+    """
+    if not other_question_indices.shape[0]:
+        return other_question_indices
+    positions = np.minimum(np.searchsorted(other_question_indices, question_indices),
+                           other_question_indices.shape[0] - 1)
+    return question_indices[other_question_indices[positions] == question_indices]
+
+
+def _union(question_indices: Sequence[np.ndarray], num_of_questions: int) -> np.ndarray:
+    """Merge sorted question indices.
+
+    Args:
+        question_indices: arrays with sorted indices of questions
+        num_of_questions: number of questions
+
+    Returns:
+        numpy array with sorted indices of questions that are in at least one of the arrays
+    """
+    if len(question_indices) == 1:
+        return question_indices[0]
+    question_indices = np.concatenate(question_indices)
+    if num_of_questions <= DENSE_ACCUMULATOR_RATIO * question_indices.shape[0]:
+        is_found = np.zeros(num_of_questions, dtype=bool)
+        is_found[question_indices] = True
+        return np.flatnonzero(is_found)
+    return np.unique(question_indices)
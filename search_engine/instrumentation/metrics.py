@@ -0,0 +1,370 @@
+import time
+import pstats
+import bisect
+import cProfile
+import threading
+from collections import OrderedDict
+from typing import *
+
+from constants import INSTRUMENTATION_ENABLED, LATENCY_HISTOGRAM_BUCKETS
+
+METRICS_PREFIX = 'question_search_engine'
+
+
+class Histogram:
+    """Histogram of observed values with fixed buckets, aggregated the same way as Prometheus histograms.
+
+    Attributes:
+        bounds (Tuple[float, ...]): sorted upper bounds of buckets, without the last (infinite) one
+        bucket_counts (List[int]): number of observed values in each bucket (not cumulative), including
+                                   the infinite one
+        count (int): number of observed values
+        sum (float): sum of observed values
+    """
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_HISTOGRAM_BUCKETS) -> None:
+        """Initialize empty histogram.
+
+        Args:
+            bounds: sorted upper bounds of buckets
+
+        Returns:
+            no value
+        """
+        self.bounds = tuple(bounds)
+        self.bucket_counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.
+
+    def observe(self, value: float) -> None:
+        """Add value to histogram.
+
+        Args:
+            value: observed value
+
+        Returns:
+            no value
+        """
+        self.bucket_counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self) -> List[int]:
+        """Number of observed values that are not greater than upper bound of each bucket.
+
+        Returns:
+            The list of cumulative counts, the last one for the infinite bucket
+        """
+        counts, total = [], 0
+        for bucket_count in self.bucket_counts:
+            total += bucket_count
+            counts.append(total)
+        return counts
+
+    def quantile(self, q: float) -> float:
+        """Estimate quantile of observed values as upper bound of the bucket that contains it.
+
+        Args:
+            q: quantile from [0, 1] range
+
+        Returns:
+            Upper bound of the bucket with quantile (infinity if it is in the last bucket, 0 if histogram is empty)
+        """
+        if self.count == 0:
+            return 0.
+        rank = q * self.count
+        for bound, cumulative_count in zip(self.bounds + (float('inf'),), self.cumulative_counts()):
+            if cumulative_count >= rank:
+                return bound
+        return float('inf')
+
+
+class CProfileSampler:
+    """Sampling profiler hook that runs sampled timed stages under cProfile and aggregates statistics per stage.
+
+    Each thread profiles into its own profiles, and runs that start while another run is profiled in the same
+    thread are not profiled, since only one profiler can be active in a thread.
+
+    Attributes:
+        _profiles (Dict[Tuple[str, int], cProfile.Profile]): profile of sampled runs of each stage in each thread
+        _active (threading.local): profiled run that is active in each thread
+        _lock (threading.Lock): lock for creating profiles
+    """
+
+    def __init__(self) -> None:
+        """Initialize sampler without profiles.
+
+        Returns:
+            no value
+        """
+        self._profiles = {}
+        self._active = threading.local()
+        self._lock = threading.Lock()
+
+    def __call__(self, stage: str) -> ContextManager:
+        """Create context manager that profiles one run of the stage.
+
+        Args:
+            stage: name of the stage
+
+        Returns:
+            Context manager that enables profiler of the stage while it is entered
+        """
+        if getattr(self._active, 'run', None) is not None:
+            return NULL_TIMER
+        with self._lock:
+            profile = self._profiles.setdefault((stage, threading.get_ident()), cProfile.Profile())
+        return _ProfiledRun(profile, self._active)
+
+    @property
+    def stages(self) -> List[str]:
+        """Names of profiled stages."""
+        return list(OrderedDict.fromkeys(stage for stage, _ in self._profiles))
+
+    def stats(self, stage: str) -> pstats.Stats:
+        """Get aggregated statistics of sampled runs of the stage.
+
+        Args:
+            stage: name of the stage
+
+        Returns:
+            Profiler statistics, which can be sorted and printed
+        """
+        with self._lock:
+            profiles = [profile for (profiled_stage, _), profile in self._profiles.items() if profiled_stage == stage]
+        if not profiles:
+            raise KeyError(f'Stage {stage} is not profiled')
+        return pstats.Stats(*profiles)
+
+
+class MetricsRegistry:
+    """Registry of per-stage timers and counters of the search hot path.
+
+    Time of each stage is aggregated into histogram. When registry is disabled, timers are shared no-op context
+    managers and counters return immediately, so instrumented code pays only for one attribute check.
+
+    Attributes:
+        enabled (bool): flag that indicates are timings and counters recorded
+        _histograms (OrderedDict): histogram of durations (in seconds) of each stage
+        _counters (OrderedDict): value of each counter
+        _profiler (Callable[[str], ContextManager]): optional hook that profiles sampled runs of stages
+        _sample_every (int): every how many-th run of a stage is profiled
+        _num_of_runs (Dict[str, int]): number of runs of each stage, used for sampling
+        _lock (threading.Lock): lock for changes of metrics
+    """
+
+    def __init__(self, enabled: bool = INSTRUMENTATION_ENABLED) -> None:
+        """Initialize registry without metrics.
+
+        Args:
+            enabled: flag that indicates are timings and counters recorded
+
+        Returns:
+            no value
+        """
+        self.enabled = enabled
+        self._histograms = OrderedDict()
+        self._counters = OrderedDict()
+        self._profiler = None
+        self._sample_every = 1
+        self._num_of_runs = {}
+        self._lock = threading.Lock()
+
+    def timer(self, stage: str) -> ContextManager:
+        """Create context manager that measures duration of the stage.
+
+        Args:
+            stage: name of the stage
+
+        Returns:
+            Context manager that records duration of the code it wraps
+        """
+        if not self.enabled:
+            return NULL_TIMER
+        return _StageTimer(self, stage)
+
+    def increment(self, counter: str, value: int = 1) -> None:
+        """Increment counter.
+
+        Args:
+            counter: name of the counter
+            value: increment
+
+        Returns:
+            no value
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + value
+
+    def observe(self, stage: str, duration: float) -> None:
+        """Record duration of one run of the stage.
+
+        Args:
+            stage: name of the stage
+            duration: duration in seconds
+
+        Returns:
+            no value
+        """
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.observe(duration)
+
+    def set_profiler(self, profiler: Optional[Callable[[str], ContextManager]], sample_every: int = 100) -> None:
+        """Set hook that profiles every sample_every-th run of each stage (e.g. CProfileSampler).
+
+        Args:
+            profiler: function that creates context manager profiling one run of given stage. Profiling is
+                      disabled if it is None.
+            sample_every: every how many-th run of a stage is profiled
+
+        Returns:
+            no value
+        """
+        with self._lock:
+            self._profiler = profiler
+            self._sample_every = max(1, sample_every)
+            self._num_of_runs = {}
+
+    def histogram(self, stage: str) -> Optional[Histogram]:
+        """Get histogram of durations of the stage.
+
+        Args:
+            stage: name of the stage
+
+        Returns:
+            Histogram, or None if stage has not been run
+        """
+        return self._histograms.get(stage)
+
+    def counter(self, counter: str) -> int:
+        """Get value of the counter.
+
+        Args:
+            counter: name of the counter
+
+        Returns:
+            Value of the counter
+        """
+        return self._counters.get(counter, 0)
+
+    def reset(self) -> None:
+        """Drop all recorded metrics.
+
+        Returns:
+            no value
+        """
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._num_of_runs = {}
+
+    def to_prometheus(self) -> str:
+        """Export metrics in Prometheus text exposition format.
+
+        Returns:
+            Text with stage duration histograms and counters
+        """
+        with self._lock:
+            histograms = [(stage, list(histogram.bounds), histogram.cumulative_counts(), histogram.sum,
+                           histogram.count) for stage, histogram in self._histograms.items()]
+            counters = list(self._counters.items())
+
+        lines = []
+        if histograms:
+            name = f'{METRICS_PREFIX}_stage_duration_seconds'
+            lines += [f'# HELP {name} Duration of search stages in seconds.', f'# TYPE {name} histogram']
+            for stage, bounds, cumulative_counts, total, count in histograms:
+                for bound, cumulative_count in zip(bounds + ['+Inf'], cumulative_counts):
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative_count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {total}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+        for counter, value in counters:
+            name = f'{METRICS_PREFIX}_{counter}_total'
+            lines += [f'# TYPE {name} counter', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+    def _sample_profiler(self, stage: str) -> Optional[ContextManager]:
+        """Get profiler context for the current run of the stage, if this run is sampled.
+
+        Args:
+            stage: name of the stage
+
+        Returns:
+            Profiler context manager, or None if run is not profiled
+        """
+        if self._profiler is None:
+            return None
+        with self._lock:
+            num_of_runs = self._num_of_runs.get(stage, 0)
+            self._num_of_runs[stage] = num_of_runs + 1
+        return self._profiler(stage) if num_of_runs % self._sample_every == 0 else None
+
+
+class _NullTimer:
+    """Timer that does nothing, used when instrumentation is disabled."""
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc_info: Any) -> None:
+        return None
+
+
+class _StageTimer:
+    """Timer that records duration of one run of a stage into registry.
+
+    Attributes:
+        _registry (MetricsRegistry): registry where duration is recorded
+        _stage (str): name of the stage
+        _profile (ContextManager): profiler context of sampled run, None otherwise
+        _start_time (float): time when the stage started
+    """
+
+    def __init__(self, registry: MetricsRegistry, stage: str) -> None:
+        self._registry = registry
+        self._stage = stage
+        self._profile = None
+        self._start_time = 0.
+
+    def __enter__(self) -> None:
+        self._profile = self._registry._sample_profiler(self._stage)
+        if self._profile is not None:
+            self._profile.__enter__()
+        self._start_time = time.perf_counter()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        duration = time.perf_counter() - self._start_time
+        if self._profile is not None:
+            self._profile.__exit__(*exc_info)
+        self._registry.observe(self._stage, duration)
+
+
+class _ProfiledRun:
+    """Context manager that enables profile while it is entered.
+
+    Attributes:
+        _profile (cProfile.Profile): profile that collects statistics
+        _active (threading.local): profiled run that is active in each thread
+    """
+
+    def __init__(self, profile: cProfile.Profile, active: threading.local) -> None:
+        self._profile = profile
+        self._active = active
+
+    def __enter__(self) -> None:
+        self._active.run = self
+        self._profile.enable()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._profile.disable()
+        self._active.run = None
+
+
+NULL_TIMER = _NullTimer()
+# registry shared by the search engine, vectorizer and service
+metrics = MetricsRegistry()
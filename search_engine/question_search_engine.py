@@ -1,69 +1,468 @@
+import time
+import threading
 import numpy as np
 from typing import *
 
 from settings import logger
+from constants import BATCH_SCORING_MEMORY_LIMIT, BYTES_PER_SCORED_POSTING, IDF_REFRESH_RATIO, MAX_NUM_OF_SEGMENTS, \
+    NUM_OF_PROBES, RESULT_CACHE_SIZE, RESULT_CACHE_TTL
+from search_engine.cache.result_cache import CacheStats, ResultCache
+from search_engine.corpus.corpus_loader import parse_tags
+from search_engine.corpus.question_store import QuestionStore
+from search_engine.index.csr_matrix import CsrMatrix
+from search_engine.index.incremental_index import IncrementalIndex
+from search_engine.index.ivf_index import IvfIndex
+from search_engine.index.sharded_index import ShardedIndex
+from search_engine.index.quantization import dequantize
+from search_engine.instrumentation.metrics import metrics
+from search_engine.vectorizer.preprocessor import QuestionPreprocessor
 from search_engine.vectorizer.tf_idf_vectorizer import TfIdfVectorizer
-from search_engine.similarity_scorer.similarity_metrics import cosine_similarity
+from search_engine.similarity_scorer.top_k_selection import select_top_k, select_top_k_rows
 
 
 class QuestionSearchEngine:
     """Search engine for QnA.
 
     Attributes:
-        _corpus (Sequence[str]): Raw question corpus
+        _corpus (QuestionStore): Raw question corpus in compact form, including removed questions
         _tf_idf_vectorizer (TfIdfVectorizer): Vectorizer that uses Tf-Idf scores
+        _index (IncrementalIndex): Index over vectorized question corpus, created on first use unless there are
+                                   multiple shards
+        _index_model_version (int): Model version of vectorizer that index is created from
+        _ivf_index (IvfIndex): Index over clusters of questions, used for approximate search
+        _approximate (bool): Flag that indicates should only questions from clusters similar to the query be scored
+        _num_of_shards (int): Number of shards that question corpus is partitioned into
+        _sharded_index (ShardedIndex): Index whose shards are scored in worker processes, used instead of
+                                       incremental index if there are multiple shards
+        _result_cache (ResultCache): Cache of results for queries with the same tokens
+        _lock (threading.Lock): Lock that keeps vectorizer unchanged while questions are added
+        _compaction_thread (threading.Thread): Thread that runs the last background compaction
+        num_of_probes (int): Number of clusters probed for each query in approximate search
     """
 
-    def __init__(self, questions: Sequence[str], fit_vectorizer: bool = True) -> None:
+    def __init__(self, questions: Sequence[str], fit_vectorizer: bool = True,
+                 tf_idf_vectorizer: Optional[TfIdfVectorizer] = None, n_jobs: int = 1,
+                 result_cache_size: int = RESULT_CACHE_SIZE, result_cache_ttl: float = RESULT_CACHE_TTL,
+                 approximate: bool = False, num_of_probes: int = NUM_OF_PROBES, num_of_shards: int = 1) -> None:
         """Initialize search engine by creating Tf-Idf vectorizer and vectorizing question corpus.
 
         Args:
-            questions: sequence of raw question corpus
+            questions: sequence of raw question corpus. It is copied into compact question store, unless it is
+                       question store already.
             fit_vectorizer: flag that indicates if fit of Tf-Idf vectorizer mandatory
+            tf_idf_vectorizer: vectorizer that should be used instead of the default one
+            n_jobs: number of processes used for fitting Tf-Idf vectorizer
+            result_cache_size: maximal number of cached query results (0 disables caching)
+            result_cache_ttl: time to live of cached query results in seconds
+            approximate: flag that indicates should questions be clustered, so that only questions from clusters
+                         similar to the query are scored. Results are approximate, but scoring cost depends on
+                         the number of probed clusters instead of the corpus size.
+            num_of_probes: number of clusters probed for each query in approximate search
+            num_of_shards: number of shards that question corpus is partitioned into. If greater than 1, each shard
+                           is scored in its own worker process and top questions of shards are merged, with results
+                           identical to the ones from a single shard. Sharded index can not be changed with
+                           add_questions and remove_questions, vectorizer has to be fitted again instead.
 
         Returns:
             no value
         """
-        self._corpus = questions
-        self._tf_idf_vectorizer = TfIdfVectorizer(use_cache=True)
+        if num_of_shards > 1 and approximate:
+            raise ValueError('Approximate search is not supported with multiple shards')
+
+        self._corpus = questions if isinstance(questions, QuestionStore) else QuestionStore.from_questions(questions)
+        self._tf_idf_vectorizer = tf_idf_vectorizer if tf_idf_vectorizer is not None else \
+            TfIdfVectorizer(use_cache=True)
         if fit_vectorizer:
-            self._tf_idf_vectorizer.fit(questions)
+            self._tf_idf_vectorizer.fit(questions, n_jobs=n_jobs)
+
+        self._index = None
+        self._index_model_version = None
+        self._ivf_index = None
+        self._approximate = approximate
+        self._num_of_shards = num_of_shards
+        self._sharded_index = None
+        self._result_cache = ResultCache(result_cache_size, result_cache_ttl)
+        self._lock = threading.Lock()
+        self._compaction_thread = None
+        self.num_of_probes = num_of_probes
+
+        # clusters and shards are built together with the fitted model
+        if fit_vectorizer and (approximate or num_of_shards > 1):
+            self._get_index()
+
+    @property
+    def result_cache_stats(self) -> CacheStats:
+        """Hit and miss statistics of query result cache."""
+        return self._result_cache.stats
 
-    def most_similar(self, query: str, n: int = 5) -> List[Tuple[float, str]]:
+    def load(self) -> None:
+        """Load vectorizer and create index ahead of the first query (e.g. before worker processes are forked,
+        so that they share the loaded index).
+
+        Returns:
+            no value
+        """
+        self._get_index()
+
+    def close(self) -> None:
+        """Stop worker processes of shards. They are started again if search engine is used afterwards.
+
+        Returns:
+            no value
+        """
+        if self._sharded_index is not None:
+            self._sharded_index.close()
+
+    def most_similar(self, query: str, n: int = 5, all_tags: Union[str, Sequence[str], None] = None,
+                     any_tags: Union[str, Sequence[str], None] = None) -> List[Tuple[float, str]]:
         """Find top n most similar questions from corpus, using cosine similarity as score.
 
+        If tag filters are given, only questions with matching tags are scored, so there are n results whenever
+        enough of them share a term with the query. Questions added with add_questions have no tags.
+
+        Results are cached for queries with the same tokens and tag filters, until the index changes.
+
         Args:
             query: raw questions input from the user
             n: number of similar questions that should be found
+            all_tags: tags that similar questions must all have, in angle brackets (e.g. "<python><pytest>") or as
+                      sequence of tags
+            any_tags: tags that similar questions must have at least one of, in angle brackets or as sequence of tags
 
         Returns:
             The list of top n most similar questions from corpus with similarity scores.
         """
         logger.info(f'Matching top {n} similar questions for question "{query}" started')
-        vectorized_query = self._tf_idf_vectorizer.transform([query])
+        metrics.increment('queries')
+        all_tags, any_tags = parse_tags(all_tags), parse_tags(any_tags)
+        index = self._get_index()
+        cache_key, cache_version = self._cache_key(query, n, all_tags, any_tags), self._cache_version(index)
+        result = self._result_cache.get(cache_key, cache_version)
+        if result is not None:
+            metrics.increment('cached_queries')
+            logger.info(f'Matching top {n} similar questions done - {len(result)} cached results')
+            return list(result)
+
+        # questions with filtered tags are found before scoring, so that only they are scored
+        filtered_indices = self._corpus.tag_index.filter(all_tags, any_tags) if all_tags or any_tags else None
+        if self._sharded_index is not None:
+            # shards select their own top n questions, which are merged into global top n
+            vectorized_query = self._tf_idf_vectorizer.transform([query], sparse=True, use_query_cache=True)
+            # shards score and select their top questions in parallel, so both stages are timed as scoring
+            with metrics.timer('score'):
+                top_results = self._sharded_index.top_k_batch(vectorized_query, n, filtered_indices)
+            result = self._build_result(*top_results[0])
+        else:
+            vectorized_query = self._tf_idf_vectorizer.transform([query], use_query_cache=True)[0]
+
+            # only questions that share at least one term with the query get nonzero score, and only those that
+            # can be among top n are scored
+            with metrics.timer('score'):
+                question_indices, cosine_similarity_scores = self._score(index, vectorized_query, n, filtered_indices)
+            # take top n cosine similarity scores, already ordered from the highest one
+            with metrics.timer('select'):
+                top_positions = select_top_k(cosine_similarity_scores, n)
+            result = self._build_result(question_indices[top_positions], cosine_similarity_scores[top_positions])
+        self._result_cache.put(cache_key, tuple(result), cache_version)
+        logger.info(f'Matching top {n} similar questions done - {len(result)} results')
+
+        return result
+
+    def most_similar_batch(self, queries: Sequence[str], n: int = 5,
+                           batch_size: Optional[int] = None) -> List[List[Tuple[float, str]]]:
+        """Find top n most similar questions from corpus for each query, using cosine similarity as score.
+
+        Queries whose results are not cached are vectorized at once and scored against the corpus in chunks of
+        queries, with one sparse matrix multiplication per chunk. Chunks are limited by number of postings they
+        touch, so memory used for intermediate scores stays bounded by BATCH_SCORING_MEMORY_LIMIT. In approximate
+        search, each query is scored against its own candidates.
 
-        cosine_similarity_scores = cosine_similarity(vectorized_query, self._tf_idf_vectorizer.questions)
-        question_ids = np.asarray(range(len(self._tf_idf_vectorizer.questions)))
+        Args:
+            queries: sequence of raw questions
+            n: number of similar questions that should be found for each query
+            batch_size: maximal number of queries scored in one matrix multiplication
+
+        Returns:
+            The list with top n most similar questions from corpus with similarity scores for each query,
+            in the same order as given queries.
+        """
+        logger.info(f'Matching top {n} similar questions for batch of {len(queries)} questions started')
+        start_time = time.perf_counter()
 
-        nonzero_indices = np.nonzero(cosine_similarity_scores)[0]
-        num_of_nonzeros = nonzero_indices.shape[0]
+        index = self._get_index()
+        cache_keys, cache_version = [self._cache_key(query, n) for query in queries], self._cache_version(index)
+        results = [self._result_cache.get(cache_key, cache_version) for cache_key in cache_keys]
+        results = [list(result) if result is not None else None for result in results]
+        missing_queries = [i for i, result in enumerate(results) if result is None]
+        metrics.increment('queries', len(queries))
+        metrics.increment('cached_queries', len(queries) - len(missing_queries))
 
-        if num_of_nonzeros == 0:
-            logger.info(f'Matching top {n} similar questions done - 0 results')
-            return []
+        vectorized_queries = self._tf_idf_vectorizer.transform([queries[i] for i in missing_queries], sparse=True,
+                                                               use_query_cache=True)
+        if self._ivf_index is not None:
+            # each query has its own candidates in approximate search, so queries are scored one by one
+            for row, i in enumerate(missing_queries):
+                with metrics.timer('score'):
+                    question_indices, cosine_similarity_scores = self._score(
+                        index, vectorized_queries.row_slice(row, row + 1).toarray()[0])
+                with metrics.timer('select'):
+                    top_positions = select_top_k(cosine_similarity_scores, n)
+                results[i] = self._build_result(question_indices[top_positions],
+                                                cosine_similarity_scores[top_positions])
+                self._result_cache.put(cache_keys[i], tuple(results[i]), cache_version)
         else:
-            # filter nonzero cosine similarity scores
-            cosine_similarity_scores = np.take(cosine_similarity_scores, nonzero_indices)
-            question_indices = np.take(question_ids, nonzero_indices)
-            if num_of_nonzeros > n:
-                # take top n cosine similarity scores
-                high_scores_indices = np.argsort(cosine_similarity_scores)[-n:]
-                cosine_similarity_scores = np.take(cosine_similarity_scores, high_scores_indices)
-                question_indices = np.take(question_indices, high_scores_indices)
-
-            cosine_similarity_scores = [np.round(score, 4) for score in cosine_similarity_scores]
-            questions = [self._corpus[idx] for idx in question_indices]
-            result = list(zip(cosine_similarity_scores, questions))
-            logger.info(f'Matching top {n} similar questions done - {len(result)} results')
-
-        return sorted(result, key=lambda pair: pair[0], reverse=True)
+            for start, end in self._split_into_chunks(vectorized_queries, batch_size):
+                if self._sharded_index is not None:
+                    with metrics.timer('score'):
+                        top_results = self._sharded_index.top_k_batch(vectorized_queries.row_slice(start, end), n)
+                else:
+                    with metrics.timer('score'):
+                        query_indices, question_indices, cosine_similarity_scores = index.score_batch(
+                            vectorized_queries.row_slice(start, end))
+                    with metrics.timer('select'):
+                        top_results = select_top_k_rows(query_indices, question_indices, cosine_similarity_scores,
+                                                        end - start, n)
+                for i, (top_question_indices, top_scores) in zip(missing_queries[start:end], top_results):
+                    results[i] = self._build_result(top_question_indices, top_scores)
+                    self._result_cache.put(cache_keys[i], tuple(results[i]), cache_version)
+
+        elapsed_time = time.perf_counter() - start_time
+        logger.info(f'Matching top {n} similar questions for batch of {len(queries)} questions done - '
+                    f'{len(queries) / max(elapsed_time, 1e-9):.1f} queries/sec, '
+                    f'{len(queries) - len(missing_queries)} cached results')
+
+        return results
+
+    def add_questions(self, questions: Sequence[str]) -> List[int]:
+        """Add questions to the corpus without refitting Tf-Idf vectorizer.
+
+        Added questions are vectorized with the current vocabulary and IDF vector and indexed as a new segment.
+        Words that are not in vocabulary are ignored. Index is compacted in background (refreshing IDF vector)
+        when there are too many segments or too many questions changed since the last IDF refresh.
+
+        Args:
+            questions: sequence of raw questions
+
+        Returns:
+            The list of indices assigned to added questions
+        """
+        self._check_not_sharded()
+        index = self._get_index()
+        # vectorizer must not get refreshed IDF vector between vectorizing and indexing of questions
+        with self._lock:
+            idf_vector = self._tf_idf_vectorizer.idf_vector
+            vectorized_questions = self._tf_idf_vectorizer.transform(questions, sparse=True)
+            # corpus is extended first, so that queries never get indices of questions missing from corpus
+            self._corpus.extend(questions)
+            question_indices = index.add(vectorized_questions, idf_vector)
+            if self._ivf_index is not None:
+                self._ivf_index.add(vectorized_questions)
+        logger.info(f'Adding {len(questions)} questions finished - {index.num_of_segments} index segments')
+
+        self._compact_if_needed(index)
+        return question_indices.tolist()
+
+    def remove_questions(self, question_indices: Sequence[int]) -> int:
+        """Remove questions from the corpus without refitting Tf-Idf vectorizer. Removed questions are never
+        returned as similar questions, and indices of the remaining questions stay the same.
+
+        Args:
+            question_indices: indices of questions that should be removed
+
+        Returns:
+            Number of removed questions, without the ones that were already removed
+        """
+        self._check_not_sharded()
+        index = self._get_index()
+        num_of_removed = index.remove(question_indices)
+        logger.info(f'Removing {num_of_removed} questions finished')
+
+        self._compact_if_needed(index)
+        return num_of_removed
+
+    def compact(self, refresh_idf: bool = True, background: bool = False) -> None:
+        """Merge index segments, drop removed questions from the index and optionally refresh IDF vector.
+
+        Args:
+            refresh_idf: flag that indicates should IDF vector be recalculated from current document frequencies
+            background: flag that indicates should compaction run in a background thread, while queries are
+                        served from the current index
+
+        Returns:
+            no value
+        """
+        self._check_not_sharded()
+        index = self._get_index()
+        if not background:
+            self._compact(index, refresh_idf)
+            return
+
+        self._compaction_thread = threading.Thread(target=self._compact, args=(index, refresh_idf), daemon=True)
+        self._compaction_thread.start()
+
+    def wait_for_compaction(self) -> None:
+        """Wait until background compaction finishes.
+
+        Returns:
+            no value
+        """
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+
+    def _get_index(self) -> Union[IncrementalIndex, ShardedIndex]:
+        """Get index over vectorized question corpus, creating it from vectorizer on first use.
+
+        Returns:
+            Index over vectorized question corpus, sharded index if there are multiple shards
+        """
+        # index is created again when vectorizer is fitted again
+        if self._index_model_version != self._tf_idf_vectorizer.model_version:
+            self._tf_idf_vectorizer.load()
+            self._index_model_version = self._tf_idf_vectorizer.model_version
+            if self._num_of_shards > 1:
+                self.close()
+                self._sharded_index = ShardedIndex(self._tf_idf_vectorizer.questions, self._num_of_shards,
+                                                   self._tf_idf_vectorizer.inverted_index.question_scales)
+                # workers build inverted indices of their own shards, so inverted index over all questions is dropped
+                self._tf_idf_vectorizer.inverted_index = None
+                return self._sharded_index
+
+            self._index = IncrementalIndex(self._tf_idf_vectorizer.questions, self._tf_idf_vectorizer.inverted_index,
+                                           self._tf_idf_vectorizer.idf_vector)
+            if self._approximate:
+                self._ivf_index = IvfIndex.build(dequantize(self._tf_idf_vectorizer.questions,
+                                                             self._tf_idf_vectorizer.inverted_index.question_scales))
+        return self._sharded_index if self._sharded_index is not None else self._index
+
+    def _check_not_sharded(self) -> None:
+        """Check that questions can be added to the index and removed from it.
+
+        Returns:
+            no value
+        """
+        if self._num_of_shards > 1:
+            raise ValueError('Sharded index can not be changed, vectorizer has to be fitted again instead')
+
+    def _score(self, index: IncrementalIndex, vectorized_query: np.ndarray, n: Optional[int] = None,
+               question_indices: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Calculate cosine similarity scores between query and questions, either exactly or only for candidates
+        from probed clusters in approximate search.
+
+        Args:
+            index: index over vectorized question corpus
+            vectorized_query: numpy array of (D,) shape with Tf-Idf vector representation of the query
+            n: number of top questions that are needed. If it is given, exact search skips questions that can not
+               be among top n.
+            question_indices: sorted indices of questions that may be scored (e.g. questions with filtered tags).
+                              All questions may be scored if they are not given.
+
+        Returns:
+            Pair of numpy arrays - sorted indices of questions with nonzero scores and their scores
+        """
+        if self._ivf_index is None:
+            return index.score(vectorized_query, n, question_indices)
+        candidates = self._ivf_index.candidates(vectorized_query, self.num_of_probes)
+        if question_indices is not None:
+            candidates = np.intersect1d(candidates, question_indices, assume_unique=True)
+        return index.score_candidates(vectorized_query, candidates)
+
+    def _cache_key(self, query: str, n: int, all_tags: Sequence[str] = (), any_tags: Sequence[str] = ()) -> Hashable:
+        """Build key of query results, which is the same for all queries with the same tokens and tag filters.
+
+        Args:
+            query: raw question
+            n: number of similar questions that should be found
+            all_tags: normalized tags that similar questions must all have
+            any_tags: normalized tags that similar questions must have at least one of
+
+        Returns:
+            Key of query results
+        """
+        num_of_probes = self.num_of_probes if self._approximate else None
+        return tuple(sorted(QuestionPreprocessor().preprocess_query(query))), n, num_of_probes, \
+            tuple(sorted(all_tags)), tuple(sorted(any_tags))
+
+    def _cache_version(self, index: Union[IncrementalIndex, ShardedIndex]) -> Hashable:
+        """Version of the index, which changes whenever vectorizer is fitted or index is changed.
+
+        Args:
+            index: index over vectorized question corpus
+
+        Returns:
+            Version of the index
+        """
+        return self._tf_idf_vectorizer.model_version, index.version
+
+    def _compact_if_needed(self, index: IncrementalIndex) -> None:
+        """Start background compaction if index has too many segments or stale IDF vector, and no compaction
+        is running already.
+
+        Args:
+            index: index over vectorized question corpus
+
+        Returns:
+            no value
+        """
+        is_compacting = self._compaction_thread is not None and self._compaction_thread.is_alive()
+        if not is_compacting and index.needs_compaction(MAX_NUM_OF_SEGMENTS, IDF_REFRESH_RATIO):
+            self.compact(refresh_idf=True, background=True)
+
+    def _compact(self, index: IncrementalIndex, refresh_idf: bool) -> None:
+        """Compact index and pass compacted corpus and IDF vector to vectorizer, so that new queries and
+        questions are vectorized with refreshed IDF vector.
+
+        Args:
+            index: index over vectorized question corpus
+            refresh_idf: flag that indicates should IDF vector be recalculated
+
+        Returns:
+            no value
+        """
+        logger.info('Compacting index started')
+        merged_segment = index.compact(refresh_idf=refresh_idf)
+        with self._lock:
+            self._tf_idf_vectorizer.update_index(merged_segment.questions, merged_segment.inverted_index,
+                                                 index.idf_vector)
+        logger.info(f'Compacting index finished - {index.num_of_segments} index segments')
+
+    def _split_into_chunks(self, vectorized_queries: CsrMatrix,
+                           batch_size: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Split vectorized queries into chunks of consecutive queries, so that postings touched by each chunk
+        fit into BATCH_SCORING_MEMORY_LIMIT.
+
+        Args:
+            vectorized_queries: vectorized queries as CSR matrix
+            batch_size: maximal number of queries in one chunk
+
+        Returns:
+            The list of (start, end) bounds of chunks
+        """
+        max_postings = max(1, BATCH_SCORING_MEMORY_LIMIT // BYTES_PER_SCORED_POSTING)
+        max_queries = batch_size if batch_size is not None else vectorized_queries.shape[0]
+        postings_per_query = vectorized_queries.sum_rows(
+            self._get_index().postings_lengths(vectorized_queries.indices))
+
+        chunks = []
+        start, num_of_postings = 0, 0
+        for end, query_postings in enumerate(postings_per_query.tolist()):
+            if end > start and (num_of_postings + query_postings > max_postings or end - start >= max_queries):
+                chunks.append((start, end))
+                start, num_of_postings = end, 0
+            num_of_postings += query_postings
+        if start < vectorized_queries.shape[0]:
+            chunks.append((start, vectorized_queries.shape[0]))
+
+        return chunks
+
+    def _build_result(self, question_indices: np.ndarray, scores: np.ndarray) -> List[Tuple[float, str]]:
+        """Pair rounded similarity scores with raw content of corresponding questions.
+
+        Args:
+            question_indices: indices of questions in corpus
+            scores: cosine similarity scores of those questions
+
+        Returns:
+            The list of (similarity score, question) pairs
+        """
+        with metrics.timer('corpus_lookup'):
+            return list(zip(np.round(scores, 4).tolist(), [self._corpus[idx] for idx in question_indices]))
@@ -0,0 +1,288 @@
+import os
+import gc
+import time
+import signal
+import socket
+import asyncio
+from typing import *
+
+from settings import logger
+from constants import MAX_BATCH_SIZE, MAX_BATCH_WAIT_TIME, NUM_OF_WORKERS, SERVICE_HOST, SERVICE_PORT, \
+    SHUTDOWN_TIMEOUT
+from search_engine.question_search_engine import QuestionSearchEngine
+from search_engine.service.search_service import SearchService
+
+# time in seconds between two checks of signals and exited workers in parent process
+SUPERVISION_INTERVAL = 0.05
+LISTEN_BACKLOG = 1024
+SERVER_SIGNALS = {signal.SIGHUP, signal.SIGTERM, signal.SIGINT}
+
+
+class PreforkServer:
+    """Parent process of search service workers that share one read-only index.
+
+    Search engine is loaded once in the parent process, which then forks worker processes. Workers share memory
+    mapped index through the OS page cache, and other loaded data (e.g. raw questions) copy-on-write. All workers
+    accept connections from one listening socket, so the kernel distributes connections across them.
+    Parent restarts workers that exit unexpectedly and handles signals (POSIX only):
+        SIGHUP - graceful reload: search engine is loaded again from the published index (e.g. after it is
+                 fitted again in another process), new workers are forked from it and old workers are stopped
+                 after requests that they handle get their responses. If loading fails, old workers keep serving.
+        SIGTERM, SIGINT - graceful stop of all workers and the parent.
+
+    Attributes:
+        host (str): host that workers listen on
+        port (int): port that workers listen on (the assigned one, after socket is bound to port 0)
+        num_of_workers (int): number of worker processes
+        _load_search_engine (Callable[[], QuestionSearchEngine]): function that loads search engine from
+                                                                  the published index
+        _search_engine (QuestionSearchEngine): search engine that current workers are forked with
+        _max_batch_size (int): maximal number of queries scored together by each worker
+        _max_wait_time (float): maximal time in seconds that the first query of a batch waits for other queries
+        _socket (socket.socket): listening socket shared by workers
+        _workers (Set[int]): process IDs of workers of the current search engine
+        _stopping_workers (Set[int]): process IDs of workers that are being stopped
+        _reload_requested (bool): flag that indicates is reload requested by signal
+        _stop_requested (bool): flag that indicates is stop requested by signal
+    """
+
+    def __init__(self, load_search_engine: Callable[[], QuestionSearchEngine], num_of_workers: int = NUM_OF_WORKERS,
+                 host: str = SERVICE_HOST, port: int = SERVICE_PORT, max_batch_size: int = MAX_BATCH_SIZE,
+                 max_wait_time: float = MAX_BATCH_WAIT_TIME,
+                 search_engine: Optional[QuestionSearchEngine] = None) -> None:
+        """Initialize server. Search engine is loaded and workers are forked when server is started.
+
+        Args:
+            load_search_engine: function that loads search engine from the published index, called on start
+                                (unless search engine is given) and on every reload
+            num_of_workers: number of worker processes
+            host: host that workers listen on
+            port: port that workers listen on. Free port is assigned if it is 0.
+            max_batch_size: maximal number of queries scored together by each worker
+            max_wait_time: maximal time in seconds that the first query of a batch waits for other queries
+            search_engine: already loaded search engine that the first workers are forked with
+
+        Returns:
+            no value
+        """
+        if num_of_workers < 1:
+            raise ValueError(f'Number of workers has to be positive, but it is {num_of_workers}')
+
+        self.host = host
+        self.port = port
+        self.num_of_workers = num_of_workers
+        self._load_search_engine = load_search_engine
+        self._search_engine = search_engine
+        self._max_batch_size = max_batch_size
+        self._max_wait_time = max_wait_time
+        self._socket = None
+        self._workers = set()
+        self._stopping_workers = set()
+        self._reload_requested = False
+        self._stop_requested = False
+
+    def bind(self) -> int:
+        """Bind listening socket shared by workers, if it is not bound already.
+
+        Returns:
+            Port that socket is bound to
+        """
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._socket.bind((self.host, self.port))
+            self._socket.listen(LISTEN_BACKLOG)
+            self.port = self._socket.getsockname()[1]
+        return self.port
+
+    def serve_forever(self) -> None:
+        """Load search engine, fork workers and supervise them until stop is requested by signal.
+
+        Returns:
+            no value
+        """
+        self.bind()
+        if self._search_engine is None:
+            self._search_engine = self._load_search_engine()
+        self._search_engine.load()
+
+        signal.signal(signal.SIGHUP, self._request_reload)
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        self._spawn_workers(self.num_of_workers)
+        logger.info(f'Prefork server started on {self.host}:{self.port} with {self.num_of_workers} workers')
+
+        try:
+            while not self._stop_requested:
+                if self._reload_requested:
+                    self._reload_requested = False
+                    self._reload()
+                self._reap_workers()
+                # workers that exited unexpectedly are replaced
+                if len(self._workers) < self.num_of_workers:
+                    self._spawn_workers(self.num_of_workers - len(self._workers))
+                time.sleep(SUPERVISION_INTERVAL)
+        finally:
+            self._stop_workers(self._workers)
+            deadline = time.perf_counter() + SHUTDOWN_TIMEOUT
+            while self._stopping_workers and time.perf_counter() < deadline:
+                self._reap_workers()
+                time.sleep(SUPERVISION_INTERVAL)
+            # workers that did not stop in time are killed
+            self._stop_workers(self._stopping_workers, signal.SIGKILL)
+            while self._stopping_workers:
+                self._reap_workers(block=True)
+            self._socket.close()
+            logger.info('Prefork server stopped')
+
+    def _request_reload(self, signal_number: int, frame: Any) -> None:
+        """Handle reload signal.
+
+        Args:
+            signal_number: number of received signal
+            frame: current stack frame
+
+        Returns:
+            no value
+        """
+        self._reload_requested = True
+
+    def _request_stop(self, signal_number: int, frame: Any) -> None:
+        """Handle stop signal.
+
+        Args:
+            signal_number: number of received signal
+            frame: current stack frame
+
+        Returns:
+            no value
+        """
+        self._stop_requested = True
+
+    def _reload(self) -> None:
+        """Load search engine from the published index, fork new workers with it and stop old workers.
+
+        Returns:
+            no value
+        """
+        logger.info('Reloading search engine started')
+        try:
+            search_engine = self._load_search_engine()
+            search_engine.load()
+        except Exception:
+            logger.exception('Reloading search engine failed - old workers keep serving')
+            return
+
+        # new workers accept connections before old ones stop, so that connections are never refused
+        old_workers = set(self._workers)
+        self._search_engine = search_engine
+        self._workers = set()
+        self._spawn_workers(self.num_of_workers)
+        self._stop_workers(old_workers)
+        logger.info('Reloading search engine finished')
+
+    def _spawn_workers(self, num_of_workers: int) -> None:
+        """Fork worker processes that serve current search engine.
+
+        Args:
+            num_of_workers: number of forked workers
+
+        Returns:
+            no value
+        """
+        # objects loaded so far are excluded from garbage collection, so that workers do not touch (and copy)
+        # their pages while collecting garbage
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+        # signals are blocked until worker replaces signal handlers of the parent
+        signal.pthread_sigmask(signal.SIG_BLOCK, SERVER_SIGNALS)
+        try:
+            for _ in range(num_of_workers):
+                self._workers.add(self._fork_worker())
+        finally:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, SERVER_SIGNALS)
+
+    def _fork_worker(self) -> int:
+        """Fork one worker process.
+
+        Returns:
+            Process ID of the worker
+        """
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 1
+            try:
+                self._run_worker()
+                exit_code = 0
+            except Exception:
+                logger.exception(f'Worker {os.getpid()} failed')
+            finally:
+                # worker must not return into the supervision loop of the parent
+                os._exit(exit_code)
+        return pid
+
+    def _stop_workers(self, workers: Set[int], signal_number: int = signal.SIGTERM) -> None:
+        """Send stop signal to workers.
+
+        Args:
+            workers: process IDs of workers
+            signal_number: number of sent signal
+
+        Returns:
+            no value
+        """
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal_number)
+            except ProcessLookupError:
+                pass
+            workers.discard(pid)
+            self._stopping_workers.add(pid)
+
+    def _reap_workers(self, block: bool = False) -> None:
+        """Collect exit status of exited workers.
+
+        Args:
+            block: flag that indicates should it wait for at least one worker to exit
+
+        Returns:
+            no value
+        """
+        while self._workers or self._stopping_workers:
+            try:
+                pid, status = os.waitpid(-1, 0 if block else os.WNOHANG)
+            except ChildProcessError:
+                self._workers.clear()
+                self._stopping_workers.clear()
+                return
+            if pid == 0:
+                return
+            if pid in self._workers:
+                logger.warning(f'Worker {pid} exited unexpectedly with status {status}')
+            self._workers.discard(pid)
+            self._stopping_workers.discard(pid)
+            block = False
+
+    def _run_worker(self) -> None:
+        """Serve requests with search service in forked worker process, until it gets stop signal.
+
+        Returns:
+            no value
+        """
+        # only the parent reloads and stops the server on interrupt
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        service = SearchService(self._search_engine, max_batch_size=self._max_batch_size,
+                                max_wait_time=self._max_wait_time, sock=self._socket)
+        stopped = asyncio.Event()
+        loop.add_signal_handler(signal.SIGTERM, stopped.set)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, SERVER_SIGNALS)
+
+        loop.run_until_complete(service.start())
+        loop.run_until_complete(stopped.wait())
+        loop.run_until_complete(service.close())
+        loop.close()
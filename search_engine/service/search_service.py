@@ -0,0 +1,583 @@
+import os
+import json
+import time
+import socket
+import asyncio
+import threading
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import *
+
+from settings import logger
+from constants import LATENCY_WINDOW_SIZE, MAX_BATCH_SIZE, MAX_BATCH_WAIT_TIME, MAX_NUM_OF_REQUEST_HEADERS, \
+    MAX_REQUEST_BODY_SIZE, SERVICE_HOST, SERVICE_PORT, SHUTDOWN_TIMEOUT
+from search_engine.instrumentation.metrics import metrics
+from search_engine.question_search_engine import QuestionSearchEngine
+
+
+HTTP_STATUSES = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class RequestError(ValueError):
+    """Error of HTTP request that can not be read, which is answered with its status before connection is closed.
+
+    Attributes:
+        status (int): HTTP status of the response
+    """
+
+    def __init__(self, status: int, message: str) -> None:
+        """Initialize error with HTTP status of the response.
+
+        Args:
+            status: HTTP status of the response
+            message: description of the error
+
+        Returns:
+            no value
+        """
+        super().__init__(message)
+        self.status = status
+
+
+class LatencyStats(NamedTuple):
+    """Latency statistics of the most recent requests.
+
+    Attributes:
+        num_of_requests (int): number of requests that statistics are calculated from
+        p50 (float): median latency in seconds
+        p99 (float): 99th percentile of latency in seconds
+        max (float): maximal latency in seconds
+    """
+    num_of_requests: int
+    p50: float
+    p99: float
+    max: float
+
+
+class BatchingStats(NamedTuple):
+    """Statistics of micro-batching.
+
+    Attributes:
+        num_of_batches (int): number of scored batches
+        num_of_queries (int): number of scored queries
+    """
+    num_of_batches: int
+    num_of_queries: int
+
+    @property
+    def mean_batch_size(self) -> float:
+        """Average number of queries scored together."""
+        return self.num_of_queries / max(self.num_of_batches, 1)
+
+
+class LatencyRecorder:
+    """Recorder of request latencies over a window of the most recent requests.
+
+    Attributes:
+        _latencies (deque): latencies of the most recent requests in seconds
+        _lock (threading.Lock): lock for changes of recorded latencies
+    """
+
+    def __init__(self, window_size: int = LATENCY_WINDOW_SIZE) -> None:
+        """Initialize recorder without latencies.
+
+        Args:
+            window_size: number of the most recent requests that statistics are calculated from
+
+        Returns:
+            no value
+        """
+        self._latencies = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self) -> LatencyStats:
+        """Latency percentiles of the most recent requests."""
+        with self._lock:
+            latencies = np.asarray(self._latencies, dtype=np.float64)
+        if latencies.shape[0] == 0:
+            return LatencyStats(0, 0.0, 0.0, 0.0)
+        p50, p99 = np.percentile(latencies, [50, 99]).tolist()
+        return LatencyStats(latencies.shape[0], p50, p99, float(latencies.max()))
+
+    def record(self, latency: float) -> None:
+        """Record latency of one request.
+
+        Args:
+            latency: latency in seconds
+
+        Returns:
+            no value
+        """
+        with self._lock:
+            self._latencies.append(latency)
+
+
+class MicroBatcher:
+    """Coalescer of concurrent queries into batches that are scored together with one matrix multiplication.
+
+    The first query of a batch waits at most max_wait_time for other queries, and batch is scored as soon as it
+    has max_batch_size queries. Batches are scored one at a time in a worker thread, so that the event loop keeps
+    accepting queries, which form the next batch while the current one is scored.
+
+    Attributes:
+        _search_engine (QuestionSearchEngine): search engine that scores batches
+        max_batch_size (int): maximal number of queries scored together
+        max_wait_time (float): maximal time in seconds that the first query of a batch waits for other queries
+        _executor (ThreadPoolExecutor): executor with one worker thread that scores batches
+        _queue (asyncio.Queue): queries waiting for a batch, with number of results and future for results
+        _batch_loop (asyncio.Task): task that collects and scores batches
+        _num_of_batches (int): number of scored batches
+        _num_of_queries (int): number of scored queries
+    """
+
+    def __init__(self, search_engine: QuestionSearchEngine, max_batch_size: int = MAX_BATCH_SIZE,
+                 max_wait_time: float = MAX_BATCH_WAIT_TIME) -> None:
+        """Initialize batcher. Batches are collected after batcher is started.
+
+        Args:
+            search_engine: search engine that scores batches
+            max_batch_size: maximal number of queries scored together
+            max_wait_time: maximal time in seconds that the first query of a batch waits for other queries
+
+        Returns:
+            no value
+        """
+        if max_batch_size < 1:
+            raise ValueError(f'Maximal batch size has to be positive, but it is {max_batch_size}')
+
+        self._search_engine = search_engine
+        self.max_batch_size = max_batch_size
+        self.max_wait_time = max_wait_time
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._queue = None
+        self._batch_loop = None
+        self._num_of_batches = self._num_of_queries = 0
+
+    @property
+    def stats(self) -> BatchingStats:
+        """Statistics of scored batches."""
+        return BatchingStats(self._num_of_batches, self._num_of_queries)
+
+    def start(self) -> None:
+        """Start collecting batches on the current event loop.
+
+        Returns:
+            no value
+        """
+        # queue is bound to the event loop it is created in
+        self._queue = asyncio.Queue()
+        self._batch_loop = asyncio.ensure_future(self._collect_batches())
+
+    async def close(self) -> None:
+        """Stop collecting batches and shut down worker thread. Waiting queries are cancelled.
+
+        Returns:
+            no value
+        """
+        if self._batch_loop is not None:
+            self._batch_loop.cancel()
+            try:
+                await self._batch_loop
+            except asyncio.CancelledError:
+                pass
+            while not self._queue.empty():
+                self._queue.get_nowait()[2].cancel()
+        self._executor.shutdown(wait=True)
+
+    async def submit(self, queries: Sequence[str], n: int = 5) -> List[List[Tuple[float, str]]]:
+        """Find top n most similar questions for each query, scoring queries together with concurrently
+        submitted ones.
+
+        Args:
+            queries: sequence of raw questions
+            n: number of similar questions that should be found for each query
+
+        Returns:
+            The list with top n most similar questions from corpus with similarity scores for each query,
+            in the same order as given queries.
+        """
+        loop = asyncio.get_event_loop()
+        futures = [loop.create_future() for _ in queries]
+        for query, future in zip(queries, futures):
+            self._queue.put_nowait((query, n, future))
+        return list(await asyncio.gather(*futures))
+
+    async def _collect_batches(self) -> None:
+        """Collect queries into batches and score them, until the task is cancelled.
+
+        Returns:
+            no value
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait_time
+            while len(batch) < self.max_batch_size:
+                # queries that are already waiting are taken without waiting for the deadline
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._score_batch(batch)
+
+    async def _score_batch(self, batch: List[Tuple[str, int, asyncio.Future]]) -> None:
+        """Score batch of queries in worker thread and pass results to futures of queries. Queries with different
+        number of results are scored separately.
+
+        Args:
+            batch: queries with number of results and future for results
+
+        Returns:
+            no value
+        """
+        loop = asyncio.get_event_loop()
+        batch_by_n = {}
+        for query, n, future in batch:
+            batch_by_n.setdefault(n, []).append((query, future))
+
+        for n, queries in batch_by_n.items():
+            try:
+                results = await loop.run_in_executor(self._executor, self._search_engine.most_similar_batch,
+                                                     [query for query, _ in queries], n)
+            except Exception as exception:
+                logger.exception(f'Scoring batch of {len(queries)} queries failed')
+                for _, future in queries:
+                    if not future.done():
+                        future.set_exception(exception)
+                continue
+
+            self._num_of_batches += 1
+            self._num_of_queries += len(queries)
+            for (_, future), result in zip(queries, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+class SearchService:
+    """HTTP service that finds similar questions for queries given as JSON.
+
+    Service handles requests:
+        POST /search with body {"query": "...", "n": 5}, which returns {"results": [[score, question], ...]}
+        POST /search with body {"queries": ["...", ...], "n": 5}, which returns {"results": [[[score, question],
+            ...], ...]} with results for each query
+        GET /stats, which returns latency percentiles (in milliseconds), batching and result cache statistics
+            of the process that handles the request
+        GET /metrics, which returns durations of search stages and counters of the process that handles the request
+            in Prometheus text format (empty unless instrumentation is enabled)
+
+    Queries of concurrent requests are scored together in micro-batches. Connections are kept alive between
+    requests unless client asks otherwise. Service is closed gracefully - requests that are being handled get
+    their responses, while idle connections are closed.
+
+    Attributes:
+        host (str): host that service listens on
+        port (int): port that service listens on (the assigned one, after service is started on port 0)
+        _socket (socket.socket): already bound listening socket, used instead of host and port if given
+        _search_engine (QuestionSearchEngine): search engine that finds similar questions
+        _batcher (MicroBatcher): batcher of queries of concurrent requests
+        _latency_recorder (LatencyRecorder): recorder of latencies of search requests
+        _server (asyncio.AbstractServer): server that accepts connections, created when service is started
+        _connections (Dict[asyncio.StreamWriter, bool]): open connections, with flag that indicates is request of
+                                                          the connection being handled
+        _closing (bool): flag that indicates is service being closed
+    """
+
+    def __init__(self, search_engine: QuestionSearchEngine, host: str = SERVICE_HOST, port: int = SERVICE_PORT,
+                 max_batch_size: int = MAX_BATCH_SIZE, max_wait_time: float = MAX_BATCH_WAIT_TIME,
+                 sock: Optional[socket.socket] = None) -> None:
+        """Initialize service. Service accepts connections after it is started.
+
+        Args:
+            search_engine: search engine that finds similar questions
+            host: host that service listens on
+            port: port that service listens on. Free port is assigned if it is 0.
+            max_batch_size: maximal number of queries scored together
+            max_wait_time: maximal time in seconds that the first query of a batch waits for other queries
+            sock: already bound listening socket (e.g. shared by multiple worker processes), used instead of
+                  host and port
+
+        Returns:
+            no value
+        """
+        self.host = host
+        self.port = port
+        self._socket = sock
+        self._search_engine = search_engine
+        self._batcher = MicroBatcher(search_engine, max_batch_size, max_wait_time)
+        self._latency_recorder = LatencyRecorder()
+        self._server = None
+        self._connections = {}
+        self._closing = False
+
+    @property
+    def latency_stats(self) -> LatencyStats:
+        """Latency percentiles of the most recent search requests."""
+        return self._latency_recorder.stats
+
+    @property
+    def batching_stats(self) -> BatchingStats:
+        """Statistics of scored batches."""
+        return self._batcher.stats
+
+    async def start(self) -> None:
+        """Start accepting connections on the current event loop.
+
+        Returns:
+            no value
+        """
+        self._batcher.start()
+        if self._socket is not None:
+            self._server = await asyncio.start_server(self._handle_connection, sock=self._socket)
+        else:
+            self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.host, self.port = self._server.sockets[0].getsockname()[:2]
+        logger.info(f'Search service started on {self.host}:{self.port} in process {os.getpid()}')
+
+    async def close(self, timeout: float = SHUTDOWN_TIMEOUT) -> None:
+        """Stop accepting connections, wait until requests that are being handled get their responses and stop
+        scoring batches.
+
+        Args:
+            timeout: maximal time in seconds to wait for requests that are being handled
+
+        Returns:
+            no value
+        """
+        self._closing = True
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+        # idle connections are closed right away, and busy ones after their responses are written
+        for writer, is_busy in list(self._connections.items()):
+            if not is_busy:
+                writer.close()
+        deadline = time.perf_counter() + timeout
+        while self._connections and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+
+        await self._batcher.close()
+        logger.info(f'Search service stopped in process {os.getpid()}')
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve requests of one connection until client closes it or asks for it to be closed.
+
+        Args:
+            reader: reader of the connection
+            writer: writer of the connection
+
+        Returns:
+            no value
+        """
+        self._connections[writer] = False
+        try:
+            while not self._closing:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                self._connections[writer] = True
+
+                start_time = time.perf_counter()
+                status, response = await self._handle_request(method, path, body)
+                if path == '/search' and status == 200:
+                    self._latency_recorder.record(time.perf_counter() - start_time)
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and not self._closing
+                _write_response(writer, status, response, keep_alive)
+                await writer.drain()
+                self._connections[writer] = False
+                if not keep_alive:
+                    break
+        except RequestError as exception:
+            # rest of the request can not be skipped reliably, so connection is closed after the response
+            _write_response(writer, exception.status, {'error': str(exception)}, keep_alive=False)
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            del self._connections[writer]
+            writer.close()
+
+    async def _handle_request(self, method: str, path: str, body: bytes) -> Tuple[int, Union[Dict[str, Any], str]]:
+        """Handle one request.
+
+        Args:
+            method: HTTP method of the request
+            path: path of the request
+            body: body of the request
+
+        Returns:
+            Pair of HTTP status and response (JSON, or text for metrics)
+        """
+        if path in ('/stats', '/metrics'):
+            if method != 'GET':
+                return 405, {'error': f'Method {method} is not allowed'}
+            return 200, self._get_stats() if path == '/stats' else metrics.to_prometheus()
+        if path != '/search':
+            return 404, {'error': f'Path {path} is not found'}
+        if method != 'POST':
+            return 405, {'error': f'Method {method} is not allowed'}
+
+        try:
+            queries, n, is_batch = _parse_search_request(body)
+        except ValueError as exception:
+            return 400, {'error': str(exception)}
+
+        try:
+            results = await self._batcher.submit(queries, n)
+        except Exception:
+            return 500, {'error': 'Search failed'}
+        results = [[list(pair) for pair in result] for result in results]
+        return 200, {'results': results if is_batch else results[0]}
+
+    def _get_stats(self) -> Dict[str, Any]:
+        """Collect statistics of the service.
+
+        Returns:
+            Statistics in JSON form
+        """
+        latency_stats, batching_stats = self.latency_stats, self.batching_stats
+        cache_stats = self._search_engine.result_cache_stats
+        return {
+            'pid': os.getpid(),
+            'latency_ms': {'num_of_requests': latency_stats.num_of_requests, 'p50': latency_stats.p50 * 1000,
+                           'p99': latency_stats.p99 * 1000, 'max': latency_stats.max * 1000},
+            'batching': {'num_of_batches': batching_stats.num_of_batches,
+                         'num_of_queries': batching_stats.num_of_queries,
+                         'mean_batch_size': batching_stats.mean_batch_size},
+            'result_cache': {'hits': cache_stats.hits, 'misses': cache_stats.misses,
+                             'hit_rate': cache_stats.hit_rate, 'size': cache_stats.size}
+        }
+
+
+def run_service(search_engine: QuestionSearchEngine, host: str = SERVICE_HOST, port: int = SERVICE_PORT,
+                max_batch_size: int = MAX_BATCH_SIZE, max_wait_time: float = MAX_BATCH_WAIT_TIME) -> None:
+    """Run search service until the process is interrupted.
+
+    Args:
+        search_engine: search engine that finds similar questions
+        host: host that service listens on
+        port: port that service listens on
+        max_batch_size: maximal number of queries scored together
+        max_wait_time: maximal time in seconds that the first query of a batch waits for other queries
+
+    Returns:
+        no value
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    service = SearchService(search_engine, host, port, max_batch_size, max_wait_time)
+    loop.run_until_complete(service.start())
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(service.close())
+        loop.close()
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """Read one HTTP request from connection.
+
+    Request that can not be read raises RequestError - malformed request line, too many headers or invalid
+    content length with 400 status, and body larger than MAX_REQUEST_BODY_SIZE with 413 status.
+
+    Args:
+        reader: reader of the connection
+
+    Returns:
+        Method, path, headers (with lowercase names) and body of the request, or None if connection is closed
+    """
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    parts = request_line.decode('latin-1').split()
+    if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+        raise RequestError(400, 'Malformed request line')
+    method, path, _ = parts
+
+    headers, num_of_headers = {}, 0
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        # header lines are counted instead of distinct names, since repeated headers overwrite each other
+        num_of_headers += 1
+        if num_of_headers > MAX_NUM_OF_REQUEST_HEADERS:
+            raise RequestError(400, 'Too many request headers')
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    content_length = headers.get('content-length', '0')
+    if not content_length.isdigit():
+        raise RequestError(400, 'Invalid Content-Length header')
+    if int(content_length) > MAX_REQUEST_BODY_SIZE:
+        raise RequestError(413, f'Request body is larger than {MAX_REQUEST_BODY_SIZE} bytes')
+    body = await reader.readexactly(int(content_length))
+    return method.upper(), path.split('?', 1)[0], headers, body
+
+
+def _write_response(writer: asyncio.StreamWriter, status: int, response: Union[Dict[str, Any], str],
+                    keep_alive: bool) -> None:
+    """Write HTTP response with JSON (or plain text) body to connection.
+
+    Args:
+        writer: writer of the connection
+        status: HTTP status
+        response: JSON response, or text that is sent as it is
+        keep_alive: flag that indicates should connection be kept open after the response
+
+    Returns:
+        no value
+    """
+    if isinstance(response, str):
+        body, content_type = response.encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8'
+    else:
+        body, content_type = json.dumps(response).encode('utf-8'), 'application/json'
+    head = f'HTTP/1.1 {status} {HTTP_STATUSES[status]}\r\nContent-Type: {content_type}\r\n' \
+           f'Content-Length: {len(body)}\r\nConnection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'
+    writer.write(head.encode('latin-1') + body)
+
+
+def _parse_search_request(body: bytes) -> Tuple[List[str], int, bool]:
+    """Parse body of search request.
+
+    Args:
+        body: JSON body with either "query" or "queries", and optional "n"
+
+    Returns:
+        Queries, number of results per query and flag that indicates are multiple queries given
+    """
+    try:
+        request = json.loads(body.decode('utf-8'))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError('Request body is not valid JSON')
+    if not isinstance(request, dict):
+        raise ValueError('Request body has to be JSON object')
+
+    n = request.get('n', 5)
+    if not isinstance(n, int) or isinstance(n, bool) or n < 1:
+        raise ValueError('Number of results "n" has to be positive integer')
+
+    if 'queries' in request:
+        queries = request['queries']
+        if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+            raise ValueError('"queries" has to be list of strings')
+        return queries, n, True
+    if isinstance(request.get('query'), str):
+        return [request['query']], n, False
+    raise ValueError('Request has to contain "query" string or "queries" list')
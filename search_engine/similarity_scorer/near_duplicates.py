@@ -0,0 +1,282 @@
+import os
+import time
+import numpy as np
+from typing import *
+
+from settings import logger
+from constants import NEAR_DUPLICATES_BLOCK_SIZE
+from search_engine.index.csr_matrix import CsrMatrix
+from search_engine.index.inverted_index import InvertedIndex
+from search_engine.index.quantization import dequantize
+from search_engine.similarity_scorer.similarity_metrics import UPPER_BOUND_MARGIN, sparse_cosine_similarity
+
+# record of near-duplicate pair in output file - indices of both questions (the first one is lower) and their score
+PAIR_DTYPE = np.dtype([('first', '<i8'), ('second', '<i8'), ('score', '<f8')])
+# relative margin of squared norms of unindexed parts, which are calculated from cumulative sums over whole corpus
+PREFIX_NORM_MARGIN = 1e-6
+
+
+class SelfJoinStats(NamedTuple):
+    """Statistics of near-duplicate self-join.
+
+    Attributes:
+        num_of_questions (int): number of joined questions
+        num_of_candidates (int): number of pairs that share at least one indexed term
+        num_of_verified_pairs (int): number of candidate pairs whose scores are calculated exactly
+        num_of_pairs (int): number of pairs with score not lower than threshold
+        elapsed_time (float): join time in seconds
+    """
+    num_of_questions: int
+    num_of_candidates: int
+    num_of_verified_pairs: int
+    num_of_pairs: int
+    elapsed_time: float
+
+    @property
+    def questions_per_second(self) -> float:
+        """Join throughput."""
+        return self.num_of_questions / max(self.elapsed_time, 1e-9)
+
+
+def find_near_duplicates(questions: CsrMatrix, threshold: float, output_path: str,
+                         question_scales: Optional[np.ndarray] = None, n_jobs: int = 1,
+                         block_size: int = NEAR_DUPLICATES_BLOCK_SIZE) -> SelfJoinStats:
+    """Find all pairs of questions whose cosine similarity is not lower than threshold, and write them to file.
+
+    Only the part of each question after its longest leading part (in order of terms from the most frequent one)
+    whose norm is below the threshold is indexed (prefix filtering). Two normalized vectors whose cosine similarity
+    is not lower than the threshold share a term in indexed parts of both of them, so each question is matched only
+    against questions that share its rare terms, instead of all of them. Candidates whose score can not reach the
+    threshold even with norms of their unindexed parts are skipped, and scores of the others are calculated exactly.
+
+    Questions are joined in blocks of consecutive questions, in parallel, and pairs of each block are appended to the
+    output file as soon as the block is joined, in order of blocks.
+
+    Args:
+        questions: vectorized question corpus
+        threshold: minimal cosine similarity of near-duplicate questions, from range (0, 1]
+        output_path: path to the file that pairs are written to, as records of PAIR_DTYPE
+        question_scales: scale factor of each question, if weights are quantized
+        n_jobs: number of processes that join blocks
+        block_size: number of questions in each block
+
+    Returns:
+        Self-join statistics
+    """
+    if not 0 < threshold <= 1:
+        raise ValueError(f'Threshold has to be in range (0, 1], but it is {threshold}')
+    if block_size < 1:
+        raise ValueError(f'Block size has to be positive, but it is {block_size}')
+
+    start_time = time.perf_counter()
+    joiner = _BlockJoiner(dequantize(questions, question_scales), threshold)
+    num_of_questions = questions.shape[0]
+    block_bounds = [(start, min(start + block_size, num_of_questions))
+                    for start in range(0, num_of_questions, block_size)]
+    n_jobs = max(1, min(n_jobs, len(block_bounds)))
+
+    num_of_candidates, num_of_verified_pairs, num_of_pairs = 0, 0, 0
+    # pairs are written to temporary file first, so that output file is either complete or not changed
+    temporary_path = f'{output_path}.tmp'
+    with open(temporary_path, 'wb') as file:
+        if n_jobs == 1:
+            joined_blocks = (joiner.join(start, end) for start, end in block_bounds)
+            pool = None
+        else:
+            # multiprocessing is imported only when it is used, since it is slow to import
+            import multiprocessing
+
+            # workers are forked where it is possible, so they share the corpus and the index copy-on-write
+            context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods()
+                                                  else None)
+            pool = context.Pool(n_jobs, initializer=_init_join_worker, initargs=(joiner,))
+            joined_blocks = pool.imap(_join_block, block_bounds)
+        try:
+            for pairs, block_candidates, block_verified_pairs in joined_blocks:
+                pairs.tofile(file)
+                num_of_candidates += block_candidates
+                num_of_verified_pairs += block_verified_pairs
+                num_of_pairs += pairs.shape[0]
+        finally:
+            if pool is not None:
+                pool.terminate()
+    os.replace(temporary_path, output_path)
+
+    stats = SelfJoinStats(num_of_questions, num_of_candidates, num_of_verified_pairs, num_of_pairs,
+                          time.perf_counter() - start_time)
+    logger.info(f'Finding near-duplicates of {num_of_questions} questions finished - {num_of_pairs} pairs from '
+                f'{num_of_candidates} candidates, {stats.questions_per_second:.1f} questions/sec')
+    return stats
+
+
+def load_near_duplicates(path: str) -> np.ndarray:
+    """Open near-duplicate pairs written by find_near_duplicates. File is memory mapped.
+
+    Args:
+        path: path to the file with pairs
+
+    Returns:
+        numpy array of records of PAIR_DTYPE, with fields first, second and score
+    """
+    # empty files can not be memory mapped
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=PAIR_DTYPE)
+    return np.memmap(path, dtype=PAIR_DTYPE, mode='r')
+
+
+class _BlockJoiner:
+    """Joins blocks of questions against all questions before them, using index over their rare terms.
+
+    Attributes:
+        _questions (CsrMatrix): vectorized question corpus with float64 weights
+        _threshold (float): minimal cosine similarity of near-duplicate questions
+        _norms (np.ndarray): norm of each question
+        _indexed_questions (CsrMatrix): indexed part of each question
+        _indexed_norms (np.ndarray): norm of indexed part of each question
+        _unindexed_norms (np.ndarray): norm of unindexed (leading) part of each question
+        _indexed_index (InvertedIndex): inverted index over indexed parts of questions
+    """
+
+    def __init__(self, questions: CsrMatrix, threshold: float) -> None:
+        """Split questions into unindexed and indexed parts, and index the latter.
+
+        Args:
+            questions: vectorized question corpus with float64 weights
+            threshold: minimal cosine similarity of near-duplicate questions
+
+        Returns:
+            no value
+        """
+        self._questions = questions
+        self._threshold = threshold
+        self._norms = np.sqrt(questions.sum_rows(questions.data ** 2))
+        self._indexed_questions, self._unindexed_norms = _split_prefixes(questions, threshold,
+                                                                         float(np.max(self._norms, initial=0.)))
+        self._indexed_norms = np.sqrt(self._indexed_questions.sum_rows(self._indexed_questions.data ** 2))
+        self._indexed_index = InvertedIndex(self._indexed_questions)
+
+    def join(self, start: int, end: int) -> Tuple[np.ndarray, int, int]:
+        """Find near-duplicates of questions from the block among questions before them.
+
+        Args:
+            start: index of the first question of the block
+            end: index after the last question of the block
+
+        Returns:
+            Triple of numpy array with pairs (records of PAIR_DTYPE, ordered by the second and then by the first
+            question), number of candidate pairs and number of verified pairs
+        """
+        query_indices, firsts, partial_scores = sparse_cosine_similarity(
+            self._indexed_questions.row_slice(start, end), self._indexed_index)
+        seconds = query_indices + start
+
+        # each pair is joined once, when its second question is joined
+        is_candidate = firsts < seconds
+        firsts, seconds, partial_scores = firsts[is_candidate], seconds[is_candidate], partial_scores[is_candidate]
+
+        # unindexed part of the first question can not add more than its norm times norm of the second question,
+        # and the same holds for unindexed part of the second question and indexed part of the first one
+        upper_bounds = (partial_scores + self._unindexed_norms[firsts] * self._norms[seconds] +
+                        self._indexed_norms[firsts] * self._unindexed_norms[seconds]) * (1 + UPPER_BOUND_MARGIN)
+        is_verified = upper_bounds >= self._threshold
+        firsts, seconds = firsts[is_verified], seconds[is_verified]
+
+        scores = _pair_scores(self._questions, self._questions.row_slice(start, end), firsts, seconds - start)
+        is_pair = scores >= self._threshold
+        pairs = np.zeros(int(np.count_nonzero(is_pair)), dtype=PAIR_DTYPE)
+        pairs['first'], pairs['second'], pairs['score'] = firsts[is_pair], seconds[is_pair], scores[is_pair]
+        return pairs, int(is_candidate.sum()), int(firsts.shape[0])
+
+
+def _split_prefixes(questions: CsrMatrix, threshold: float, max_norm: float) -> Tuple[CsrMatrix, np.ndarray]:
+    """Split each question into the longest leading part whose norm is below the threshold (in order of terms from
+    the most frequent one) and the rest, which is indexed.
+
+    Args:
+        questions: vectorized question corpus with float64 weights
+        threshold: minimal cosine similarity of near-duplicate questions
+        max_norm: the highest norm of questions, which bounds norm of the other question of each pair
+
+    Returns:
+        Pair of indexed parts of questions (CSR matrix of the same shape as questions) and norm of unindexed
+        part of each question
+    """
+    document_frequencies = np.bincount(questions.indices, minlength=questions.shape[1])
+    term_ranks = np.zeros(questions.shape[1], dtype=np.int64)
+    term_ranks[np.argsort(-document_frequencies, kind='stable')] = np.arange(questions.shape[1])
+
+    # values of each question ordered from its most frequent term, and squared norm of each leading part
+    row_lengths = questions.row_lengths()
+    row_indices = questions.row_indices()
+    order = np.lexsort((term_ranks[questions.indices], row_indices))
+    cumulative_squares = np.cumsum(questions.data[order] ** 2)
+    row_offsets = np.concatenate(([0.], cumulative_squares))[questions.indptr[:-1]]
+    prefix_squares = cumulative_squares - np.repeat(row_offsets, row_lengths)
+
+    is_unindexed = np.zeros(questions.nnz, dtype=bool)
+    is_unindexed[order] = prefix_squares * (1 + PREFIX_NORM_MARGIN) * max_norm ** 2 < threshold ** 2
+    unindexed_norms = np.sqrt(np.bincount(row_indices[is_unindexed], weights=questions.data[is_unindexed] ** 2,
+                                          minlength=questions.shape[0]))
+
+    indptr = np.zeros(questions.shape[0] + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row_indices[~is_unindexed], minlength=questions.shape[0]), out=indptr[1:])
+    indexed_questions = CsrMatrix(indptr, questions.indices[~is_unindexed], questions.data[~is_unindexed],
+                                  questions.shape)
+    return indexed_questions, unindexed_norms
+
+
+def _pair_scores(questions: CsrMatrix, block: CsrMatrix, firsts: np.ndarray, block_seconds: np.ndarray) -> np.ndarray:
+    """Calculate cosine similarity of pairs of questions, summing products over terms of the first question and
+    looking up weights of the second one.
+
+    Args:
+        questions: vectorized question corpus with float64 weights
+        block: vectorized questions of the block
+        firsts: index of the first question of each pair
+        block_seconds: index of the second question of each pair inside the block
+
+    Returns:
+        numpy array with cosine similarity score of each pair
+    """
+    first_questions = questions.take_rows(firsts)
+    pair_positions = first_questions.row_indices()
+
+    # column indices are sorted inside each row, so keys of block values are sorted
+    num_of_terms = questions.shape[1]
+    block_keys = block.row_indices() * num_of_terms + block.indices
+    keys = block_seconds[pair_positions] * num_of_terms + first_questions.indices
+    positions = np.minimum(np.searchsorted(block_keys, keys), max(block_keys.shape[0] - 1, 0))
+    is_found = block_keys[positions] == keys if block_keys.shape[0] else np.zeros(keys.shape[0], dtype=bool)
+
+    contributions = np.zeros(keys.shape[0])
+    contributions[is_found] = first_questions.data[is_found] * block.data[positions[is_found]]
+    return np.bincount(pair_positions, weights=contributions, minlength=firsts.shape[0])
+
+
+# joiner of the worker process, set when the worker is started
+_block_joiner = None
+
+
+def _init_join_worker(joiner: _BlockJoiner) -> None:
+    """Keep joiner in worker process, so that it is not sent with each block.
+
+    Args:
+        joiner: joiner with vectorized question corpus and index over its rare terms
+
+    Returns:
+        no value
+    """
+    global _block_joiner
+    _block_joiner = joiner
+
+
+def _join_block(bounds: Tuple[int, int]) -> Tuple[np.ndarray, int, int]:
+    """Join one block in worker process.
+
+    Args:
+        bounds: index of the first question of the block and index after its last question
+
+    Returns:
+        Triple of near-duplicate pairs, number of candidate pairs and number of verified pairs
+    """
+    return _block_joiner.join(*bounds)
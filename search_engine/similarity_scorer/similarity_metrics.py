@@ -1,16 +1,216 @@
 import numpy as np
+from typing import *
 
+from search_engine.index.csr_matrix import CsrMatrix
+from search_engine.index.inverted_index import InvertedIndex
 
-def cosine_similarity(query_vectors: np.ndarray, corpus_vectors: np.ndarray) -> np.ndarray:
+# dense accumulator is used when range of accumulated keys is at most this many times greater than number of
+# contributions, since clearing and scanning it is cheaper than sorting the contributions
+DENSE_ACCUMULATOR_RATIO = 8
+# relative margin of upper bounds of scores, so that rounding errors never make pruning skip a top question
+UPPER_BOUND_MARGIN = 1e-9
+# pruning is used only when postings of the terms that have to be read are at most this many times shorter than
+# postings of all query terms, since looking weights up is slower than reading postings whole
+PRUNING_POSTINGS_RATIO = 20
+
+
+def cosine_similarity(query_vectors: np.ndarray, corpus_vectors: Union[np.ndarray, CsrMatrix]) -> np.ndarray:
     """Calculate cosine similarity scores between two numpy arrays.
 
     Args:
         query_vectors: numpy array of (N, D) shape with Tf-Idf vector representation for one or multiple sequences,
                        where N is number of Tf-Idf vectors and D is dimension of those vectors
-        corpus_vectors: numpy array of (M, D) shape with Tf-Idf vector representation for multiple sequences,
-                        where M is number of Tf-Idf vectors and D is dimension of those vectors
+        corpus_vectors: numpy array or CSR matrix of (M, D) shape with Tf-Idf vector representation for multiple
+                        sequences, where M is number of Tf-Idf vectors and D is dimension of those vectors
+
+    Returns:
+        Cosine similarity score for each pair of vectors, in form of numpy array of (N, M) shape - one row with
+        scores of each query vector, which is not flattened, so that scores of a batch of queries stay separated
+    """
+    if isinstance(corpus_vectors, CsrMatrix):
+        # only nonzero values of corpus vectors take part in calculation
+        return corpus_vectors.dot(query_vectors.transpose()).transpose()
+    return query_vectors.dot(corpus_vectors.transpose())
+
+
+def term_at_a_time_cosine_similarity(query_vector: np.ndarray,
+                                     inverted_index: InvertedIndex) -> Tuple[np.ndarray, np.ndarray]:
+    """Calculate cosine similarity scores between query vector and corpus vectors using inverted index.
+
+    Scores are accumulated term by term only over postings of the terms that appear in the query,
+    so questions without any query term are never touched. Quantized weights are accumulated as they are stored,
+    and sums are multiplied by scale factors of questions at the end.
+
+    Args:
+        query_vector: numpy array of (D,) shape with Tf-Idf vector representation of the query
+        inverted_index: inverted index over vectorized question corpus
+
+    Returns:
+        Pair of numpy arrays - sorted indices of questions that share at least one term with the query
+        and cosine similarity scores for those questions
+    """
+    query_terms = np.flatnonzero(query_vector)
+    term_positions, question_indices, term_weights = inverted_index.gather_postings(query_terms)
+
+    # accumulate contributions of all query terms for each question
+    contributions = term_weights * query_vector[query_terms][term_positions]
+    question_indices, scores = _accumulate(question_indices, contributions, inverted_index.num_of_questions)
+    if inverted_index.question_scales is not None:
+        scores = scores * inverted_index.question_scales[question_indices]
+    return question_indices, scores
+
+
+def max_score_cosine_similarity(query_vector: np.ndarray, inverted_index: InvertedIndex, k: int,
+                                excluded: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Calculate cosine similarity scores between query vector and only those corpus vectors that can be among top k,
+    using MaxScore pruning.
+
+    Score contribution of each query term is bounded by its weight in the query multiplied by its maximal weight in
+    corpus. Questions with terms of the highest bounds (usually the rarest terms) are scored first, and the k-th
+    highest of their scores is a threshold that top k scores can not be lower than. Query terms whose bounds sum up
+    below the threshold are non-essential - questions that contain only them can not reach top k, so postings of
+    (usually very common) non-essential terms are never read whole. Only questions from postings of essential terms
+    are scored, looking up weights of the other terms in their sorted postings. Looking weights up pays off only when
+    much fewer postings are read, so all questions are scored with term_at_a_time_cosine_similarity otherwise.
+
+    Scores are accumulated term by term in the same order as in term_at_a_time_cosine_similarity, so they are
+    identical to exhaustive scores, and top k questions (with ties broken by question index) are the same.
+
+    Args:
+        query_vector: numpy array of (D,) shape with Tf-Idf vector representation of the query
+        inverted_index: inverted index over vectorized question corpus
+        k: number of top questions that have to be kept
+        excluded: flag for each question that indicates should it be ignored (e.g. removed question), as it
+                  can not be used for the threshold
 
     Returns:
-        Cosine similarity score for each pair of vectors, in form of numpy array of (N, M) shape
+        Pair of numpy arrays - sorted indices of questions that can be among top k (at least all of the top k
+        questions that share a term with the query) and cosine similarity scores for those questions
     """
-    return query_vectors.dot(corpus_vectors.transpose()).flatten()
+    query_terms = np.flatnonzero(query_vector)
+    query_weights = query_vector[query_terms]
+    upper_bounds = query_weights * inverted_index.max_weights[query_terms]
+    if k <= 0 or query_terms.shape[0] < 2:
+        return term_at_a_time_cosine_similarity(query_vector, inverted_index)
+
+    # threshold is the k-th highest score of questions with the terms of the highest bounds, taking as many of
+    # those terms as it is needed for k postings
+    order = np.argsort(upper_bounds, kind='stable')
+    postings_lengths = inverted_index.postings_lengths(query_terms[order])
+    max_postings_length = postings_lengths.sum() / PRUNING_POSTINGS_RATIO
+    seed_lengths = np.cumsum(postings_lengths[::-1])
+    num_of_seed_terms = min(int(np.searchsorted(seed_lengths, k)) + 1, query_terms.shape[0])
+    # enough postings can be skipped only if the threshold is higher than sum of bounds of skipped terms, which can not
+    # happen when that sum is higher than cosine similarity of (normalized) vectors can be
+    num_of_skipped_terms = query_terms.shape[0] - int(np.searchsorted(seed_lengths, max_postings_length, side='right'))
+    if seed_lengths[num_of_seed_terms - 1] > max_postings_length or \
+            (num_of_skipped_terms > 0 and upper_bounds[order][:num_of_skipped_terms].sum() > 1):
+        return term_at_a_time_cosine_similarity(query_vector, inverted_index)
+    seed_questions = _union_postings(np.sort(query_terms[order[::-1][:num_of_seed_terms]]), inverted_index)
+    if excluded is not None:
+        seed_questions = seed_questions[~excluded[seed_questions]]
+    if seed_questions.shape[0] < k:
+        return term_at_a_time_cosine_similarity(query_vector, inverted_index)
+    seed_scores = _score_questions(seed_questions, query_terms, query_weights, inverted_index)
+    threshold = np.partition(seed_scores, seed_scores.shape[0] - k)[seed_scores.shape[0] - k]
+
+    # terms with the lowest bounds are non-essential while sum of their bounds is below the threshold
+    num_of_non_essential = int(np.searchsorted(np.cumsum(upper_bounds[order]) * (1 + UPPER_BOUND_MARGIN), threshold))
+    if postings_lengths[num_of_non_essential:].sum() > max_postings_length:
+        return term_at_a_time_cosine_similarity(query_vector, inverted_index)
+
+    question_indices = _union_postings(np.sort(query_terms[order[num_of_non_essential:]]), inverted_index)
+    return question_indices, _score_questions(question_indices, query_terms, query_weights, inverted_index)
+
+
+def sparse_cosine_similarity(query_vectors: CsrMatrix,
+                             inverted_index: InvertedIndex) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Calculate cosine similarity scores between multiple query vectors and corpus vectors using inverted index.
+
+    This is sparse matrix multiplication of query vectors and transposed corpus vectors, where only nonzero
+    scores are calculated and returned (in coordinate form). Scores of each query are accumulated in the same
+    order as in term_at_a_time_cosine_similarity, so they are identical to the ones calculated for single query.
+
+    Args:
+        query_vectors: CSR matrix of (N, D) shape with Tf-Idf vector representation of the queries
+        inverted_index: inverted index over vectorized question corpus
+
+    Returns:
+        Triple of numpy arrays - query indices, question indices and nonzero cosine similarity scores,
+        sorted by query index and then by question index
+    """
+    term_positions, question_indices, term_weights = inverted_index.gather_postings(query_vectors.indices)
+    query_indices = query_vectors.row_indices()[term_positions]
+
+    # accumulate contributions of all query terms for each pair of query and question
+    pair_keys, scores = _accumulate(query_indices * inverted_index.num_of_questions + question_indices,
+                                    term_weights * query_vectors.data[term_positions],
+                                    query_vectors.shape[0] * inverted_index.num_of_questions)
+    question_indices = pair_keys % inverted_index.num_of_questions
+    if inverted_index.question_scales is not None:
+        scores = scores * inverted_index.question_scales[question_indices]
+    return pair_keys // inverted_index.num_of_questions, question_indices, scores
+
+
+def _union_postings(term_indices: np.ndarray, inverted_index: InvertedIndex) -> np.ndarray:
+    """Find questions that contain at least one of given terms.
+
+    Args:
+        term_indices: sorted indices of terms
+        inverted_index: inverted index over vectorized question corpus
+
+    Returns:
+        numpy array with sorted indices of questions
+    """
+    _, question_indices, _ = inverted_index.gather_postings(term_indices)
+    if inverted_index.num_of_questions <= DENSE_ACCUMULATOR_RATIO * question_indices.shape[0]:
+        is_found = np.zeros(inverted_index.num_of_questions, dtype=bool)
+        is_found[question_indices] = True
+        return np.flatnonzero(is_found)
+    return np.unique(question_indices)
+
+
+def _score_questions(question_indices: np.ndarray, query_terms: np.ndarray, query_weights: np.ndarray,
+                     inverted_index: InvertedIndex) -> np.ndarray:
+    """Calculate cosine similarity scores of given questions, looking up weights of query terms in their postings.
+    Contributions are summed term by term in ascending order of terms, as they are summed in exhaustive scoring.
+
+    Args:
+        question_indices: sorted indices of questions
+        query_terms: sorted indices of query terms
+        query_weights: weight of each query term
+        inverted_index: inverted index over vectorized question corpus
+
+    Returns:
+        numpy array with cosine similarity score of each question
+    """
+    scores = np.zeros(question_indices.shape[0])
+    for position, term_index in enumerate(query_terms.tolist()):
+        # weight of the query term is kept in array, so that contributions have the same type as in exhaustive scoring
+        scores += inverted_index.lookup_weights(term_index, question_indices) * query_weights[position:position + 1]
+    if inverted_index.question_scales is not None:
+        scores = scores * inverted_index.question_scales[question_indices]
+    return scores
+
+
+def _accumulate(keys: np.ndarray, contributions: np.ndarray, num_of_keys: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Sum contributions with the same key, in order in which they are given.
+
+    When there are many contributions compared to the range of keys, they are summed in dense accumulator.
+    Otherwise, only keys that are present are sorted, so cost does not depend on range of keys.
+
+    Args:
+        keys: numpy array with key of each contribution, from range [0, num_of_keys)
+        contributions: numpy array with contributions
+        num_of_keys: range of keys
+
+    Returns:
+        Pair of numpy arrays - sorted unique keys and sum of contributions for each of them
+    """
+    if num_of_keys <= DENSE_ACCUMULATOR_RATIO * keys.shape[0]:
+        sums = np.bincount(keys, weights=contributions, minlength=num_of_keys)
+        unique_keys = np.flatnonzero(sums)
+        return unique_keys, sums[unique_keys]
+
+    unique_keys, positions = np.unique(keys, return_inverse=True)
+    return unique_keys, np.bincount(positions, weights=contributions, minlength=unique_keys.shape[0])
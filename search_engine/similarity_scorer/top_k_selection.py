@@ -0,0 +1,57 @@
+import numpy as np
+from typing import *
+
+
+def select_top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Select positions of top k scores, ordered by score in descending order.
+
+    Partial selection (partition) is used to find the k-th highest score in linear time, so only scores that
+    are not lower than it are sorted. Ties are broken deterministically by position in ascending order.
+
+    Args:
+        scores: numpy array of (M,) shape with similarity scores
+        k: number of scores that should be selected
+
+    Returns:
+        numpy array with at most k positions of the highest scores
+    """
+    num_of_scores = scores.shape[0]
+    if k <= 0 or num_of_scores == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    if num_of_scores > k:
+        # k-th highest score, found without sorting all scores
+        kth_score = np.partition(scores, num_of_scores - k)[num_of_scores - k]
+        candidates = np.flatnonzero(scores >= kth_score)
+    else:
+        candidates = np.arange(num_of_scores)
+
+    # order by score (descending) and then by position (ascending)
+    order = np.lexsort((candidates, -scores[candidates]))[:k]
+    return candidates[order]
+
+
+def select_top_k_rows(rows: np.ndarray, positions: np.ndarray, scores: np.ndarray, num_of_rows: int,
+                      k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Select positions of top k scores for each row of sparse score matrix, ordered by score in descending order.
+
+    Scores have to be sorted by row and then by position, as they are returned from sparse_cosine_similarity.
+    Each row is selected with select_top_k, so ties are broken by position in ascending order.
+
+    Args:
+        rows: numpy array with row of each score
+        positions: numpy array with position (column) of each score
+        scores: numpy array with scores
+        num_of_rows: number of rows in score matrix
+        k: number of scores that should be selected in each row
+
+    Returns:
+        List with pair of numpy arrays for each row - at most k positions of the highest scores and those scores
+    """
+    row_bounds = np.searchsorted(rows, np.arange(num_of_rows + 1))
+
+    top_k_rows = []
+    for start, end in zip(row_bounds[:-1].tolist(), row_bounds[1:].tolist()):
+        top_positions = start + select_top_k(scores[start:end], k)
+        top_k_rows.append((positions[top_positions], scores[top_positions]))
+    return top_k_rows
@@ -1,54 +1,91 @@
 import re
+import inspect
+from functools import lru_cache
 from typing import *
 
+from constants import QUERY_TOKENS_CACHE_SIZE
+
+# compiled once, instead of on every question
+NON_WORD_CHARS_REGEX = re.compile('[^a-zA-Z ]+')
+# tokens shorter than minimal length are dropped, except the listed ones
+MIN_TOKEN_LENGTH = 2
+SHORT_TOKENS = frozenset({'c'})
+# preprocessing steps applied to questions, stored together with fitted model so that queries are checked to be
+# preprocessed the same way as the corpus that model is fitted on
+PREPROCESSING_CONFIG = {
+    'non_word_chars': NON_WORD_CHARS_REGEX.pattern,
+    'lowercase': True,
+    'min_token_length': MIN_TOKEN_LENGTH,
+    'short_tokens': sorted(SHORT_TOKENS)
+}
+
 
 class Singleton(type):
-    """Metaclass for classes that use Singleton pattern"""
+    """Metaclass for classes that use Singleton pattern. Arguments given after the instance is created have to be
+    the same as the ones it is created with, since they can not change it."""
 
     _instances = {}
+    _arguments = {}
 
     def __call__(cls, *args, **kwargs):
         if cls not in cls._instances:
             cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
+            cls._arguments[cls] = _bind_arguments(cls, args, kwargs)
+        elif (args or kwargs) and _bind_arguments(cls, args, kwargs) != cls._arguments[cls]:
+            raise ValueError(f'{cls.__name__} is already created with arguments {cls._arguments[cls]}, which can not '
+                             f'be changed to {_bind_arguments(cls, args, kwargs)}')
         return cls._instances[cls]
 
 
-class QuestionPreprocessor(metaclass=Singleton):
-    """Preprocessor for question content."""
+def _bind_arguments(cls: type, args: tuple, kwargs: dict) -> Dict[str, Any]:
+    """Bind arguments of class constructor to its parameters, including default values of omitted ones.
 
-    def _remove_non_word_chars(self, text: str) -> Optional[str]:
-        """Remove all non word characters from input text.
+    Args:
+        cls: class whose constructor is called
+        args: positional arguments of the constructor
+        kwargs: keyword arguments of the constructor
 
-        Args:
-            text: text (question content)
+    Returns:
+        Value of each parameter of the constructor
+    """
+    arguments = inspect.signature(cls.__init__).bind(None, *args, **kwargs)
+    arguments.apply_defaults()
+    return {name: value for name, value in list(arguments.arguments.items())[1:]}
 
-        Returns:
-            Cleaned text
-        """
-        regex = re.compile('[^a-zA-Z ]+')
-        return regex.sub('', text)
 
-    def _normalize(self, text: str) -> str:
-        """Normalize input text, converting all letters into lowercase.
+class QuestionPreprocessor(metaclass=Singleton):
+    """Preprocessor for question content.
+
+    Attributes:
+        _tokenize_cached (Callable[[str], Tuple[str, ...]]): tokenizer with LRU cache for repeated queries
+    """
+
+    def __init__(self, query_cache_size: int = QUERY_TOKENS_CACHE_SIZE) -> None:
+        """Initialize preprocessor.
 
         Args:
-            text: text (question content)
+            query_cache_size: maximal number of queries whose tokens are cached. Cache is disabled if it is 0.
 
         Returns:
-            Lowercase text
+            no value
         """
-        return text.lower()
+        self._tokenize_cached = lru_cache(maxsize=query_cache_size)(lambda query: tuple(self.tokenize(query)))
 
-    def _tokenize(self, text: str) -> List[str]:
-        """Tokenize input text.
+    def tokenize(self, question: str) -> List[str]:
+        """Preprocess one raw question - remove non word characters, normalize, tokenize and drop too short tokens
+        (except 'c'). Each step is one pass of compiled regular expression or string method over the question.
+
+        Non word characters are removed before splitting, so that words they are inside of stay whole tokens
+        (e.g. "don't" is "dont"), which is why tokens are not found in one pass with a word pattern.
 
         Args:
-            text: text (question content)
+            question: raw question content
 
         Returns:
             List of textual tokens.
         """
-        return text.split()
+        return [token for token in NON_WORD_CHARS_REGEX.sub('', question).lower().split()
+                if len(token) >= MIN_TOKEN_LENGTH or token in SHORT_TOKENS]
 
     def preprocess(self, questions: Sequence[str]) -> Sequence[List[str]]:
         """Preprocess sequence of raw questions.
@@ -60,12 +97,26 @@ class QuestionPreprocessor(metaclass=Singleton):
             Sequence of preprocessed questions, where each question is represented
             as list of its textual tokens.
         """
-        preprocessed_questions = []
-        for question in questions:
-            question = self._remove_non_word_chars(question)
-            question = self._normalize(question)
-            tokens = self._tokenize(question)
-            tokens = [token for token in tokens if len(token) > 1 or len(token) == 1 and token == 'c']
-            preprocessed_questions.append(tokens)
-
-        return preprocessed_questions
+        return list(map(self.tokenize, questions))
+
+    def preprocess_iter(self, questions: Iterable[str]) -> Iterator[List[str]]:
+        """Preprocess raw questions lazily, so that tokens of the whole corpus are never held in memory at once.
+
+        Args:
+            questions: iterable of raw questions
+
+        Returns:
+            Iterator over preprocessed questions, where each question is represented as list of its textual tokens.
+        """
+        return map(self.tokenize, questions)
+
+    def preprocess_query(self, query: str) -> List[str]:
+        """Preprocess raw query, reusing tokens of recently preprocessed equal queries.
+
+        Args:
+            query: raw query content
+
+        Returns:
+            List of textual tokens.
+        """
+        return list(self._tokenize_cached(query))
@@ -0,0 +1,255 @@
+import os
+import json
+import shutil
+import numpy as np
+from zlib import crc32
+from typing import *
+
+from utils import check_does_dir_exist, check_does_file_exist
+from search_engine.index.csr_matrix import CsrMatrix
+from search_engine.index.index_store import IndexFormatError
+from search_engine.instrumentation.metrics import metrics
+from search_engine.vectorizer.preprocessor import PREPROCESSING_CONFIG, QuestionPreprocessor
+
+ENCODER_FORMAT_NAME = 'question-search-engine-query-encoder'
+ENCODER_FORMAT_VERSION = 1
+HEADER_FILE_NAME = 'header.json'
+VOCABULARY_FILE_NAME = 'vocabulary.txt'
+IDF_VECTOR_FILE_NAME = 'idf_vector.bin'
+
+
+class QueryEncoder:
+    """Query-time part of Tf-Idf model - vocabulary, IDF vector and preprocessing configuration.
+
+    Encoder holds no vectorized question corpus, so it takes a few hundred KB and starts in milliseconds. It is
+    stored as its own artifact (directory with header, vocabulary table and raw IDF vector), which processes that
+    only encode queries load without opening the index. Without vocabulary, tokens are hashed into as many features
+    as there are IDF scores.
+
+    Attributes:
+        vocabulary (Dict[str, int]): vocabulary for Bag-Of-Words model, None if tokens are hashed into features
+        idf_vector (np.ndarray): vector with IDF scores for all words from vocabulary
+        preprocessing_config (Dict[str, Any]): preprocessing steps applied to questions that model is fitted on
+        _preprocessor (QuestionPreprocessor): singleton preprocessor for question content
+    """
+
+    def __init__(self, vocabulary: Optional[Dict[str, int]], idf_vector: np.ndarray,
+                 preprocessing_config: Optional[Dict[str, Any]] = None) -> None:
+        """Initialize encoder from fitted vocabulary and IDF vector.
+
+        Args:
+            vocabulary: vocabulary for Bag-Of-Words model, None if tokens are hashed into features
+            idf_vector: vector with IDF scores for all words from vocabulary
+            preprocessing_config: preprocessing steps applied to questions that model is fitted on. Current
+                                  preprocessing configuration is used if it is not given.
+
+        Returns:
+            no value
+        """
+        if vocabulary is not None and len(vocabulary) != len(idf_vector):
+            raise ValueError('Vocabulary size does not match IDF vector')
+
+        self.vocabulary = vocabulary
+        self.idf_vector = idf_vector
+        self.preprocessing_config = preprocessing_config if preprocessing_config is not None else PREPROCESSING_CONFIG
+        self._preprocessor = QuestionPreprocessor()
+
+    @property
+    def vocabulary_size(self) -> int:
+        """Number of words in vocabulary, or number of features that tokens are hashed into."""
+        return len(self.idf_vector)
+
+    def encode(self, questions: Sequence[str], sparse: bool = False,
+               use_query_cache: bool = False) -> Union[np.ndarray, CsrMatrix]:
+        """Transform sequence of raw questions into vector representation, with Tf-Idf scores.
+
+        Args:
+            questions: sequence of raw questions
+            sparse: flag that indicates should vectorized questions be returned as CSR matrix instead of
+                    dense numpy array
+            use_query_cache: flag that indicates should tokens of questions be cached, which pays off for
+                             repeated queries
+
+        Returns:
+            Sequence of vectorized questions as numpy array (or CSR matrix) of (N, D) shape where
+            N is number of questions and D is vocabulary size.
+        """
+        with metrics.timer('preprocess'):
+            if use_query_cache:
+                questions = [self._preprocessor.preprocess_query(question) for question in questions]
+            else:
+                questions = self._preprocessor.preprocess(questions)
+
+        with metrics.timer('transform'):
+            vectorized_questions = vectorize_tokens(questions, self.vocabulary, self.idf_vector)
+        return vectorized_questions if sparse else vectorized_questions.toarray()
+
+    @classmethod
+    def load(cls, path: str) -> 'QueryEncoder':
+        """Load encoder saved in directory.
+
+        Args:
+            path: path to the encoder directory
+
+        Returns:
+            Query encoder
+        """
+        header_path = os.path.join(path, HEADER_FILE_NAME)
+        if not check_does_file_exist(header_path):
+            raise FileNotFoundError(header_path)
+        try:
+            with open(header_path, 'r') as file:
+                header = json.load(file)
+        except ValueError:
+            raise IndexFormatError('Query encoder header is not valid JSON')
+        if not isinstance(header, dict) or header.get('format') != ENCODER_FORMAT_NAME or \
+                header.get('version') != ENCODER_FORMAT_VERSION:
+            raise IndexFormatError('Unknown query encoder format or version')
+        # queries have to be preprocessed the same way as the corpus that model is fitted on
+        if header['preprocessing'] != PREPROCESSING_CONFIG:
+            raise IndexFormatError(f'Query encoder {path} is fitted with different preprocessing configuration')
+
+        idf_vector_path = os.path.join(path, IDF_VECTOR_FILE_NAME)
+        vocabulary_size, dtype = header['vocabulary_size'], header['idf_dtype']
+        if not check_does_file_exist(idf_vector_path) or \
+                os.path.getsize(idf_vector_path) != vocabulary_size * np.dtype(dtype).itemsize:
+            raise IndexFormatError(f'IDF vector file {idf_vector_path} is missing or does not match encoder header')
+        # IDF vector is read with native byte order, the same as the one of fitted model
+        idf_vector = np.fromfile(idf_vector_path, dtype=dtype).astype(np.dtype(dtype).newbyteorder('='), copy=False)
+
+        vocabulary = None
+        if not header.get('hashed_features', False):
+            with open(os.path.join(path, VOCABULARY_FILE_NAME), 'r', encoding='utf-8') as file:
+                vocabulary = {word: i for i, word in enumerate(file.read().splitlines())}
+            if len(vocabulary) != vocabulary_size:
+                raise IndexFormatError('Vocabulary size does not match query encoder header')
+
+        return cls(vocabulary, idf_vector, header['preprocessing'])
+
+    def save(self, path: str) -> None:
+        """Save encoder into directory with header, vocabulary table and raw little-endian IDF vector. Encoder is
+        written into temporary directory first and then moved to given path, so readers never see partially
+        written encoder.
+
+        Args:
+            path: path to the encoder directory
+
+        Returns:
+            no value
+        """
+        temporary_path = f'{path}.tmp'
+        if os.path.exists(temporary_path):
+            shutil.rmtree(temporary_path)
+        check_does_dir_exist(path=temporary_path, create_dir=True)
+
+        if self.vocabulary is not None:
+            with open(os.path.join(temporary_path, VOCABULARY_FILE_NAME), 'w', encoding='utf-8') as file:
+                for word in sorted(self.vocabulary, key=self.vocabulary.get):
+                    file.write(f'{word}\n')
+        dtype = self.idf_vector.dtype.newbyteorder('<').str
+        np.ascontiguousarray(self.idf_vector, dtype=dtype).tofile(os.path.join(temporary_path, IDF_VECTOR_FILE_NAME))
+        header = {
+            'format': ENCODER_FORMAT_NAME,
+            'version': ENCODER_FORMAT_VERSION,
+            'vocabulary_size': self.vocabulary_size,
+            'hashed_features': self.vocabulary is None,
+            'idf_dtype': dtype,
+            'preprocessing': self.preprocessing_config
+        }
+        with open(os.path.join(temporary_path, HEADER_FILE_NAME), 'w') as file:
+            json.dump(header, file, indent=2)
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(temporary_path, path)
+
+
+def flatten_questions(questions: Iterable[List[str]], question_lengths: List[int]) -> Iterator[str]:
+    """Iterate over tokens of all questions, recording number of tokens of each question on the way.
+
+    Args:
+        questions: iterable of tokens for question corpus
+        question_lengths: list that number of tokens of each question is appended to
+
+    Returns:
+        Iterator over tokens of all questions
+    """
+    for tokens in questions:
+        question_lengths.append(len(tokens))
+        yield from tokens
+
+
+def hash_tokens(questions: Iterable[List[str]], num_of_features: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Hash question tokens into fixed number of features, with CRC32 hash that is stable across processes and
+    Python versions.
+
+    Args:
+        questions: iterable of tokens for question corpus, consumed only once
+        num_of_features: number of features that tokens are hashed into
+
+    Returns:
+        Pair of flat numpy array with feature index of each token and numpy array with number of tokens in
+        each question
+    """
+    question_lengths = []
+    token_hashes = np.fromiter((crc32(token.encode('utf-8'))
+                                for token in flatten_questions(questions, question_lengths)), dtype=np.int64)
+    return token_hashes % num_of_features, np.asarray(question_lengths, dtype=np.int64)
+
+
+def vectorize_tokens(questions: Iterable[List[str]], vocabulary: Optional[Dict[str, int]],
+                     idf_vector: np.ndarray) -> CsrMatrix:
+    """Transform sequence of question tokens into vector representation, using given vocabulary and idf vector.
+
+    Args:
+        questions: iterable of tokens for question corpus, consumed only once
+        vocabulary: vocabulary for Bag-Of-Words model. If it is None, tokens are hashed into as many features as
+                    there are IDF scores.
+        idf_vector: vector with IDF scores for all words from vocabulary
+
+    Returns:
+        Sequence of vectorized questions as CSR matrix of (N, D) shape
+    """
+    if vocabulary is None:
+        return vectorize_token_indices(*hash_tokens(questions, idf_vector.shape[0]), idf_vector)
+
+    question_lengths = []
+    vocabulary_indices = np.fromiter((vocabulary.get(token, -1)
+                                      for token in flatten_questions(questions, question_lengths)), dtype=np.int64)
+    return vectorize_token_indices(vocabulary_indices, np.asarray(question_lengths, dtype=np.int64), idf_vector)
+
+
+def vectorize_token_indices(vocabulary_indices: np.ndarray, question_lengths: np.ndarray,
+                            idf_vector: np.ndarray) -> CsrMatrix:
+    """Transform encoded question tokens into vector representation, using given idf vector.
+
+    Args:
+        vocabulary_indices: flat numpy array with vocabulary index of each token (-1 if token
+                            is not in vocabulary)
+        question_lengths: numpy array with number of tokens in each question
+        idf_vector: vector with IDF scores for all words from vocabulary
+
+    Returns:
+        Sequence of vectorized questions as CSR matrix of (N, D) shape where
+        N is number of questions in sequence and D is vocabulary size.
+    """
+    num_of_questions = question_lengths.shape[0]
+    vocabulary_size = idf_vector.shape[0]
+    question_indices = np.repeat(np.arange(num_of_questions, dtype=np.int64), question_lengths)
+    in_vocabulary = vocabulary_indices >= 0
+
+    # number of occurrences of each vocabulary word in each question, sorted by question and word
+    question_word_pairs, token_occurences = np.unique(
+        question_indices[in_vocabulary] * vocabulary_size + vocabulary_indices[in_vocabulary], return_counts=True)
+    rows = question_word_pairs // max(vocabulary_size, 1)
+    indices = (question_word_pairs % max(vocabulary_size, 1)).astype(np.int32)
+
+    # calculate tf values and tf-idf values
+    data = idf_vector[indices] * (token_occurences / question_lengths[rows])
+    # normalize vectors
+    norms = np.sqrt(np.bincount(rows, weights=data ** 2, minlength=num_of_questions))
+    data /= norms[rows]
+
+    indptr = np.zeros(num_of_questions + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=num_of_questions), out=indptr[1:])
+    return CsrMatrix(indptr, indices, data, (num_of_questions, vocabulary_size))
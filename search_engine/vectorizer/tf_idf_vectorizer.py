@@ -1,10 +1,16 @@
 import numpy as np
-from collections import Counter
+from itertools import repeat
 
 from utils import *
 from settings import *
 from constants import *
+from search_engine.index.csr_matrix import CsrMatrix
+from search_engine.index.inverted_index import InvertedIndex
+from search_engine.index.index_store import IndexFormatError, load_index, read_index_header, save_index
+from search_engine.index.quantization import VECTOR_DTYPES, idf_dtype, quantize
 from search_engine.vectorizer.preprocessor import QuestionPreprocessor
+from search_engine.vectorizer.query_encoder import HEADER_FILE_NAME, QueryEncoder, flatten_questions, hash_tokens, \
+    vectorize_token_indices, vectorize_tokens
 
 
 class TfIdfVectorizer:
@@ -12,58 +18,103 @@ class TfIdfVectorizer:
 
     Attributes:
         _use_cache (bool): flag that indicates should vectorized question corpus be serialized or not
-        _cache_path (str): path to the file where vectorized question corpus will be serialized
-        _vocabulary_path (str): path to the file where vocabulary for Bag-Of-Words model will be serialized
-        _idf_vector_path (str): path to the file where vector with IDF scores for all words from vocabulary
-                                will be stored
-        _vocabulary_size (int): size of vocabulary for Bag-Of-Words model
-        _vocabulary (dict): vocabulary for Bag-Of-Words model
+        _cache_path (str): path to the directory where vectorized question corpus will be stored
+        _query_encoder_path (str): path to the directory where query encoder (vocabulary, vector with IDF scores
+                                   for all words from vocabulary and preprocessing configuration) will be stored
+        _vocabulary_size (int): size of vocabulary for Bag-Of-Words model (number of features in hashing mode)
+        _num_of_hashed_features (int): number of features that tokens are hashed into instead of vocabulary words,
+                                       None if vocabulary is used
+        _vocabulary (dict): vocabulary for Bag-Of-Words model, None in hashing mode
         _idf_vector (np.ndarray): vector with IDF scores for all words from vocabulary
+        _dtype (str): type of Tf-Idf weights of vectorized question corpus
+        _query_encoder (QueryEncoder): encoder of queries with current vocabulary and idf vector, created on first use
         _preprocessor (QuestionPreprocessor): singleton preprocessor for question content
-        questions (np.ndarray): vectorized question corpus
+        questions (CsrMatrix): vectorized question corpus in sparse (CSR) form
+        inverted_index (InvertedIndex): inverted index over vectorized question corpus
+        model_version (int): number that is incremented every time vectorizer is fitted
+        metadata (Dict[str, Any]): metadata stored together with vectorized question corpus (e.g. hash of the raw
+                                   corpus that vectorizer is fitted on)
     """
 
-    def __init__(self, use_cache: bool = True, cache_path: str = TF_IDF_CACHE_PATH) -> None:
+    def __init__(self, use_cache: bool = True, cache_path: str = TF_IDF_CACHE_PATH, dtype: str = VECTOR_DTYPE,
+                 num_of_hashed_features: Optional[int] = NUM_OF_HASHED_FEATURES,
+                 query_encoder_path: str = QUERY_ENCODER_PATH) -> None:
         """Initialize vectorizer that uses Tf-Idf approach (document level embedding).
 
         Args:
             use_cache: flag that indicates should vectorized question corpus be serialized or not
-            cache_path: path to the file where vectorized question corpus will be serialized
+            cache_path: path to the directory where vectorized question corpus will be stored
+            dtype: type of Tf-Idf weights of fitted question corpus - float64, float32, or int8 with scale
+                   factor for each question. IDF vector is float32 for int8 weights. Index loaded from disk
+                   keeps the type it was stored with.
+            num_of_hashed_features: number of features that tokens are hashed into (hashing mode). Vocabulary of
+                                    VOCABULARY_SIZE most frequent words is built instead if it is None. Model loaded
+                                    from disk keeps the mode it was fitted in.
+            query_encoder_path: path to the directory where query encoder will be stored. It is stored even if
+                                vectorized question corpus is not serialized.
 
         Returns:
             no value
         """
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f'Unsupported vector type {dtype}, expected one of {", ".join(VECTOR_DTYPES)}')
+        if num_of_hashed_features is not None and num_of_hashed_features <= 0:
+            raise ValueError('Number of hashed features has to be positive')
+
         self._use_cache = use_cache
         self._cache_path = cache_path
 
-        self._vocabulary_path = VOCABULARY_PATH
-        self._idf_vector_path = IDF_VECTOR_PATH
-        self._vocabulary_size = VOCABULARY_SIZE
+        self._query_encoder_path = query_encoder_path
+        self._vocabulary_size = VOCABULARY_SIZE if num_of_hashed_features is None else num_of_hashed_features
+        self._num_of_hashed_features = num_of_hashed_features
         self._vocabulary = None
         self._idf_vector = None
+        self._dtype = dtype
+        self._query_encoder = None
 
         self._preprocessor = QuestionPreprocessor()
         self.questions = None
+        self.inverted_index = None
+        self.model_version = 0
+        self.metadata = {}
 
-    def fit(self, questions: Sequence[str]) -> None:
+    def fit(self, questions: Sequence[str], n_jobs: int = 1, metadata: Optional[Dict[str, Any]] = None) -> None:
         """Fit vectorizer with sequence of raw questions.
 
+        In hashing mode, corpus is fitted in a single streaming pass - tokens are hashed into features while
+        questions are preprocessed, and document frequencies are counted per feature, without any vocabulary.
+
         Args:
             questions: sequence of raw question corpus
+            n_jobs: number of processes that fit the vectorizer. If greater than 1, corpus is split into shards
+                    that are preprocessed, counted and vectorized in parallel. Result is identical to the one
+                    from a single process. Hashing mode always uses a single process.
+            metadata: JSON serializable metadata stored together with vectorized question corpus
 
         Returns:
             no value
         """
         print('----> Fitting Tf-Idf vectorizer\n\n')
 
-        questions = self._preprocessor.preprocess(questions)
-        self._build_vocabulary(questions)
-        self.questions = self._vectorize_questions(questions)
-
-        # serialize vocabulary and idf vector
-        check_does_dir_exist(path=MODEL_DIR_PATH, create_dir=True)
-        serialize_data(data=self._vocabulary, path=self._vocabulary_path)
-        serialize_data(data=self._idf_vector, path=self._idf_vector_path)
+        if self._num_of_hashed_features is not None:
+            self.questions = self._fit_hashed(questions)
+        elif n_jobs > 1 and len(questions) > 1:
+            self.questions = self._fit_parallel(questions, n_jobs)
+        else:
+            # tokens are encoded while questions are preprocessed, so token lists are never held all at once
+            tokens, token_indices, question_lengths = _encode_tokens(self._preprocessor.preprocess_iter(questions))
+            token_counts, document_frequencies = _count_tokens(token_indices, question_lengths, len(tokens))
+            vocabulary_indices = self._build_vocabulary(tokens, token_counts, document_frequencies,
+                                                        question_lengths.shape[0])
+            self.questions = vectorize_token_indices(vocabulary_indices[token_indices], question_lengths,
+                                                     self._idf_vector)
+        self.questions, question_scales = quantize(self.questions, self._dtype)
+        self.inverted_index = InvertedIndex(self.questions, question_scales)
+        self.model_version += 1
+        self.metadata = dict(metadata or {})
+
+        # store query encoder separately from vectorized questions, so that queries are encoded without opening them
+        self.query_encoder.save(self._query_encoder_path)
 
         # serialize vectorized questions
         if self._use_cache:
@@ -71,116 +122,307 @@ class TfIdfVectorizer:
 
         logger.info(f'Fitting Tf-Idf vectorizer on corpus with {len(questions)} questions finished')
 
-    def transform(self, questions: Sequence[str]) -> np.ndarray:
+    def transform(self, questions: Sequence[str], sparse: bool = False,
+                  use_query_cache: bool = False) -> Union[np.ndarray, CsrMatrix]:
         """Transform sequence of raw questions into vector representation, with Tf-Idf scores.
 
         Args:
             questions: sequence of raw question corpus
+            sparse: flag that indicates should vectorized questions be returned as CSR matrix instead of
+                    dense numpy array
+            use_query_cache: flag that indicates should tokens of questions be cached, which pays off for
+                             repeated queries
 
         Returns:
-            Sequence of vectorized questions as numpy array of (N, D) shape where
+            Sequence of vectorized questions as numpy array (or CSR matrix) of (N, D) shape where
             N is number of questions in given corpus and D is vocabulary size.
         """
-        questions = self._preprocessor.preprocess(questions)
+        # only query encoder is needed, vectorized question corpus is opened explicitly by load
+        self.load_encoder()
+        return self.query_encoder.encode(questions, sparse=sparse, use_query_cache=use_query_cache)
+
+    @property
+    def idf_vector(self) -> Optional[np.ndarray]:
+        """Vector with IDF scores for all words from vocabulary, if vectorizer is fitted or loaded."""
+        return self._idf_vector
+
+    @property
+    def query_encoder(self) -> QueryEncoder:
+        """Encoder of queries with vocabulary and idf vector of the vectorizer, which has to be fitted or loaded."""
+        if self._query_encoder is None:
+            self._query_encoder = QueryEncoder(self._vocabulary, self._idf_vector)
+        return self._query_encoder
+
+    def load(self, verify_checksum: bool = False) -> None:
+        """Load query encoder and vectorized question corpus, if they are not loaded or fitted already. Stored
+        corpus is opened again if its inverted index is dropped (e.g. by sharded search engine).
+
+        Args:
+            verify_checksum: flag that indicates should checksums of stored corpus files be verified, which requires
+                             reading the whole corpus instead of only mapping it into memory
+
+        Returns:
+            no value
+        """
+        self.load_encoder()
+        if self.questions is None or self.inverted_index is None:
+            self._load(verify_checksum)
 
-        # deserialize vocabulary and idf vector
-        if self._vocabulary is None:
-            self._vocabulary = deserialize_data(path=self._vocabulary_path)
-            self._vocabulary_size = len(self._vocabulary)
+    def load_encoder(self) -> None:
+        """Load query encoder (vocabulary and idf vector) without vectorized question corpus, if it is not loaded
+        or fitted already.
+
+        Returns:
+            no value
+        """
         if self._idf_vector is None:
-            self._idf_vector = deserialize_data(path=self._idf_vector_path)
-        if self.questions is None:
-            self._load()
+            self._query_encoder = QueryEncoder.load(self._query_encoder_path)
+            self._vocabulary = self._query_encoder.vocabulary
+            self._idf_vector = self._query_encoder.idf_vector
+            self._vocabulary_size = self._query_encoder.vocabulary_size
+            self._num_of_hashed_features = self._vocabulary_size if self._vocabulary is None else None
 
-        return self._vectorize_questions(questions)
+    def stored_metadata(self) -> Optional[Dict[str, Any]]:
+        """Read metadata of vectorized question corpus stored on disk, without loading it.
 
-    def _build_vocabulary(self, questions: Sequence[List[str]]) -> None:
-        """Build vocabulary used in Bag-Of-Words model using sequence of question tokens.
+        Returns:
+            Metadata, or None if query encoder or vectorized question corpus is not stored
+        """
+        if not check_does_file_exist(os.path.join(self._query_encoder_path, HEADER_FILE_NAME)):
+            return None
+        try:
+            return read_index_header(self._cache_path)['metadata']
+        except (OSError, IndexFormatError):
+            return None
+
+    def update_index(self, questions: CsrMatrix, inverted_index: InvertedIndex, idf_vector: np.ndarray) -> None:
+        """Replace vectorized question corpus and idf vector with the ones updated outside of fit
+        (e.g. by incremental indexing). Vocabulary stays the same.
 
         Args:
-            questions: sequence of tokens for question corpus
+            questions: vectorized question corpus
+            inverted_index: inverted index over vectorized question corpus
+            idf_vector: vector with IDF scores for all words from vocabulary
 
         Returns:
             no value
         """
-        self._vocabulary = Counter()
-        idf_map = Counter()
-        for question_tokens in questions:
-            self._vocabulary.update(question_tokens)
-            unique_tokens = set(question_tokens)
-            idf_map.update(unique_tokens)
-
-        # take N most frequent words
-        self._vocabulary = dict(self._vocabulary.most_common(self._vocabulary_size))
-        # update vocabulary_size if there is less words in vocabulary
-        vocabulary_size = len(self._vocabulary)
-        if vocabulary_size < self._vocabulary_size:
-            self._vocabulary_size = vocabulary_size
+        self._idf_vector = idf_vector
+        self._query_encoder = None
+        self.questions = questions
+        self.inverted_index = inverted_index
 
-        # transform vocabulary in form of word-index pairs
-        self._vocabulary = dict(zip(sorted(self._vocabulary.keys()), range(self._vocabulary_size)))
+    def _fit_parallel(self, questions: Sequence[str], n_jobs: int) -> CsrMatrix:
+        """Fit vectorizer by splitting question corpus into shards processed by a pool of processes.
 
-        num_of_questions = len(questions)
-        idf_func = lambda value: np.round(np.log((num_of_questions + 1)/(value + 1)) + 1, decimals=8)
-        # calculate idf value for each word in vocabulary
-        self._idf_vector = np.asarray([idf_func(idf_map[word]) for word in self._vocabulary.keys()])
+        Each process preprocesses its shard and counts tokens in it. Partial counts are merged (in order of
+        shards, so that order of the first occurrence of tokens is the same as in a single process) into global
+        vocabulary and idf vector, and then each process vectorizes its shard.
 
-        logger.info('Building vocabulary and IDF vector finished')
+        Args:
+            questions: sequence of raw question corpus
+            n_jobs: number of processes
+
+        Returns:
+            Vectorized question corpus as CSR matrix of (N, D) shape
+        """
+        n_jobs = min(n_jobs, len(questions))
+        bounds = [len(questions) * job // n_jobs for job in range(n_jobs + 1)]
+        shards = [questions[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+        # process pool is imported only when it is used, since multiprocessing is slow to import
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            token_to_index = {}
+            shard_counts = []
+            for tokens, token_counts, document_frequencies in executor.map(_count_shard, shards):
+                # map tokens of shard to global token indices
+                token_indices = np.fromiter((token_to_index.setdefault(token, len(token_to_index)) for token in tokens),
+                                            dtype=np.int64, count=len(tokens))
+                shard_counts.append((token_indices, token_counts, document_frequencies))
+
+            num_of_tokens = len(token_to_index)
+            token_counts = np.zeros(num_of_tokens, dtype=np.int64)
+            document_frequencies = np.zeros(num_of_tokens, dtype=np.int64)
+            for token_indices, shard_token_counts, shard_document_frequencies in shard_counts:
+                token_counts[token_indices] += shard_token_counts
+                document_frequencies[token_indices] += shard_document_frequencies
+            self._build_vocabulary(list(token_to_index.keys()), token_counts, document_frequencies, len(questions))
+
+            vectorized_shards = list(executor.map(_vectorize_shard, shards, repeat(self._vocabulary),
+                                                  repeat(self._idf_vector)))
+
+        return CsrMatrix.vstack(vectorized_shards)
+
+    def _fit_hashed(self, questions: Sequence[str]) -> CsrMatrix:
+        """Fit vectorizer in hashing mode, where tokens are hashed into fixed number of features instead of being
+        mapped with vocabulary.
+
+        Args:
+            questions: sequence of raw question corpus
+
+        Returns:
+            Vectorized question corpus as CSR matrix of (N, D) shape where D is number of hashed features
+        """
+        # tokens are hashed while questions are preprocessed, so token lists are never held all at once
+        feature_indices, question_lengths = hash_tokens(self._preprocessor.preprocess_iter(questions),
+                                                        self._num_of_hashed_features)
+        _, document_frequencies = _count_tokens(feature_indices, question_lengths, self._num_of_hashed_features)
+
+        self._vocabulary = None
+        self._vocabulary_size = self._num_of_hashed_features
+        self._query_encoder = None
+        self._idf_vector = _calculate_idf_vector(document_frequencies, question_lengths.shape[0], self._dtype)
 
-    def _vectorize_questions(self, questions: Sequence[List[str]]) -> np.ndarray:
-        """Transform sequence of question tokens into vector representation, using calculated Tf-Idf scores.
+        logger.info(f'Hashing tokens into {self._num_of_hashed_features} features finished')
+        return vectorize_token_indices(feature_indices, question_lengths, self._idf_vector)
+
+    def _build_vocabulary(self, tokens: List[str], token_counts: np.ndarray, document_frequencies: np.ndarray,
+                          num_of_questions: int) -> np.ndarray:
+        """Build vocabulary used in Bag-Of-Words model using counts of question tokens.
 
         Args:
-            questions: sequence of tokens for question corpus
+            tokens: distinct tokens from question corpus, in order of their first occurrence
+            token_counts: numpy array with number of occurrences of each token in corpus
+            document_frequencies: numpy array with number of questions that contain each token
+            num_of_questions: number of questions in corpus
 
         Returns:
-            Sequence of vectorized questions as numpy array of (N, D) shape where
-            N is number of questions in sequence and D is vocabulary size.
+            numpy array that maps index of each distinct token to its index in vocabulary (-1 if token
+            is not in vocabulary)
         """
-        vectorized_questions = []
+        # take N most frequent words, where ties are resolved by the first occurrence of words
+        most_frequent = np.argsort(-token_counts, kind='stable')[:self._vocabulary_size]
+        # update vocabulary_size if there is less words in vocabulary
+        if most_frequent.shape[0] < self._vocabulary_size:
+            self._vocabulary_size = most_frequent.shape[0]
 
-        for question_tokens in questions:
-            # zero question vector
-            question_vector = np.zeros(self._vocabulary_size)
-            nonzero_array = False
+        # transform vocabulary in form of word-index pairs
+        most_frequent = most_frequent[np.argsort(np.asarray(tokens, dtype=object)[most_frequent])]
+        self._vocabulary = {tokens[token_index]: i for i, token_index in enumerate(most_frequent.tolist())}
+        self._query_encoder = None
 
-            token_occurences = Counter(question_tokens)
-            num_of_tokens = len(question_tokens)
-            for token in set(question_tokens):
-                if token in self._vocabulary:
-                    token_index = self._vocabulary[token]
-                    nonzero_array = True
-                    # calculate tf value
-                    tf_value = token_occurences[token]/num_of_tokens
-                    # calculate tf-idf value
-                    question_vector[token_index] = self._idf_vector[token_index] * tf_value
+        # calculate idf value for each word in vocabulary
+        self._idf_vector = _calculate_idf_vector(document_frequencies[most_frequent], num_of_questions, self._dtype)
 
-            # normalize vector
-            if nonzero_array:
-                question_vector /= np.sqrt(np.sum(question_vector ** 2))
+        vocabulary_indices = np.full(len(tokens), -1, dtype=np.int64)
+        vocabulary_indices[most_frequent] = np.arange(self._vocabulary_size)
 
-            vectorized_questions.append(question_vector)
+        logger.info('Building vocabulary and IDF vector finished')
+        return vocabulary_indices
 
-        return np.asarray(vectorized_questions)
+    def _load(self, verify_checksum: bool = False) -> None:
+        """Open vectorized question corpus and inverted index stored on disk, mapping them into memory.
 
-    def _load(self) -> None:
-        """Deserialize vectorized question corpus.
+        Args:
+            verify_checksum: flag that indicates should checksums of stored files be verified
 
         Returns:
             no value
         """
-        print('----> Deserialization of vectorized corpus\n\n')
-        self.questions = deserialize_data(self._cache_path)
+        print('----> Opening vectorized corpus\n\n')
+        stored_index = load_index(self._cache_path, verify_checksum=verify_checksum)
+
+        # index has to be built with the same vocabulary and idf vector as the ones used for queries
+        if self._vocabulary is not None and stored_index.vocabulary != self._vocabulary or \
+                self._idf_vector is not None and not np.array_equal(stored_index.idf_vector, self._idf_vector):
+            raise IndexFormatError(f'Index {self._cache_path} is stale - it does not match vocabulary and IDF vector')
 
-        logger.info('Deserialization of vectorized corpus finished')
+        self.questions = stored_index.questions
+        self.inverted_index = stored_index.inverted_index
+        self.metadata = stored_index.metadata
+
+        logger.info(f'Opening vectorized corpus {self.questions.shape} finished')
 
     def _save(self) -> None:
-        """Serialize vectorized question corpus.
+        """Store vectorized question corpus and inverted index on disk, in memory mappable index format.
 
         Returns:
             no value
         """
-        print(f'----> Serialization of vectorized corpus {self.questions.shape}\n\n')
-        serialize_data(self.questions, self._cache_path)
+        print(f'----> Storing vectorized corpus {self.questions.shape}\n\n')
+        save_index(self._cache_path, self._vocabulary, self._idf_vector, self.questions, self.inverted_index,
+                   self.metadata)
+
+        logger.info('Storing vectorized corpus finished')
+
+
+def _encode_tokens(questions: Iterable[List[str]]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Map each distinct token to integer index, in order of the first occurrence of tokens.
+
+    Args:
+        questions: iterable of tokens for question corpus, consumed only once
+
+    Returns:
+        Triple of distinct tokens, flat numpy array with index of each token from corpus and
+        numpy array with number of tokens in each question
+    """
+    token_to_index = {}
+    question_lengths = []
+    token_indices = np.fromiter((token_to_index.setdefault(token, len(token_to_index))
+                                 for token in flatten_questions(questions, question_lengths)), dtype=np.int64)
+    return list(token_to_index.keys()), token_indices, np.asarray(question_lengths, dtype=np.int64)
+
+
+def _count_tokens(token_indices: np.ndarray, question_lengths: np.ndarray,
+                  num_of_tokens: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Count occurrences of each token and number of questions that contain each token.
+
+    Args:
+        token_indices: flat numpy array with index of each token from corpus
+        question_lengths: numpy array with number of tokens in each question
+        num_of_tokens: number of distinct tokens
 
-        logger.info('Serialization of vectorized corpus finished')
+    Returns:
+        Pair of numpy arrays with token counts and document frequencies
+    """
+    token_counts = np.bincount(token_indices, minlength=num_of_tokens)
+    # each distinct pair of question and token is counted once
+    question_indices = np.repeat(np.arange(question_lengths.shape[0], dtype=np.int64), question_lengths)
+    question_token_pairs = np.unique(question_indices * num_of_tokens + token_indices)
+    document_frequencies = np.bincount(question_token_pairs % max(num_of_tokens, 1), minlength=num_of_tokens)
+    return token_counts, document_frequencies
+
+
+def _calculate_idf_vector(document_frequencies: np.ndarray, num_of_questions: int, dtype: str) -> np.ndarray:
+    """Calculate smoothed IDF score of each word (or hashed feature) from number of questions that contain it.
+
+    Args:
+        document_frequencies: numpy array with number of questions that contain each word
+        num_of_questions: number of questions in corpus
+        dtype: type of Tf-Idf weights of vectorized question corpus
+
+    Returns:
+        Vector with IDF scores
+    """
+    return np.round(np.log((num_of_questions + 1) / (document_frequencies + 1)) + 1,
+                    decimals=8).astype(idf_dtype(dtype))
+
+
+def _count_shard(questions: Sequence[str]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Preprocess shard of question corpus and count its tokens. Used by processes of parallel fit.
+
+    Args:
+        questions: shard of raw question corpus
+
+    Returns:
+        Triple of distinct tokens in shard (in order of their first occurrence), their counts and
+        document frequencies
+    """
+    tokens, token_indices, question_lengths = _encode_tokens(QuestionPreprocessor().preprocess_iter(questions))
+    token_counts, document_frequencies = _count_tokens(token_indices, question_lengths, len(tokens))
+    return tokens, token_counts, document_frequencies
+
+
+def _vectorize_shard(questions: Sequence[str], vocabulary: Dict[str, int], idf_vector: np.ndarray) -> CsrMatrix:
+    """Preprocess and vectorize shard of question corpus. Used by processes of parallel fit.
+
+    Args:
+        questions: shard of raw question corpus
+        vocabulary: vocabulary for Bag-Of-Words model
+        idf_vector: vector with IDF scores for all words from vocabulary
+
+    Returns:
+        Vectorized shard as CSR matrix
+    """
+    return vectorize_tokens(QuestionPreprocessor().preprocess_iter(questions), vocabulary, idf_vector)
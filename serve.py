@@ -0,0 +1,72 @@
+import os
+import argparse
+
+from constants import *
+from run import load_search_engine
+from search_engine.instrumentation.metrics import metrics
+from search_engine.question_search_engine import QuestionSearchEngine
+from search_engine.service.prefork_server import PreforkServer
+from search_engine.service.search_service import run_service
+
+
+def build_search_engine(refit: bool = False, n_jobs: int = 1, fit: bool = True,
+                        verify_checksum: bool = False) -> QuestionSearchEngine:
+    """Build search engine over question corpus, either by opening the published model, index and question store,
+    or by fitting vectorizer (which publishes them). Vectorizer is fitted only if it is asked for, or if the published
+    ones are missing or built from another corpus.
+
+    Args:
+        refit: flag that indicates should vectorizer be fitted even if the published index is built from the same
+               corpus
+        n_jobs: number of processes that load corpus and fit vectorizer
+        fit: flag that indicates may vectorizer be fitted if the published index is missing or stale. If it may not,
+             IndexFormatError is raised instead.
+        verify_checksum: flag that indicates should checksums of the published index be verified when it is opened
+
+    Returns:
+        Search engine over question corpus
+    """
+    search_engine, _, _ = load_search_engine(RAW_DATA_FILE_PATH, n_jobs=n_jobs, refit=refit, fit=fit,
+                                             verify_checksum=verify_checksum)
+    return search_engine
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='HTTP service that finds similar questions')
+    parser.add_argument('--host', default=SERVICE_HOST, help='host that service listens on')
+    parser.add_argument('--port', type=int, default=SERVICE_PORT, help='port that service listens on')
+    parser.add_argument('--max-batch-size', type=int, default=MAX_BATCH_SIZE,
+                        help='maximal number of queries scored together')
+    parser.add_argument('--max-wait-time', type=float, default=MAX_BATCH_WAIT_TIME,
+                        help='maximal time in seconds that the first query of a batch waits for other queries')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of forked worker processes that share one index (1 serves from this process)')
+    parser.add_argument('--refit', action='store_true',
+                        help='fit vectorizer even if the published index is built from the same corpus')
+    parser.add_argument('--publish', action='store_true',
+                        help='fit vectorizer, publish model and index for running servers and exit')
+    parser.add_argument('--instrument', action='store_true',
+                        help='record durations of search stages, exported at /metrics')
+    args = parser.parse_args()
+
+    n_jobs = os.cpu_count() or 1
+    search_engine = build_search_engine(refit=args.refit or args.publish, n_jobs=n_jobs)
+    metrics.enabled = args.instrument or INSTRUMENTATION_ENABLED
+    if args.publish:
+        # published index is read back whole, so that files corrupted while they are written are detected before
+        # servers are reloaded
+        build_search_engine(n_jobs=n_jobs, fit=False, verify_checksum=True)
+        print('----> Published model and index')
+    elif args.workers > 1:
+        print(f'----> Serving on http://{args.host}:{args.port}/search with {args.workers} workers '
+              f'(process {os.getpid()})')
+        # reload only opens the index published by another process, so that the parent never fits vectorizer (and
+        # writes the published files) while it supervises workers. Its latency does not delay serving, so checksums
+        # are verified as well.
+        server = PreforkServer(lambda: build_search_engine(n_jobs=n_jobs, fit=False, verify_checksum=True),
+                               args.workers, args.host, args.port, args.max_batch_size, args.max_wait_time,
+                               search_engine=search_engine)
+        server.serve_forever()
+    else:
+        print(f'----> Serving on http://{args.host}:{args.port}/search')
+        run_service(search_engine, args.host, args.port, args.max_batch_size, args.max_wait_time)
@@ -1,12 +1,36 @@
 import os
 import logging
+from typing import *
+
 from constants import LOGS_DIR_PATH
 
 
-if not os.path.exists(LOGS_DIR_PATH):
-    os.mkdir(LOGS_DIR_PATH)
+class _LazyFileHandler(logging.FileHandler):
+    """File handler that opens log file (creating logs directory) when the first message is logged, so importing
+    settings has no side effects on the file system."""
+
+    def __init__(self, path: str) -> None:
+        """Initialize handler without opening log file.
+
+        Args:
+            path: path to the log file
+
+        Returns:
+            no value
+        """
+        super().__init__(path, delay=True)
+
+    def _open(self) -> TextIO:
+        """Create logs directory if it does not exist and open log file.
+
+        Returns:
+            Stream of the opened log file
+        """
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
 
-logging.basicConfig(filename=os.path.join(LOGS_DIR_PATH, 'question_search_engine.log'),
+logging.basicConfig(handlers=[_LazyFileHandler(os.path.join(LOGS_DIR_PATH, 'question_search_engine.log'))],
                     format='%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s',
                     datefmt='%d %b %Y %H:%M:%S')
 logger = logging.getLogger('question_search_engine')
@@ -1,4 +1,21 @@
+python -m tests.test_corpus_loader
+python -m tests.test_csr_matrix
+python -m tests.test_incremental_index
+python -m tests.test_index_store
+python -m tests.test_inverted_index
+python -m tests.test_ivf_index
+python -m tests.test_metrics
+python -m tests.test_near_duplicates
+python -m tests.test_prefork_server
 python -m tests.test_preprocessor
+python -m tests.test_quantization
+python -m tests.test_query_encoder
 python -m tests.test_question_search_engine
+python -m tests.test_question_store
+python -m tests.test_result_cache
+python -m tests.test_search_service
+python -m tests.test_sharded_index
+python -m tests.test_tag_index
 python -m tests.test_tf_idf_vectorizer
+python -m tests.test_top_k_selection
 python -m tests.test_utils
\ No newline at end of file
@@ -0,0 +1,100 @@
+import unittest
+
+from utils import *
+from search_engine.corpus.corpus_loader import iter_questions, load_corpus, parse_tags, _load_range
+
+
+class TestCorpusLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.path = 'questions.json'
+        lines = [
+            '{"id": 1, "question": "what is TF-IDF?", "tags": "<nlp>"}',
+            '{"id": 2, "question": "should I ignore poentry.lock?", "tags": "<python>"}',
+            '{"id": 3, "question": "How to use pytest?", "tags": "<python><pytest>"}',
+            '{"id": 4, "question": "what is TF-IDF?", "tags": "<nlp>"}',
+            '{"id": 5, "question": "broken line',
+            '',
+            '["not", "a", "question"]',
+            '{"id": 6, "content": "missing question key"}',
+            '{"id": 7, "question": "Unicode čćž question?", "tags": "<unicode>"}',
+            '{"id": "x8", "question": "question with string ID"}',
+            '{"id": 9, "question": null}',
+            '{"id": true, "question": "question with boolean ID"}'
+        ]
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(lines) + '\n')
+
+        self.expected_data = {
+            'what is TF-IDF?': 4,
+            'should I ignore poentry.lock?': 2,
+            'How to use pytest?': 3,
+            'Unicode čćž question?': 7
+        }
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_iter_questions(self):
+        malformed_lines = []
+        questions = iter_questions(self.path, malformed_lines=malformed_lines)
+        self.assertIsInstance(questions, Iterator)
+
+        questions = list(questions)
+        self.assertEqual(len(questions), 5)
+        self.assertEqual(questions[0], ('what is TF-IDF?', 1))
+        # lines whose question is not a string or whose ID is not an integer are malformed as well
+        self.assertEqual(len(malformed_lines), 6)
+
+        # tags are parsed only if they are needed, and questions without tags field have no tags
+        questions = list(iter_questions(self.path, with_tags=True))
+        self.assertEqual(questions[2], ('How to use pytest?', 3, ['python', 'pytest']))
+        self.assertEqual([tags for _, _, tags in questions], [['nlp'], ['python'], ['python', 'pytest'], ['nlp'],
+                                                              ['unicode']])
+
+    def test_parse_tags(self):
+        self.assertEqual(parse_tags('<python><pytest>'), ['python', 'pytest'])
+        self.assertEqual(parse_tags('<Python>< pytest ><><python>'), ['python', 'pytest'])
+        self.assertEqual(parse_tags(['Python', 'c++', 'python']), ['python', 'c++'])
+        self.assertEqual(parse_tags(''), [])
+        self.assertEqual(parse_tags(None), [])
+        with self.assertRaises(TypeError):
+            parse_tags(42)
+
+    def test_load_range(self):
+        # each line must be parsed exactly once, regardless of where range bounds are
+        file_size = os.path.getsize(self.path)
+        for num_of_ranges in [1, 2, 3, 7, file_size]:
+            bounds = [file_size * i // num_of_ranges for i in range(num_of_ranges + 1)]
+            questions, num_of_lines, num_of_malformed_lines = [], 0, 0
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                range_questions, range_lines, range_malformed_lines = _load_range(self.path, start, end)
+                questions.extend(range_questions)
+                num_of_lines += range_lines
+                num_of_malformed_lines += range_malformed_lines
+
+            self.assertEqual(questions, list(iter_questions(self.path)))
+            self.assertEqual(num_of_lines, 11)
+            self.assertEqual(num_of_malformed_lines, 6)
+
+    def test_load_corpus(self):
+        data, stats = load_corpus(self.path)
+        self.assertIsInstance(data, dict)
+        self.assertEqual(data, self.expected_data)
+        # order of questions is the order of their first occurrence
+        self.assertEqual(list(data.keys()), list(self.expected_data.keys()))
+        self.assertEqual(stats.num_of_lines, 11)
+        self.assertEqual(stats.num_of_malformed_lines, 6)
+        self.assertGreater(stats.lines_per_second, 0)
+
+        # parallel loading gives the same result
+        data, stats = load_corpus(self.path, n_jobs=3, min_chunk_size=1)
+        self.assertEqual(data, self.expected_data)
+        self.assertEqual(list(data.keys()), list(self.expected_data.keys()))
+        self.assertEqual(stats.num_of_lines, 11)
+        self.assertEqual(stats.num_of_malformed_lines, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
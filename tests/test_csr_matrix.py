@@ -0,0 +1,100 @@
+import pickle
+import unittest
+import numpy as np
+
+from search_engine.index.csr_matrix import CsrMatrix
+
+
+class TestCsrMatrix(unittest.TestCase):
+
+    def setUp(self):
+        self.dense = np.asarray([
+            [0., 0.5, 0., 0.5],
+            [0., 0., 0., 0.],
+            [1., 0., 0., 0.],
+            [0., 0.2, 0.3, 0.]
+        ])
+        self.matrix = CsrMatrix(indptr=np.asarray([0, 2, 2, 3, 5]),
+                                indices=np.asarray([1, 3, 0, 1, 2]),
+                                data=np.asarray([0.5, 0.5, 1., 0.2, 0.3]),
+                                shape=(4, 4))
+
+    def test_init(self):
+        self.assertEqual(self.matrix.shape, (4, 4))
+        self.assertEqual(self.matrix.nnz, 5)
+        self.assertEqual(len(self.matrix), 4)
+
+        # inconsistent component arrays
+        with self.assertRaises(ValueError):
+            CsrMatrix(np.asarray([0, 2]), np.asarray([1, 3]), np.asarray([0.5, 0.5]), shape=(2, 4))
+        with self.assertRaises(ValueError):
+            CsrMatrix(np.asarray([0, 3]), np.asarray([1, 3]), np.asarray([0.5, 0.5]), shape=(1, 4))
+
+    def test_empty(self):
+        matrix = CsrMatrix.empty(num_of_columns=4)
+        self.assertEqual(matrix.shape, (0, 4))
+        self.assertEqual(matrix.nnz, 0)
+        self.assertEqual(matrix.dot(np.ones(4)).shape, (0,))
+
+    def test_vstack(self):
+        matrix = CsrMatrix.vstack([self.matrix.row_slice(0, 1), self.matrix.row_slice(1, 1),
+                                   self.matrix.row_slice(1, 4)])
+        self.assertEqual(matrix.shape, (4, 4))
+        self.assertEqual(np.array_equal(matrix.indptr, self.matrix.indptr), True)
+        self.assertEqual(np.array_equal(matrix.toarray(), self.dense), True)
+
+    def test_getrow(self):
+        indices, data = self.matrix.getrow(3)
+        self.assertEqual(indices.tolist(), [1, 2])
+        self.assertEqual(data.tolist(), [0.2, 0.3])
+
+        indices, data = self.matrix.getrow(1)
+        self.assertEqual(len(indices), 0)
+        self.assertEqual(len(data), 0)
+
+    def test_toarray(self):
+        self.assertEqual(np.array_equal(self.matrix.toarray(), self.dense), True)
+
+    def test_dot(self):
+        # single vector
+        vector = np.asarray([1., 2., 3., 4.])
+        self.assertEqual(np.allclose(self.matrix.dot(vector), self.dense.dot(vector)), True)
+
+        # multiple vectors, including empty row
+        vectors = np.arange(12, dtype=np.float64).reshape(4, 3)
+        self.assertEqual(self.matrix.dot(vectors).shape, (4, 3))
+        self.assertEqual(np.allclose(self.matrix.dot(vectors), self.dense.dot(vectors)), True)
+
+    def test_row_slice(self):
+        matrix = self.matrix.row_slice(1, 3)
+        self.assertEqual(matrix.shape, (2, 4))
+        self.assertEqual(np.array_equal(matrix.toarray(), self.dense[1:3]), True)
+
+        # slice that exceeds number of rows
+        matrix = self.matrix.row_slice(2, 10)
+        self.assertEqual(np.array_equal(matrix.toarray(), self.dense[2:]), True)
+        self.assertEqual(self.matrix.row_slice(4, 6).shape, (0, 4))
+
+    def test_take_rows(self):
+        rows = np.asarray([3, 1, 0, 3])
+        matrix = self.matrix.take_rows(rows)
+        self.assertEqual(matrix.shape, (4, 4))
+        self.assertEqual(np.array_equal(matrix.toarray(), self.dense[rows]), True)
+        self.assertEqual(self.matrix.take_rows(np.zeros(0, dtype=np.int64)).shape, (0, 4))
+
+    def test_transpose(self):
+        transposed = self.matrix.transpose()
+        self.assertEqual(transposed.shape, (4, 4))
+        self.assertEqual(np.array_equal(transposed.toarray(), self.dense.transpose()), True)
+        # row indices of the original matrix are sorted inside each row of transposed matrix
+        indices, _ = transposed.getrow(1)
+        self.assertEqual(indices.tolist(), [0, 3])
+
+    def test_pickle(self):
+        matrix = pickle.loads(pickle.dumps(self.matrix))
+        self.assertEqual(matrix.shape, self.matrix.shape)
+        self.assertEqual(np.array_equal(matrix.toarray(), self.dense), True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+import shutil
+import unittest
+import numpy as np
+
+from utils import *
+from search_engine.index.incremental_index import IncrementalIndex
+from search_engine.question_search_engine import QuestionSearchEngine
+from search_engine.similarity_scorer.top_k_selection import select_top_k
+from search_engine.vectorizer.tf_idf_vectorizer import TfIdfVectorizer
+
+
+class TestIncrementalIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = [
+            'How do I use Error handling in Java?',
+            'Error Handling in Swift 3',
+            'Java BufferedReader error',
+            'If block error handling in bash',
+            'java ATM program simulation with exception handling - no error neither full output?',
+            'Exception handling in Swift',
+            'How do I read file in bash?'
+        ]
+        # added questions use only words from vocabulary of the fitted corpus
+        self.added_questions = [
+            'Java error handling in bash',
+            'How do I use Swift exception?',
+            'read file with BufferedReader in Java'
+        ]
+        self.queries = ['Error handling in Java?', 'bash file', 'Swift exception', 'Rukovanje greskama u Javi?']
+        self.work_dir_path = 'incremental_index'
+        self.engine = self._build_search_engine(self.corpus, 'engine')
+
+    def tearDown(self):
+        if os.path.exists(self.work_dir_path):
+            shutil.rmtree(self.work_dir_path)
+
+    def _build_search_engine(self, questions, name):
+        dir_path = os.path.join(self.work_dir_path, name)
+        check_does_dir_exist(dir_path, create_dir=True)
+        vectorizer = TfIdfVectorizer(cache_path=os.path.join(dir_path, 'index'),
+                                     query_encoder_path=os.path.join(dir_path, 'query_encoder'))
+        return QuestionSearchEngine(questions, fit_vectorizer=True, tf_idf_vectorizer=vectorizer)
+
+    def _assert_results_almost_equal(self, result, expected):
+        self.assertEqual(len(result), len(expected))
+        for (score, question), (expected_score, expected_question) in zip(result, expected):
+            self.assertEqual(question, expected_question)
+            self.assertAlmostEqual(score, expected_score, places=4)
+
+    def test_add_questions(self):
+        question_indices = self.engine.add_questions(self.added_questions)
+        self.assertEqual(question_indices, [7, 8, 9])
+        # so many added questions make IDF vector stale, so index may already be compacting in background
+        self.engine.wait_for_compaction()
+
+        # added questions are found right away
+        result = self.engine.most_similar('read file with BufferedReader in Java', n=1)
+        self.assertEqual(result[0][1], self.added_questions[2])
+
+        # document frequencies are updated with every change
+        vocabulary = self.engine._tf_idf_vectorizer._vocabulary
+        self.assertEqual(self.engine._index._document_frequencies[vocabulary['java']], 5)
+
+    def test_add_segment(self):
+        vectorizer = self.engine._tf_idf_vectorizer
+        index = IncrementalIndex(vectorizer.questions, vectorizer.inverted_index, vectorizer.idf_vector)
+        question_indices = index.add(vectorizer.transform(self.added_questions, sparse=True), vectorizer.idf_vector)
+        self.assertEqual(question_indices.tolist(), [7, 8, 9])
+        self.assertEqual(index.num_of_segments, 2)
+        self.assertEqual(index.needs_compaction(max_num_of_segments=8, idf_refresh_ratio=0.1), True)
+
+        # removed questions are skipped before compaction
+        query_vector = vectorizer.transform(['java error'])[0]
+        self.assertEqual(index.remove([2, 7]), 2)
+        question_indices, _ = index.score(query_vector)
+        self.assertEqual(question_indices.tolist(), [0, 1, 3, 4, 9])
+
+        index.compact(refresh_idf=False)
+        self.assertEqual(index.num_of_segments, 1)
+        self.assertEqual(index.score(query_vector)[0].tolist(), [0, 1, 3, 4, 9])
+        self.assertEqual(np.array_equal(index.idf_vector, vectorizer.idf_vector), True)
+
+    def test_remove_questions(self):
+        self.assertEqual(self.engine.remove_questions([0, 2, 2]), 2)
+        self.assertEqual(self.engine.remove_questions([0]), 0)
+        with self.assertRaises(IndexError):
+            self.engine.remove_questions([len(self.corpus)])
+        self.engine.wait_for_compaction()
+
+        vocabulary = self.engine._tf_idf_vectorizer._vocabulary
+        self.assertEqual(self.engine._index._document_frequencies[vocabulary['java']], 1)
+
+        # removed questions never appear in results, before and after compaction
+        for compact in [False, True]:
+            if compact:
+                self.engine.compact(refresh_idf=True)
+            for result in self.engine.most_similar_batch(self.queries, n=10):
+                self.assertNotIn(self.corpus[0], [question for _, question in result])
+                self.assertNotIn(self.corpus[2], [question for _, question in result])
+            self.assertEqual(self.engine.most_similar_batch(self.queries, n=10),
+                             [self.engine.most_similar(query, n=10) for query in self.queries])
+
+    def test_score_top_k(self):
+        self.engine.add_questions(self.added_questions)
+        self.engine.remove_questions([0, 4])
+        self.engine.wait_for_compaction()
+        index = self.engine._get_index()
+        for query_vector in self.engine._tf_idf_vectorizer.transform(self.queries):
+            question_indices, scores = index.score(query_vector)
+            for k in [1, 2, 5]:
+                # skipping questions that can not be among top k does not change top k questions or their scores
+                pruned_indices, pruned_scores = index.score(query_vector, k)
+                top_positions, pruned_positions = select_top_k(scores, k), select_top_k(pruned_scores, k)
+                self.assertEqual(pruned_indices[pruned_positions].tolist(), question_indices[top_positions].tolist())
+                self.assertEqual(pruned_scores[pruned_positions].tolist(), scores[top_positions].tolist())
+                self.assertNotIn(0, pruned_indices.tolist())
+                self.assertNotIn(4, pruned_indices.tolist())
+
+    def test_score_filtered(self):
+        self.engine.add_questions(self.added_questions)
+        self.engine.remove_questions([0, 4])
+        self.engine.wait_for_compaction()
+        index = self.engine._get_index()
+        # few questions are scored by their vectors, and many of them through postings of query terms
+        filters = [np.array([], dtype=np.int64), np.array([2]), np.array([0, 1, 5, 8]), np.arange(10),
+                   np.array([1, 2, 3, 5, 6, 7, 8, 9, 12])]
+        for query_vector in self.engine._tf_idf_vectorizer.transform(self.queries):
+            question_indices, scores = index.score(query_vector)
+            for filtered_indices in filters:
+                for k in [None, 1, 5]:
+                    expected = np.isin(question_indices, filtered_indices)
+                    filtered_question_indices, filtered_scores = index.score(query_vector, k, filtered_indices)
+                    top_positions = select_top_k(scores[expected], k or 10)
+                    filtered_positions = select_top_k(filtered_scores, k or 10)
+                    self.assertEqual(filtered_question_indices[filtered_positions].tolist(),
+                                     question_indices[expected][top_positions].tolist())
+                    self.assertEqual(np.allclose(filtered_scores[filtered_positions],
+                                                 scores[expected][top_positions]), True)
+                    self.assertNotIn(0, filtered_question_indices.tolist())
+
+    def test_compact_matches_refit(self):
+        self.engine.add_questions(self.added_questions[:2])
+        self.engine.add_questions(self.added_questions[2:])
+        self.engine.remove_questions([1, 8])
+        self.engine.compact(refresh_idf=True, background=True)
+        self.engine.wait_for_compaction()
+        self.assertEqual(self.engine._index.num_of_segments, 1)
+
+        remaining_questions = [question for i, question in enumerate(self.corpus + self.added_questions)
+                               if i not in [1, 8]]
+        refitted_engine = self._build_search_engine(remaining_questions, 'refitted_engine')
+
+        # Tf-Idf vectors match the refitted ones within 1e-9, so results match up to rounding
+        for query in self.queries:
+            expected = refitted_engine.most_similar(query, n=10)
+            self._assert_results_almost_equal(self.engine.most_similar(query, n=10), expected)
+
+            vectorized_query = self.engine._tf_idf_vectorizer.transform([query])[0]
+            question_indices, scores = self.engine._index.score(vectorized_query)
+            expected_scores = {question: score for question, score in zip(
+                *refitted_engine._index.score(refitted_engine._tf_idf_vectorizer.transform([query])[0]))}
+            self.assertEqual(len(question_indices), len(expected_scores))
+            remaining_indices = [i for i in range(len(self.corpus) + len(self.added_questions)) if i not in [1, 8]]
+            for question_index, score in zip(question_indices.tolist(), scores.tolist()):
+                self.assertAlmostEqual(score, expected_scores[remaining_indices.index(question_index)], delta=1e-9)
+
+    def test_quantized_index(self):
+        vectorizer = TfIdfVectorizer(cache_path=os.path.join(self.work_dir_path, 'int8_index'), dtype='int8',
+                                     query_encoder_path=os.path.join(self.work_dir_path, 'query_encoder'))
+        engine = QuestionSearchEngine(self.corpus, fit_vectorizer=True, tf_idf_vectorizer=vectorizer)
+
+        # added questions and compacted index keep quantized weights
+        engine.add_questions(self.added_questions)
+        engine.remove_questions([1])
+        engine.compact(refresh_idf=True)
+        self.engine.add_questions(self.added_questions)
+        self.engine.remove_questions([1])
+        self.engine.compact(refresh_idf=True)
+
+        merged_segment = engine._index._segments[0]
+        self.assertEqual(merged_segment.questions.data.dtype, np.int8)
+        self.assertEqual(merged_segment.inverted_index.question_scales.shape[0], 10)
+        for query in self.queries:
+            result = engine.most_similar(query, n=3)
+            expected = self.engine.most_similar(query, n=3)
+            self.assertEqual([question for _, question in result], [question for _, question in expected])
+            for (score, _), (expected_score, _) in zip(result, expected):
+                self.assertAlmostEqual(score, expected_score, delta=1e-2)
+
+    def test_auto_compaction(self):
+        # adding many questions makes IDF vector stale, so index is compacted in background
+        self.engine.add_questions(self.added_questions * 2)
+        self.engine.wait_for_compaction()
+        self.assertEqual(self.engine._index.num_of_segments, 1)
+        self.assertEqual(np.array_equal(self.engine._tf_idf_vectorizer.idf_vector, self.engine._index.idf_vector),
+                         True)
+
+        # questions added after IDF refresh are vectorized with refreshed IDF vector
+        self.engine.add_questions(['Swift error'])
+        self.engine.wait_for_compaction()
+        self.assertEqual(self.engine.most_similar('Swift error', n=1)[0][1], 'Swift error')
+
+
+if __name__ == '__main__':
+    unittest.main()
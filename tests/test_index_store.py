@@ -0,0 +1,123 @@
+import json
+import shutil
+import unittest
+import numpy as np
+
+from utils import *
+from search_engine.index.csr_matrix import CsrMatrix
+from search_engine.index.inverted_index import InvertedIndex
+from search_engine.index.quantization import quantize
+from search_engine.index.index_store import IndexFormatError, StoredIndex, load_index, save_index, \
+    HEADER_FILE_NAME, INDEX_FORMAT_VERSION
+
+
+class TestIndexStore(unittest.TestCase):
+
+    def setUp(self):
+        self.path = 'index'
+        self.vocabulary = {'document': 0, 'first': 1, 'second': 2}
+        self.idf_vector = np.asarray([1.2, 1.5, 1.9])
+        self.questions = CsrMatrix(indptr=np.asarray([0, 2, 2, 4]),
+                                   indices=np.asarray([0, 1, 0, 2], dtype=np.int32),
+                                   data=np.asarray([0.6, 0.8, 0.28, 0.96]),
+                                   shape=(3, 3))
+        self.inverted_index = InvertedIndex(self.questions)
+        save_index(self.path, self.vocabulary, self.idf_vector, self.questions, self.inverted_index,
+                   metadata={'corpus': 'test'})
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+
+    def test_save_index(self):
+        self.assertEqual(check_does_dir_exist(self.path, create_dir=False), True)
+        self.assertEqual(check_does_file_exist(os.path.join(self.path, HEADER_FILE_NAME)), True)
+        self.assertEqual(check_does_dir_exist(f'{self.path}.tmp', create_dir=False), False)
+
+        # raw little-endian arrays
+        data = np.fromfile(os.path.join(self.path, 'data.bin'), dtype='<f8')
+        self.assertEqual(np.array_equal(data, self.questions.data), True)
+
+        # saving over existing index replaces it
+        save_index(self.path, self.vocabulary, self.idf_vector * 2, self.questions, self.inverted_index)
+        self.assertEqual(np.array_equal(load_index(self.path).idf_vector, self.idf_vector * 2), True)
+
+    def test_load_index(self):
+        stored_index = load_index(self.path, verify_checksum=True)
+        self.assertIsInstance(stored_index, StoredIndex)
+        self.assertEqual(stored_index.vocabulary, self.vocabulary)
+        self.assertEqual(np.array_equal(stored_index.idf_vector, self.idf_vector), True)
+        self.assertEqual(stored_index.metadata, {'corpus': 'test'})
+
+        # arrays are memory mapped
+        self.assertIsInstance(stored_index.questions.data, np.memmap)
+        self.assertEqual(stored_index.questions.shape, self.questions.shape)
+        self.assertEqual(np.array_equal(stored_index.questions.toarray(), self.questions.toarray()), True)
+
+        question_indices, weights = stored_index.inverted_index.postings(0)
+        self.assertEqual(question_indices.tolist(), [0, 2])
+        self.assertEqual(weights.tolist(), [0.6, 0.28])
+        self.assertIsInstance(stored_index.inverted_index.max_weights, np.memmap)
+        self.assertEqual(stored_index.inverted_index.max_weights.tolist(), [0.6, 0.8, 0.96])
+
+        # maximal weights of terms are calculated for indexes that were saved without them
+        header_path = os.path.join(self.path, HEADER_FILE_NAME)
+        with open(header_path, 'r') as file:
+            header = json.load(file)
+        del header['files']['max_weights.bin']
+        with open(header_path, 'w') as file:
+            json.dump(header, file)
+        self.assertEqual(load_index(self.path).inverted_index.max_weights.tolist(), [0.6, 0.8, 0.96])
+
+        # non existent index
+        with self.assertRaises(FileNotFoundError):
+            load_index('non_existent_index')
+
+    def test_load_quantized_index(self):
+        questions, question_scales = quantize(self.questions, 'int8')
+        save_index(self.path, self.vocabulary, self.idf_vector.astype(np.float32), questions,
+                   InvertedIndex(questions, question_scales))
+
+        stored_index = load_index(self.path, verify_checksum=True)
+        self.assertEqual(stored_index.idf_vector.dtype, np.float32)
+        self.assertEqual(stored_index.questions.data.dtype, np.int8)
+        self.assertEqual(stored_index.inverted_index.postings_matrix.data.dtype, np.int8)
+        self.assertEqual(np.array_equal(stored_index.inverted_index.question_scales, question_scales), True)
+
+        # float index has no scale factors
+        save_index(self.path, self.vocabulary, self.idf_vector, self.questions, self.inverted_index)
+        self.assertIsNone(load_index(self.path).inverted_index.question_scales)
+
+    def test_load_index_rejects_invalid_files(self):
+        header_path = os.path.join(self.path, HEADER_FILE_NAME)
+        with open(header_path, 'r') as file:
+            header = json.load(file)
+
+        # unsupported version
+        with open(header_path, 'w') as file:
+            json.dump(dict(header, version=INDEX_FORMAT_VERSION + 1), file)
+        with self.assertRaises(IndexFormatError):
+            load_index(self.path)
+        with open(header_path, 'w') as file:
+            json.dump(header, file)
+
+        # corrupted content is detected by checksum
+        data_path = os.path.join(self.path, 'data.bin')
+        (self.questions.data + 1).astype('<f8').tofile(data_path)
+        load_index(self.path)
+        with self.assertRaises(IndexFormatError):
+            load_index(self.path, verify_checksum=True)
+
+        # truncated file
+        self.questions.data[:-1].astype('<f8').tofile(data_path)
+        with self.assertRaises(IndexFormatError):
+            load_index(self.path)
+
+        # missing file
+        os.remove(data_path)
+        with self.assertRaises(IndexFormatError):
+            load_index(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import shutil
+import unittest
+import numpy as np
+
+from utils import *
+from search_engine.index.inverted_index import InvertedIndex
+from search_engine.vectorizer.tf_idf_vectorizer import TfIdfVectorizer
+from search_engine.index.csr_matrix import CsrMatrix
+from search_engine.index.quantization import quantize
+from search_engine.similarity_scorer.similarity_metrics import cosine_similarity, max_score_cosine_similarity, \
+    sparse_cosine_similarity, term_at_a_time_cosine_similarity
+from search_engine.similarity_scorer.top_k_selection import select_top_k
+
+
+class TestInvertedIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = [
+            'This is the first document.',
+            'This document is the second document.',
+            'And this is the third one.',
+            'Is this the first document?'
+        ]
+        self.cache_path = 'cache_index'
+        self.vectorizer = TfIdfVectorizer(cache_path=self.cache_path, query_encoder_path='query_encoder')
+        self.vectorizer.fit(self.corpus)
+
+    def tearDown(self):
+        for path in [self.cache_path, 'query_encoder']:
+            if os.path.exists(path):
+                shutil.rmtree(path)
+
+    def test_postings(self):
+        inverted_index = self.vectorizer.inverted_index
+        self.assertIsInstance(inverted_index, InvertedIndex)
+        self.assertEqual(inverted_index.num_of_terms, self.vectorizer._vocabulary_size)
+        self.assertEqual(inverted_index.num_of_questions, len(self.corpus))
+
+        # 'document' occurs in questions 0, 1 and 3
+        question_indices, weights = inverted_index.postings(self.vectorizer._vocabulary['document'])
+        self.assertEqual(question_indices.tolist(), [0, 1, 3])
+        self.assertEqual(np.array_equal(np.round(weights, 8), [0.46979139, 0.6876236, 0.46979139]), True)
+
+        # 'third' occurs only in question 2
+        question_indices, _ = inverted_index.postings(self.vectorizer._vocabulary['third'])
+        self.assertEqual(question_indices.tolist(), [2])
+
+        term_indices = np.asarray([self.vectorizer._vocabulary['document'], self.vectorizer._vocabulary['third']])
+        self.assertEqual(inverted_index.postings_lengths(term_indices).tolist(), [3, 1])
+
+    def test_term_at_a_time_cosine_similarity(self):
+        query_vector = self.vectorizer.transform(['Is this the second one?'])[0]
+        question_indices, scores = term_at_a_time_cosine_similarity(query_vector, self.vectorizer.inverted_index)
+
+        # scores must match exhaustive scoring over whole corpus
+        expected_scores = cosine_similarity(query_vector[None, :], self.vectorizer.questions)[0]
+        self.assertEqual(question_indices.tolist(), np.flatnonzero(expected_scores).tolist())
+        self.assertEqual(np.allclose(scores, expected_scores[question_indices]), True)
+
+        # scores of multiple queries have one row for each query, the same for dense and CSR corpus vectors
+        query_vectors = self.vectorizer.transform(['Is this the second one?', 'first document'])
+        batch_scores = cosine_similarity(query_vectors, self.vectorizer.questions)
+        self.assertEqual(batch_scores.shape, (2, self.vectorizer.questions.shape[0]))
+        self.assertEqual(np.allclose(batch_scores[0], expected_scores), True)
+        self.assertEqual(np.allclose(cosine_similarity(query_vectors, self.vectorizer.questions.toarray()),
+                                     batch_scores), True)
+
+        # query without vocabulary words
+        query_vector = self.vectorizer.transform(['Unknown words'])[0]
+        question_indices, scores = term_at_a_time_cosine_similarity(query_vector, self.vectorizer.inverted_index)
+        self.assertEqual(question_indices.shape[0], 0)
+        self.assertEqual(scores.shape[0], 0)
+
+    def test_gather_postings(self):
+        term_indices = np.asarray([self.vectorizer._vocabulary['third'], self.vectorizer._vocabulary['document']])
+        term_positions, question_indices, weights = self.vectorizer.inverted_index.gather_postings(term_indices)
+        self.assertEqual(term_positions.tolist(), [0, 1, 1, 1])
+        self.assertEqual(question_indices.tolist(), [2, 0, 1, 3])
+        self.assertEqual(weights.shape[0], 4)
+
+    def test_sparse_cosine_similarity(self):
+        queries = ['Is this the second one?', 'Unknown words', 'first document']
+        query_vectors = self.vectorizer.transform(queries, sparse=True)
+        self.assertIsInstance(query_vectors, CsrMatrix)
+
+        query_indices, question_indices, scores = sparse_cosine_similarity(query_vectors,
+                                                                           self.vectorizer.inverted_index)
+        # scores must be identical to the ones calculated for each query separately
+        for i, query_vector in enumerate(query_vectors.toarray()):
+            expected_question_indices, expected_scores = term_at_a_time_cosine_similarity(
+                query_vector, self.vectorizer.inverted_index)
+            self.assertEqual(question_indices[query_indices == i].tolist(), expected_question_indices.tolist())
+            self.assertEqual(scores[query_indices == i].tolist(), expected_scores.tolist())
+
+    def test_max_weights(self):
+        inverted_index = self.vectorizer.inverted_index
+        dense = self.vectorizer.questions.toarray()
+        self.assertEqual(np.array_equal(inverted_index.max_weights, dense.max(axis=0)), True)
+
+        # weights of the term are looked up only in given questions
+        term_index = self.vectorizer._vocabulary['document']
+        weights = inverted_index.lookup_weights(term_index, np.asarray([0, 2, 3]))
+        self.assertEqual(weights.tolist(), dense[[0, 2, 3], term_index].tolist())
+        self.assertEqual(inverted_index.lookup_weights(term_index, np.asarray([], dtype=np.int64)).shape[0], 0)
+
+        # bounds of quantized weights are dequantized
+        questions, question_scales = quantize(self.vectorizer.questions, 'int8')
+        quantized_index = InvertedIndex(questions, question_scales)
+        expected_max_weights = (questions.toarray() * question_scales[:, None]).max(axis=0)
+        self.assertEqual(np.array_equal(quantized_index.max_weights, expected_max_weights), True)
+        self.assertEqual(np.array_equal(InvertedIndex.from_postings(quantized_index.postings_matrix,
+                                                                    question_scales).max_weights,
+                                        expected_max_weights), True)
+
+    def test_max_score_cosine_similarity(self):
+        # few very common terms and many rare ones, and queries with both, so that postings of common terms are pruned
+        random_generator = np.random.RandomState(0)
+        dense = (random_generator.rand(5000, 200) < 0.5 / np.arange(1, 201)) * random_generator.choice(
+            [0.5, 1.], size=(5000, 200))
+        dense /= np.maximum(np.linalg.norm(dense, axis=1, keepdims=True), 1e-12)
+        indptr = np.concatenate(([0], np.cumsum(np.count_nonzero(dense, axis=1))))
+        rows, indices = np.nonzero(dense)
+        questions = CsrMatrix(indptr, indices.astype(np.int32), dense[rows, indices], dense.shape)
+        query_vectors = np.zeros((50, 200))
+        for query_vector in query_vectors:
+            query_vector[random_generator.choice(5, 3, replace=False)] = random_generator.rand(3) * 0.3
+            query_vector[random_generator.choice(np.arange(20, 200), 2, replace=False)] = random_generator.rand(2)
+        query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+
+        float32_questions = CsrMatrix(indptr, questions.indices, questions.data.astype(np.float32), dense.shape)
+        quantized_questions, question_scales = quantize(questions, 'int8')
+        excluded = np.zeros(dense.shape[0], dtype=bool)
+        excluded[::7] = True
+        num_of_scored, num_of_pruned = 0, 0
+        for inverted_index, dtype in [(InvertedIndex(questions), np.float64),
+                                      (InvertedIndex(float32_questions), np.float32),
+                                      (InvertedIndex(quantized_questions, question_scales), np.float32)]:
+            for query_vector in query_vectors.astype(dtype):
+                question_indices, scores = term_at_a_time_cosine_similarity(query_vector, inverted_index)
+                for k in [1, 10]:
+                    top_positions = select_top_k(scores, k)
+                    pruned_indices, pruned_scores = max_score_cosine_similarity(query_vector, inverted_index, k)
+                    pruned_positions = select_top_k(pruned_scores, k)
+                    # top k questions and their scores are identical to the ones of exhaustive scoring
+                    self.assertEqual(pruned_indices[pruned_positions].tolist(),
+                                     question_indices[top_positions].tolist())
+                    self.assertEqual(pruned_scores[pruned_positions].tolist(), scores[top_positions].tolist())
+                    num_of_scored += question_indices.shape[0]
+                    num_of_pruned += pruned_indices.shape[0]
+
+                    # excluded questions do not count for threshold
+                    kept = ~excluded[question_indices]
+                    top_positions = select_top_k(scores[kept], k)
+                    pruned_indices, pruned_scores = max_score_cosine_similarity(query_vector, inverted_index, k,
+                                                                                excluded)
+                    pruned_kept = ~excluded[pruned_indices]
+                    pruned_positions = select_top_k(pruned_scores[pruned_kept], k)
+                    self.assertEqual(pruned_indices[pruned_kept][pruned_positions].tolist(),
+                                     question_indices[kept][top_positions].tolist())
+        self.assertLess(num_of_pruned, num_of_scored)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import shutil
+import unittest
+import numpy as np
+
+from utils import *
+from search_engine.index.csr_matrix import CsrMatrix
+from search_engine.index.ivf_index import IvfIndex
+from search_engine.question_search_engine import QuestionSearchEngine
+from search_engine.vectorizer.tf_idf_vectorizer import TfIdfVectorizer
+
+
+class TestIvfIndex(unittest.TestCase):
+
+    def setUp(self):
+        # two groups of questions that do not share any term
+        dense = np.asarray([
+            [0.6, 0.8, 0., 0.],
+            [0.8, 0.6, 0., 0.],
+            [1., 0., 0., 0.],
+            [0., 0., 0.6, 0.8],
+            [0., 0., 1., 0.],
+            [0., 0., 0., 0.]
+        ])
+        indptr = np.concatenate(([0], np.cumsum(np.count_nonzero(dense, axis=1))))
+        rows, indices = np.nonzero(dense)
+        self.questions = CsrMatrix(indptr, indices.astype(np.int32), dense[rows, indices], dense.shape)
+        self.ivf_index = IvfIndex.build(self.questions, num_of_clusters=2)
+
+        self.work_dir_path = 'ivf_index'
+        self.corpus = [
+            'How do I use Error handling in Java?',
+            'Error Handling in Swift 3',
+            'Java BufferedReader error',
+            'If block error handling in bash',
+            'java ATM program simulation with exception handling - no error neither full output?',
+            'Exception handling in Swift',
+            'How do I read file in bash?'
+        ]
+
+    def tearDown(self):
+        if os.path.exists(self.work_dir_path):
+            shutil.rmtree(self.work_dir_path)
+
+    def test_build(self):
+        self.assertEqual(self.ivf_index.num_of_clusters, 2)
+        self.assertEqual(self.ivf_index.num_of_questions, 6)
+        self.assertEqual(np.allclose(np.linalg.norm(self.ivf_index.centroids, axis=1), 1.), True)
+
+        # questions of the same group belong to the same cluster
+        assignments = self.ivf_index._assignments
+        self.assertEqual(len(set(assignments[:3].tolist())), 1)
+        self.assertEqual(len(set(assignments[3:5].tolist())), 1)
+        self.assertNotEqual(assignments[0], assignments[3])
+
+    def test_candidates(self):
+        query_vector = np.asarray([0., 0., 0.8, 0.6])
+        candidates = self.ivf_index.candidates(query_vector, num_of_probes=1)
+        self.assertEqual(candidates.tolist()[:2], [3, 4])
+        self.assertNotIn(0, candidates.tolist())
+
+        # probing all clusters gives all questions as candidates
+        self.assertEqual(self.ivf_index.candidates(query_vector, num_of_probes=2).tolist(), list(range(6)))
+        self.assertEqual(self.ivf_index.candidates(np.zeros(4), num_of_probes=2).shape[0], 0)
+
+    def test_add(self):
+        self.ivf_index.add(self.questions.row_slice(3, 4))
+        self.assertEqual(self.ivf_index.num_of_questions, 7)
+        self.assertIn(6, self.ivf_index.candidates(np.asarray([0., 0., 0.8, 0.6]), num_of_probes=1).tolist())
+
+    def test_approximate_search(self):
+        check_does_dir_exist(self.work_dir_path, create_dir=True)
+        vectorizer = TfIdfVectorizer(cache_path=os.path.join(self.work_dir_path, 'index'),
+                                     query_encoder_path=os.path.join(self.work_dir_path, 'query_encoder'))
+        search_engine = QuestionSearchEngine(self.corpus, fit_vectorizer=True, tf_idf_vectorizer=vectorizer,
+                                             approximate=True, num_of_probes=1)
+        exact_search_engine = QuestionSearchEngine(self.corpus, fit_vectorizer=False, tf_idf_vectorizer=vectorizer)
+        self.assertEqual(search_engine._ivf_index.num_of_clusters, 2)
+
+        queries = ['Error handling in Java?', 'bash file', 'Rukovanje greskama u Javi?']
+        for query in queries:
+            result = search_engine.most_similar(query, n=3)
+            exact_result = exact_search_engine.most_similar(query, n=10)
+            # approximate results are a subset of exact results with the same scores
+            for pair in result:
+                self.assertIn(pair, exact_result)
+
+        # probing all clusters gives exact results
+        search_engine.num_of_probes = 2
+        expected = [exact_search_engine.most_similar(query, n=3) for query in queries]
+        self.assertEqual([search_engine.most_similar(query, n=3) for query in queries], expected)
+        self.assertEqual(search_engine.most_similar_batch(queries, n=3), expected)
+
+        # added questions are assigned to clusters
+        search_engine.add_questions(['read file in Java'])
+        self.assertEqual(search_engine.most_similar('read file in Java', n=1)[0][1], 'read file in Java')
+
+
+if __name__ == '__main__':
+    unittest.main()
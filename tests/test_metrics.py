@@ -0,0 +1,101 @@
+import shutil
+import unittest
+
+from utils import *
+from search_engine.instrumentation.metrics import CProfileSampler, Histogram, MetricsRegistry, metrics
+from search_engine.question_search_engine import QuestionSearchEngine
+from search_engine.vectorizer.tf_idf_vectorizer import TfIdfVectorizer
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry(enabled=True)
+        self.work_dir_path = 'metrics'
+        self.corpus = [
+            'How do I use Error handling in Java?',
+            'Error Handling in Swift 3',
+            'Java BufferedReader error',
+            'How do I read file in bash?'
+        ]
+
+    def tearDown(self):
+        metrics.enabled = False
+        metrics.reset()
+        if os.path.exists(self.work_dir_path):
+            shutil.rmtree(self.work_dir_path)
+
+    def test_histogram(self):
+        histogram = Histogram([0.1, 1., 10.])
+        for value in [0.05, 0.1, 0.5, 2., 20.]:
+            histogram.observe(value)
+
+        # bucket contains values that are not greater than its upper bound
+        self.assertEqual(histogram.bucket_counts, [2, 1, 1, 1])
+        self.assertEqual(histogram.cumulative_counts(), [2, 3, 4, 5])
+        self.assertEqual(histogram.count, 5)
+        self.assertAlmostEqual(histogram.sum, 22.65)
+        self.assertEqual(histogram.quantile(0.5), 1.)
+        self.assertEqual(histogram.quantile(1.), float('inf'))
+        self.assertEqual(Histogram().quantile(0.5), 0.)
+
+    def test_disabled(self):
+        registry = MetricsRegistry(enabled=False)
+        with registry.timer('score'):
+            pass
+        registry.increment('queries')
+
+        self.assertIsNone(registry.histogram('score'))
+        self.assertEqual(registry.counter('queries'), 0)
+        self.assertEqual(registry.to_prometheus(), '\n')
+
+    def test_prometheus_export(self):
+        for _ in range(3):
+            with self.registry.timer('score'):
+                pass
+        self.registry.increment('queries', 2)
+
+        lines = self.registry.to_prometheus().splitlines()
+        self.assertIn('# TYPE question_search_engine_stage_duration_seconds histogram', lines)
+        self.assertIn('question_search_engine_stage_duration_seconds_bucket{stage="score",le="+Inf"} 3', lines)
+        self.assertIn('question_search_engine_stage_duration_seconds_count{stage="score"} 3', lines)
+        self.assertIn('question_search_engine_queries_total 2', lines)
+
+        self.registry.reset()
+        self.assertIsNone(self.registry.histogram('score'))
+
+    def test_sampling_profiler(self):
+        sampler = CProfileSampler()
+        self.registry.set_profiler(sampler, sample_every=2)
+        for _ in range(4):
+            with self.registry.timer('select'):
+                # nested stage is timed but not profiled, since sampler is already active
+                with self.registry.timer('score'):
+                    sorted(range(100))
+
+        self.assertEqual(self.registry.histogram('select').count, 4)
+        self.assertEqual(self.registry.histogram('score').count, 4)
+        self.assertEqual(sampler.stages, ['select'])
+        functions = [function for _, _, function in sampler.stats('select').stats]
+        self.assertIn('<built-in method builtins.sorted>', functions)
+
+    def test_search_stages(self):
+        check_does_dir_exist(self.work_dir_path, create_dir=True)
+        vectorizer = TfIdfVectorizer(cache_path=os.path.join(self.work_dir_path, 'index'),
+                                     query_encoder_path=os.path.join(self.work_dir_path, 'query_encoder'))
+        search_engine = QuestionSearchEngine(self.corpus, fit_vectorizer=True, tf_idf_vectorizer=vectorizer)
+
+        metrics.reset()
+        metrics.enabled = True
+        search_engine.most_similar('Error handling in Java?', n=2)
+        search_engine.most_similar('Error handling in Java?', n=2)
+        search_engine.most_similar_batch(['bash file', 'Swift'], n=2)
+
+        for stage in ['preprocess', 'transform', 'score', 'select', 'corpus_lookup']:
+            self.assertIsNotNone(metrics.histogram(stage), stage)
+        self.assertEqual(metrics.counter('queries'), 4)
+        self.assertEqual(metrics.counter('cached_queries'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
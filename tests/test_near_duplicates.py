@@ -0,0 +1,105 @@
+import shutil
+import unittest
+import numpy as np
+
+from utils import *
+from run import write_near_duplicates
+from search_engine.index.csr_matrix import CsrMatrix
+from search_engine.index.quantization import dequantize, quantize
+from search_engine.similarity_scorer.near_duplicates import PAIR_DTYPE, SelfJoinStats, find_near_duplicates, \
+    load_near_duplicates
+from search_engine.vectorizer.tf_idf_vectorizer import TfIdfVectorizer
+
+
+class TestNearDuplicates(unittest.TestCase):
+
+    def setUp(self):
+        # few very common terms and many rare ones, with copies of questions that have a few terms added
+        random_generator = np.random.RandomState(0)
+        dense = (random_generator.rand(300, 40) < 0.5 / np.arange(1, 41)) * random_generator.rand(300, 40)
+        dense[200:] = dense[random_generator.choice(200, 100)] + \
+            (random_generator.rand(100, 40) < 0.05) * random_generator.rand(100, 40) * 0.3
+        dense[::17] = 0.
+        dense /= np.maximum(np.linalg.norm(dense, axis=1, keepdims=True), 1e-12)
+        indptr = np.concatenate(([0], np.cumsum(np.count_nonzero(dense, axis=1))))
+        rows, indices = np.nonzero(dense)
+        self.questions = CsrMatrix(indptr, indices.astype(np.int32), dense[rows, indices], dense.shape)
+
+        self.work_dir_path = 'near_duplicates'
+        check_does_dir_exist(self.work_dir_path, create_dir=True)
+        self.path = os.path.join(self.work_dir_path, 'near_duplicates.bin')
+
+    def tearDown(self):
+        if os.path.exists(self.work_dir_path):
+            shutil.rmtree(self.work_dir_path)
+
+    def _assert_all_pairs_found(self, questions, question_scales, threshold):
+        dense = dequantize(questions, question_scales).toarray()
+        scores = dense.dot(dense.transpose())
+        # pairs with scores equal to threshold (up to rounding) may be found or not
+        is_expected = np.triu(scores, 1) >= threshold
+        is_ambiguous = np.abs(scores - threshold) < 1e-12
+
+        pairs = load_near_duplicates(self.path)
+        self.assertEqual(np.all(pairs['first'] < pairs['second']), True)
+        is_found = np.zeros(scores.shape, dtype=bool)
+        is_found[pairs['first'], pairs['second']] = True
+        self.assertEqual(np.array_equal(is_found & ~is_ambiguous, is_expected & ~is_ambiguous), True)
+        self.assertEqual(np.allclose(pairs['score'], scores[pairs['first'], pairs['second']]), True)
+
+    def test_find_near_duplicates(self):
+        for threshold in [0.5, 0.8, 0.95, 1.]:
+            stats = find_near_duplicates(self.questions, threshold, self.path, block_size=64)
+            self.assertIsInstance(stats, SelfJoinStats)
+            self._assert_all_pairs_found(self.questions, None, threshold)
+            self.assertEqual(stats.num_of_questions, self.questions.shape[0])
+            self.assertEqual(stats.num_of_pairs, len(load_near_duplicates(self.path)))
+            # only a fraction of all pairs is scored
+            self.assertLessEqual(stats.num_of_pairs, stats.num_of_verified_pairs)
+            self.assertLessEqual(stats.num_of_verified_pairs, stats.num_of_candidates)
+            self.assertLess(stats.num_of_candidates, self.questions.shape[0] * (self.questions.shape[0] - 1) // 2)
+
+        # blocks joined by a pool of processes are written in the same order
+        expected_pairs = np.array(load_near_duplicates(self.path))
+        for n_jobs, block_size in [(1, 1), (2, 7), (3, 1000)]:
+            find_near_duplicates(self.questions, 1., self.path, n_jobs=n_jobs, block_size=block_size)
+            self.assertEqual(np.array_equal(load_near_duplicates(self.path), expected_pairs), True)
+
+    def test_quantized_questions(self):
+        questions, question_scales = quantize(self.questions, 'int8')
+        find_near_duplicates(questions, 0.8, self.path, question_scales)
+        self._assert_all_pairs_found(questions, question_scales, 0.8)
+
+    def test_invalid_arguments(self):
+        for threshold in [0., -0.5, 1.5]:
+            with self.assertRaises(ValueError):
+                find_near_duplicates(self.questions, threshold, self.path)
+        with self.assertRaises(ValueError):
+            find_near_duplicates(self.questions, 0.9, self.path, block_size=0)
+
+        # corpus without questions has no pairs
+        stats = find_near_duplicates(CsrMatrix.empty(40), 0.9, self.path)
+        self.assertEqual(stats.num_of_pairs, 0)
+        self.assertEqual(load_near_duplicates(self.path).dtype, PAIR_DTYPE)
+        self.assertEqual(len(load_near_duplicates(self.path)), 0)
+
+    def test_write_near_duplicates(self):
+        corpus = [
+            'How do I use Error handling in Java?',
+            'Error Handling in Swift 3',
+            'How to use error handling in Java',
+            'If block error handling in bash',
+            'Error handling in Swift'
+        ]
+        vectorizer = TfIdfVectorizer(cache_path=os.path.join(self.work_dir_path, 'index'),
+                                     query_encoder_path=os.path.join(self.work_dir_path, 'query_encoder'))
+        vectorizer.fit(corpus)
+
+        stats = write_near_duplicates(vectorizer, 0.7, output_path=self.path)
+        pairs = load_near_duplicates(self.path)
+        self.assertEqual(stats.num_of_pairs, 2)
+        self.assertEqual(list(zip(pairs['first'].tolist(), pairs['second'].tolist())), [(0, 2), (1, 4)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import shutil
+import signal
+import unittest
+import http.client
+
+from search_engine.question_search_engine import QuestionSearchEngine
+from search_engine.service.prefork_server import PreforkServer
+from search_engine.vectorizer.tf_idf_vectorizer import TfIdfVectorizer
+
+
+class TestPreforkServer(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = [
+            'How do I use Error handling in Java?',
+            'Error Handling in Swift 3',
+            'Java BufferedReader error',
+            'If block error handling in bash'
+        ]
+        self.new_corpus = self.corpus + ['Error handling in Kotlin coroutines', 'Kotlin error']
+        self.corpus_path = 'corpus.txt'
+        self.query_encoder_path = 'query_encoder'
+        self.cache_path = 'cache_index'
+        self.server_pid = None
+        self._publish(self.corpus)
+
+    def tearDown(self):
+        if self.server_pid is not None:
+            os.kill(self.server_pid, signal.SIGTERM)
+            os.waitpid(self.server_pid, 0)
+        if os.path.exists(self.corpus_path):
+            os.remove(self.corpus_path)
+        for path in [self.query_encoder_path, self.cache_path]:
+            if os.path.exists(path):
+                shutil.rmtree(path)
+
+    def _build_vectorizer(self):
+        tf_idf_vectorizer = TfIdfVectorizer(use_cache=True, cache_path=self.cache_path,
+                                            query_encoder_path=self.query_encoder_path)
+        return tf_idf_vectorizer
+
+    def _publish(self, corpus):
+        # fitting stores model and index, which are loaded by the server
+        self._build_vectorizer().fit(corpus)
+        with open(self.corpus_path, 'w') as file:
+            file.write('\n'.join(corpus))
+
+    def _load_search_engine(self):
+        with open(self.corpus_path, 'r') as file:
+            corpus = file.read().splitlines()
+        return QuestionSearchEngine(corpus, fit_vectorizer=False, tf_idf_vectorizer=self._build_vectorizer())
+
+    def _start_server(self, num_of_workers):
+        server = PreforkServer(self._load_search_engine, num_of_workers=num_of_workers, port=0)
+        port = server.bind()
+        self.server_pid = os.fork()
+        if self.server_pid == 0:
+            try:
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        return port
+
+    def _request(self, port, method, path, request=None, timeout=10.):
+        # workers may not accept connections yet right after the server is started
+        deadline = time.perf_counter() + timeout
+        while True:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+            try:
+                connection.request(method, path, json.dumps(request) if request is not None else None)
+                response = connection.getresponse()
+                return response.status, json.loads(response.read().decode('utf-8'))
+            except (ConnectionError, http.client.HTTPException):
+                if time.perf_counter() > deadline:
+                    raise
+                time.sleep(0.05)
+            finally:
+                connection.close()
+
+    def test_workers(self):
+        port = self._start_server(num_of_workers=2)
+        status, response = self._request(port, 'POST', '/search', {'query': 'Error handling in Java?', 'n': 2})
+        self.assertEqual(status, 200)
+        self.assertEqual(response['results'][0][1], 'How do I use Error handling in Java?')
+
+        # requests are served by forked workers, not by the parent
+        pids = {self._request(port, 'GET', '/stats')[1]['pid'] for _ in range(10)}
+        self.assertNotIn(self.server_pid, pids)
+        self.assertLessEqual(len(pids), 2)
+
+    def test_reload(self):
+        port = self._start_server(num_of_workers=2)
+        status, response = self._request(port, 'POST', '/search', {'query': 'Kotlin coroutines'})
+        self.assertEqual((status, response['results']), (200, []))
+
+        self._publish(self.new_corpus)
+        os.kill(self.server_pid, signal.SIGHUP)
+
+        # new index is served after workers are replaced
+        deadline = time.perf_counter() + 10
+        while True:
+            status, response = self._request(port, 'POST', '/search', {'query': 'Kotlin coroutines', 'n': 1})
+            if response['results'] or time.perf_counter() > deadline:
+                break
+            time.sleep(0.05)
+        self.assertEqual(status, 200)
+        self.assertEqual(response['results'][0][1], 'Error handling in Kotlin coroutines')
+
+    def test_invalid_number_of_workers(self):
+        with self.assertRaises(ValueError):
+            PreforkServer(self._load_search_engine, num_of_workers=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 import string
 import unittest
 
+from constants import QUERY_TOKENS_CACHE_SIZE
 from search_engine.vectorizer.preprocessor import QuestionPreprocessor
 
 
@@ -13,66 +14,59 @@ class TestPreprocessor(unittest.TestCase):
         preprocessor_2 = QuestionPreprocessor()
         self.assertEqual(id(self.preprocessor_1), id(preprocessor_2))
 
-    def test_remove_non_word_chars(self):
-        text_1 = 'Some text 28 and speci@al character!s!'
-        self.assertIsInstance(self.preprocessor_1._remove_non_word_chars(text_1), str)
-        self.assertEqual(self.preprocessor_1._remove_non_word_chars(text_1), 'Some text  and special characters')
+    def test_singleton_arguments(self):
+        # instance is shared, so it can not be created again with another query cache size
+        self.assertIs(QuestionPreprocessor(query_cache_size=QUERY_TOKENS_CACHE_SIZE), self.preprocessor_1)
+        with self.assertRaises(ValueError):
+            QuestionPreprocessor(query_cache_size=QUERY_TOKENS_CACHE_SIZE + 1)
 
-        text_2 = ''
-        self.assertIsInstance(self.preprocessor_1._remove_non_word_chars(text_2), str)
-        self.assertEqual(self.preprocessor_1._remove_non_word_chars(text_2), '')
+    def test_tokenize_removes_non_word_chars(self):
+        self.assertEqual(self.preprocessor_1.tokenize('Some text 28 and speci@al character!s!'),
+                         ['some', 'text', 'and', 'special', 'characters'])
+        self.assertEqual(self.preprocessor_1.tokenize(''), [])
+        self.assertEqual(self.preprocessor_1.tokenize(string.digits + ' ' + string.punctuation), [])
 
-        text_3 = string.digits + string.punctuation
-        self.assertIsInstance(self.preprocessor_1._remove_non_word_chars(text_3), str)
-        self.assertEqual(self.preprocessor_1._remove_non_word_chars(text_3), '')
+    def test_tokenize_lowercases(self):
+        for text in ['Some TexT', 'SOME TEXT', 'some text']:
+            self.assertEqual(self.preprocessor_1.tokenize(text), ['some', 'text'])
 
-        text_4 = 'Some text'
-        self.assertIsInstance(self.preprocessor_1._remove_non_word_chars(text_4), str)
-        self.assertEqual(self.preprocessor_1._remove_non_word_chars(text_4), 'Some text')
-
-    def test_normalize(self):
-        text_1 = 'Some TexT'
-        self.assertIsInstance(self.preprocessor_1._normalize(text_1), str)
-        self.assertEqual(self.preprocessor_1._normalize(text_1), 'some text')
+    def test_tokenize(self):
+        tokens = self.preprocessor_1.tokenize('Some text with several tokens')
+        self.assertIsInstance(tokens, list)
+        self.assertEqual(tokens, ['some', 'text', 'with', 'several', 'tokens'])
+        for token in tokens:
+            self.assertIsInstance(token, str)
 
-        text_2 = 'SOME TEXT'
-        self.assertIsInstance(self.preprocessor_1._normalize(text_2), str)
-        self.assertEqual(self.preprocessor_1._normalize(text_2), 'some text')
+        self.assertEqual(self.preprocessor_1.tokenize('some     text'), ['some', 'text'])
+        self.assertEqual(self.preprocessor_1.tokenize('    '), [])
 
-        text_3 = 'some text'
-        self.assertIsInstance(self.preprocessor_1._normalize(text_3), str)
-        self.assertEqual(self.preprocessor_1._normalize(text_3), 'some text')
+    def test_tokenize_question(self):
+        self.assertEqual(self.preprocessor_1.tokenize('Is C# like C++ or a C?'), ['is', 'c', 'like', 'c', 'or', 'c'])
+        self.assertEqual(self.preprocessor_1.tokenize("Don't split\ton tabs"), ['dont', 'spliton', 'tabs'])
+        self.assertEqual(self.preprocessor_1.tokenize(string.digits + string.punctuation), [])
 
-        text_4 = ''
-        self.assertIsInstance(self.preprocessor_1._normalize(text_4), str)
-        self.assertEqual(self.preprocessor_1._normalize(text_4), '')
+    def test_preprocess_iter(self):
+        texts = ['First sentence   in corpus!', '\'Second senten@ce here?!']
+        sequences = self.preprocessor_1.preprocess_iter(iter(texts))
+        self.assertEqual(next(sequences), ['first', 'sentence', 'in', 'corpus'])
+        self.assertEqual(list(sequences), [['second', 'sentence', 'here']])
 
-    def test_tokenize(self):
-        text_1 = 'Some text with several tokens'
-        self.assertIsInstance(self.preprocessor_1._tokenize(text_1), list)
-        self.assertEqual(len(self.preprocessor_1._tokenize(text_1)), 5)
-        self.assertEqual(self.preprocessor_1._tokenize(text_1), ['Some', 'text', 'with', 'several', 'tokens'])
-        for token in self.preprocessor_1._tokenize(text_1):
-            self.assertIsInstance(token, str)
-
-        text_2 = 'some     text'
-        self.assertIsInstance(self.preprocessor_1._tokenize(text_2), list)
-        self.assertEqual(len(self.preprocessor_1._tokenize(text_2)), 2)
-        self.assertEqual(self.preprocessor_1._tokenize(text_2), ['some', 'text'])
-        for token in self.preprocessor_1._tokenize(text_2):
-            self.assertIsInstance(token, str)
+    def test_preprocess_query(self):
+        query = 'Error handling in Java?'
+        self.assertEqual(self.preprocessor_1.preprocess_query(query), self.preprocessor_1.tokenize(query))
 
-        text_3 = '    '
-        self.assertIsInstance(self.preprocessor_1._tokenize(text_3), list)
-        self.assertEqual(len(self.preprocessor_1._tokenize(text_3)), 0)
+        # cached tokens can not be changed through returned list
+        tokens = self.preprocessor_1.preprocess_query(query)
+        tokens.append('python')
+        self.assertEqual(self.preprocessor_1.preprocess_query(query), ['error', 'handling', 'in', 'java'])
 
-    def text_preprocess(self):
+    def test_preprocess(self):
         text_1 = 'First sentence   in corpus!'
         text_2 = '\'Second senten@ce here?!'
         texts = [text_1, text_2]
 
         self.assertIsInstance(self.preprocessor_1.preprocess(texts), list)
-        self.assertIsInstance(len(self.preprocessor_1.preprocess(texts)), 2)
+        self.assertEqual(len(self.preprocessor_1.preprocess(texts)), 2)
 
         sequences = self.preprocessor_1.preprocess(texts)
         for sequence in sequences:
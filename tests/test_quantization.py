@@ -0,0 +1,61 @@
+import unittest
+import numpy as np
+
+from search_engine.index.csr_matrix import CsrMatrix
+from search_engine.index.inverted_index import InvertedIndex
+from search_engine.index.quantization import dequantize, idf_dtype, quantize
+from search_engine.similarity_scorer.similarity_metrics import sparse_cosine_similarity, \
+    term_at_a_time_cosine_similarity
+
+
+class TestQuantization(unittest.TestCase):
+
+    def setUp(self):
+        self.questions = CsrMatrix(indptr=np.asarray([0, 2, 2, 4]),
+                                   indices=np.asarray([0, 1, 0, 2], dtype=np.int32),
+                                   data=np.asarray([0.6, 0.8, 0.28, 0.96]),
+                                   shape=(3, 3))
+        self.query_vector = np.asarray([0.8, 0., 0.6])
+
+    def test_quantize_float(self):
+        for dtype in ['float64', 'float32']:
+            questions, scales = quantize(self.questions, dtype)
+            self.assertIsNone(scales)
+            self.assertEqual(questions.data.dtype, np.dtype(dtype))
+            self.assertEqual(np.allclose(dequantize(questions, scales).toarray(), self.questions.toarray()), True)
+
+        with self.assertRaises(ValueError):
+            quantize(self.questions, 'float16')
+
+    def test_quantize_int8(self):
+        questions, scales = quantize(self.questions, 'int8')
+        self.assertEqual(questions.data.dtype, np.int8)
+        self.assertEqual(questions.data.tolist(), [95, 127, 37, 127])
+        # empty question gets unit scale
+        self.assertEqual(scales[1], 1.)
+
+        # error of each weight is at most half of the scale factor of its question
+        error = np.abs(dequantize(questions, scales).toarray() - self.questions.toarray())
+        self.assertEqual(np.all(error <= scales[:, None] / 2 + 1e-12), True)
+        self.assertEqual(idf_dtype('int8'), np.float32)
+
+    def test_scoring_quantized(self):
+        expected_indices, expected_scores = term_at_a_time_cosine_similarity(self.query_vector,
+                                                                             InvertedIndex(self.questions))
+        for dtype, tolerance in [('float32', 1e-6), ('int8', 1e-2)]:
+            questions, scales = quantize(self.questions, dtype)
+            inverted_index = InvertedIndex(questions, scales)
+
+            question_indices, scores = term_at_a_time_cosine_similarity(self.query_vector, inverted_index)
+            self.assertEqual(question_indices.tolist(), expected_indices.tolist())
+            self.assertEqual(np.allclose(scores, expected_scores, atol=tolerance), True)
+
+            query_vectors = CsrMatrix(np.asarray([0, 2]), np.asarray([0, 2], dtype=np.int32),
+                                      self.query_vector[[0, 2]], (1, 3))
+            _, batch_indices, batch_scores = sparse_cosine_similarity(query_vectors, inverted_index)
+            self.assertEqual(batch_indices.tolist(), question_indices.tolist())
+            self.assertEqual(np.array_equal(batch_scores, scores), True)
+
+
+if __name__ == '__main__':
+    unittest.main()
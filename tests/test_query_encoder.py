@@ -0,0 +1,72 @@
+import json
+import shutil
+import unittest
+import numpy as np
+
+from utils import *
+from search_engine.index.index_store import IndexFormatError
+from search_engine.vectorizer.preprocessor import PREPROCESSING_CONFIG
+from search_engine.vectorizer.query_encoder import HEADER_FILE_NAME, QueryEncoder
+from search_engine.vectorizer.tf_idf_vectorizer import TfIdfVectorizer
+
+
+class TestQueryEncoder(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = [
+            'How do I use Error handling in Java?',
+            'Error Handling in Swift 3',
+            'Java BufferedReader error',
+            'If block error handling in C'
+        ]
+        self.work_dir_path = 'query_encoder_test'
+        self.query_encoder_path = os.path.join(self.work_dir_path, 'query_encoder')
+        self.vectorizer = TfIdfVectorizer(cache_path=os.path.join(self.work_dir_path, 'tf-idf_index'), dtype='float32',
+                                          query_encoder_path=self.query_encoder_path)
+        self.vectorizer.fit(self.corpus)
+
+    def tearDown(self):
+        if os.path.exists(self.work_dir_path):
+            shutil.rmtree(self.work_dir_path)
+
+    def test_save_and_load(self):
+        query_encoder = QueryEncoder.load(self.query_encoder_path)
+        self.assertEqual(query_encoder.vocabulary, self.vectorizer._vocabulary)
+        self.assertEqual(query_encoder.idf_vector.dtype, np.float32)
+        self.assertEqual(np.array_equal(query_encoder.idf_vector, self.vectorizer.idf_vector), True)
+        self.assertEqual(query_encoder.preprocessing_config, PREPROCESSING_CONFIG)
+
+        # queries are encoded the same way as by fitted vectorizer
+        queries = ['Error handling in C', 'Java error', 'unknown words', '']
+        self.assertEqual(np.array_equal(query_encoder.encode(queries), self.vectorizer.transform(queries)), True)
+        self.assertEqual(query_encoder.encode(queries, sparse=True).shape,
+                         (len(queries), query_encoder.vocabulary_size))
+
+        with self.assertRaises(FileNotFoundError):
+            QueryEncoder.load(os.path.join(self.work_dir_path, 'missing'))
+
+    def test_preprocessing_mismatch(self):
+        # encoder fitted with different preprocessing would encode queries differently than the corpus
+        header_path = os.path.join(self.query_encoder_path, HEADER_FILE_NAME)
+        with open(header_path, 'r') as file:
+            header = json.load(file)
+        header['preprocessing']['min_token_length'] = 3
+        with open(header_path, 'w') as file:
+            json.dump(header, file)
+
+        with self.assertRaises(IndexFormatError):
+            QueryEncoder.load(self.query_encoder_path)
+
+    def test_transform_without_index(self):
+        # queries are encoded without vectorized question corpus, which is opened only when it is loaded
+        shutil.rmtree(self.vectorizer._cache_path)
+        vectorizer = TfIdfVectorizer(cache_path=self.vectorizer._cache_path, query_encoder_path=self.query_encoder_path)
+        expected_query = self.vectorizer.transform(['Java error'])
+        self.assertEqual(np.array_equal(vectorizer.transform(['Java error']), expected_query), True)
+        self.assertIsNone(vectorizer.questions)
+        with self.assertRaises(FileNotFoundError):
+            vectorizer.load()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
 import os
+import shutil
 import unittest
+from search_engine.corpus.question_store import QuestionStore
 from search_engine.question_search_engine import QuestionSearchEngine
+from search_engine.vectorizer.tf_idf_vectorizer import TfIdfVectorizer
 
 
 class TestQuestionSearchEngine(unittest.TestCase):
@@ -13,21 +16,17 @@ class TestQuestionSearchEngine(unittest.TestCase):
             'If block error handling in bash',
             'java ATM program simulation with exception handling - no error neither full output?'
         ]
-        self.question_search_engine = QuestionSearchEngine(self.corpus, fit_vectorizer=True)
-        self.vocabulary_path = 'vocabulary.pkl'
-        self.idf_vector_path = 'idf_vector.pkl'
-        self.cache_path = 'cache.pkl'
-        self.question_search_engine._tf_idf_vectorizer._vocabulary_path = self.vocabulary_path
-        self.question_search_engine._tf_idf_vectorizer._idf_vector_path = self.idf_vector_path
-        self.question_search_engine._tf_idf_vectorizer._cache_path = self.cache_path
+        self.query_encoder_path = 'query_encoder'
+        self.cache_path = 'cache_index'
+        tf_idf_vectorizer = TfIdfVectorizer(cache_path=self.cache_path, query_encoder_path=self.query_encoder_path)
+        self.question_search_engine = QuestionSearchEngine(self.corpus, fit_vectorizer=True,
+                                                           tf_idf_vectorizer=tf_idf_vectorizer)
 
     def tearDown(self):
         if os.path.exists(self.cache_path):
-            os.remove(self.cache_path)
-        if os.path.exists(self.vocabulary_path):
-            os.remove(self.vocabulary_path)
-        if os.path.exists(self.idf_vector_path):
-            os.remove(self.idf_vector_path)
+            shutil.rmtree(self.cache_path)
+        if os.path.exists(self.query_encoder_path):
+            shutil.rmtree(self.query_encoder_path)
 
     def test_most_similar_small_corpus(self):
         # test number of results when top N is greater than corpus size
@@ -37,6 +36,17 @@ class TestQuestionSearchEngine(unittest.TestCase):
         self.assertIsInstance(result, list)
         self.assertEqual(len(result), 5)
 
+    def test_most_similar_order(self):
+        query = 'Error handling in Java?'
+        result = self.question_search_engine.most_similar(query, n=3)
+
+        self.assertEqual(len(result), 3)
+        scores = [similarity_score for similarity_score, _ in result]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        for similarity_score, question in result:
+            self.assertIsInstance(similarity_score, float)
+            self.assertIn(question, self.corpus)
+
     def test_most_similar_(self):
         query = 'Rukovanje greskama u Javi?'
         result = self.question_search_engine.most_similar(query, n=2)
@@ -51,6 +61,79 @@ class TestQuestionSearchEngine(unittest.TestCase):
         self.assertIsInstance(result, list)
         self.assertEqual(len(result), 0)
 
+    def test_most_similar_batch(self):
+        queries = ['Error handling in Java?', 'Rukovanje greskama u Javi?', 'bash if block', 'java error']
+
+        # results for each query must be the same as the ones from most_similar, regardless of chunk size
+        expected = [self.question_search_engine.most_similar(query, n=3) for query in queries]
+        for batch_size in [None, 1, 3]:
+            result = self.question_search_engine.most_similar_batch(queries, n=3, batch_size=batch_size)
+            self.assertIsInstance(result, list)
+            self.assertEqual(len(result), len(queries))
+            self.assertEqual(result, expected)
+
+        # empty batch
+        self.assertEqual(self.question_search_engine.most_similar_batch([], n=3), [])
+
+    def test_most_similar_tags(self):
+        question_tags = [['java', 'exception'], ['swift'], ['java', 'io'], ['bash'], ['java', 'exception']]
+        question_search_engine = QuestionSearchEngine(QuestionStore.from_questions(self.corpus,
+                                                                                   question_tags=question_tags),
+                                                      tf_idf_vectorizer=self.question_search_engine._tf_idf_vectorizer)
+        query = 'Error handling in Java?'
+        full_result = question_search_engine.most_similar(query, n=5)
+
+        # only questions with filtered tags are scored, so that there are n of them if possible
+        filters = [('<java>', None, [0, 2, 4]), (['java', 'exception'], None, [0, 4]),
+                   (None, ['swift', 'bash'], [1, 3]), ('<Java>', '<io><bash>', [2]), (['kotlin'], None, []),
+                   (None, ['kotlin'], [])]
+        for all_tags, any_tags, question_indices in filters:
+            result = question_search_engine.most_similar(query, n=2, all_tags=all_tags, any_tags=any_tags)
+            expected = [(score, question) for score, question in full_result
+                        if self.corpus.index(question) in question_indices][:2]
+            self.assertEqual(result, expected)
+
+        # results are cached for each filter, regardless of how its tags are written
+        self.assertEqual(question_search_engine.most_similar(query, n=2, all_tags=['JAVA']),
+                         question_search_engine.most_similar(query, n=2, all_tags='<java>'))
+        self.assertEqual(question_search_engine.most_similar(query, n=5), full_result)
+        self.assertEqual(question_search_engine.result_cache_stats.hits, 3)
+
+        # added questions have no tags
+        question_search_engine.add_questions(['Error handling in Java'])
+        self.assertNotIn('Error handling in Java', [question for _, question in question_search_engine.most_similar(
+            query, n=5, all_tags=['java'])])
+
+    def test_result_cache(self):
+        result = self.question_search_engine.most_similar('Error handling in Java?', n=3)
+
+        # queries with the same tokens get cached result
+        for query in ['error HANDLING in java', 'Java: error handling in?']:
+            self.assertEqual(self.question_search_engine.most_similar(query, n=3), result)
+        self.assertEqual(self.question_search_engine.most_similar_batch(['java error handling in'], n=3), [result])
+        stats = self.question_search_engine.result_cache_stats
+        self.assertEqual((stats.hits, stats.misses), (3, 1))
+
+        # different n is cached separately
+        self.assertEqual(len(self.question_search_engine.most_similar('Error handling in Java?', n=1)), 1)
+
+        # cache is invalidated when index changes
+        self.question_search_engine.remove_questions([self.corpus.index(result[0][1])])
+        self.assertNotEqual(self.question_search_engine.most_similar('Error handling in Java?', n=3), result)
+        self.assertEqual(self.question_search_engine.result_cache_stats.invalidations, 1)
+
+    def test_result_cache_refit(self):
+        self.question_search_engine.most_similar('bash error', n=3)
+
+        # cache is invalidated when vectorizer is fitted again
+        self.question_search_engine._tf_idf_vectorizer.fit(self.corpus[:3])
+        self.question_search_engine._corpus = self.corpus[:3]
+        result = self.question_search_engine.most_similar('bash error', n=3)
+        self.assertEqual(self.question_search_engine.result_cache_stats.hits, 0)
+        self.assertEqual(len(result), 3)
+        for _, question in result:
+            self.assertIn(question, self.corpus[:3])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,180 @@
+import shutil
+import unittest
+import numpy as np
+
+from utils import *
+from run import load_search_engine
+from search_engine.corpus.question_store import QuestionStore, hash_corpus
+from search_engine.index.index_store import IndexFormatError
+from search_engine.service.prefork_server import PreforkServer
+from search_engine.vectorizer.tf_idf_vectorizer import TfIdfVectorizer
+
+
+class TestQuestionStore(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir_path = 'question_store'
+        check_does_dir_exist(self.work_dir_path, create_dir=True)
+        self.path = os.path.join(self.work_dir_path, 'questions.json')
+        self.store_path = os.path.join(self.work_dir_path, 'store')
+        self.lines = [
+            '{"id": 1, "question": "How do I use Error handling in Java?", "tags": "<java>"}',
+            '{"id": 2, "question": "Error Handling in Swift 3", "tags": "<swift><swift3>"}',
+            '{"id": 3, "question": "How do I use Error handling in Java?", "tags": "<java><exception>"}',
+            '{"id": 4, "question": "broken line',
+            '{"id": 5, "question": "Čitanje fajla u bash-u?", "tags": "<bash><čitanje>"}',
+            '{"id": 6, "question": "Error Handling in Swift 3", "tags": "<swift>"}',
+            '{"id": 7, "question": ""}'
+        ]
+        self.expected_questions = ['How do I use Error handling in Java?', 'Error Handling in Swift 3',
+                                   'Čitanje fajla u bash-u?', '']
+        # duplicated questions have tags of their last occurrence, like their IDs
+        self.expected_tags = {'bash': [2], 'exception': [0], 'java': [0], 'swift': [1], 'swift3': [], 'čitanje': [2]}
+        self._write_corpus(self.lines)
+
+    def tearDown(self):
+        if os.path.exists(self.work_dir_path):
+            shutil.rmtree(self.work_dir_path)
+
+    def _write_corpus(self, lines):
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(lines))
+
+    def _assert_tags(self, tag_index):
+        self.assertEqual(tag_index.tag_names, sorted(self.expected_tags))
+        self.assertEqual(tag_index.num_of_questions, len(self.expected_questions))
+        for tag, question_indices in self.expected_tags.items():
+            self.assertEqual(tag_index.questions(tag).tolist(), question_indices)
+
+    def _create_vectorizer(self):
+        vectorizer = TfIdfVectorizer(cache_path=os.path.join(self.work_dir_path, 'tf-idf_index'),
+                                     query_encoder_path=os.path.join(self.work_dir_path, 'query_encoder'))
+        return vectorizer
+
+    def test_build(self):
+        for n_jobs in [1, 3]:
+            question_store, stats = QuestionStore.build(self.path, n_jobs=n_jobs, min_chunk_size=1)
+
+            # duplicates keep position of the first occurrence and ID of the last one
+            self.assertEqual(list(question_store), self.expected_questions)
+            self.assertEqual(question_store.question_ids.tolist(), [3, 6, 5, 7])
+            self.assertEqual(question_store.buffer.dtype, np.uint8)
+            self.assertEqual(question_store.offsets[-1], len(question_store.buffer))
+            self.assertEqual((stats.num_of_lines, stats.num_of_malformed_lines), (7, 1))
+            self._assert_tags(question_store.tag_index)
+
+    def test_build_invalid_types(self):
+        # lines with question that is not a string or ID that is not an integer are malformed, instead of failing
+        self._write_corpus(self.lines + ['{"id": "8", "question": "Java error with string ID"}',
+                                         '{"id": 9, "question": null}', '{"id": 10, "question": "Kotlin error"}'])
+        for n_jobs in [1, 3]:
+            question_store, stats = QuestionStore.build(self.path, n_jobs=n_jobs, min_chunk_size=1)
+            self.assertEqual(list(question_store), self.expected_questions + ['Kotlin error'])
+            self.assertEqual(question_store.question_ids.tolist(), [3, 6, 5, 7, 10])
+            self.assertEqual((stats.num_of_lines, stats.num_of_malformed_lines), (10, 3))
+
+    def test_access(self):
+        question_store = QuestionStore.from_questions(['Java error', 'Swift error', 'Java error'], [10, 20, 30])
+        self.assertEqual(len(question_store), 3)
+        self.assertEqual(question_store[np.int64(1)], 'Swift error')
+        self.assertEqual(question_store[-1], 'Java error')
+        self.assertEqual(question_store[:2], ['Java error', 'Swift error'])
+        with self.assertRaises(IndexError):
+            question_store[3]
+
+        # questions are found through hashes of their content
+        self.assertEqual(question_store.find('Java error'), 0)
+        self.assertEqual(question_store.question_id('Swift error'), 20)
+        self.assertEqual(question_store.find('Kotlin error'), -1)
+        self.assertIsNone(question_store.question_id('Kotlin error'))
+
+        question_store.extend(['Kotlin error'])
+        self.assertEqual(len(question_store), 4)
+        self.assertEqual(question_store[3], 'Kotlin error')
+        self.assertEqual(question_store.find('Kotlin error'), 3)
+        self.assertIsNone(question_store.question_id('Kotlin error'))
+        self.assertIsNone(QuestionStore.from_questions(['Java error']).question_id('Java error'))
+
+        # questions have tags only if they are given
+        question_store = QuestionStore.from_questions(['Java error', 'Swift error'], question_tags=[['java'], []])
+        self.assertEqual(question_store.tag_index.filter(['java']).tolist(), [0])
+        self.assertEqual(QuestionStore.from_questions(['Java error']).tag_index.filter(['java']).tolist(), [])
+        with self.assertRaises(ValueError):
+            QuestionStore.from_questions(['Java error'], question_tags=[['java'], ['swift']])
+
+    def test_save_and_load(self):
+        question_store, _ = QuestionStore.build(self.path)
+        question_store.save(self.store_path)
+
+        for mmap in [True, False]:
+            loaded_question_store = QuestionStore.load(self.store_path, hash_corpus(self.path), mmap=mmap)
+            self.assertEqual(list(loaded_question_store), self.expected_questions)
+            self.assertEqual(loaded_question_store.question_id('Čitanje fajla u bash-u?'), 5)
+            self.assertEqual(isinstance(loaded_question_store.buffer.base, np.memmap), mmap)
+            self._assert_tags(loaded_question_store.tag_index)
+
+        # store built from another corpus is rejected
+        self._write_corpus(self.lines + ['{"id": 8, "question": "Exception handling in Swift"}'])
+        with self.assertRaises(IndexFormatError):
+            QuestionStore.load(self.store_path, hash_corpus(self.path))
+        with self.assertRaises(FileNotFoundError):
+            QuestionStore.load(os.path.join(self.work_dir_path, 'missing'))
+
+        # empty store is saved and loaded as well
+        QuestionStore.from_questions([]).save(self.store_path)
+        self.assertEqual(len(QuestionStore.load(self.store_path)), 0)
+        self.assertEqual(QuestionStore.load(self.store_path).tag_index.num_of_tags, 0)
+
+    def test_fast_start(self):
+        search_engine, question_store, is_persisted = load_search_engine(
+            self.path, tf_idf_vectorizer=self._create_vectorizer(), question_store_path=self.store_path)
+        self.assertFalse(is_persisted)
+        expected_result = search_engine.most_similar('Error handling in Java?', n=2)
+
+        # fresh persisted index is opened without fitting the vectorizer
+        vectorizer = self._create_vectorizer()
+        vectorizer.fit = None
+        search_engine, question_store, is_persisted = load_search_engine(
+            self.path, tf_idf_vectorizer=vectorizer, question_store_path=self.store_path)
+        self.assertTrue(is_persisted)
+        self.assertEqual(search_engine.most_similar('Error handling in Java?', n=2), expected_result)
+        self.assertEqual(question_store.question_id(expected_result[0][1]), 3)
+
+        # changed corpus is fitted again
+        self._write_corpus(self.lines + ['{"id": 8, "question": "Exception handling in Swift"}'])
+        search_engine, question_store, is_persisted = load_search_engine(
+            self.path, tf_idf_vectorizer=self._create_vectorizer(), question_store_path=self.store_path)
+        self.assertFalse(is_persisted)
+        self.assertEqual(len(question_store), 5)
+        self.assertEqual(self._create_vectorizer().stored_metadata()['corpus_hash'], hash_corpus(self.path))
+
+    def test_reload_stale_question_store(self):
+        search_engine, _, _ = load_search_engine(
+            self.path, tf_idf_vectorizer=self._create_vectorizer(), question_store_path=self.store_path)
+        fit_calls = []
+
+        def load_published_search_engine():
+            vectorizer = self._create_vectorizer()
+            vectorizer.fit = lambda *args, **kwargs: fit_calls.append(args)
+            return load_search_engine(self.path, tf_idf_vectorizer=vectorizer, question_store_path=self.store_path,
+                                      fit=False)[0]
+
+        # question store that is not built from the published corpus is rejected instead of fitting the vectorizer
+        QuestionStore.from_questions(['Exception handling in Swift']).save(self.store_path)
+        with self.assertRaises(IndexFormatError):
+            load_published_search_engine()
+
+        # old workers keep serving old search engine
+        server = PreforkServer(load_published_search_engine, num_of_workers=1, search_engine=search_engine)
+        server._workers = {os.getpid()}
+        server._reload()
+        self.assertIs(server._search_engine, search_engine)
+        self.assertEqual(server._workers, {os.getpid()})
+        self.assertEqual(fit_calls, [])
+
+        with self.assertRaises(ValueError):
+            load_search_engine(self.path, refit=True, fit=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
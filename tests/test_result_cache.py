@@ -0,0 +1,65 @@
+import unittest
+
+from search_engine.cache.result_cache import CacheStats, ResultCache
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.time = 0.
+        self.cache = ResultCache(max_size=2, ttl=10., clock=lambda: self.time)
+
+    def test_get(self):
+        self.assertIsNone(self.cache.get('a', 0))
+        self.cache.put('a', [1], 0)
+        self.assertEqual(self.cache.get('a', 0), [1])
+
+        stats = self.cache.stats
+        self.assertIsInstance(stats, CacheStats)
+        self.assertEqual((stats.hits, stats.misses, stats.size), (1, 1, 1))
+        self.assertEqual(stats.hit_rate, 0.5)
+
+    def test_lru_eviction(self):
+        self.cache.get('a', 0)
+        self.cache.put('a', [1], 0)
+        self.cache.put('b', [2], 0)
+        # the least recently used result is evicted
+        self.cache.get('a', 0)
+        self.cache.put('c', [3], 0)
+
+        self.assertEqual(self.cache.get('a', 0), [1])
+        self.assertIsNone(self.cache.get('b', 0))
+        self.assertEqual(self.cache.get('c', 0), [3])
+        self.assertEqual(self.cache.stats.evictions, 1)
+        self.assertEqual(self.cache.stats.size, 2)
+
+    def test_ttl_expiration(self):
+        self.cache.get('a', 0)
+        self.cache.put('a', [1], 0)
+        self.time = 9.
+        self.assertEqual(self.cache.get('a', 0), [1])
+        self.time = 10.
+        self.assertIsNone(self.cache.get('a', 0))
+        self.assertEqual(self.cache.stats.expirations, 1)
+        self.assertEqual(self.cache.stats.size, 0)
+
+    def test_version_invalidation(self):
+        self.cache.get('a', 0)
+        self.cache.put('a', [1], 0)
+        self.assertIsNone(self.cache.get('a', 1))
+        self.assertEqual(self.cache.stats.invalidations, 1)
+
+        # results computed from outdated index are not stored
+        self.cache.put('a', [1], 0)
+        self.assertIsNone(self.cache.get('a', 1))
+
+    def test_disabled(self):
+        cache = ResultCache(max_size=0, ttl=10.)
+        cache.get('a', 0)
+        cache.put('a', [1], 0)
+        self.assertIsNone(cache.get('a', 0))
+        self.assertEqual(cache.stats.size, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import os
+import json
+import shutil
+import asyncio
+import unittest
+
+from constants import MAX_REQUEST_BODY_SIZE
+from search_engine.instrumentation.metrics import metrics
+from search_engine.question_search_engine import QuestionSearchEngine
+from search_engine.vectorizer.tf_idf_vectorizer import TfIdfVectorizer
+from search_engine.service.search_service import LatencyRecorder, MicroBatcher, SearchService
+
+
+class TestSearchService(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = [
+            'How do I use Error handling in Java?',
+            'Error Handling in Swift 3',
+            'Java BufferedReader error',
+            'If block error handling in bash',
+            'java ATM program simulation with exception handling - no error neither full output?'
+        ]
+        self.queries = ['Error handling in Java?', 'Swift error', 'bash', 'java program', 'Rukovanje greskama']
+        self.query_encoder_path = 'query_encoder'
+        self.cache_path = 'cache_index'
+        tf_idf_vectorizer = TfIdfVectorizer(cache_path=self.cache_path, query_encoder_path=self.query_encoder_path)
+        self.question_search_engine = QuestionSearchEngine(self.corpus, fit_vectorizer=True,
+                                                           tf_idf_vectorizer=tf_idf_vectorizer, result_cache_size=0)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        if os.path.exists(self.cache_path):
+            shutil.rmtree(self.cache_path)
+        if os.path.exists(self.query_encoder_path):
+            shutil.rmtree(self.query_encoder_path)
+
+    def _submit_concurrently(self, batcher, queries, n):
+        async def submit_all():
+            batcher.start()
+            try:
+                results = await asyncio.gather(*[batcher.submit([query], n) for query in queries])
+            finally:
+                await batcher.close()
+            return [result[0] for result in results]
+
+        return self.loop.run_until_complete(submit_all())
+
+    def _request(self, service, method, path, request=None, as_json=True):
+        async def send():
+            reader, writer = await asyncio.open_connection(service.host, service.port)
+            body = json.dumps(request).encode('utf-8') if request is not None else b''
+            writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n'
+                         f'Connection: close\r\n\r\n'.encode('latin-1') + body)
+            response = await reader.read()
+            writer.close()
+            return response
+
+        head, _, body = self.loop.run_until_complete(send()).partition(b'\r\n\r\n')
+        body = body.decode('utf-8')
+        return int(head.split(b' ')[1]), json.loads(body) if as_json else body
+
+    def _send(self, service, data):
+        async def send():
+            reader, writer = await asyncio.open_connection(service.host, service.port)
+            writer.write(data)
+            response = await reader.read()
+            writer.close()
+            return response
+
+        return int(self.loop.run_until_complete(send()).split(b' ')[1])
+
+    def test_micro_batching(self):
+        batcher = MicroBatcher(self.question_search_engine, max_batch_size=16, max_wait_time=0.05)
+        results = self._submit_concurrently(batcher, self.queries, n=3)
+
+        # concurrent queries are scored together, with the same results as single queries
+        self.assertEqual(batcher.stats.num_of_batches, 1)
+        self.assertEqual(batcher.stats.mean_batch_size, len(self.queries))
+        self.assertEqual(results, [self.question_search_engine.most_similar(query, n=3) for query in self.queries])
+
+    def test_max_batch_size(self):
+        batcher = MicroBatcher(self.question_search_engine, max_batch_size=2, max_wait_time=0.05)
+        results = self._submit_concurrently(batcher, self.queries, n=2)
+
+        self.assertEqual(batcher.stats.num_of_batches, 3)
+        self.assertEqual(batcher.stats.num_of_queries, len(self.queries))
+        self.assertEqual(results, [self.question_search_engine.most_similar(query, n=2) for query in self.queries])
+
+        with self.assertRaises(ValueError):
+            MicroBatcher(self.question_search_engine, max_batch_size=0)
+
+    def test_latency_recorder(self):
+        latency_recorder = LatencyRecorder(window_size=100)
+        self.assertEqual(latency_recorder.stats.num_of_requests, 0)
+
+        for latency in range(1, 201):
+            latency_recorder.record(latency / 1000)
+        stats = latency_recorder.stats
+
+        # only the most recent requests are taken into account
+        self.assertEqual(stats.num_of_requests, 100)
+        self.assertAlmostEqual(stats.p50, 0.1505)
+        self.assertAlmostEqual(stats.p99, 0.19901)
+        self.assertAlmostEqual(stats.max, 0.2)
+
+    def test_search_requests(self):
+        service = SearchService(self.question_search_engine, port=0, max_wait_time=0.01)
+        self.loop.run_until_complete(service.start())
+        try:
+            status, response = self._request(service, 'POST', '/search', {'query': self.queries[0], 'n': 2})
+            self.assertEqual(status, 200)
+            expected_result = self.question_search_engine.most_similar(self.queries[0], n=2)
+            self.assertEqual([tuple(pair) for pair in response['results']], expected_result)
+
+            status, response = self._request(service, 'POST', '/search', {'queries': self.queries})
+            self.assertEqual(status, 200)
+            self.assertEqual(len(response['results']), len(self.queries))
+            self.assertEqual(response['results'][-1], [])
+
+            status, response = self._request(service, 'GET', '/stats')
+            self.assertEqual(status, 200)
+            self.assertEqual(response['latency_ms']['num_of_requests'], 2)
+            self.assertGreater(response['latency_ms']['p99'], 0)
+            self.assertEqual(response['batching']['num_of_queries'], len(self.queries) + 1)
+        finally:
+            self.loop.run_until_complete(service.close())
+
+    def test_metrics_request(self):
+        service = SearchService(self.question_search_engine, port=0)
+        self.loop.run_until_complete(service.start())
+        metrics.enabled = True
+        try:
+            self._request(service, 'POST', '/search', {'query': self.queries[0], 'n': 2})
+            status, response = self._request(service, 'GET', '/metrics', as_json=False)
+            self.assertEqual(status, 200)
+            self.assertIn('question_search_engine_stage_duration_seconds_count{stage="score"} 1',
+                          response.splitlines())
+            self.assertEqual(self._request(service, 'POST', '/metrics')[0], 405)
+        finally:
+            metrics.enabled = False
+            metrics.reset()
+            self.loop.run_until_complete(service.close())
+
+    def test_invalid_requests(self):
+        service = SearchService(self.question_search_engine, port=0)
+        self.loop.run_until_complete(service.start())
+        try:
+            self.assertEqual(self._request(service, 'POST', '/search', {'n': 2})[0], 400)
+            self.assertEqual(self._request(service, 'POST', '/search', {'query': 'java', 'n': 0})[0], 400)
+            self.assertEqual(self._request(service, 'POST', '/search', {'queries': 'java'})[0], 400)
+            self.assertEqual(self._request(service, 'GET', '/search')[0], 405)
+            self.assertEqual(self._request(service, 'GET', '/unknown')[0], 404)
+
+            # requests that can not be read are answered before connection is closed
+            self.assertEqual(self._send(service, b'GARBAGE\r\n\r\n'), 400)
+            self.assertEqual(self._send(service, b'POST /search HTTP/1.1\r\nContent-Length: -1\r\n\r\n'), 400)
+            self.assertEqual(self._send(service, b'GET /stats HTTP/1.1\r\n' + b'X-Header: 1\r\n' * 101 + b'\r\n'),
+                             400)
+            self.assertEqual(self._send(service, f'POST /search HTTP/1.1\r\nContent-Length: '
+                                                 f'{MAX_REQUEST_BODY_SIZE + 1}\r\n\r\n'.encode('latin-1')), 413)
+            self.assertEqual(self._request(service, 'GET', '/stats')[0], 200)
+        finally:
+            self.loop.run_until_complete(service.close())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import shutil
+import unittest
+import numpy as np
+
+from utils import *
+from search_engine.corpus.question_store import QuestionStore
+from search_engine.index.csr_matrix import CsrMatrix
+from search_engine.index.inverted_index import InvertedIndex
+from search_engine.index.quantization import quantize
+from search_engine.index.sharded_index import ShardError, ShardedIndex
+from search_engine.question_search_engine import QuestionSearchEngine
+from search_engine.similarity_scorer.similarity_metrics import sparse_cosine_similarity
+from search_engine.similarity_scorer.top_k_selection import select_top_k_rows
+from search_engine.vectorizer.tf_idf_vectorizer import TfIdfVectorizer
+
+
+class TestShardedIndex(unittest.TestCase):
+
+    def setUp(self):
+        # weights from a small set of values, so that many questions have tied scores
+        random_generator = np.random.RandomState(0)
+        dense = random_generator.choice([0., 0., 0., 0.5, 1.], size=(200, 12))
+        dense[::17] = 0.
+        dense /= np.maximum(np.linalg.norm(dense, axis=1, keepdims=True), 1e-12)
+        self.questions = self._to_csr(dense)
+        self.queries = self._to_csr(random_generator.choice([0., 0., 1.], size=(20, 12)))
+
+        self.work_dir_path = 'sharded_index'
+        self.corpus = [
+            'How do I use Error handling in Java?',
+            'Error Handling in Swift 3',
+            'Java BufferedReader error',
+            'If block error handling in bash',
+            'java ATM program simulation with exception handling - no error neither full output?',
+            'Exception handling in Swift',
+            'How do I read file in bash?'
+        ]
+
+    def tearDown(self):
+        if os.path.exists(self.work_dir_path):
+            shutil.rmtree(self.work_dir_path)
+
+    @staticmethod
+    def _to_csr(dense):
+        indptr = np.concatenate(([0], np.cumsum(np.count_nonzero(dense, axis=1))))
+        rows, indices = np.nonzero(dense)
+        return CsrMatrix(indptr, indices.astype(np.int32), dense[rows, indices], dense.shape)
+
+    @staticmethod
+    def _unsharded_top_k(questions, question_scales, queries, k):
+        query_indices, question_indices, scores = sparse_cosine_similarity(
+            queries, InvertedIndex(questions, question_scales))
+        return select_top_k_rows(query_indices, question_indices, scores, queries.shape[0], k)
+
+    def _assert_same_top_k(self, top_k_rows, expected_top_k_rows):
+        self.assertEqual(len(top_k_rows), len(expected_top_k_rows))
+        for (question_indices, scores), (expected_question_indices, expected_scores) in \
+                zip(top_k_rows, expected_top_k_rows):
+            self.assertEqual(question_indices.tolist(), expected_question_indices.tolist())
+            self.assertEqual(scores.tolist(), expected_scores.tolist())
+
+    def test_shard_bounds(self):
+        sharded_index = ShardedIndex(self.questions, num_of_shards=4)
+        self.assertEqual(sharded_index.num_of_shards, 4)
+        self.assertEqual(sharded_index.shard_bounds[[0, -1]].tolist(), [0, 200])
+
+        # shards have similar number of nonzero values
+        shard_nnz = np.diff(self.questions.indptr[sharded_index.shard_bounds])
+        self.assertLess(shard_nnz.max() - shard_nnz.min(), 2 * self.questions.row_lengths().max())
+
+        # shards without questions are not created
+        self.assertEqual(ShardedIndex(self.questions.row_slice(1, 3), num_of_shards=8).num_of_shards, 2)
+        with self.assertRaises(ValueError):
+            ShardedIndex(self.questions, num_of_shards=0)
+
+    def test_top_k_batch(self):
+        for dtype in ['float64', 'int8']:
+            questions, question_scales = quantize(self.questions, dtype)
+            expected_top_k_rows = self._unsharded_top_k(questions, question_scales, self.queries, 7)
+            for num_of_shards in [1, 3, 5]:
+                sharded_index = ShardedIndex(questions, num_of_shards, question_scales)
+                try:
+                    # results are identical to unsharded ones, including ties
+                    self._assert_same_top_k(sharded_index.top_k_batch(self.queries, 7), expected_top_k_rows)
+                finally:
+                    sharded_index.close()
+
+    def test_restart(self):
+        sharded_index = ShardedIndex(self.questions, num_of_shards=2)
+        top_k_rows = sharded_index.top_k_batch(self.queries, 3)
+        sharded_index.close()
+
+        # workers are started again after they are stopped
+        self._assert_same_top_k(sharded_index.top_k_batch(self.queries, 3), top_k_rows)
+        sharded_index.close()
+
+    def test_dead_worker(self):
+        sharded_index = ShardedIndex(self.questions, num_of_shards=3)
+        try:
+            top_k_rows = sharded_index.top_k_batch(self.queries, 3)
+            sharded_index._workers[1].terminate()
+            sharded_index._workers[1].join()
+
+            # worker that stopped unexpectedly raises clear error, and workers of all shards are started again
+            with self.assertRaises(ShardError):
+                sharded_index.top_k_batch(self.queries, 3)
+            self._assert_same_top_k(sharded_index.top_k_batch(self.queries, 3), top_k_rows)
+        finally:
+            sharded_index.close()
+
+    def test_sharded_search(self):
+        check_does_dir_exist(self.work_dir_path, create_dir=True)
+        vectorizer = TfIdfVectorizer(cache_path=os.path.join(self.work_dir_path, 'index'),
+                                     query_encoder_path=os.path.join(self.work_dir_path, 'query_encoder'))
+        corpus = QuestionStore.from_questions(self.corpus, question_tags=[
+            ['java'], ['swift'], ['java', 'io'], ['bash'], ['java'], ['swift'], ['bash', 'io']])
+        search_engine = QuestionSearchEngine(corpus, fit_vectorizer=True, tf_idf_vectorizer=vectorizer,
+                                             num_of_shards=3, result_cache_size=0)
+        exact_search_engine = QuestionSearchEngine(corpus, fit_vectorizer=False, tf_idf_vectorizer=vectorizer)
+        try:
+            self.assertEqual(search_engine._sharded_index.num_of_shards, 3)
+            # only shards have their own indices
+            self.assertIsNone(search_engine._index)
+            queries = ['Error handling in Java?', 'bash file', 'Rukovanje greskama u Javi?']
+            expected = [exact_search_engine.most_similar(query, n=4) for query in queries]
+            self.assertEqual([search_engine.most_similar(query, n=4) for query in queries], expected)
+            self.assertEqual(search_engine.most_similar_batch(queries, n=4), expected)
+
+            # questions with filtered tags are found by shards
+            for all_tags, any_tags in [(['java'], None), (None, ['io', 'swift']), (['java', 'io'], None)]:
+                self.assertEqual([search_engine.most_similar(query, n=2, all_tags=all_tags, any_tags=any_tags)
+                                  for query in queries],
+                                 [exact_search_engine.most_similar(query, n=2, all_tags=all_tags, any_tags=any_tags)
+                                  for query in queries])
+
+            # sharded index can not be changed
+            with self.assertRaises(ValueError):
+                search_engine.add_questions(['read file in Java'])
+            with self.assertRaises(ValueError):
+                search_engine.remove_questions([0])
+            with self.assertRaises(ValueError):
+                search_engine.compact()
+            with self.assertRaises(ValueError):
+                QuestionSearchEngine(self.corpus, fit_vectorizer=False, tf_idf_vectorizer=vectorizer,
+                                     approximate=True, num_of_shards=2)
+        finally:
+            search_engine.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import numpy as np
+
+from search_engine.index.tag_index import TagIndex
+
+
+class TestTagIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.question_tags = [
+            ['java', 'exception'],
+            ['swift'],
+            [],
+            ['bash', 'java'],
+            ['java', 'exception', 'io'],
+            ['swift', 'exception']
+        ]
+        self.tag_index = TagIndex.from_question_tags(self.question_tags)
+
+    def _expected(self, all_tags, any_tags):
+        return [i for i, tags in enumerate(self.question_tags)
+                if all(tag in tags for tag in all_tags) and (not any_tags or any(tag in tags for tag in any_tags))]
+
+    def test_from_question_tags(self):
+        self.assertEqual(self.tag_index.tag_names, ['bash', 'exception', 'io', 'java', 'swift'])
+        self.assertEqual(self.tag_index.num_of_tags, 5)
+        self.assertEqual(self.tag_index.num_of_questions, 6)
+        self.assertEqual(self.tag_index.questions('java').tolist(), [0, 3, 4])
+        self.assertEqual(self.tag_index.questions(' Exception ').tolist(), [0, 4, 5])
+        self.assertEqual(self.tag_index.questions('kotlin').tolist(), [])
+
+        # only tags of given questions are indexed, in their order
+        tag_index = TagIndex.from_tag_ids(['a', 'b', 'c'], np.array([1, 2, 0, 1]),
+                                          np.array([2, 0, 2, 1], dtype=np.int32), rows=np.array([3, 1, 2]))
+        self.assertEqual(tag_index.num_of_questions, 3)
+        self.assertEqual([tag_index.questions(tag).tolist() for tag in 'abc'], [[1], [0], [1]])
+
+    def test_filter(self):
+        self.assertIsNone(self.tag_index.filter())
+        self.assertIsNone(self.tag_index.filter([], []))
+
+        filters = [(['java'], []), (['java', 'exception'], []), (['exception', 'java', 'io'], []),
+                   ([], ['swift', 'bash']), ([], ['io']), (['exception'], ['swift', 'io']), (['java', 'kotlin'], []),
+                   ([], ['kotlin', 'bash']), (['swift', 'bash'], [])]
+        for all_tags, any_tags in filters:
+            question_indices = self.tag_index.filter(all_tags, any_tags)
+            self.assertEqual(question_indices.dtype, np.int64)
+            self.assertEqual(question_indices.tolist(), self._expected(all_tags, any_tags))
+
+    def test_empty(self):
+        tag_index = TagIndex.empty(3)
+        self.assertEqual(tag_index.num_of_tags, 0)
+        self.assertEqual(tag_index.filter(['java']).tolist(), [])
+        self.assertEqual(tag_index.filter(any_tags=['java', 'swift']).tolist(), [])
+        self.assertEqual(TagIndex.from_question_tags([]).num_of_questions, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
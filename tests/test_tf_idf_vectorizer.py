@@ -1,8 +1,13 @@
+import shutil
 import unittest
 import numpy as np
+from collections import Counter
 
 from utils import *
+from search_engine.index.csr_matrix import CsrMatrix
+from search_engine.index.index_store import IndexFormatError
 from search_engine.vectorizer.preprocessor import QuestionPreprocessor
+from search_engine.vectorizer.query_encoder import QueryEncoder
 from search_engine.vectorizer.tf_idf_vectorizer import TfIdfVectorizer
 
 
@@ -15,39 +20,34 @@ class TestTfIdfVectorizer(unittest.TestCase):
             'And this is the third one.',
             'Is this the first document?'
         ]
-        self.cache_path = 'cache.pkl'
-        self.vocabulary_path = 'vocabulary.pkl'
-        self.idf_vector_path = 'idf_vector.pkl'
+        self.cache_path = 'cache_index'
+        self.query_encoder_path = 'query_encoder'
 
     def tearDown(self):
         if os.path.exists(self.cache_path):
-            os.remove(self.cache_path)
-        if os.path.exists(self.vocabulary_path):
-            os.remove(self.vocabulary_path)
-        if os.path.exists(self.idf_vector_path):
-            os.remove(self.idf_vector_path)
+            shutil.rmtree(self.cache_path)
+        if os.path.exists(self.query_encoder_path):
+            shutil.rmtree(self.query_encoder_path)
 
     def test_init(self):
-        vectorizer = TfIdfVectorizer(cache_path=self.cache_path)
+        vectorizer = TfIdfVectorizer(cache_path=self.cache_path, query_encoder_path=self.query_encoder_path)
 
         # check attribute types and values after initialization
         self.assertIsInstance(vectorizer._use_cache, bool)
         self.assertEqual(vectorizer._use_cache, True)
 
         self.assertIsInstance(vectorizer._cache_path, str)
-        self.assertEqual(vectorizer._cache_path, 'cache.pkl')
+        self.assertEqual(vectorizer._cache_path, 'cache_index')
 
-        self.assertIsInstance(vectorizer._vocabulary_path, str)
-        self.assertIsInstance(vectorizer._idf_vector_path, str)
+        self.assertIsInstance(vectorizer._query_encoder_path, str)
+        self.assertEqual(vectorizer._query_encoder_path, 'query_encoder')
         self.assertIsInstance(vectorizer._vocabulary_size, int)
         self.assertIsInstance(vectorizer._preprocessor, QuestionPreprocessor)
         self.assertEqual(vectorizer.questions, None)
 
     def test_fit(self):
-        # test for methods: __init__, fit, _build_vocabulary, _vectorize_questions and _save
-        vectorizer = TfIdfVectorizer(cache_path=self.cache_path)
-        vectorizer._vocabulary_path = self.vocabulary_path
-        vectorizer._idf_vector_path = self.idf_vector_path
+        # test for methods: __init__, fit, _build_vocabulary and _save
+        vectorizer = TfIdfVectorizer(cache_path=self.cache_path, query_encoder_path=self.query_encoder_path)
 
         # check return value of fit method
         self.assertEqual(vectorizer.fit(self.corpus), None)
@@ -73,14 +73,12 @@ class TestTfIdfVectorizer(unittest.TestCase):
         self.assertIsInstance(vectorizer._idf_vector, np.ndarray)
         self.assertEqual(np.array_equal(vectorizer._idf_vector, idf_vector), True)
 
-        # check vocabulary serialization
-        vocabulary_deserialized = deserialize_data(self.vocabulary_path)
-        self.assertIsInstance(vocabulary_deserialized, dict)
-        self.assertEqual(vectorizer._vocabulary, vocabulary_deserialized)
-        # check idf vector serialization
-        idf_vector_deserialized = deserialize_data(self.idf_vector_path)
-        self.assertIsInstance(idf_vector_deserialized, np.ndarray)
-        self.assertEqual(np.array_equal(vectorizer._idf_vector, idf_vector_deserialized), True)
+        # check vocabulary and idf vector serialization
+        query_encoder = QueryEncoder.load(self.query_encoder_path)
+        self.assertIsInstance(query_encoder.vocabulary, dict)
+        self.assertEqual(vectorizer._vocabulary, query_encoder.vocabulary)
+        self.assertIsInstance(query_encoder.idf_vector, np.ndarray)
+        self.assertEqual(np.array_equal(vectorizer._idf_vector, query_encoder.idf_vector), True)
 
         vectorized_corpus = np.asarray([
             np.asarray([0., 0.46979139, 0.58028582, 0.38408524, 0., 0., 0.38408524, 0., 0.38408524]),
@@ -89,11 +87,14 @@ class TestTfIdfVectorizer(unittest.TestCase):
             np.asarray([0., 0.46979139, 0.58028582, 0.38408524, 0., 0., 0.38408524, 0., 0.38408524])
         ])
         # check vectorized corpus - type and dimensions
-        self.assertIsInstance(vectorizer.questions, np.ndarray)
+        self.assertIsInstance(vectorizer.questions, CsrMatrix)
         self.assertEqual(len(vectorizer.questions), len(self.corpus))
+        self.assertEqual(vectorizer.questions.shape, (len(self.corpus), vectorizer._vocabulary_size))
+        # only nonzero Tf-Idf scores are stored
+        self.assertEqual(vectorizer.questions.nnz, np.count_nonzero(vectorized_corpus))
 
         # check type, dimensions, number of nonzero elements (Tf-Idf scores) and Tf-Idf embedding for each question from corpus
-        for i, tf_idf_embedding in enumerate(vectorizer.questions):
+        for i, tf_idf_embedding in enumerate(vectorizer.questions.toarray()):
             # type - numpy array
             self.assertIsInstance(tf_idf_embedding, np.ndarray)
             # tf-idf embedding size
@@ -106,14 +107,12 @@ class TestTfIdfVectorizer(unittest.TestCase):
             self.assertEqual(np.array_equal(np.round(tf_idf_embedding, 8), vectorized_corpus[i]), True)
 
     def test_transform(self):
-        # test for methods: transform, _vectorize_questions and _load
+        # test for methods: transform and load_encoder
 
         query_question = 'Is this first or second document?'
 
         # transform with previous vectorizer.fit()
-        vectorizer = TfIdfVectorizer(cache_path=self.cache_path)
-        vectorizer._vocabulary_path = self.vocabulary_path
-        vectorizer._idf_vector_path = self.idf_vector_path
+        vectorizer = TfIdfVectorizer(cache_path=self.cache_path, query_encoder_path=self.query_encoder_path)
         vectorizer.fit(self.corpus)
 
         vectorized_query = np.asarray([0., 0.39787085, 0.49144966, 0.32528549, 0., 0.62334157, 0., 0., 0.32528549])
@@ -130,9 +129,7 @@ class TestTfIdfVectorizer(unittest.TestCase):
         self.assertEqual(np.array_equal(np.round(tranfsormed_query, 8), vectorized_query), True)
 
         # transform without previous vectorizer.fit()
-        vectorizer = TfIdfVectorizer(cache_path=self.cache_path)
-        vectorizer._vocabulary_path = self.vocabulary_path
-        vectorizer._idf_vector_path = self.idf_vector_path
+        vectorizer = TfIdfVectorizer(cache_path=self.cache_path, query_encoder_path=self.query_encoder_path)
 
         # vocabulary, idf vector and questions are None
         self.assertEqual(vectorizer._vocabulary, None)
@@ -151,6 +148,178 @@ class TestTfIdfVectorizer(unittest.TestCase):
         self.assertEqual(np.count_nonzero(tranfsormed_query), len(set(words_in_vocabulary)))
         # check Tf-Idf embedding
         self.assertEqual(np.array_equal(np.round(tranfsormed_query, 8), vectorized_query), True)
+        # vectorized question corpus is not loaded for encoding queries
+        self.assertEqual(vectorizer.questions, None)
+
+    def test_load_stale_index(self):
+        vectorizer = TfIdfVectorizer(cache_path=self.cache_path, query_encoder_path=self.query_encoder_path)
+        vectorizer.fit(self.corpus)
+
+        # index built for different corpus does not match stored vocabulary and idf vector
+        other_vectorizer = TfIdfVectorizer(cache_path=self.cache_path, query_encoder_path='other_query_encoder')
+        other_vectorizer.fit(['Some other corpus', 'with different words'])
+        shutil.rmtree('other_query_encoder')
+
+        vectorizer = TfIdfVectorizer(cache_path=self.cache_path, query_encoder_path=self.query_encoder_path)
+        with self.assertRaises(IndexFormatError):
+            vectorizer.load()
+
+    def test_load_corrupted_index(self):
+        vectorizer = TfIdfVectorizer(cache_path=self.cache_path, query_encoder_path=self.query_encoder_path)
+        vectorizer.fit(self.corpus)
+
+        # corrupted file of the same size is opened, unless its checksum is verified
+        data_path = os.path.join(self.cache_path, 'data.bin')
+        with open(data_path, 'r+b') as file:
+            data = file.read()
+            file.seek(0)
+            file.write(bytes(byte ^ 0xff for byte in data))
+
+        TfIdfVectorizer(cache_path=self.cache_path, query_encoder_path=self.query_encoder_path).load()
+        vectorizer = TfIdfVectorizer(cache_path=self.cache_path, query_encoder_path=self.query_encoder_path)
+        with self.assertRaises(IndexFormatError):
+            vectorizer.load(verify_checksum=True)
+
+    def test_fit_matches_reference(self):
+        # vectorized fit must give the same vocabulary, idf vector and embeddings as per-question computation
+        random_generator = np.random.RandomState(0)
+        words = [f'word{chr(97 + i % 26)}{chr(97 + i // 26)}' for i in range(200)]
+        corpus = [' '.join(random_generator.choice(words, random_generator.randint(0, 12))) for _ in range(300)]
+
+        vectorizer = TfIdfVectorizer(cache_path=self.cache_path, query_encoder_path=self.query_encoder_path)
+        vectorizer._vocabulary_size = 100
+        vectorizer.fit(corpus)
+
+        questions = vectorizer._preprocessor.preprocess(corpus)
+        vocabulary, idf_vector = self._reference_vocabulary(questions, vocabulary_size=100)
+        self.assertEqual(vectorizer._vocabulary, vocabulary)
+        self.assertEqual(np.allclose(vectorizer._idf_vector, idf_vector, rtol=0, atol=1e-8), True)
+
+        reference_vectors = self._reference_vectors(questions, vocabulary, idf_vector)
+        self.assertEqual(np.allclose(vectorizer.questions.toarray(), reference_vectors, rtol=0, atol=1e-8), True)
+
+        queries = ['wordaa wordab wordab', 'unknown words', '']
+        reference_vectors = self._reference_vectors(vectorizer._preprocessor.preprocess(queries), vocabulary,
+                                                    idf_vector)
+        self.assertEqual(np.allclose(vectorizer.transform(queries), reference_vectors, rtol=0, atol=1e-8), True)
+
+    def test_fit_parallel(self):
+        # parallel fit must give identical vocabulary, idf vector and embeddings as fit in a single process
+        random_generator = np.random.RandomState(1)
+        words = [f'word{chr(97 + i % 26)}{chr(97 + i // 26)}' for i in range(200)]
+        corpus = [' '.join(random_generator.choice(words, random_generator.randint(0, 12))) for _ in range(300)]
+
+        vectorizers = []
+        for n_jobs in [1, 3]:
+            vectorizer = TfIdfVectorizer(use_cache=False, query_encoder_path=self.query_encoder_path)
+            vectorizer._vocabulary_size = 100
+            vectorizer.fit(corpus, n_jobs=n_jobs)
+            vectorizers.append(vectorizer)
+
+        single_process, multi_process = vectorizers
+        self.assertEqual(multi_process._vocabulary, single_process._vocabulary)
+        self.assertEqual(np.array_equal(multi_process._idf_vector, single_process._idf_vector), True)
+        self.assertEqual(multi_process.questions.shape, single_process.questions.shape)
+        self.assertEqual(np.array_equal(multi_process.questions.indptr, single_process.questions.indptr), True)
+        self.assertEqual(np.array_equal(multi_process.questions.indices, single_process.questions.indices), True)
+        self.assertEqual(np.array_equal(multi_process.questions.data, single_process.questions.data), True)
+
+    def test_fit_dtype(self):
+        with self.assertRaises(ValueError):
+            TfIdfVectorizer(dtype='float16')
+
+        vectorizers = {}
+        for dtype in ['float64', 'float32', 'int8']:
+            vectorizer = TfIdfVectorizer(cache_path=self.cache_path, dtype=dtype,
+                                         query_encoder_path=self.query_encoder_path)
+            vectorizer.fit(self.corpus)
+            vectorizers[dtype] = vectorizer
+
+        self.assertEqual(vectorizers['float32'].questions.data.dtype, np.float32)
+        self.assertEqual(vectorizers['float32']._idf_vector.dtype, np.float32)
+        self.assertIsNone(vectorizers['float32'].inverted_index.question_scales)
+        self.assertEqual(vectorizers['int8'].questions.data.dtype, np.int8)
+        self.assertEqual(vectorizers['int8']._idf_vector.dtype, np.float32)
+
+        # weights of each type approximate float64 weights
+        expected = vectorizers['float64'].questions.toarray()
+        int8_questions = vectorizers['int8'].questions
+        int8_weights = int8_questions.toarray() * vectorizers['int8'].inverted_index.question_scales[:, None]
+        self.assertEqual(np.allclose(vectorizers['float32'].questions.toarray(), expected, atol=1e-6), True)
+        self.assertEqual(np.allclose(int8_weights, expected, atol=1e-2), True)
+
+        # the last fitted index is stored with its type
+        vectorizer = TfIdfVectorizer(cache_path=self.cache_path, query_encoder_path=self.query_encoder_path)
+        vectorizer.load()
+        self.assertEqual(vectorizer.questions.data.dtype, np.int8)
+        self.assertEqual(np.array_equal(vectorizer.inverted_index.question_scales,
+                                        vectorizers['int8'].inverted_index.question_scales), True)
+
+    def test_fit_hashed(self):
+        with self.assertRaises(ValueError):
+            TfIdfVectorizer(num_of_hashed_features=0)
+
+        random_generator = np.random.RandomState(2)
+        words = [f'word{chr(97 + i % 26)}{chr(97 + i // 26)}' for i in range(200)]
+        corpus = [' '.join(random_generator.choice(words, random_generator.randint(0, 12))) for _ in range(300)]
+        queries = ['wordaa wordab wordab', 'unknown words', '']
+
+        vectorizer = TfIdfVectorizer(cache_path=self.cache_path, num_of_hashed_features=2 ** 20,
+                                     query_encoder_path=self.query_encoder_path)
+        vectorizer.fit(corpus)
+        self.assertIsNone(vectorizer._vocabulary)
+        self.assertEqual(vectorizer.questions.shape, (len(corpus), 2 ** 20))
+
+        # without collisions, hashed features are a permutation of vocabulary words, so similarities are the same
+        reference_vectorizer = TfIdfVectorizer(use_cache=False, query_encoder_path='reference_query_encoder')
+        reference_vectorizer.fit(corpus)
+        shutil.rmtree('reference_query_encoder')
+        feature_indices = vectorizer.transform(list(reference_vectorizer._vocabulary), sparse=True).indices
+        self.assertEqual(len(np.unique(feature_indices)), len(reference_vectorizer._vocabulary))
+        self.assertEqual(np.allclose(vectorizer._idf_vector[feature_indices], reference_vectorizer._idf_vector), True)
+
+        similarities = vectorizer.questions.toarray() @ vectorizer.transform(queries).T
+        reference_similarities = reference_vectorizer.questions.toarray() @ reference_vectorizer.transform(queries).T
+        self.assertEqual(np.allclose(similarities, reference_similarities), True)
+
+        # vectorizer loaded from disk keeps hashing mode
+        loaded_vectorizer = TfIdfVectorizer(cache_path=self.cache_path, query_encoder_path=self.query_encoder_path)
+        loaded_vectorizer.load()
+        self.assertIsNone(loaded_vectorizer._vocabulary)
+        self.assertEqual(loaded_vectorizer._num_of_hashed_features, 2 ** 20)
+        self.assertEqual(np.array_equal(loaded_vectorizer.questions.indices, vectorizer.questions.indices), True)
+        self.assertEqual(np.array_equal(loaded_vectorizer.transform(queries, sparse=True).indices,
+                                        vectorizer.transform(queries, sparse=True).indices), True)
+
+        # colliding tokens share a feature
+        vectorizer = TfIdfVectorizer(use_cache=False, num_of_hashed_features=1,
+                                     query_encoder_path=self.query_encoder_path)
+        vectorizer.fit(corpus)
+        self.assertEqual(np.allclose(vectorizer.transform(queries), [[1.], [1.], [0.]]), True)
+
+    def _reference_vocabulary(self, questions, vocabulary_size):
+        counts, document_frequencies = Counter(), Counter()
+        for question_tokens in questions:
+            counts.update(question_tokens)
+            document_frequencies.update(set(question_tokens))
+
+        words = sorted(dict(counts.most_common(vocabulary_size)).keys())
+        vocabulary = dict(zip(words, range(len(words))))
+        idf_vector = np.asarray([np.round(np.log((len(questions) + 1) / (document_frequencies[word] + 1)) + 1, 8)
+                                 for word in words])
+        return vocabulary, idf_vector
+
+    def _reference_vectors(self, questions, vocabulary, idf_vector):
+        vectors = np.zeros((len(questions), len(vocabulary)))
+        for i, question_tokens in enumerate(questions):
+            token_occurences = Counter(question_tokens)
+            for token in token_occurences:
+                if token in vocabulary:
+                    vectors[i, vocabulary[token]] = idf_vector[vocabulary[token]] * token_occurences[token] / \
+                        len(question_tokens)
+            if np.any(vectors[i]):
+                vectors[i] /= np.sqrt(np.sum(vectors[i] ** 2))
+        return vectors
 
 
 if __name__ == '__main__':
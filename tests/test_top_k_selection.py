@@ -0,0 +1,64 @@
+import unittest
+import numpy as np
+
+from search_engine.similarity_scorer.top_k_selection import select_top_k, select_top_k_rows
+
+
+class TestTopKSelection(unittest.TestCase):
+
+    def test_select_top_k(self):
+        scores = np.asarray([0.1, 0.7, 0.3, 0.9, 0.5])
+
+        top_positions = select_top_k(scores, 3)
+        self.assertIsInstance(top_positions, np.ndarray)
+        self.assertEqual(top_positions.tolist(), [3, 1, 4])
+
+        # k greater than number of scores
+        self.assertEqual(select_top_k(scores, 10).tolist(), [3, 1, 4, 2, 0])
+
+        # no scores or k equal to zero
+        self.assertEqual(len(select_top_k(np.zeros(0), 3)), 0)
+        self.assertEqual(len(select_top_k(scores, 0)), 0)
+
+    def test_select_top_k_ties(self):
+        # ties are broken by position in ascending order
+        scores = np.asarray([0.5, 0.9, 0.5, 0.5, 0.9, 0.1])
+        self.assertEqual(select_top_k(scores, 1).tolist(), [1])
+        self.assertEqual(select_top_k(scores, 3).tolist(), [1, 4, 0])
+        self.assertEqual(select_top_k(scores, 4).tolist(), [1, 4, 0, 2])
+
+    def test_select_top_k_matches_full_sort(self):
+        random_generator = np.random.RandomState(0)
+        scores = np.round(random_generator.random_sample(1000), 2)
+        expected = sorted(range(len(scores)), key=lambda position: (-scores[position], position))[:20]
+        self.assertEqual(select_top_k(scores, 20).tolist(), expected)
+
+    def test_select_top_k_rows(self):
+        scores = np.asarray([
+            [0.1, 0.7, 0.3, 0.9, 0.5],
+            [0.5, 0.9, 0.5, 0.5, 0.9],
+            [0., 0., 0., 0., 0.],
+            [0., 0.2, 0., 0., 0.]
+        ])
+        rows, positions = np.nonzero(scores)
+
+        result = select_top_k_rows(rows, positions, scores[rows, positions], num_of_rows=4, k=3)
+        self.assertEqual(len(result), 4)
+        self.assertEqual(result[0][0].tolist(), [3, 1, 4])
+        self.assertEqual(result[0][1].tolist(), [0.9, 0.7, 0.5])
+        # ties are broken by position in ascending order
+        self.assertEqual(result[1][0].tolist(), [1, 4, 0])
+        # rows without scores
+        self.assertEqual(len(result[2][0]), 0)
+        self.assertEqual(result[3][0].tolist(), [1])
+
+        # each row must give the same positions as select_top_k
+        random_generator = np.random.RandomState(0)
+        scores = np.round(random_generator.random_sample((10, 100)), 2)
+        rows, positions = np.indices(scores.shape).reshape(2, -1)
+        result = select_top_k_rows(rows, positions, scores.flatten(), num_of_rows=10, k=7)
+        for row_scores, (top_positions, _) in zip(scores, result):
+            self.assertEqual(top_positions.tolist(), select_top_k(row_scores, 7).tolist())
+
+if __name__ == '__main__':
+    unittest.main()